@@ -6,14 +6,15 @@ Returns: JWT токен при успешной авторизации
 '''
 import json
 import os
-import psycopg2
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
 from typing import Dict, Any
+import tracing
 
 SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
 
+@tracing.traced('admin-auth')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
@@ -55,7 +56,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = tracing.connect(os.environ['DATABASE_URL'])
     cur = conn.cursor()
     
     try:
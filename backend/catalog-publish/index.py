@@ -0,0 +1,299 @@
+'''
+Business: Публикация статического снимка каталога в S3: полный JSON и файлы по категориям с хэшем содержимого в имени плюс manifest.json
+Args: event - dict с httpMethod (POST - публикация после изменения каталога, нужен X-Admin-Token;
+      GET - только чтение: опубликованный манифест и состояние публикации),
+      queryStringParameters (force=true - опубликовать без ожидания окна).
+      Правка внутри окна троттлинга не теряется: первый отложенный вызов дожидается конца окна и публикует
+      последнюю версию, остальные сразу отвечают 202
+      context - object с request_id
+Returns: HTTP response со статусом публикации и текущим манифестом; GET - up_to_date или stale без публикации
+'''
+import hashlib
+import json
+import os
+import time
+import boto3
+import jwt
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+CDN_URL = os.environ.get('CDN_URL', 'https://cdn.poehali.dev')
+THROTTLE_SECONDS = int(os.environ.get('CATALOG_PUBLISH_THROTTLE_SECONDS', '30'))
+# Ожидающий вызов, не снявший отметку за это время после конца окна, считается упавшим - ожидание берёт следующий
+DEFERRED_GRACE_SECONDS = 30
+MAX_DEFERRED_WAITS = 3
+MANIFEST_KEY = 'catalog/manifest.json'
+SNAPSHOT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+MANIFEST_CACHE_CONTROL = 'public, max-age=60'
+
+# Те же поля, что отдаёт витрине products?assets=sample_pdf,trainer
+SNAPSHOT_ASSET_KINDS = ['sample_pdf', 'trainer']
+TRAINER_POSITIONS = [1, 2, 3]
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def get_catalog_version(cur) -> str:
+    """Версия каталога: число товаров и время последнего изменения"""
+    cur.execute("SELECT COUNT(*), MAX(updated_at) FROM t_p99209851_math_resources_site.products")
+    count, last_modified = cur.fetchone()
+    return f"{count}|{last_modified.isoformat() if last_modified else ''}"
+
+def asset_field(kind: str, position: int) -> str:
+    if kind == 'trainer':
+        return f'trainer{position}_url'
+    return f'{kind}_url'
+
+def load_catalog(cur) -> List[Dict[str, Any]]:
+    cur.execute(
+        "SELECT product_id, kind, position, url FROM t_p99209851_math_resources_site.product_assets WHERE kind = ANY(%s)",
+        (SNAPSHOT_ASSET_KINDS,)
+    )
+    assets: Dict[int, Dict[str, str]] = {}
+    for product_id, kind, position, url in cur.fetchall():
+        assets.setdefault(product_id, {})[asset_field(kind, position)] = url
+
+    cur.execute(
+        "SELECT id, title, description, price, category, type, is_free, preview_image_url, updated_at "
+        "FROM t_p99209851_math_resources_site.products ORDER BY id"
+    )
+    products = []
+    for row in cur.fetchall():
+        product = {
+            'id': row[0],
+            'title': row[1],
+            'description': row[2],
+            'price': row[3],
+            'category': row[4],
+            'type': row[5],
+            'is_free': row[6],
+            'preview_image_url': row[7],
+            'updated_at': row[8].isoformat() if row[8] else None
+        }
+        product_assets = assets.get(row[0], {})
+        for kind in SNAPSHOT_ASSET_KINDS:
+            for position in (TRAINER_POSITIONS if kind == 'trainer' else [1]):
+                field_name = asset_field(kind, position)
+                product[field_name] = product_assets.get(field_name)
+        products.append(product)
+    return products
+
+def render_snapshot(name: str, products: List[Dict[str, Any]]) -> Tuple[str, bytes]:
+    """Сериализует товары и возвращает ключ объекта с хэшем содержимого"""
+    body = json.dumps(products, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    content_hash = hashlib.sha256(body).hexdigest()[:16]
+    return f'catalog/{name}.{content_hash}.json', body
+
+def publish(cur, catalog_version: str, previous_manifest: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Загружает изменившиеся файлы снимка и затем манифест, который на них ссылается"""
+    products = load_catalog(cur)
+
+    by_category: Dict[str, List[Dict[str, Any]]] = {}
+    for product in products:
+        by_category.setdefault(product['category'], []).append(product)
+
+    objects: Dict[str, bytes] = {}
+    full_key, full_body = render_snapshot('products', products)
+    objects[full_key] = full_body
+
+    categories = {}
+    for category, category_products in sorted(by_category.items()):
+        category_slug = hashlib.sha256(category.encode('utf-8')).hexdigest()[:12]
+        key, body = render_snapshot(f'categories/{category_slug}', category_products)
+        objects[key] = body
+        categories[category] = {'url': f'{CDN_URL}/{key}', 'count': len(category_products)}
+
+    # Файлы с хэшем в имени неизменяемы: то, что уже есть в прошлом манифесте, повторно не загружаем
+    published_urls = set()
+    if previous_manifest:
+        published_urls.add(previous_manifest.get('products', {}).get('url'))
+        published_urls.update(entry.get('url') for entry in previous_manifest.get('categories', {}).values())
+
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=os.environ.get('S3_ENDPOINT', 'https://storage.yandexcloud.net'),
+        region_name=os.environ.get('S3_REGION', 'ru-central1'),
+        aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
+    )
+    bucket = os.environ.get('S3_BUCKET', 'poehali-user-files')
+
+    uploaded = 0
+    for key, body in objects.items():
+        if f'{CDN_URL}/{key}' in published_urls:
+            continue
+        with tracing.span('s3', 'put_object'):
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=body,
+                ContentType='application/json; charset=utf-8',
+                CacheControl=SNAPSHOT_CACHE_CONTROL
+            )
+        uploaded += 1
+
+    manifest = {
+        'version': catalog_version,
+        'generated_at': datetime.utcnow().isoformat() + 'Z',
+        'products': {'url': f'{CDN_URL}/{full_key}', 'count': len(products)},
+        'categories': categories
+    }
+    with tracing.span('s3', 'put_object'):
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=MANIFEST_KEY,
+            Body=json.dumps(manifest, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json; charset=utf-8',
+            CacheControl=MANIFEST_CACHE_CONTROL
+        )
+    manifest['uploaded'] = uploaded
+    return manifest
+
+def try_publish(conn, cur, force: bool, waiting: bool) -> Tuple[str, Dict[str, Any], Optional[datetime]]:
+    """Публикует, если каталог изменился и окно троттлинга закрыто. Внутри окна вызов становится ожидающим (wait),
+    если ожидающего ещё нет, иначе возвращает deferred. Возвращает статус, тело ответа и конец окна"""
+    # Публикации идут по очереди: кто ждал блокировку, сравнивает версию уже после предыдущей публикации
+    cur.execute(
+        "SELECT catalog_version, manifest, published_at, deferred_until FROM t_p99209851_math_resources_site.catalog_publish_state "
+        "WHERE name = 'catalog' FOR UPDATE"
+    )
+    published_version, previous_manifest, published_at, deferred_until = cur.fetchone()
+    catalog_version = get_catalog_version(cur)
+    now = datetime.utcnow()
+
+    if catalog_version == published_version:
+        if waiting:
+            cur.execute("UPDATE t_p99209851_math_resources_site.catalog_publish_state SET deferred_until = NULL WHERE name = 'catalog'")
+        conn.commit()
+        return 'up_to_date', {'status': 'up_to_date', 'manifest': previous_manifest}, None
+
+    # Первая правка после паузы публикуется сразу, серия быстрых правок - не чаще раза в THROTTLE_SECONDS
+    window_closes = published_at + timedelta(seconds=THROTTLE_SECONDS) if published_at else None
+    if not force and window_closes and window_closes > now:
+        if not waiting and deferred_until and deferred_until > now - timedelta(seconds=DEFERRED_GRACE_SECONDS):
+            conn.rollback()
+            return 'deferred', {'status': 'deferred', 'retry_after': THROTTLE_SECONDS}, window_closes
+        cur.execute(
+            "UPDATE t_p99209851_math_resources_site.catalog_publish_state SET deferred_until = %s WHERE name = 'catalog'",
+            (window_closes,)
+        )
+        conn.commit()
+        return 'wait', {'status': 'deferred', 'retry_after': THROTTLE_SECONDS}, window_closes
+
+    manifest = publish(cur, catalog_version, previous_manifest)
+    uploaded = manifest.pop('uploaded')
+
+    cur.execute(
+        "UPDATE t_p99209851_math_resources_site.catalog_publish_state "
+        "SET catalog_version = %s, manifest = %s, published_at = %s, deferred_until = NULL WHERE name = 'catalog'",
+        (catalog_version, json.dumps(manifest, ensure_ascii=False), datetime.utcnow())
+    )
+    conn.commit()
+    return 'published', {'status': 'published', 'uploaded': uploaded, 'manifest': manifest}, None
+
+def get_state(cur) -> Dict[str, Any]:
+    """Состояние публикации без блокировок и записи: опубликован ли текущий каталог и что ждёт публикации"""
+    cur.execute(
+        "SELECT catalog_version, manifest, published_at, deferred_until FROM t_p99209851_math_resources_site.catalog_publish_state "
+        "WHERE name = 'catalog'"
+    )
+    published_version, manifest, published_at, deferred_until = cur.fetchone()
+    return {
+        'status': 'up_to_date' if get_catalog_version(cur) == published_version else 'stale',
+        'published_at': published_at.isoformat() + 'Z' if published_at else None,
+        'deferred_until': deferred_until.isoformat() + 'Z' if deferred_until else None,
+        'manifest': manifest
+    }
+
+@tracing.traced('catalog-publish')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers_response = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    if method not in ['GET', 'POST']:
+        return {
+            'statusCode': 405,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    if method == 'POST' and not verify_admin_token(event.get('headers', {})):
+        return {
+            'statusCode': 401,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+    force = params.get('force') == 'true'
+
+    conn = tracing.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    try:
+        # GET ничего не публикует и не ждёт: публикация и ожидание окна - только POST с токеном админа
+        if method == 'GET':
+            return {
+                'statusCode': 200,
+                'headers': headers_response,
+                'body': json.dumps(get_state(cur), ensure_ascii=False),
+                'isBase64Encoded': False
+            }
+
+        status, result, window_closes = try_publish(conn, cur, force, False)
+
+        # Правка внутри окна: один вызов дожидается его конца и публикует последнюю версию, остальные отвечают 202
+        for _ in range(MAX_DEFERRED_WAITS):
+            if status != 'wait':
+                break
+            time.sleep(max((window_closes - datetime.utcnow()).total_seconds(), 0))
+            status, result, window_closes = try_publish(conn, cur, False, True)
+
+        if status == 'wait':
+            cur.execute("UPDATE t_p99209851_math_resources_site.catalog_publish_state SET deferred_until = NULL WHERE name = 'catalog'")
+            conn.commit()
+
+        return {
+            'statusCode': 202 if status in ['wait', 'deferred'] else 200,
+            'headers': headers_response,
+            'body': json.dumps(result),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
@@ -1,17 +1,97 @@
 '''
 Business: Безопасное создание платежа - берёт цены из БД по product_ids
+          и заранее сохраняет заказ в статусе pending со снимком товаров.
+          Повторный checkout той же корзины возвращает уже созданный платёж, пока он не оплачен
 Args: event - dict с httpMethod, body (product_ids, customer_email, return_url)
       context - object с request_id
 Returns: HTTP response с payment_url для оплаты (цены из базы данных)
 '''
 import json
 import os
+import time
 import uuid
-import base64
-from typing import Dict, Any, List
-import urllib.request
+import hashlib
+from typing import Dict, Any, List, Optional, Tuple
 import psycopg2
+import psycopg2.extras
+import yookassa_client
+import tracing
 
+CHECKOUT_TTL_SECONDS = int(os.environ.get('CHECKOUT_TTL_SECONDS', '600'))
+# Заявка на создание платежа старше этого считается брошенной упавшим вызовом
+CHECKOUT_CLAIM_TIMEOUT_SECONDS = 60
+CHECKOUT_WAIT_SECONDS = 20
+CHECKOUT_POLL_SECONDS = 0.1
+FRONT_CACHE_TTL_SECONDS = 30
+FRONT_CACHE_MAX_SIZE = 1000
+
+_checkout_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+def checkout_cache_key(customer_email: str, products: List[Tuple[Any, ...]]) -> str:
+    """Ключ корзины: email, отсортированные id товаров и версия их цен"""
+    items = sorted((product_id, price) for product_id, _, price, _ in products)
+    price_version = hashlib.sha256(','.join(f'{product_id}:{price}' for product_id, price in items).encode()).hexdigest()[:16]
+    raw_key = f"{customer_email.strip().lower()}|{','.join(str(product_id) for product_id, _ in items)}|{price_version}"
+    return hashlib.sha256(raw_key.encode()).hexdigest()
+
+def remember_checkout(cache_key: str, result: Dict[str, Any]) -> None:
+    """Кладёт ответ в кэш тёплого контейнера, вытесняя устаревшие записи"""
+    now = time.monotonic()
+    if len(_checkout_cache) >= FRONT_CACHE_MAX_SIZE:
+        for key in [key for key, (expires, _) in _checkout_cache.items() if expires <= now]:
+            del _checkout_cache[key]
+        if len(_checkout_cache) >= FRONT_CACHE_MAX_SIZE:
+            _checkout_cache.clear()
+    _checkout_cache[cache_key] = (now + FRONT_CACHE_TTL_SECONDS, result)
+
+def find_checkout_session(cur, cache_key: str) -> Optional[Tuple[Any, ...]]:
+    """Действующая сессия корзины с неоплаченным заказом: (order_id, payment_id, payment_url, total_amount,
+    discount_applied, платёж ещё создаётся другим вызовом)"""
+    cur.execute(
+        """
+        SELECT cs.order_id, cs.payment_id, cs.payment_url, cs.total_amount, cs.discount_applied,
+               cs.payment_id IS NULL AND cs.claimed_at > CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+        FROM t_p99209851_math_resources_site.checkout_sessions cs
+        JOIN t_p99209851_math_resources_site.orders o ON o.id = cs.order_id
+        WHERE cs.cache_key = %s AND cs.expires_at > CURRENT_TIMESTAMP AND o.payment_status = 'pending'
+        """,
+        (CHECKOUT_CLAIM_TIMEOUT_SECONDS, cache_key)
+    )
+    return cur.fetchone()
+
+def wait_for_checkout_session(conn, cur, cache_key: str) -> Optional[Tuple[Any, ...]]:
+    """Ждёт, пока вызов, взявший заявку, допишет payment_id; None - заявка пропала или ожидание истекло"""
+    deadline = time.monotonic() + CHECKOUT_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(CHECKOUT_POLL_SECONDS)
+        session = find_checkout_session(cur, cache_key)
+        conn.commit()
+        if session and session[1]:
+            return session
+        if not session or not session[5]:
+            return None
+    return None
+
+def checkout_response(cache_key: str, session: Tuple[Any, ...]) -> Dict[str, Any]:
+    result = {
+        'payment_url': session[2],
+        'payment_id': session[1],
+        'order_id': session[0],
+        'total_amount': session[3],
+        'discount_applied': session[4]
+    }
+    remember_checkout(cache_key, result)
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps(result),
+        'isBase64Encoded': False
+    }
+
+@tracing.traced('create-payment')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -69,18 +149,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     # Подключаемся к БД и получаем реальные цены из таблицы products
-    conn = psycopg2.connect(database_url)
+    conn = tracing.connect(database_url)
     cur = conn.cursor()
     
     placeholders = ','.join(['%s'] * len(product_ids))
-    query = f'SELECT id, title, price FROM t_p99209851_math_resources_site.products WHERE id IN ({placeholders})'
+    query = (
+        "SELECT p.id, p.title, p.price, pa.url FROM t_p99209851_math_resources_site.products p "
+        "LEFT JOIN t_p99209851_math_resources_site.product_assets pa ON pa.product_id = p.id AND pa.kind = 'full_pdf' "
+        f"WHERE p.id IN ({placeholders})"
+    )
     cur.execute(query, product_ids)
     products = cur.fetchall()
     
-    cur.close()
-    conn.close()
-    
     if not products:
+        cur.close()
+        conn.close()
         return {
             'statusCode': 404,
             'headers': {
@@ -92,23 +175,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     # Вычисляем общую сумму и применяем скидку если нужно
-    subtotal = sum(price for _, _, price in products)
+    subtotal = sum(price for _, _, price, _ in products)
     has_discount = len(products) >= 10
     discount_percent = 15 if has_discount else 0
     discount_amount = int(subtotal * discount_percent / 100) if has_discount else 0
     total_amount = subtotal - discount_amount
     
     # Формируем описание заказа
-    product_titles = [title for _, title, _ in products]
+    product_titles = [title for _, title, _, _ in products]
     description = ', '.join(product_titles[:3])
     if len(product_titles) > 3:
         description += f' и ещё {len(product_titles) - 3} товар(ов)'
     
-    # Получаем ЮКасса credentials
-    shop_id = os.environ.get('YOOKASSA_SHOP_ID')
-    secret_key = os.environ.get('YOOKASSA_SECRET_KEY')
+    # Получаем клиент ЮКассы (credentials из секретов)
+    yookassa = yookassa_client.get_client()
     
-    if not shop_id or not secret_key:
+    if not yookassa:
+        cur.close()
+        conn.close()
         return {
             'statusCode': 500,
             'headers': {
@@ -119,7 +203,109 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    idempotence_key = str(uuid.uuid4())
+    cache_key = checkout_cache_key(customer_email, products)
+    cached = _checkout_cache.get(cache_key)
+    hit = bool(cached and cached[0] > time.monotonic())
+    if hit:
+        # Заказ мог быть оплачен или отменён после того, как ответ попал в кэш: старую ссылку на оплату не отдаём
+        cur.execute(
+            "SELECT payment_status FROM t_p99209851_math_resources_site.orders WHERE id = %s",
+            (cached[1]['order_id'],)
+        )
+        row = cur.fetchone()
+        if not row or row[0] != 'pending':
+            _checkout_cache.pop(cache_key, None)
+            hit = False
+    tracing.cache_lookup('checkout', hit)
+    
+    if hit:
+        conn.commit()
+        cur.close()
+        conn.close()
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps(cached[1]),
+            'isBase64Encoded': False
+        }
+    
+    # Короткая транзакция под блокировкой ключа корзины: либо готовый платёж, либо чужая заявка на его создание,
+    # либо своя заявка - заказ pending и строка checkout_sessions без payment_id. Запрос в ЮКассу идёт уже без блокировки
+    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (cache_key,))
+    session = find_checkout_session(cur, cache_key)
+    
+    if session and session[1]:
+        conn.commit()
+        cur.close()
+        conn.close()
+        return checkout_response(cache_key, session)
+    
+    if session and session[5]:
+        conn.commit()
+        session = wait_for_checkout_session(conn, cur, cache_key)
+        cur.close()
+        conn.close()
+        if session:
+            return checkout_response(cache_key, session)
+        return {
+            'statusCode': 503,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*',
+                'Retry-After': '1'
+            },
+            'body': json.dumps({'error': 'Checkout is being created, retry later'}),
+            'isBase64Encoded': False
+        }
+    
+    cur.execute("DELETE FROM t_p99209851_math_resources_site.checkout_sessions WHERE expires_at < CURRENT_TIMESTAMP")
+    
+    if session:
+        # Заявка осталась от упавшего вызова: продолжаем с тем же заказом и тем же Idempotence-Key,
+        # и если платёж успел создаться, ЮКасса вернёт его же
+        order_id = session[0]
+        cur.execute(
+            "SELECT idempotence_key FROM t_p99209851_math_resources_site.orders WHERE id = %s",
+            (order_id,)
+        )
+        idempotence_key = cur.fetchone()[0]
+    else:
+        idempotence_key = str(uuid.uuid4())
+        
+        # Заказ в статусе pending со снимком товаров создаётся до платежа, webhook только подтвердит оплату
+        cur.execute(
+            "INSERT INTO t_p99209851_math_resources_site.orders (guest_email, total_price, payment_status, idempotence_key) VALUES (%s, %s, %s, %s) RETURNING id",
+            (customer_email, total_amount, 'pending', idempotence_key)
+        )
+        order_id = cur.fetchone()[0]
+        
+        psycopg2.extras.execute_values(
+            cur,
+            "INSERT INTO t_p99209851_math_resources_site.order_items (order_id, product_id, product_title, product_price, full_pdf_url, quantity) VALUES %s",
+            [(order_id, product_id, title, price, full_pdf_url, 1) for product_id, title, price, full_pdf_url in products]
+        )
+    
+    cur.execute(
+        """
+        INSERT INTO t_p99209851_math_resources_site.checkout_sessions (cache_key, order_id, payment_id, payment_url, total_amount, discount_applied, claimed_at, expires_at)
+        VALUES (%s, %s, NULL, NULL, %s, %s, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP + %s * INTERVAL '1 second')
+        ON CONFLICT (cache_key) DO UPDATE SET
+            order_id = EXCLUDED.order_id,
+            payment_id = NULL,
+            payment_url = NULL,
+            total_amount = EXCLUDED.total_amount,
+            discount_applied = EXCLUDED.discount_applied,
+            claimed_at = EXCLUDED.claimed_at,
+            expires_at = EXCLUDED.expires_at
+        """,
+        (cache_key, order_id, total_amount, has_discount, CHECKOUT_TTL_SECONDS)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
     
     # Создаём платёж в ЮКасса
     payment_data = {
@@ -147,48 +333,63 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'vat_code': 1,
                 'payment_mode': 'full_payment',
                 'payment_subject': 'commodity'
-            } for _, title, price in products]
+            } for _, title, price, _ in products]
         },
         'metadata': {
-            'order_id': idempotence_key,
+            'order_id': str(order_id),
+            'idempotence_key': idempotence_key,
             'product_ids': ','.join(map(str, product_ids)),
             'customer_email': customer_email
         }
     }
     
-    auth_string = f'{shop_id}:{secret_key}'
-    credentials = base64.b64encode(auth_string.encode('utf-8')).decode('ascii')
-    
-    req = urllib.request.Request(
-        'https://api.yookassa.ru/v3/payments',
-        data=json.dumps(payment_data).encode(),
-        headers={
-            'Authorization': f'Basic {credentials}',
-            'Idempotence-Key': idempotence_key,
-            'Content-Type': 'application/json'
-        }
-    )
-    
     try:
-        response = urllib.request.urlopen(req)
-        response_data = json.loads(response.read().decode())
+        payment = yookassa.create_payment(payment_data, idempotence_key)
+    except yookassa_client.YooKassaError as e:
+        conn = tracing.connect(database_url)
+        cur = conn.cursor()
+        if e.status is None or e.status >= 500:
+            # Таймаут или сбой у провайдера: платёж мог создаться. Заявка и заказ остаются, заявка сразу считается
+            # брошенной - следующий checkout корзины повторит запрос с тем же Idempotence-Key и получит тот же платёж,
+            # а webhook найдёт заказ по order_id из metadata
+            cur.execute(
+                "UPDATE t_p99209851_math_resources_site.checkout_sessions SET claimed_at = CURRENT_TIMESTAMP - %s * INTERVAL '1 second' "
+                "WHERE cache_key = %s AND order_id = %s AND payment_id IS NULL",
+                (CHECKOUT_CLAIM_TIMEOUT_SECONDS, cache_key, order_id)
+            )
+            conn.commit()
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 503,
+                'headers': {
+                    'Content-Type': 'application/json',
+                    'Access-Control-Allow-Origin': '*',
+                    'Retry-After': '1'
+                },
+                'body': json.dumps({'error': 'YooKassa is unavailable, retry later'}),
+                'isBase64Encoded': False
+            }
+        
+        # ЮКасса отклонила запрос (4xx) - платёж точно не создан: заказ и заявка удаляются,
+        # следующий checkout той же корзины начнёт заново
+        cur.execute(
+            "DELETE FROM t_p99209851_math_resources_site.checkout_sessions WHERE cache_key = %s AND order_id = %s AND payment_id IS NULL",
+            (cache_key, order_id)
+        )
+        cur.execute(
+            "DELETE FROM t_p99209851_math_resources_site.order_items WHERE order_id = %s AND EXISTS "
+            "(SELECT 1 FROM t_p99209851_math_resources_site.orders WHERE id = %s AND payment_id IS NULL AND payment_status = 'pending')",
+            (order_id, order_id)
+        )
+        cur.execute(
+            "DELETE FROM t_p99209851_math_resources_site.orders WHERE id = %s AND payment_id IS NULL AND payment_status = 'pending'",
+            (order_id,)
+        )
+        conn.commit()
+        cur.close()
+        conn.close()
         
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'payment_url': response_data['confirmation']['confirmation_url'],
-                'payment_id': response_data['id'],
-                'total_amount': total_amount,
-                'discount_applied': has_discount
-            }),
-            'isBase64Encoded': False
-        }
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode()
         return {
             'statusCode': 500,
             'headers': {
@@ -197,7 +398,24 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             },
             'body': json.dumps({
                 'error': 'YooKassa API error',
-                'details': error_body
+                'details': e.body
             }),
             'isBase64Encoded': False
         }
+    
+    conn = tracing.connect(database_url)
+    cur = conn.cursor()
+    cur.execute(
+        "UPDATE t_p99209851_math_resources_site.orders SET payment_id = %s WHERE id = %s",
+        (payment.id, order_id)
+    )
+    cur.execute(
+        "UPDATE t_p99209851_math_resources_site.checkout_sessions SET payment_id = %s, payment_url = %s "
+        "WHERE cache_key = %s AND order_id = %s",
+        (payment.id, payment.confirmation_url, cache_key, order_id)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+    
+    return checkout_response(cache_key, (order_id, payment.id, payment.confirmation_url, total_amount, has_discount))
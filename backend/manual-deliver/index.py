@@ -1,11 +1,12 @@
 import json
 import os
-import psycopg2
 from typing import Dict, Any
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import tracing
 
+@tracing.traced('manual-deliver')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Manually deliver products to customer by email
@@ -48,7 +49,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     database_url = os.environ.get('DATABASE_URL')
     
-    conn = psycopg2.connect(database_url)
+    conn = tracing.connect(database_url)
     cur = conn.cursor()
     
     # Create order
@@ -62,7 +63,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     # Get products
     product_ids_str = ','.join(map(str, product_ids))
     cur.execute(
-        f"SELECT id, title, full_pdf_url, full_pdf_with_answers_url FROM t_p99209851_math_resources_site.products WHERE id IN ({product_ids_str})"
+        "SELECT p.id, p.title, full_pdf.url, with_answers.url FROM t_p99209851_math_resources_site.products p "
+        "LEFT JOIN t_p99209851_math_resources_site.product_assets full_pdf ON full_pdf.product_id = p.id AND full_pdf.kind = 'full_pdf' "
+        "LEFT JOIN t_p99209851_math_resources_site.product_assets with_answers ON with_answers.product_id = p.id AND with_answers.kind = 'full_pdf_with_answers' "
+        f"WHERE p.id IN ({product_ids_str})"
     )
     products = cur.fetchall()
     
@@ -74,6 +78,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             (order_id, product[0], product[1], int(amount), product[2], 1)
         )
     
+    cur.execute("SELECT t_p99209851_math_resources_site.on_order_paid(%s)", (order_id,))
     conn.commit()
     
     # Send email
@@ -81,6 +86,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     smtp_port = int(os.environ.get('SMTP_PORT', 587))
     smtp_user = os.environ.get('SMTP_USER')
     smtp_password = os.environ.get('SMTP_PASSWORD')
+    smtp_starttls = os.environ.get('SMTP_STARTTLS', 'true') == 'true'
     
     msg = MIMEMultipart('alternative')
     msg['Subject'] = 'Ваши материалы готовы!'
@@ -109,8 +115,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     msg.attach(MIMEText(text, 'plain'))
     
-    with smtplib.SMTP(smtp_host, smtp_port) as server:
-        server.starttls()
+    with tracing.span('smtp', 'send'), smtplib.SMTP(smtp_host, smtp_port) as server:
+        if smtp_starttls:
+            server.starttls()
         server.login(smtp_user, smtp_password)
         server.send_message(msg)
     
@@ -1,12 +1,12 @@
 import json
 import os
-import base64
-import urllib.request
 from typing import Dict, Any
+import tracing
 
+@tracing.traced('manual-send-purchase')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Manually send purchase email by fetching payment from YooKassa
+    Business: Manually send purchase email by looking up the customer's YooKassa payments in the local mirror
     Args: event with email in query params, context object
     Returns: HTTP response
     '''
@@ -41,39 +41,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Email is required'})
         }
     
-    shop_id = os.environ.get('YOOKASSA_SHOP_ID')
-    secret_key = os.environ.get('YOOKASSA_SECRET_KEY')
+    dsn = os.environ.get('DATABASE_URL')
     
-    if not shop_id or not secret_key:
+    if not dsn:
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'YooKassa credentials not configured'})
+            'body': json.dumps({'error': 'Database not configured'})
         }
     
-    # Get payments from YooKassa
-    credentials = base64.b64encode(f'{shop_id}:{secret_key}'.encode()).decode()
+    # Find payments by email in the local mirror kept up to date by payments-sync
+    conn = tracing.connect(dsn)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id, amount, created_at, metadata FROM t_p99209851_math_resources_site.payments "
+        "WHERE customer_email = lower(%s) AND status = 'succeeded' AND refunded_amount < amount ORDER BY created_at DESC",
+        (email,)
+    )
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
     
-    url = 'https://api.yookassa.ru/v3/payments'
-    req = urllib.request.Request(url)
-    req.add_header('Authorization', f'Basic {credentials}')
-    req.add_header('Content-Type', 'application/json')
-    
-    response = urllib.request.urlopen(req)
-    data = json.loads(response.read().decode())
-    
-    # Find payment by email
     matching_payments = []
-    for payment in data.get('items', []):
-        receipt = payment.get('receipt', {})
-        customer = receipt.get('customer', {})
-        if customer.get('email') == email and payment.get('status') == 'succeeded':
-            matching_payments.append({
-                'id': payment['id'],
-                'amount': payment['amount']['value'],
-                'created_at': payment['created_at'],
-                'metadata': payment.get('metadata', {})
-            })
+    for row in rows:
+        matching_payments.append({
+            'id': row[0],
+            'amount': f'{row[1]:.2f}',
+            'created_at': row[2].isoformat() + 'Z',
+            'metadata': row[3] or {}
+        })
     
     return {
         'statusCode': 200,
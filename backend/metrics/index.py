@@ -0,0 +1,130 @@
+'''
+Business: Метрики всех функций в текстовом формате Prometheus: длительность обработки, запросы к БД, внешние вызовы,
+          попадания в кэши - из таблицы metrics, куда их досылают контейнеры
+Args: event - dict с httpMethod, headers (Authorization: Bearer METRICS_TOKEN для сборщика или X-Admin-Token)
+      context - object с request_id
+Returns: HTTP response с text/plain; version=0.0.4
+'''
+import hmac
+import json
+import os
+import jwt
+from typing import Dict, Any, List, Optional
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def verify_scraper_token(headers: Dict[str, str]) -> bool:
+    """Сборщик метрик присылает статический токен METRICS_TOKEN в Authorization: Bearer"""
+    authorization = headers.get('authorization') or headers.get('Authorization') or ''
+    if not METRICS_TOKEN or not authorization.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(authorization[len('Bearer '):], METRICS_TOKEN)
+
+def format_number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+def render(rows: List[tuple]) -> str:
+    """Строки таблицы metrics в текстовый формат Prometheus; метка function добавляется к меткам ряда"""
+    lines: List[str] = []
+    current_name = None
+
+    for function_name, name, labels, kind, value, count, buckets in rows:
+        if name != current_name:
+            lines.append(f'# TYPE {name} {kind}')
+            current_name = name
+        series_labels = f'function="{function_name}"' + (f',{labels}' if labels else '')
+
+        if kind == 'counter':
+            lines.append(f'{name}{{{series_labels}}} {format_number(value)}')
+            continue
+
+        # В таблице корзины не накопительные, Prometheus ждёт число значений <= le
+        cumulative = 0
+        for bound, bucket_count in zip(tracing.BUCKET_BOUNDS_MS, buckets or []):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{series_labels},le="{format_number(bound)}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{series_labels},le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{{series_labels}}} {format_number(value)}')
+        lines.append(f'{name}_count{{{series_labels}}} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+@tracing.traced('metrics')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Admin-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers_response = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    request_headers = event.get('headers') or {}
+    if not verify_scraper_token(request_headers) and not verify_admin_token(request_headers):
+        return {
+            'statusCode': 401,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    conn = tracing.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    try:
+        cur.execute(
+            "SELECT function_name, name, labels, kind, value, count, buckets "
+            "FROM t_p99209851_math_resources_site.metrics ORDER BY name, function_name, labels"
+        )
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-store'
+        },
+        'body': render(rows),
+        'isBase64Encoded': False
+    }
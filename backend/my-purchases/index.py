@@ -1,14 +1,58 @@
 '''
 Business: Получение списка покупок пользователя по email
-Args: event - dict с httpMethod, queryStringParameters (email)
+Args: event - dict с httpMethod, queryStringParameters (email, limit, cursor; owned=true - только id купленных товаров)
       context - object с request_id
-Returns: HTTP response со списком заказов и товаров
+Returns: HTTP response со страницей покупок и next_cursor для следующей страницы
 '''
 import json
 import os
-import psycopg2
-from typing import Dict, Any, List
+import time
+import base64
+from datetime import datetime
+from typing import Dict, Any, List, Tuple
+import tracing
 
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_EMAILS = 500
+# Страниц на один email: курсоров много, первые страницы разных limit - самые частые
+CACHE_MAX_PAGES_PER_EMAIL = 16
+
+# email -> (версия покупок, время истечения, страницы по (cursor, limit))
+_purchases_cache: Dict[str, Tuple[int, float, Dict[Tuple[str, int], Dict[str, Any]]]] = {}
+
+def normalize_email(email: str) -> str:
+    """Форма email в entitlements, customer_cache_versions и индексе orders: LOWER(TRIM(...))"""
+    return email.strip().lower()
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{item_id}'.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    created_at, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+    return datetime.fromisoformat(created_at), int(item_id)
+
+def get_cached_pages(email: str, version: int) -> Dict[Tuple[str, int], Dict[str, Any]]:
+    """Возвращает страницы из кэша для актуальной версии покупок, устаревшую запись заменяет пустой"""
+    now = time.monotonic()
+    entry = _purchases_cache.get(email)
+    if entry and entry[0] == version and entry[1] > now:
+        return entry[2]
+    if len(_purchases_cache) >= CACHE_MAX_EMAILS:
+        _purchases_cache.clear()
+    pages: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    _purchases_cache[email] = (version, now + CACHE_TTL_SECONDS, pages)
+    return pages
+
+def remember_page(pages: Dict[Tuple[str, int], Dict[str, Any]], cache_key: Tuple[str, int], result: Dict[str, Any]) -> None:
+    """Кладёт страницу в кэш email; при переполнении вытесняет самую старую страницу по курсору, первые страницы - последними"""
+    if len(pages) >= CACHE_MAX_PAGES_PER_EMAIL:
+        evicted = next((key for key in pages if key[0]), next(iter(pages)))
+        del pages[evicted]
+    pages[cache_key] = result
+
+@tracing.traced('my-purchases')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -34,7 +78,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     params = event.get('queryStringParameters', {})
-    email = params.get('email')
+    email = normalize_email(params.get('email') or '')
     
     if not email:
         return {
@@ -44,6 +88,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
+    try:
+        limit = min(max(int(params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        cursor = params.get('cursor')
+        cursor_position = decode_cursor(cursor) if cursor else None
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid limit or cursor'}),
+            'isBase64Encoded': False
+        }
+    
     dsn = os.environ.get('DATABASE_URL')
     
     if not dsn:
@@ -54,38 +110,84 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = tracing.connect(dsn)
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT 
-            oi.id,
-            oi.product_id,
-            oi.product_title,
-            oi.product_price,
-            p.full_pdf_with_answers_url,
-            p.full_pdf_without_answers_url,
-            o.created_at
-        FROM t_p99209851_math_resources_site.orders o
-        JOIN t_p99209851_math_resources_site.order_items oi ON oi.order_id = o.id
-        LEFT JOIN t_p99209851_math_resources_site.products p ON p.id = oi.product_id
-        WHERE o.guest_email = %s AND o.payment_status = 'paid'
-        ORDER BY o.created_at DESC
-    """, (email,))
+    # Быстрая проверка владения: только id купленных товаров из entitlements
+    if params.get('owned') == 'true':
+        cur.execute(
+            "SELECT product_id FROM t_p99209851_math_resources_site.entitlements WHERE email = %s ORDER BY product_id",
+            (email,)
+        )
+        product_ids = [row[0] for row in cur.fetchall()]
+        cur.close()
+        conn.close()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'product_ids': product_ids}),
+            'isBase64Encoded': False
+        }
+    
+    # Версия покупок меняется в транзакции оплаты заказа - по ней проверяем кэш тёплого контейнера
+    cur.execute(
+        "SELECT version FROM t_p99209851_math_resources_site.customer_cache_versions WHERE email = %s",
+        (email,)
+    )
+    version_row = cur.fetchone()
+    version = version_row[0] if version_row else 0
     
-    rows = cur.fetchall()
+    cache_key = (cursor or '', limit)
+    cached_pages = get_cached_pages(email, version)
+    tracing.cache_lookup('purchases', cache_key in cached_pages)
     
-    purchases: List[Dict[str, Any]] = []
-    for row in rows:
-        purchases.append({
-            'id': row[0],
-            'product_id': row[1],
-            'product_title': row[2],
-            'product_price': row[3],
-            'full_pdf_with_answers_url': row[4] or '',
-            'full_pdf_without_answers_url': row[5] or '',
-            'created_at': row[6].isoformat() if row[6] else ''
-        })
+    if cache_key in cached_pages:
+        result = cached_pages[cache_key]
+    else:
+        cursor_filter = ''
+        query_params: List[Any] = [email]
+        if cursor_position:
+            cursor_filter = 'AND o.created_at <= %s AND (o.created_at, oi.id) < (%s, %s)'
+            query_params += [cursor_position[0], cursor_position[0], cursor_position[1]]
+        query_params.append(limit + 1)
+        
+        cur.execute(f"""
+            SELECT 
+                oi.id,
+                oi.product_id,
+                oi.product_title,
+                oi.product_price,
+                p.full_pdf_with_answers_url,
+                p.full_pdf_without_answers_url,
+                o.created_at
+            FROM t_p99209851_math_resources_site.orders o
+            JOIN t_p99209851_math_resources_site.order_items oi ON oi.order_id = o.id
+            LEFT JOIN t_p99209851_math_resources_site.products p ON p.id = oi.product_id
+            WHERE LOWER(TRIM(o.guest_email)) = %s AND o.payment_status = 'paid' {cursor_filter}
+            ORDER BY o.created_at DESC, oi.id DESC
+            LIMIT %s
+        """, query_params)
+        
+        rows = cur.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        purchases: List[Dict[str, Any]] = []
+        for row in rows:
+            purchases.append({
+                'id': row[0],
+                'product_id': row[1],
+                'product_title': row[2],
+                'product_price': row[3],
+                'full_pdf_with_answers_url': row[4] or '',
+                'full_pdf_without_answers_url': row[5] or '',
+                'created_at': row[6].isoformat() if row[6] else ''
+            })
+        
+        next_cursor = encode_cursor(rows[-1][6], rows[-1][0]) if has_more else None
+        result = {'purchases': purchases, 'next_cursor': next_cursor}
+        remember_page(cached_pages, cache_key, result)
     
     cur.close()
     conn.close()
@@ -93,6 +195,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'purchases': purchases}),
+        'body': json.dumps(result),
         'isBase64Encoded': False
     }
\ No newline at end of file
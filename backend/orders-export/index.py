@@ -0,0 +1,278 @@
+'''
+Business: Выгрузка заказов с товарами для бухгалтерии в CSV или JSONL потоком через серверный курсор
+Args: event - dict с httpMethod, headers (X-Admin-Token), queryStringParameters (format, date_from, date_to, status)
+      context - object с request_id
+Returns: HTTP response с временной подписанной ссылкой на файл выгрузки в закрытом бакете S3;
+         из командной строки пишет выгрузку в stdout или файл
+'''
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import uuid
+import boto3
+import jwt
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import Dict, Any, Iterator, Optional, TextIO, Tuple
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+FETCH_BATCH_SIZE = 5000
+# В выгрузке email покупателей: отдельный бакет без публичного доступа и CDN, ссылка живёт минуты, файл - сутки
+EXPORTS_BUCKET = os.environ.get('EXPORTS_BUCKET', 'poehali-orders-exports')
+EXPORTS_PREFIX = 'exports/'
+EXPORT_URL_TTL_SECONDS = int(os.environ.get('EXPORT_URL_TTL_SECONDS', '900'))
+EXPORT_RETENTION_DAYS = int(os.environ.get('EXPORT_RETENTION_DAYS', '1'))
+EXPORTS_LIFECYCLE_RULE_ID = 'expire-orders-exports'
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+CSV_COLUMNS = [
+    'order_id', 'created_at', 'paid_at', 'guest_email', 'total_price', 'payment_id', 'payment_status',
+    'product_id', 'product_title', 'product_price', 'quantity'
+]
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+    
+    if not token:
+        return None
+    
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+_lifecycle_checked = False
+
+def ensure_exports_lifecycle(s3_client, bucket: str) -> None:
+    """Правило удаления exports/ через EXPORT_RETENTION_DAYS дней; проверяется один раз на тёплый контейнер,
+    остальные правила бакета сохраняются"""
+    global _lifecycle_checked
+    if _lifecycle_checked:
+        return
+    
+    try:
+        rules = s3_client.get_bucket_lifecycle_configuration(Bucket=bucket).get('Rules', [])
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'NoSuchLifecycleConfiguration':
+            raise
+        rules = []
+    
+    rule = {
+        'ID': EXPORTS_LIFECYCLE_RULE_ID,
+        'Filter': {'Prefix': EXPORTS_PREFIX},
+        'Status': 'Enabled',
+        'Expiration': {'Days': EXPORT_RETENTION_DAYS}
+    }
+    current = next((existing for existing in rules if existing.get('ID') == EXPORTS_LIFECYCLE_RULE_ID), None)
+    if current != rule:
+        rules = [existing for existing in rules if existing.get('ID') != EXPORTS_LIFECYCLE_RULE_ID] + [rule]
+        s3_client.put_bucket_lifecycle_configuration(Bucket=bucket, LifecycleConfiguration={'Rules': rules})
+    _lifecycle_checked = True
+
+def iter_order_rows(conn, date_from: date, date_to: date, status: Optional[str]) -> Iterator[Tuple[Any, ...]]:
+    """Читает заказы с товарами через именованный серверный курсор порциями по FETCH_BATCH_SIZE строк"""
+    status_filter = 'AND o.payment_status = %s' if status else ''
+    params = [date_from, date_to] + ([status] if status else [])
+    
+    cur = conn.cursor(name=f'orders_export_{uuid.uuid4().hex}')
+    cur.itersize = FETCH_BATCH_SIZE
+    cur.execute(f"""
+        SELECT o.id, o.created_at, o.paid_at, o.guest_email, o.total_price, o.payment_id, o.payment_status,
+               oi.product_id, oi.product_title, oi.product_price, oi.quantity
+        FROM t_p99209851_math_resources_site.orders o
+        LEFT JOIN t_p99209851_math_resources_site.order_items oi ON oi.order_id = o.id
+        WHERE o.created_at >= %s AND o.created_at < %s {status_filter}
+        ORDER BY o.id, oi.id
+    """, params)
+    
+    try:
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
+
+def format_time(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() + 'Z' if value else None
+
+def write_export(conn, out: TextIO, export_format: str, date_from: date, date_to: date, status: Optional[str]) -> int:
+    """Пишет выгрузку в поток, не держа в памяти больше одного заказа; возвращает число заказов"""
+    rows = iter_order_rows(conn, date_from, date_to, status)
+    orders_count = 0
+    
+    if export_format == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(CSV_COLUMNS)
+        last_order_id = None
+        for row in rows:
+            if row[0] != last_order_id:
+                orders_count += 1
+                last_order_id = row[0]
+            writer.writerow([row[0], format_time(row[1]), format_time(row[2])] + list(row[3:]))
+        return orders_count
+    
+    for order_id, order_rows in groupby(rows, key=lambda row: row[0]):
+        order_rows = list(order_rows)
+        first = order_rows[0]
+        out.write(json.dumps({
+            'order_id': order_id,
+            'created_at': format_time(first[1]),
+            'paid_at': format_time(first[2]),
+            'guest_email': first[3],
+            'total_price': first[4],
+            'payment_id': first[5],
+            'payment_status': first[6],
+            'items': [
+                {
+                    'product_id': row[7],
+                    'product_title': row[8],
+                    'product_price': row[9],
+                    'quantity': row[10]
+                }
+                for row in order_rows if row[7] is not None or row[8] is not None
+            ]
+        }, ensure_ascii=False))
+        out.write('\n')
+        orders_count += 1
+    return orders_count
+
+def parse_range(date_from: Optional[str], date_to: Optional[str]) -> Tuple[date, date]:
+    """Период [date_from, date_to] включительно, по умолчанию - последние 30 дней"""
+    end = date.fromisoformat(date_to) if date_to else date.today()
+    start = date.fromisoformat(date_from) if date_from else end - timedelta(days=30)
+    if start > end:
+        raise ValueError('date_from is after date_to')
+    return start, end + timedelta(days=1)
+
+@tracing.traced('orders-export')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+    
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': headers,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    if not verify_admin_token(event.get('headers', {})):
+        return {
+            'statusCode': 401,
+            'headers': headers,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+    
+    params = event.get('queryStringParameters') or {}
+    export_format = params.get('format', 'csv')
+    
+    try:
+        if export_format not in FORMATS:
+            raise ValueError('Unknown format')
+        date_from, date_to = parse_range(params.get('date_from'), params.get('date_to'))
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    
+    conn = tracing.connect(os.environ['DATABASE_URL'])
+    
+    # Выгрузка пишется во временный файл на диске и загружается в закрытый бакет - память не зависит от числа заказов
+    with tempfile.TemporaryFile() as raw_file:
+        text_file = io.TextIOWrapper(raw_file, encoding='utf-8', newline='')
+        try:
+            orders_count = write_export(conn, text_file, export_format, date_from, date_to, params.get('status'))
+        finally:
+            conn.close()
+        # Отсоединяем обёртку до загрузки: upload_fileobj закрывает переданный файл
+        text_file.detach()
+        raw_file.seek(0)
+        
+        s3_client = boto3.client(
+            's3',
+            endpoint_url=os.environ.get('S3_ENDPOINT', 'https://storage.yandexcloud.net'),
+            region_name=os.environ.get('S3_REGION', 'ru-central1'),
+            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY'),
+            config=Config(signature_version='s3v4')
+        )
+        file_name = f'orders-{date_from.isoformat()}-{uuid.uuid4().hex}.{export_format}'
+        file_key = f'{EXPORTS_PREFIX}{file_name}'
+        with tracing.span('s3', 'lifecycle'):
+            ensure_exports_lifecycle(s3_client, EXPORTS_BUCKET)
+        with tracing.span('s3', 'upload_fileobj'):
+            s3_client.upload_fileobj(
+                raw_file,
+                EXPORTS_BUCKET,
+                file_key,
+                ExtraArgs={
+                    'ContentType': FORMATS[export_format],
+                    'ContentDisposition': f'attachment; filename="{file_name}"'
+                }
+            )
+    
+    url = s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': EXPORTS_BUCKET, 'Key': file_key},
+        ExpiresIn=EXPORT_URL_TTL_SECONDS
+    )
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps({
+            'url': url,
+            'expires_in': EXPORT_URL_TTL_SECONDS,
+            'orders': orders_count
+        }),
+        'isBase64Encoded': False
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Выгрузка заказов в CSV/JSONL')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+    parser.add_argument('--date-from')
+    parser.add_argument('--date-to')
+    parser.add_argument('--status')
+    parser.add_argument('--output', help='файл для выгрузки, по умолчанию stdout')
+    args = parser.parse_args()
+    
+    range_from, range_to = parse_range(args.date_from, args.date_to)
+    cli_conn = tracing.connect(os.environ['DATABASE_URL'])
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        count = write_export(cli_conn, output, args.format, range_from, range_to, args.status)
+    finally:
+        cli_conn.close()
+        if args.output:
+            output.close()
+    print(f'Exported {count} orders', file=sys.stderr)
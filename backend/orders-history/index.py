@@ -6,10 +6,11 @@ Returns: HTTP response с массивом заказов и информаци
 '''
 import json
 import os
-import psycopg2
 from typing import Dict, Any, List
 from collections import defaultdict
+import tracing
 
+@tracing.traced('orders-history')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -44,7 +45,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = tracing.connect(dsn)
     cur = conn.cursor()
     
     cur.execute("SELECT id, guest_email, total_price, payment_status, created_at FROM t_p99209851_math_resources_site.orders ORDER BY created_at DESC")
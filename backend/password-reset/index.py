@@ -6,12 +6,13 @@ Returns: Статус отправки письма или результат с
 '''
 import json
 import os
-import psycopg2
 import bcrypt
 import secrets
 from datetime import datetime, timedelta
 from typing import Dict, Any
+import tracing
 
+@tracing.traced('password-reset')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
@@ -44,7 +45,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     body_data = json.loads(event.get('body', '{}'))
     action = body_data.get('action')
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = tracing.connect(os.environ['DATABASE_URL'])
     cur = conn.cursor()
     
     try:
@@ -85,6 +86,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             smtp_port = int(os.environ.get('SMTP_PORT', '587'))
             smtp_user = os.environ.get('SMTP_USER')
             smtp_password = os.environ.get('SMTP_PASSWORD')
+            smtp_starttls = os.environ.get('SMTP_STARTTLS', 'true') == 'true'
             
             if all([smtp_host, smtp_user, smtp_password]):
                 import smtplib
@@ -118,11 +120,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 msg.attach(MIMEText(html_body, 'html', 'utf-8'))
                 
                 try:
-                    server = smtplib.SMTP(smtp_host, smtp_port)
-                    server.starttls()
-                    server.login(smtp_user, smtp_password)
-                    server.send_message(msg)
-                    server.quit()
+                    with tracing.span('smtp', 'send'):
+                        server = smtplib.SMTP(smtp_host, smtp_port)
+                        if smtp_starttls:
+                            server.starttls()
+                        server.login(smtp_user, smtp_password)
+                        server.send_message(msg)
+                        server.quit()
                 except Exception as e:
                     print(f'Failed to send email: {e}')
             
@@ -5,12 +5,12 @@ Args: event - dict с httpMethod, body (amount, description, return_url)
 Returns: HTTP response с payment_url и confirmation_token для оплаты
 '''
 import json
-import os
 import uuid
-import base64
 from typing import Dict, Any
-import urllib.request
+import yookassa_client
+import tracing
 
+@tracing.traced('payment')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -56,10 +56,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    shop_id = os.environ.get('YOOKASSA_SHOP_ID')
-    secret_key = os.environ.get('YOOKASSA_SECRET_KEY')
+    yookassa = yookassa_client.get_client()
     
-    if not shop_id or not secret_key:
+    if not yookassa:
         return {
             'statusCode': 500,
             'headers': {
@@ -106,22 +105,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     }
     
-    auth_string = f'{shop_id}:{secret_key}'
-    credentials = base64.b64encode(auth_string.encode('utf-8')).decode('ascii')
-    
-    req = urllib.request.Request(
-        'https://api.yookassa.ru/v3/payments',
-        data=json.dumps(payment_data).encode(),
-        headers={
-            'Authorization': f'Basic {credentials}',
-            'Idempotence-Key': idempotence_key,
-            'Content-Type': 'application/json'
-        }
-    )
-    
     try:
-        response = urllib.request.urlopen(req)
-        response_data = json.loads(response.read().decode())
+        payment = yookassa.create_payment(payment_data, idempotence_key)
         
         return {
             'statusCode': 200,
@@ -130,13 +115,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Access-Control-Allow-Origin': '*'
             },
             'body': json.dumps({
-                'payment_url': response_data['confirmation']['confirmation_url'],
-                'payment_id': response_data['id']
+                'payment_url': payment.confirmation_url,
+                'payment_id': payment.id
             }),
             'isBase64Encoded': False
         }
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode()
+    except yookassa_client.YooKassaError as e:
         return {
             'statusCode': 500,
             'headers': {
@@ -145,7 +129,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             },
             'body': json.dumps({
                 'error': 'YooKassa API error',
-                'details': error_body
+                'details': e.body
             }),
             'isBase64Encoded': False
         }
\ No newline at end of file
@@ -0,0 +1,213 @@
+'''
+Business: Сверка успешных платежей ЮКассы с заказами - восстанавливает заказы, для которых не дошёл webhook
+Args: event - dict с httpMethod, headers (X-Admin-Token), queryStringParameters/body (hours - глубина сверки, по умолчанию 72)
+      context - object с request_id
+Returns: HTTP response со статистикой сверки (проверено, не найдено, восстановлено)
+'''
+import json
+import os
+import time
+import threading
+import urllib.request
+import jwt
+import psycopg2
+import psycopg2.pool
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+import yookassa_client
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+WEBHOOK_URL = os.environ.get('YOOKASSA_WEBHOOK_URL', 'https://functions.poehali.dev/12ec2917-d90f-4d0c-9e80-1b0bdcf79273')
+CONCURRENCY = int(os.environ.get('RECONCILE_CONCURRENCY', '4'))
+PAGE_SIZE = 100
+MAX_HOURS = 24 * 30
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def find_missing(db_pool: psycopg2.pool.ThreadedConnectionPool, payment_ids: List[str]) -> List[str]:
+    """Одним запросом на страницу находит платежи без оплаченного заказа"""
+    conn = db_pool.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT p.payment_id
+            FROM unnest(%s::varchar[]) AS p(payment_id)
+            LEFT JOIN t_p99209851_math_resources_site.orders o
+                ON o.payment_id = p.payment_id AND o.payment_status = 'paid'
+            WHERE o.id IS NULL
+            """,
+            (payment_ids,)
+        )
+        missing = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+        return missing
+    finally:
+        db_pool.putconn(conn)
+
+def replay_webhook(payment: yookassa_client.Payment) -> bool:
+    """Передаёт платёж в yookassa-webhook, чтобы заказ создавался тем же путём, что и при обычном уведомлении"""
+    payload = json.dumps({
+        'type': 'notification',
+        'event': 'payment.succeeded',
+        'object': payment.raw
+    }).encode()
+    req = urllib.request.Request(WEBHOOK_URL, data=payload, headers={'Content-Type': 'application/json'})
+    try:
+        with tracing.span('http', 'yookassa-webhook'):
+            urllib.request.urlopen(req, timeout=30)
+        return True
+    except Exception as e:
+        print(f'[RECONCILE] Replay failed for {payment.id}: {str(e)}')
+        return False
+
+def reconcile_page(db_pool: psycopg2.pool.ThreadedConnectionPool, page: List[yookassa_client.Payment]) -> Dict[str, Any]:
+    by_id = {payment.id: payment for payment in page}
+    missing = find_missing(db_pool, list(by_id))
+    recovered = [payment_id for payment_id in missing if replay_webhook(by_id[payment_id])]
+    return {
+        'checked': len(page),
+        'missing': missing,
+        'recovered': recovered
+    }
+
+def reconcile(yookassa: yookassa_client.YooKassaClient, dsn: str, hours: int) -> Dict[str, Any]:
+    """Читает страницы последовательно по курсору, а сверяет их параллельно в ограниченном пуле потоков"""
+    started = time.monotonic()
+    created_from = datetime.utcnow() - timedelta(hours=hours)
+    db_pool = psycopg2.pool.ThreadedConnectionPool(1, CONCURRENCY, dsn, cursor_factory=tracing.TracedCursor)
+    # Не даём чтению API убежать далеко вперёд сверки: в памяти не больше 2 * CONCURRENCY страниц
+    in_flight = threading.BoundedSemaphore(CONCURRENCY * 2)
+    futures = []
+
+    def submit(executor: ThreadPoolExecutor, page: List[yookassa_client.Payment]) -> None:
+        in_flight.acquire()
+        future = executor.submit(reconcile_page, db_pool, page)
+        future.add_done_callback(lambda _: in_flight.release())
+        futures.append(future)
+
+    try:
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+            page: List[yookassa_client.Payment] = []
+            for payment in yookassa.list_payments(
+                status='succeeded',
+                limit=PAGE_SIZE,
+                **{'created_at.gte': created_from.strftime('%Y-%m-%dT%H:%M:%S.000Z')}
+            ):
+                page.append(payment)
+                if len(page) >= PAGE_SIZE:
+                    submit(executor, page)
+                    page = []
+            if page:
+                submit(executor, page)
+        results = [future.result() for future in futures]
+    finally:
+        db_pool.closeall()
+
+    missing = [payment_id for result in results for payment_id in result['missing']]
+    recovered = {payment_id for result in results for payment_id in result['recovered']}
+    return {
+        'checked': sum(result['checked'] for result in results),
+        'missing': len(missing),
+        'recovered': len(recovered),
+        'failed': [payment_id for payment_id in missing if payment_id not in recovered],
+        'elapsed_ms': int((time.monotonic() - started) * 1000)
+    }
+
+@tracing.traced('payments-reconcile')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+    if method not in ['GET', 'POST']:
+        return {
+            'statusCode': 405,
+            'headers': headers,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    if not verify_admin_token(event.get('headers') or {}):
+        return {
+            'statusCode': 401,
+            'headers': headers,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    params = dict(event.get('queryStringParameters') or {})
+    if method == 'POST' and event.get('body'):
+        params.update(json.loads(event['body']))
+
+    try:
+        hours = int(params.get('hours', 72))
+    except (TypeError, ValueError):
+        hours = 0
+
+    if hours < 1 or hours > MAX_HOURS:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': f'hours must be between 1 and {MAX_HOURS}'}),
+            'isBase64Encoded': False
+        }
+
+    dsn = os.environ.get('DATABASE_URL')
+    yookassa = yookassa_client.get_client()
+
+    if not dsn or not yookassa:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': 'Server configuration incomplete'}),
+            'isBase64Encoded': False
+        }
+
+    try:
+        result = reconcile(yookassa, dsn, hours)
+    except yookassa_client.YooKassaError as e:
+        return {
+            'statusCode': 502,
+            'headers': headers,
+            'body': json.dumps({'error': 'YooKassa API error', 'details': e.body}),
+            'isBase64Encoded': False
+        }
+
+    print(f"[RECONCILE] checked={result['checked']} missing={result['missing']} recovered={result['recovered']} elapsed_ms={result['elapsed_ms']}")
+
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(result),
+        'isBase64Encoded': False
+    }
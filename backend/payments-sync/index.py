@@ -0,0 +1,319 @@
+'''
+Business: Синхронизация платежей ЮКассы в локальную таблицу payments (инкрементально по курсору created_at или backfill за период);
+          инкрементальный запуск заодно перечитывает платежи, которые в копии ещё не в конечном статусе
+Args: event - dict с httpMethod, headers (X-Admin-Token или Authorization: Bearer PAYMENTS_SYNC_TOKEN для планировщика),
+      queryStringParameters/body (mode: incremental/backfill, date_from, date_to, concurrency)
+      context - object с request_id
+Returns: HTTP response с количеством синхронизированных платежей и новым курсором
+'''
+import hmac
+import json
+import os
+import jwt
+import psycopg2
+import psycopg2.extras
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
+import yookassa_client
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+SYNC_TOKEN = os.environ.get('PAYMENTS_SYNC_TOKEN', '')
+SYNC_NAME = 'yookassa_payments'
+OVERLAP_MINUTES = int(os.environ.get('PAYMENTS_SYNC_OVERLAP_MINUTES', '60'))
+REFRESH_LIMIT = int(os.environ.get('PAYMENTS_SYNC_REFRESH_LIMIT', '500'))
+REFRESH_CONCURRENCY = 4
+MAX_CONCURRENCY = 8
+PAGE_SIZE = 100
+# Платёж в этих статусах ещё может стать succeeded или canceled
+NON_FINAL_STATUSES = ['pending', 'waiting_for_capture']
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def verify_sync_token(headers: Dict[str, str]) -> bool:
+    """Планировщик присылает статический токен PAYMENTS_SYNC_TOKEN в Authorization: Bearer"""
+    authorization = headers.get('authorization') or headers.get('Authorization') or ''
+    if not SYNC_TOKEN or not authorization.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(authorization[len('Bearer '):], SYNC_TOKEN)
+
+def to_utc(value: datetime) -> datetime:
+    """Все даты синхронизации - наивные UTC, как created_at в таблице; дата со смещением переводится в UTC"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def format_api_time(value: datetime) -> str:
+    return value.strftime('%Y-%m-%dT%H:%M:%S.') + f'{value.microsecond // 1000:03d}Z'
+
+def upsert_payments(cur, payments: List[yookassa_client.Payment]) -> Optional[datetime]:
+    """Сохраняет страницу платежей одним запросом, возвращает максимальный created_at"""
+    if not payments:
+        return None
+
+    rows = psycopg2.extras.execute_values(
+        cur,
+        """
+        INSERT INTO t_p99209851_math_resources_site.payments (id, status, amount, refunded_amount, currency, customer_email, description, metadata, created_at)
+        VALUES %s
+        ON CONFLICT (id) DO UPDATE SET
+            status = EXCLUDED.status,
+            amount = EXCLUDED.amount,
+            refunded_amount = EXCLUDED.refunded_amount,
+            customer_email = EXCLUDED.customer_email,
+            metadata = EXCLUDED.metadata,
+            synced_at = CURRENT_TIMESTAMP
+        RETURNING created_at
+        """,
+        [
+            (
+                p.id,
+                p.status,
+                p.amount.value,
+                p.refunded_amount.value if p.refunded_amount else 0,
+                p.amount.currency,
+                p.customer_email.lower() if p.customer_email else None,
+                p.description,
+                json.dumps(p.metadata),
+                p.created_at
+            )
+            for p in payments
+        ],
+        fetch=True
+    )
+    return max(row[0] for row in rows)
+
+def sync_range(yookassa: yookassa_client.YooKassaClient, conn, params: Dict[str, Any]) -> Tuple[int, Optional[datetime]]:
+    """Постранично выгружает платежи по фильтру и сохраняет каждую страницу"""
+    cur = conn.cursor()
+    synced = 0
+    max_created_at: Optional[datetime] = None
+    page: List[yookassa_client.Payment] = []
+
+    def flush() -> None:
+        nonlocal synced, max_created_at
+        page_max = upsert_payments(cur, page)
+        conn.commit()
+        synced += len(page)
+        if page_max and (max_created_at is None or page_max > max_created_at):
+            max_created_at = page_max
+        page.clear()
+
+    for payment in yookassa.list_payments(limit=PAGE_SIZE, **params):
+        page.append(payment)
+        if len(page) >= PAGE_SIZE:
+            flush()
+    flush()
+
+    cur.close()
+    return synced, max_created_at
+
+def refresh_non_final(yookassa: yookassa_client.YooKassaClient, conn) -> int:
+    """Перечитывает из API платежи, которые в копии всё ещё pending/waiting_for_capture: окно по created_at
+    не увидит платёж, оплаченный или отменённый позже, чем через OVERLAP_MINUTES после создания"""
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT id FROM t_p99209851_math_resources_site.payments WHERE status = ANY(%s) ORDER BY synced_at LIMIT %s",
+        (NON_FINAL_STATUSES, REFRESH_LIMIT)
+    )
+    payment_ids = [row[0] for row in cur.fetchall()]
+    if not payment_ids:
+        cur.close()
+        return 0
+
+    with ThreadPoolExecutor(max_workers=REFRESH_CONCURRENCY) as executor:
+        payments = list(executor.map(yookassa.get_payment, payment_ids))
+
+    for start in range(0, len(payments), PAGE_SIZE):
+        upsert_payments(cur, payments[start:start + PAGE_SIZE])
+    conn.commit()
+    cur.close()
+    return len(payments)
+
+def run_incremental(yookassa: yookassa_client.YooKassaClient, dsn: str) -> Dict[str, Any]:
+    conn = tracing.connect(dsn)
+    cur = conn.cursor()
+
+    cur.execute(
+        "SELECT cursor_created_at FROM t_p99209851_math_resources_site.payments_sync_state WHERE name = %s",
+        (SYNC_NAME,)
+    )
+    row = cur.fetchone()
+    cursor_created_at = to_utc(row[0]) if row and row[0] else None
+
+    # Перечитываем окно перед курсором: статус недавних платежей мог измениться после создания
+    params: Dict[str, Any] = {}
+    if cursor_created_at:
+        params['created_at.gte'] = format_api_time(cursor_created_at - timedelta(minutes=OVERLAP_MINUTES))
+
+    synced, max_created_at = sync_range(yookassa, conn, params)
+    refreshed = refresh_non_final(yookassa, conn)
+    new_cursor = max(filter(None, [cursor_created_at, max_created_at and to_utc(max_created_at)]), default=None)
+
+    cur.execute(
+        """
+        INSERT INTO t_p99209851_math_resources_site.payments_sync_state (name, cursor_created_at, updated_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE SET cursor_created_at = EXCLUDED.cursor_created_at, updated_at = CURRENT_TIMESTAMP
+        """,
+        (SYNC_NAME, new_cursor)
+    )
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return {
+        'mode': 'incremental',
+        'synced': synced,
+        'refreshed': refreshed,
+        'cursor': new_cursor.isoformat() if new_cursor else None
+    }
+
+def run_backfill(yookassa: yookassa_client.YooKassaClient, dsn: str, date_from: datetime, date_to: datetime, concurrency: int) -> Dict[str, Any]:
+    """Делит период на окна и выгружает их параллельно, не более concurrency запросов к API одновременно"""
+    windows_count = concurrency * 4
+    step = (date_to - date_from) / windows_count
+    windows = [(date_from + step * i, date_from + step * (i + 1)) for i in range(windows_count)]
+
+    def sync_window(window: Tuple[datetime, datetime]) -> int:
+        conn = tracing.connect(dsn)
+        try:
+            synced, _ = sync_range(yookassa, conn, {
+                'created_at.gte': format_api_time(window[0]),
+                'created_at.lt': format_api_time(window[1])
+            })
+            return synced
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        synced = sum(executor.map(sync_window, windows))
+
+    return {
+        'mode': 'backfill',
+        'synced': synced,
+        'windows': windows_count
+    }
+
+@tracing.traced('payments-sync')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token, Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+    if method not in ['GET', 'POST']:
+        return {
+            'statusCode': 405,
+            'headers': headers,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    request_headers = event.get('headers') or {}
+    if not verify_admin_token(request_headers) and not verify_sync_token(request_headers):
+        return {
+            'statusCode': 401,
+            'headers': headers,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    params = dict(event.get('queryStringParameters') or {})
+    if method == 'POST' and event.get('body'):
+        params.update(json.loads(event['body']))
+    mode = params.get('mode', 'incremental')
+
+    if mode not in ['incremental', 'backfill']:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Unknown mode'}),
+            'isBase64Encoded': False
+        }
+
+    if mode == 'backfill':
+        try:
+            date_from = to_utc(datetime.fromisoformat(params['date_from']))
+            date_to = to_utc(datetime.fromisoformat(params['date_to'])) if params.get('date_to') else datetime.utcnow()
+        except (KeyError, TypeError, ValueError):
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'Backfill requires date_from (and optional date_to) in ISO format'}),
+                'isBase64Encoded': False
+            }
+        if date_to <= date_from:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'date_to must be later than date_from'}),
+                'isBase64Encoded': False
+            }
+        try:
+            concurrency = int(params.get('concurrency', 4))
+        except (TypeError, ValueError):
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'concurrency must be an integer'}),
+                'isBase64Encoded': False
+            }
+        concurrency = min(max(concurrency, 1), MAX_CONCURRENCY)
+
+    dsn = os.environ.get('DATABASE_URL')
+    yookassa = yookassa_client.get_client()
+
+    if not dsn or not yookassa:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': 'Server configuration incomplete'}),
+            'isBase64Encoded': False
+        }
+
+    try:
+        if mode == 'backfill':
+            result = run_backfill(yookassa, dsn, date_from, date_to, concurrency)
+        else:
+            result = run_incremental(yookassa, dsn)
+    except yookassa_client.YooKassaError as e:
+        return {
+            'statusCode': 502,
+            'headers': headers,
+            'body': json.dumps({'error': 'YooKassa API error', 'details': e.body}),
+            'isBase64Encoded': False
+        }
+
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'body': json.dumps(result),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,238 @@
+'''
+Business: Клиент API ЮКассы - пул keep-alive соединений, таймауты, повторы с джиттером и постраничный обход списков
+Args: shop_id и secret_key магазина (по умолчанию из YOOKASSA_SHOP_ID / YOOKASSA_SECRET_KEY)
+Returns: Типизированные объекты Payment и итераторы по спискам платежей
+'''
+import base64
+import http.client
+import json
+import os
+import random
+import re
+import socket
+import ssl
+import threading
+import time
+import uuid
+import tracing
+from dataclasses import dataclass, field
+from typing import Dict, Any, Iterator, List, Optional
+from urllib.parse import quote, urlencode, urlsplit
+
+API_URL = os.environ.get('YOOKASSA_API_URL', 'https://api.yookassa.ru')
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# id платежа ЮКассы - UUID-подобная строка; всё остальное в путь запроса не попадает
+PAYMENT_ID_PATTERN = re.compile(r'^[0-9A-Za-z-]{1,64}$')
+
+
+def is_valid_payment_id(payment_id: Any) -> bool:
+    return isinstance(payment_id, str) and bool(PAYMENT_ID_PATTERN.match(payment_id))
+
+
+class YooKassaError(Exception):
+    """Ошибка API ЮКассы: status - HTTP-код (None, если ответа не было), body - тело ответа"""
+
+    def __init__(self, status: Optional[int], body: str):
+        super().__init__(f'YooKassa API error {status}: {body}')
+        self.status = status
+        self.body = body
+
+
+@dataclass
+class Amount:
+    value: str
+    currency: str = 'RUB'
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> 'Amount':
+        data = data or {}
+        return cls(value=str(data.get('value', '0')), currency=data.get('currency', 'RUB'))
+
+
+@dataclass
+class Payment:
+    id: str
+    status: str
+    amount: Amount
+    refunded_amount: Optional[Amount] = None
+    description: str = ''
+    created_at: str = ''
+    paid: bool = False
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    customer_email: Optional[str] = None
+    confirmation_url: Optional[str] = None
+    raw: Dict[str, Any] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Payment':
+        metadata = data.get('metadata') or {}
+        receipt_email = (data.get('receipt') or {}).get('customer', {}).get('email')
+        return cls(
+            id=data.get('id', ''),
+            status=data.get('status', ''),
+            amount=Amount.from_dict(data.get('amount')),
+            refunded_amount=Amount.from_dict(data['refunded_amount']) if data.get('refunded_amount') else None,
+            description=data.get('description', ''),
+            created_at=data.get('created_at', ''),
+            paid=bool(data.get('paid', False)),
+            metadata=metadata,
+            customer_email=metadata.get('customer_email') or receipt_email,
+            confirmation_url=(data.get('confirmation') or {}).get('confirmation_url'),
+            raw=data
+        )
+
+
+class ConnectionPool:
+    """Пул постоянных HTTP(S)-соединений к одному хосту, переживает тёплые вызовы функции"""
+
+    def __init__(self, base_url: str, max_size: int = 4):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.max_size = max_size
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context() if self.scheme == 'https' else None
+
+    def acquire(self, timeout: float) -> http.client.HTTPConnection:
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            if self.scheme == 'https':
+                conn = http.client.HTTPSConnection(self.host, self.port, timeout=timeout, context=self._ssl_context)
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def discard(self, conn: http.client.HTTPConnection) -> None:
+        conn.close()
+
+
+class YooKassaClient:
+    def __init__(
+        self,
+        shop_id: str,
+        secret_key: str,
+        base_url: str = API_URL,
+        timeout: float = 10.0,
+        max_retries: int = 3,
+        backoff: float = 0.3,
+        pool_size: int = 4
+    ):
+        credentials = base64.b64encode(f'{shop_id}:{secret_key}'.encode('utf-8')).decode('ascii')
+        self.auth_header = f'Basic {credentials}'
+        self.base_path = urlsplit(base_url).path.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.pool = ConnectionPool(base_url, pool_size)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict[str, Any]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        idempotence_key: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Выполняет запрос с повторами; для POST один и тот же Idempotence-Key используется во всех попытках"""
+        url = self.base_path + path
+        # В имени спана id платежа заменяется шаблоном, чтобы спаны агрегировались по методу API
+        span_path = '/'.join('{id}' if index > 2 else part for index, part in enumerate(path.split('/')))
+        if params:
+            url += '?' + urlencode({k: v for k, v in params.items() if v is not None})
+
+        headers = {
+            'Authorization': self.auth_header,
+            'Content-Type': 'application/json',
+            'Connection': 'keep-alive'
+        }
+        payload = None
+        if method == 'POST':
+            headers['Idempotence-Key'] = idempotence_key or str(uuid.uuid4())
+            payload = json.dumps(body or {}).encode('utf-8')
+
+        call_timeout = timeout or self.timeout
+        last_error: Optional[YooKassaError] = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+            conn = self.pool.acquire(call_timeout)
+            try:
+                with tracing.span('http', f'yookassa {method} {span_path}'):
+                    conn.request(method, url, body=payload, headers=headers)
+                    response = conn.getresponse()
+                    raw_body = response.read().decode('utf-8')
+            except (http.client.HTTPException, socket.timeout, OSError) as e:
+                self.pool.discard(conn)
+                last_error = YooKassaError(None, str(e))
+                continue
+
+            if response.will_close:
+                self.pool.discard(conn)
+            else:
+                self.pool.release(conn)
+
+            if response.status in RETRYABLE_STATUSES:
+                last_error = YooKassaError(response.status, raw_body)
+                continue
+            if response.status >= 400:
+                raise YooKassaError(response.status, raw_body)
+            return json.loads(raw_body) if raw_body else {}
+
+        raise last_error
+
+    def create_payment(self, payment_data: Dict[str, Any], idempotence_key: str, timeout: Optional[float] = None) -> Payment:
+        return Payment.from_dict(self.request('POST', '/v3/payments', body=payment_data, idempotence_key=idempotence_key, timeout=timeout))
+
+    def get_payment(self, payment_id: str, timeout: Optional[float] = None) -> Payment:
+        if not is_valid_payment_id(payment_id):
+            raise ValueError(f'Invalid payment id: {payment_id!r}')
+        return Payment.from_dict(self.request('GET', f'/v3/payments/{quote(payment_id, safe="")}', timeout=timeout))
+
+    def iter_list(self, path: str, params: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """Обходит все страницы списка, следуя за next_cursor"""
+        page_params = dict(params or {})
+        while True:
+            page = self.request('GET', path, params=page_params)
+            for item in page.get('items', []):
+                yield item
+            next_cursor = page.get('next_cursor')
+            if not next_cursor:
+                return
+            page_params['cursor'] = next_cursor
+
+    def list_payments(self, **params: Any) -> Iterator[Payment]:
+        params.setdefault('limit', 100)
+        for item in self.iter_list('/v3/payments', params):
+            yield Payment.from_dict(item)
+
+
+_client: Optional[YooKassaClient] = None
+
+
+def get_client() -> Optional[YooKassaClient]:
+    """Возвращает общий для тёплого контейнера клиент или None, если не заданы credentials"""
+    global _client
+    shop_id = os.environ.get('YOOKASSA_SHOP_ID')
+    secret_key = os.environ.get('YOOKASSA_SECRET_KEY')
+    if not shop_id or not secret_key:
+        return None
+    if _client is None:
+        _client = YooKassaClient(shop_id, secret_key)
+    return _client
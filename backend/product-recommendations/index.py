@@ -0,0 +1,252 @@
+'''
+Business: Офлайн-расчёт рекомендаций «Часто покупают вместе»: разреженная матрица совместных покупок по оплаченным заказам
+          и top-K соседей каждого товара в таблицу product_recommendations
+Args: event - dict с httpMethod (POST), headers (X-Admin-Token), queryStringParameters (top_k, min_co_count)
+      context - object с request_id
+Returns: HTTP response со статистикой расчёта; из командной строки - то же в stdout
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import jwt
+import numpy as np
+import psycopg2
+import psycopg2.extras
+import scipy.sparse as sp
+from typing import Dict, Any, List, Optional, Tuple
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+# Строк order_items в одной порции: ограничивает память под матрицу заказы x товары
+CHUNK_ROWS = int(os.environ.get('RECOMMENDATIONS_CHUNK_ROWS', '100000'))
+DEFAULT_TOP_K = 10
+MAX_TOP_K = 50
+DEFAULT_MIN_CO_COUNT = 2
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def chunk_cooccurrence(rows: np.ndarray, product_ids: np.ndarray) -> Tuple[sp.csr_matrix, int]:
+    """Матрица совместных покупок для порции пар (order_id, product_id): X^T X по бинарной матрице заказы x товары.
+    Матрица симметрична, поэтому хранится только верхний треугольник с диагональю - вдвое меньше памяти под накопление"""
+    positions = np.searchsorted(product_ids, rows[:, 1])
+    positions = np.minimum(positions, len(product_ids) - 1)
+    # Позиции удалённых товаров отбрасываем
+    known = product_ids[positions] == rows[:, 1]
+    order_ids = rows[known, 0]
+    columns = positions[known]
+
+    unique_orders, order_index = np.unique(order_ids, return_inverse=True)
+    incidence = sp.csr_matrix(
+        (np.ones(len(columns), dtype=np.int32), (order_index, columns)),
+        shape=(len(unique_orders), len(product_ids))
+    )
+    # Один товар дважды в заказе считается один раз
+    incidence.sum_duplicates()
+    incidence.data[:] = 1
+
+    return sp.triu(incidence.T @ incidence, format='csr'), len(unique_orders)
+
+def build_cooccurrence(conn, product_ids: np.ndarray) -> Tuple[sp.csr_matrix, int, int]:
+    """Читает позиции оплаченных заказов серверным курсором порциями и накапливает верхний треугольник разреженной матрицы"""
+    cur = conn.cursor(name='recommendations_order_items')
+    cur.itersize = CHUNK_ROWS
+    cur.execute("""
+        SELECT oi.order_id, oi.product_id
+        FROM t_p99209851_math_resources_site.order_items oi
+        JOIN t_p99209851_math_resources_site.orders o ON o.id = oi.order_id
+        WHERE o.payment_status = 'paid' AND oi.product_id IS NOT NULL
+        ORDER BY oi.order_id
+    """)
+
+    cooccurrence = sp.csr_matrix((len(product_ids), len(product_ids)), dtype=np.int32)
+    carry = np.empty((0, 2), dtype=np.int64)
+    orders_count = 0
+    items_count = 0
+
+    while True:
+        fetched = cur.fetchmany(CHUNK_ROWS)
+        if not fetched:
+            break
+        rows = np.concatenate([carry, np.array(fetched, dtype=np.int64)])
+        items_count += len(fetched)
+
+        # Последний заказ порции может продолжиться в следующей - переносим его строки
+        last_order = rows[:, 0] == rows[-1, 0]
+        carry = rows[last_order]
+        rows = rows[~last_order]
+        if len(rows):
+            chunk, chunk_orders = chunk_cooccurrence(rows, product_ids)
+            cooccurrence = cooccurrence + chunk
+            orders_count += chunk_orders
+
+    if len(carry):
+        chunk, chunk_orders = chunk_cooccurrence(carry, product_ids)
+        cooccurrence = cooccurrence + chunk
+        orders_count += chunk_orders
+
+    cur.close()
+    return cooccurrence, orders_count, items_count
+
+def top_neighbours(upper: sp.csr_matrix, top_k: int, min_co_count: int) -> List[Tuple[int, int, int, float, int]]:
+    """Top-K соседей по косинусной мере co / sqrt(n_i * n_j) по верхнему треугольнику матрицы совместных покупок;
+    возвращает (строка, столбец, ранг, score, co_count)"""
+    purchases = upper.diagonal().astype(np.float64)
+    # Диагональ (сколько раз купили сам товар) и редкие пары убираем без перестройки матрицы,
+    # и только потом отражаем треугольник: редких пар большинство, полная матрица получается небольшой
+    row_of_value = np.repeat(np.arange(upper.shape[0], dtype=upper.indices.dtype), np.diff(upper.indptr))
+    upper.data[(row_of_value == upper.indices) | (upper.data < min_co_count)] = 0
+    del row_of_value
+    upper.eliminate_zeros()
+    cooccurrence = (upper + upper.T).tocsr()
+
+    row_of_value = np.repeat(np.arange(cooccurrence.shape[0]), np.diff(cooccurrence.indptr))
+    scores = cooccurrence.data / np.sqrt(purchases[row_of_value] * purchases[cooccurrence.indices])
+
+    neighbours = []
+    for row in range(cooccurrence.shape[0]):
+        start, end = cooccurrence.indptr[row], cooccurrence.indptr[row + 1]
+        if start == end:
+            continue
+        row_scores = scores[start:end]
+        if end - start > top_k:
+            best = np.argpartition(-row_scores, top_k)[:top_k]
+        else:
+            best = np.arange(end - start)
+        best = best[np.argsort(-row_scores[best], kind='stable')]
+        for rank, offset in enumerate(best, start=1):
+            neighbours.append((
+                row,
+                int(cooccurrence.indices[start + offset]),
+                rank,
+                float(row_scores[offset]),
+                int(cooccurrence.data[start + offset])
+            ))
+    return neighbours
+
+def rebuild(dsn: str, top_k: int = DEFAULT_TOP_K, min_co_count: int = DEFAULT_MIN_CO_COUNT) -> Dict[str, Any]:
+    started = time.monotonic()
+    conn = tracing.connect(dsn)
+    cur = conn.cursor()
+
+    try:
+        cur.execute("SELECT id FROM t_p99209851_math_resources_site.products ORDER BY id")
+        product_ids = np.array([row[0] for row in cur.fetchall()], dtype=np.int64)
+        if not len(product_ids):
+            return {'orders': 0, 'items': 0, 'products': 0, 'recommendations': 0, 'elapsed_ms': 0}
+
+        cooccurrence, orders_count, items_count = build_cooccurrence(conn, product_ids)
+        neighbours = top_neighbours(cooccurrence, top_k, min_co_count)
+
+        # Таблица заменяется целиком в одной транзакции: витрина видит либо старый, либо новый расчёт
+        cur.execute("DELETE FROM t_p99209851_math_resources_site.product_recommendations")
+        psycopg2.extras.execute_values(
+            cur,
+            """
+            INSERT INTO t_p99209851_math_resources_site.product_recommendations
+                (product_id, recommended_product_id, rank, score, co_count)
+            VALUES %s
+            """,
+            [
+                (int(product_ids[row]), int(product_ids[column]), rank, score, co_count)
+                for row, column, rank, score, co_count in neighbours
+            ],
+            page_size=1000
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        conn.close()
+
+    return {
+        'orders': orders_count,
+        'items': items_count,
+        'products': len(product_ids),
+        'recommendations': len(neighbours),
+        'elapsed_ms': int((time.monotonic() - started) * 1000)
+    }
+
+@tracing.traced('product-recommendations')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'POST')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers_response = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    if not verify_admin_token(event.get('headers', {})):
+        return {
+            'statusCode': 401,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+    try:
+        top_k = min(max(int(params.get('top_k', DEFAULT_TOP_K)), 1), MAX_TOP_K)
+        min_co_count = max(int(params.get('min_co_count', DEFAULT_MIN_CO_COUNT)), 1)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'top_k and min_co_count must be integers'}),
+            'isBase64Encoded': False
+        }
+
+    result = rebuild(os.environ['DATABASE_URL'], top_k, min_co_count)
+
+    return {
+        'statusCode': 200,
+        'headers': headers_response,
+        'body': json.dumps(result),
+        'isBase64Encoded': False
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Пересчёт рекомендаций «Часто покупают вместе»')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+    parser.add_argument('--min-co-count', type=int, default=DEFAULT_MIN_CO_COUNT)
+    args = parser.parse_args()
+
+    json.dump(rebuild(os.environ['DATABASE_URL'], args.top_k, args.min_co_count), sys.stdout)
+    sys.stdout.write('\n')
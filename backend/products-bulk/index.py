@@ -0,0 +1,525 @@
+'''
+Business: Массовые операции с товарами: импорт и экспорт (CSV/JSONL) через COPY с обновлением по external_key,
+          пакетные изменения и удаление одной транзакцией
+Args: event - dict с httpMethod, headers (X-Admin-Token), queryStringParameters (action: import/export/update/delete, format, strict),
+      body (файл импорта или JSON с updates / filter+set / ids)
+      context - object с request_id
+Returns: HTTP response со статистикой импорта, файлом выгрузки каталога или результатом по каждому товару
+'''
+import base64
+import csv
+import io
+import json
+import os
+import jwt
+import psycopg2
+import psycopg2.extras
+import urllib.error
+import urllib.request
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+MAX_REPORTED_ERRORS = 100
+COPY_NULL = '\\N'
+CATALOG_PUBLISH_URL = os.environ.get('CATALOG_PUBLISH_URL')
+CATALOG_PUBLISH_TIMEOUT = 3
+
+PRODUCT_COLUMNS = [
+    'external_key', 'title', 'description', 'price', 'category', 'type',
+    'sample_pdf_url', 'full_pdf_with_answers_url', 'full_pdf_without_answers_url',
+    'trainer1_url', 'trainer2_url', 'trainer3_url', 'is_free', 'preview_image_url'
+]
+URL_COLUMNS = [
+    'sample_pdf_url', 'full_pdf_with_answers_url', 'full_pdf_without_answers_url',
+    'trainer1_url', 'trainer2_url', 'trainer3_url', 'preview_image_url'
+]
+TEXT_LIMITS = {'external_key': 100, 'title': 255, 'category': 50, 'type': 50}
+UPDATABLE_COLUMNS = {
+    'title': 'varchar',
+    'description': 'text',
+    'price': 'integer',
+    'category': 'varchar',
+    'type': 'varchar',
+    'sample_pdf_url': 'text',
+    'full_pdf_with_answers_url': 'text',
+    'full_pdf_without_answers_url': 'text',
+    'trainer1_url': 'text',
+    'trainer2_url': 'text',
+    'trainer3_url': 'text',
+    'is_free': 'boolean',
+    'preview_image_url': 'text'
+}
+FILTER_COLUMNS = ['category', 'type', 'is_free']
+MAX_BATCH_SIZE = 50000
+MAX_PRODUCT_ID = 2147483647
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value or '').strip().lower()
+    if text in ('', '0', 'false', 'no', 'нет'):
+        return False
+    if text in ('1', 'true', 'yes', 'да'):
+        return True
+    raise ValueError(f'is_free: invalid boolean {value!r}')
+
+def parse_product_id(value: Any) -> int:
+    """id товара из JSON: целое число или строка из цифр в пределах INTEGER; null, дроби и bool - ошибка"""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'invalid id {value!r}')
+    try:
+        product_id = int(value)
+    except ValueError:
+        raise ValueError(f'invalid id {value!r}')
+    if product_id < 1 or product_id > MAX_PRODUCT_ID:
+        raise ValueError(f'invalid id {value!r}')
+    return product_id
+
+def validate_row(raw: Dict[str, Any]) -> List[Any]:
+    """Приводит строку импорта к значениям колонок PRODUCT_COLUMNS или бросает ValueError"""
+    row: Dict[str, Any] = {}
+
+    for column, max_length in TEXT_LIMITS.items():
+        value = str(raw.get(column) or '').strip()
+        if not value:
+            raise ValueError(f'{column} is required')
+        if len(value) > max_length:
+            raise ValueError(f'{column} is longer than {max_length} characters')
+        row[column] = value
+
+    row['description'] = str(raw.get('description') or '')
+
+    try:
+        row['price'] = int(raw.get('price') or 0)
+    except (TypeError, ValueError):
+        raise ValueError(f"price: invalid integer {raw.get('price')!r}")
+    if row['price'] < 0:
+        raise ValueError('price must not be negative')
+
+    for column in URL_COLUMNS:
+        value = str(raw.get(column) or '').strip()
+        row[column] = value or None
+
+    row['is_free'] = parse_bool(raw.get('is_free'))
+    return [row[column] for column in PRODUCT_COLUMNS]
+
+def iter_import_rows(body: str, import_format: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Построчно читает файл импорта, не разбирая его целиком"""
+    stream = io.StringIO(body)
+    if import_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, {'__error__': f'invalid JSON: {e.msg}'}
+
+def build_copy_buffer(body: str, import_format: str) -> Tuple[io.StringIO, int, List[Dict[str, Any]], int]:
+    """Один проход по файлу: валидные строки пишутся в буфер для COPY, ошибки собираются в отчёт"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    valid = 0
+    errors: List[Dict[str, Any]] = []
+    error_count = 0
+
+    for line_number, raw in iter_import_rows(body, import_format):
+        try:
+            if '__error__' in raw:
+                raise ValueError(raw['__error__'])
+            values = validate_row(raw)
+        except ValueError as e:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': line_number, 'error': str(e)})
+            continue
+        writer.writerow([line_number] + [COPY_NULL if value is None else value for value in values])
+        valid += 1
+
+    buffer.seek(0)
+    return buffer, valid, errors, error_count
+
+def import_products(conn, buffer: io.StringIO) -> Tuple[int, int, List[Tuple[int, str]]]:
+    """COPY в staging-таблицу и слияние с products одной транзакцией;
+    возвращает (создано, обновлено, перекрытые повтором external_key строки)"""
+    columns = ', '.join(PRODUCT_COLUMNS)
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in PRODUCT_COLUMNS if column != 'external_key')
+    cur = conn.cursor()
+
+    cur.execute("""
+        CREATE TEMP TABLE products_import (
+            line_number INTEGER,
+            external_key VARCHAR(100),
+            title VARCHAR(255),
+            description TEXT,
+            price INTEGER,
+            category VARCHAR(50),
+            type VARCHAR(50),
+            sample_pdf_url TEXT,
+            full_pdf_with_answers_url TEXT,
+            full_pdf_without_answers_url TEXT,
+            trainer1_url TEXT,
+            trainer2_url TEXT,
+            trainer3_url TEXT,
+            is_free BOOLEAN,
+            preview_image_url TEXT
+        ) ON COMMIT DROP
+    """)
+    cur.copy_expert(
+        f"COPY products_import (line_number, {columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+        buffer
+    )
+    # При повторе external_key в файле побеждает последняя строка: ON CONFLICT не может изменить одну строку дважды
+    cur.execute("""
+        DELETE FROM products_import earlier
+        USING products_import later
+        WHERE later.external_key = earlier.external_key AND later.line_number > earlier.line_number
+        RETURNING earlier.line_number, earlier.external_key
+    """)
+    superseded = sorted(cur.fetchall())
+    cur.execute(f"""
+        WITH upserted AS (
+            INSERT INTO t_p99209851_math_resources_site.products ({columns})
+            SELECT {columns}
+            FROM products_import
+            ON CONFLICT (external_key) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM upserted
+    """)
+    created, updated = cur.fetchone()
+    conn.commit()
+    cur.close()
+    return created, updated, superseded
+
+def validate_changes(changes: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверяет частичное изменение товара: только известные колонки и допустимые значения"""
+    unknown = set(changes) - set(UPDATABLE_COLUMNS)
+    if unknown:
+        raise ValueError(f"unknown columns: {', '.join(sorted(unknown))}")
+    if not changes:
+        raise ValueError('no columns to update')
+
+    result: Dict[str, Any] = {}
+    for column, value in changes.items():
+        if column in TEXT_LIMITS:
+            value = str(value or '').strip()
+            if not value:
+                raise ValueError(f'{column} must not be empty')
+            if len(value) > TEXT_LIMITS[column]:
+                raise ValueError(f'{column} is longer than {TEXT_LIMITS[column]} characters')
+        elif column == 'price':
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ValueError('price must be a non-negative integer')
+        elif column == 'is_free':
+            value = parse_bool(value)
+        elif column == 'description':
+            value = str(value or '')
+        elif value is not None:
+            value = str(value).strip() or None
+        result[column] = value
+    return result
+
+def apply_updates(cur, updates: List[Tuple[int, Dict[str, Any]]]) -> set:
+    """Обновляет товары через UPDATE ... FROM (VALUES ...), по одному запросу на набор колонок"""
+    groups: Dict[Tuple[str, ...], List[Tuple[int, Dict[str, Any]]]] = {}
+    for product_id, changes in updates:
+        groups.setdefault(tuple(sorted(changes)), []).append((product_id, changes))
+
+    updated_ids = set()
+    for columns, rows in groups.items():
+        assignments = ', '.join(f'{column} = v.{column}' for column in columns)
+        template = '(' + ', '.join(['%s::integer'] + [f'%s::{UPDATABLE_COLUMNS[column]}' for column in columns]) + ')'
+        result = psycopg2.extras.execute_values(
+            cur,
+            f"""
+            UPDATE t_p99209851_math_resources_site.products p
+            SET {assignments}, updated_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(id, {', '.join(columns)})
+            WHERE p.id = v.id
+            RETURNING p.id
+            """,
+            [[product_id] + [changes[column] for column in columns] for product_id, changes in rows],
+            template=template,
+            page_size=1000,
+            fetch=True
+        )
+        updated_ids.update(row[0] for row in result)
+    return updated_ids
+
+def apply_filtered_update(cur, filters: Dict[str, Any], changes: Dict[str, Any]) -> List[int]:
+    """Одно изменение для всех товаров, подходящих под фильтр (например, цена для категории)"""
+    conditions = ' AND '.join(f'{column} = %s' for column in filters)
+    assignments = ', '.join(f'{column} = %s' for column in changes)
+    cur.execute(
+        f"UPDATE t_p99209851_math_resources_site.products SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE {conditions} RETURNING id",
+        list(changes.values()) + list(filters.values())
+    )
+    return sorted(row[0] for row in cur.fetchall())
+
+def parse_batch(action: str, body_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Проверяет весь пакет до первого запроса к БД, чтобы не применять его частично"""
+    if not isinstance(body_data, dict):
+        raise ValueError('body must be a JSON object')
+
+    if action == 'delete':
+        ids = body_data.get('ids')
+        if not isinstance(ids, list) or not ids:
+            raise ValueError('ids must be a non-empty list')
+        if len(ids) > MAX_BATCH_SIZE:
+            raise ValueError(f'at most {MAX_BATCH_SIZE} ids per request')
+        parsed_ids = []
+        for index, product_id in enumerate(ids):
+            try:
+                parsed_ids.append(parse_product_id(product_id))
+            except ValueError as e:
+                raise ValueError(f'ids[{index}]: {e}')
+        return {'ids': list(dict.fromkeys(parsed_ids))}
+
+    if 'filter' in body_data:
+        filters = body_data.get('filter') or {}
+        if not isinstance(filters, dict) or not filters or set(filters) - set(FILTER_COLUMNS):
+            raise ValueError(f"filter must use only: {', '.join(FILTER_COLUMNS)}")
+        changes = body_data.get('set') or {}
+        if not isinstance(changes, dict):
+            raise ValueError('set must be an object')
+        # Значения фильтра проходят те же проверки, что и изменения: иначе {"is_free": "abc"} упал бы в БД
+        try:
+            filters = validate_changes(filters)
+        except ValueError as e:
+            raise ValueError(f'filter: {e}')
+        return {'filter': filters, 'set': validate_changes(changes)}
+
+    updates = body_data.get('updates')
+    if not isinstance(updates, list) or not updates:
+        raise ValueError('updates must be a non-empty list')
+    if len(updates) > MAX_BATCH_SIZE:
+        raise ValueError(f'at most {MAX_BATCH_SIZE} updates per request')
+
+    # Один товар дважды в VALUES - UPDATE ... FROM применит случайную из строк; правки одного id сливаются,
+    # для одной колонки побеждает более поздняя
+    parsed: Dict[int, Dict[str, Any]] = {}
+    for index, update in enumerate(updates):
+        try:
+            changes = dict(update)
+            if 'id' not in changes:
+                raise ValueError('id is required')
+            product_id = parse_product_id(changes.pop('id'))
+            parsed.setdefault(product_id, {}).update(validate_changes(changes))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'updates[{index}]: {e}')
+    return {'updates': list(parsed.items())}
+
+def export_products(conn, export_format: str) -> str:
+    cur = conn.cursor()
+    out = io.StringIO()
+
+    if export_format == 'csv':
+        cur.copy_expert(
+            f"COPY (SELECT id, {', '.join(PRODUCT_COLUMNS)} FROM t_p99209851_math_resources_site.products ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)",
+            out
+        )
+    else:
+        cur.execute(f"SELECT id, {', '.join(PRODUCT_COLUMNS)} FROM t_p99209851_math_resources_site.products ORDER BY id")
+        names = ['id'] + PRODUCT_COLUMNS
+        for row in cur:
+            out.write(json.dumps(dict(zip(names, row)), ensure_ascii=False))
+            out.write('\n')
+
+    cur.close()
+    return out.getvalue()
+
+def notify_catalog_changed(request_headers: Dict[str, str]) -> None:
+    """Просит catalog-publish обновить снимок каталога в S3; сбой публикации не отменяет уже сохранённую правку"""
+    if not CATALOG_PUBLISH_URL:
+        return
+    token = request_headers.get('x-admin-token') or request_headers.get('X-Admin-Token')
+    req = urllib.request.Request(
+        CATALOG_PUBLISH_URL,
+        data=b'{}',
+        headers={'Content-Type': 'application/json', 'X-Admin-Token': token},
+        method='POST'
+    )
+    try:
+        with tracing.span('http', 'catalog-publish'), urllib.request.urlopen(req, timeout=CATALOG_PUBLISH_TIMEOUT) as response:
+            response.read()
+    except (urllib.error.URLError, OSError) as e:
+        print(f'Catalog publish request failed: {e}')
+
+@tracing.traced('products-bulk')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers_response = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    if not verify_admin_token(event.get('headers', {})):
+        return {
+            'statusCode': 401,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+    action = params.get('action')
+    data_format = params.get('format', 'csv')
+
+    if data_format not in FORMATS:
+        return {
+            'statusCode': 400,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Unknown format'}),
+            'isBase64Encoded': False
+        }
+
+    if method == 'GET' and action == 'export':
+        conn = tracing.connect(os.environ['DATABASE_URL'])
+        try:
+            body = export_products(conn, data_format)
+        finally:
+            conn.close()
+
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Content-Type': FORMATS[data_format],
+                'Content-Disposition': f'attachment; filename="products.{data_format}"',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': body,
+            'isBase64Encoded': False
+        }
+
+    if method == 'POST' and action == 'import':
+        body = event.get('body') or ''
+        if event.get('isBase64Encoded'):
+            body = base64.b64decode(body).decode('utf-8')
+
+        buffer, valid, errors, error_count = build_copy_buffer(body.lstrip('\ufeff'), data_format)
+
+        if error_count and params.get('strict') == 'true':
+            return {
+                'statusCode': 400,
+                'headers': headers_response,
+                'body': json.dumps({'error': 'Validation failed', 'invalid': error_count, 'errors': errors}),
+                'isBase64Encoded': False
+            }
+
+        created, updated = 0, 0
+        superseded: List[Tuple[int, str]] = []
+        if valid:
+            conn = tracing.connect(os.environ['DATABASE_URL'])
+            try:
+                created, updated, superseded = import_products(conn, buffer)
+            finally:
+                conn.close()
+            if created or updated:
+                notify_catalog_changed(event.get('headers', {}))
+
+        return {
+            'statusCode': 200,
+            'headers': headers_response,
+            'body': json.dumps({
+                'created': created,
+                'updated': updated,
+                'invalid': error_count,
+                'errors': errors,
+                'duplicates': len(superseded),
+                'superseded': [
+                    {'line': line_number, 'external_key': external_key}
+                    for line_number, external_key in superseded[:MAX_REPORTED_ERRORS]
+                ]
+            }),
+            'isBase64Encoded': False
+        }
+
+    if method == 'POST' and action in ['update', 'delete']:
+        try:
+            batch = parse_batch(action, json.loads(event.get('body') or '{}'))
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': headers_response,
+                'body': json.dumps({'error': str(e)}),
+                'isBase64Encoded': False
+            }
+
+        conn = tracing.connect(os.environ['DATABASE_URL'])
+        cur = conn.cursor()
+        try:
+            if action == 'delete':
+                cur.execute(
+                    "DELETE FROM t_p99209851_math_resources_site.products WHERE id = ANY(%s) RETURNING id",
+                    (batch['ids'],)
+                )
+                deleted_ids = {row[0] for row in cur.fetchall()}
+                results = [{'id': product_id, 'status': 'deleted' if product_id in deleted_ids else 'not_found'} for product_id in batch['ids']]
+            elif 'filter' in batch:
+                results = [{'id': product_id, 'status': 'updated'} for product_id in apply_filtered_update(cur, batch['filter'], batch['set'])]
+            else:
+                updated_ids = apply_updates(cur, batch['updates'])
+                results = [{'id': product_id, 'status': 'updated' if product_id in updated_ids else 'not_found'} for product_id, _ in batch['updates']]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cur.close()
+            conn.close()
+
+        affected = sum(1 for result in results if result['status'] != 'not_found')
+        if affected:
+            notify_catalog_changed(event.get('headers', {}))
+
+        return {
+            'statusCode': 200,
+            'headers': headers_response,
+            'body': json.dumps({
+                'affected': affected,
+                'results': results
+            }),
+            'isBase64Encoded': False
+        }
+
+    return {
+        'statusCode': 405,
+        'headers': headers_response,
+        'body': json.dumps({'error': 'Method not allowed'}),
+        'isBase64Encoded': False
+    }
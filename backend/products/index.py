@@ -5,11 +5,45 @@ Returns: HTTP response с JSON данными
 '''
 import json
 import os
-import psycopg2
 import jwt
-from typing import Dict, Any, Optional
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import tracing
 
 ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+CATALOG_PUBLISH_URL = os.environ.get('CATALOG_PUBLISH_URL')
+CATALOG_PUBLISH_TIMEOUT = 3
+
+PATCH_COLUMNS = [
+    'title', 'description', 'price', 'category', 'type', 'sample_pdf_url',
+    'full_pdf_with_answers_url', 'full_pdf_without_answers_url',
+    'trainer1_url', 'trainer2_url', 'trainer3_url', 'is_free', 'preview_image_url'
+]
+NULLABLE_COLUMNS = [
+    'sample_pdf_url', 'full_pdf_with_answers_url', 'full_pdf_without_answers_url',
+    'trainer1_url', 'trainer2_url', 'trainer3_url', 'preview_image_url'
+]
+NOT_NULL_COLUMNS = ['title', 'description', 'category', 'type']
+
+# Виды файлов из product_assets, которые отдаются в каталоге (full_pdf - устаревшая ссылка только для выдачи)
+ASSET_KINDS = ['sample_pdf', 'full_pdf_with_answers', 'full_pdf_without_answers', 'trainer']
+TRAINER_POSITIONS = [1, 2, 3]
+
+PRODUCT_SELECT = 'id, title, description, price, category, type, is_free, preview_image_url, updated_at'
+
+DEFAULT_RECOMMENDATIONS = 6
+MAX_RECOMMENDATIONS = 20
+RECOMMENDATIONS_TTL_SECONDS = 600
+RECOMMENDATIONS_CACHE_MAX_PRODUCTS = 2000
+
+# product_id -> (время истечения, рекомендации); таблица пересчитывается офлайн, поэтому TTL достаточно
+_recommendations_cache: Dict[int, Tuple[float, List[Dict[str, Any]]]] = {}
+
+# Подготовленный текст UPDATE для каждого набора колонок (и с проверкой версии, и без)
+_patch_statements: Dict[Tuple[Tuple[str, ...], bool], str] = {}
 
 def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
     """Проверяет JWT токен админа из заголовка X-Admin-Token"""
@@ -26,6 +60,171 @@ def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
     except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
         return None
 
+def notify_catalog_changed(request_headers: Dict[str, str]) -> None:
+    """Просит catalog-publish обновить снимок каталога в S3; сбой публикации не отменяет уже сохранённую правку"""
+    if not CATALOG_PUBLISH_URL:
+        return
+    token = request_headers.get('x-admin-token') or request_headers.get('X-Admin-Token')
+    req = urllib.request.Request(
+        CATALOG_PUBLISH_URL,
+        data=b'{}',
+        headers={'Content-Type': 'application/json', 'X-Admin-Token': token},
+        method='POST'
+    )
+    try:
+        with tracing.span('http', 'catalog-publish'), urllib.request.urlopen(req, timeout=CATALOG_PUBLISH_TIMEOUT) as response:
+            response.read()
+    except (urllib.error.URLError, OSError) as e:
+        print(f'Catalog publish request failed: {e}')
+
+def asset_field(kind: str, position: int) -> str:
+    """Имя поля в ответе API для файла товара (trainer с позицией 2 -> trainer2_url)"""
+    if kind == 'trainer':
+        return f'trainer{position}_url'
+    return f'{kind}_url'
+
+def parse_asset_kinds(query_params: Optional[Dict[str, str]]) -> List[str]:
+    """Какие виды файлов нужны странице: ?assets=sample_pdf,trainer, по умолчанию все"""
+    requested = (query_params or {}).get('assets')
+    if requested is None:
+        return ASSET_KINDS
+    return [kind for kind in requested.split(',') if kind in ASSET_KINDS]
+
+def load_assets(cur, kinds: List[str], product_ids: Optional[List[int]] = None) -> Dict[int, Dict[str, str]]:
+    """Загружает ссылки на файлы нужных видов, сгруппированные по товару"""
+    if not kinds:
+        return {}
+    query = 'SELECT product_id, kind, position, url FROM product_assets WHERE kind = ANY(%s)'
+    params: List[Any] = [kinds]
+    if product_ids is not None:
+        query += ' AND product_id = ANY(%s)'
+        params.append(product_ids)
+    cur.execute(query, params)
+    
+    assets: Dict[int, Dict[str, str]] = {}
+    for product_id, kind, position, url in cur.fetchall():
+        assets.setdefault(product_id, {})[asset_field(kind, position)] = url
+    return assets
+
+def product_to_dict(row: tuple, kinds: List[str], assets: Dict[str, str]) -> Dict[str, Any]:
+    product = {
+        'id': row[0],
+        'title': row[1],
+        'description': row[2],
+        'price': row[3],
+        'category': row[4],
+        'type': row[5],
+        'is_free': row[6],
+        'preview_image_url': row[7],
+        'updated_at': row[8].isoformat() if row[8] else None
+    }
+    for kind in kinds:
+        positions = TRAINER_POSITIONS if kind == 'trainer' else [1]
+        for position in positions:
+            field_name = asset_field(kind, position)
+            product[field_name] = assets.get(field_name)
+    return product
+
+def get_recommendations(product_id: int) -> List[Dict[str, Any]]:
+    """Рекомендации «Часто покупают вместе» из тёплого кэша, при промахе - из product_recommendations"""
+    now = time.monotonic()
+    entry = _recommendations_cache.get(product_id)
+    hit = bool(entry and entry[0] > now)
+    tracing.cache_lookup('recommendations', hit)
+    if hit:
+        return entry[1]
+    
+    conn = tracing.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            SELECT p.id, p.title, p.price, p.category, p.type, p.is_free, p.preview_image_url, r.score
+            FROM product_recommendations r
+            JOIN products p ON p.id = r.recommended_product_id
+            WHERE r.product_id = %s
+            ORDER BY r.rank
+            LIMIT %s
+            """,
+            (product_id, MAX_RECOMMENDATIONS)
+        )
+        recommendations = [
+            {
+                'id': row[0],
+                'title': row[1],
+                'price': row[2],
+                'category': row[3],
+                'type': row[4],
+                'is_free': row[5],
+                'preview_image_url': row[6],
+                'score': round(row[7], 4)
+            }
+            for row in cur.fetchall()
+        ]
+    finally:
+        cur.close()
+        conn.close()
+    
+    if len(_recommendations_cache) >= RECOMMENDATIONS_CACHE_MAX_PRODUCTS:
+        _recommendations_cache.clear()
+    _recommendations_cache[product_id] = (now + RECOMMENDATIONS_TTL_SECONDS, recommendations)
+    return recommendations
+
+def get_patch_statement(columns: Tuple[str, ...], check_version: bool) -> str:
+    """Собирает UPDATE только по переданным колонкам и кэширует его на время жизни контейнера"""
+    key = (columns, check_version)
+    if key not in _patch_statements:
+        assignments = ', '.join(f'{column} = %s' for column in columns)
+        version_check = ' AND updated_at = %s' if check_version else ''
+        _patch_statements[key] = f"UPDATE products SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = %s{version_check} RETURNING updated_at"
+    return _patch_statements[key]
+
+def parse_patch(body_data: Dict[str, Any]) -> Tuple[int, Tuple[str, ...], List[Any], Optional[datetime]]:
+    """Проверяет PATCH до запроса к БД: id, значения колонок и expected_updated_at; ошибка - ValueError с текстом для 400"""
+    product_id = body_data.get('id')
+    if isinstance(product_id, bool) or not isinstance(product_id, (int, str)):
+        raise ValueError('Product id required')
+    try:
+        product_id = int(product_id)
+    except ValueError:
+        raise ValueError('Product id must be an integer')
+    
+    columns = tuple(column for column in PATCH_COLUMNS if column in body_data)
+    if not columns:
+        raise ValueError('No fields to update')
+    
+    values = []
+    for column in columns:
+        value = body_data[column]
+        if column in NULLABLE_COLUMNS:
+            if value is not None and not isinstance(value, str):
+                raise ValueError(f'{column} must be a string or null')
+            value = value or None
+        elif column in NOT_NULL_COLUMNS:
+            if value is None:
+                raise ValueError(f'{column} must not be null')
+            if not isinstance(value, str):
+                raise ValueError(f'{column} must be a string')
+        elif column == 'price':
+            value = value or 0
+            if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+                raise ValueError('price must be a non-negative integer')
+        elif column == 'is_free':
+            if not isinstance(value, bool):
+                raise ValueError('is_free must be a boolean')
+        values.append(value)
+    
+    expected_updated_at = body_data.get('expected_updated_at')
+    if expected_updated_at is None or expected_updated_at == '':
+        return product_id, columns, values, None
+    if not isinstance(expected_updated_at, str):
+        raise ValueError('expected_updated_at must be an ISO 8601 timestamp')
+    try:
+        return product_id, columns, values, datetime.fromisoformat(expected_updated_at)
+    except ValueError:
+        raise ValueError('expected_updated_at must be an ISO 8601 timestamp')
+
+@tracing.traced('products')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -34,7 +233,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, PATCH, DELETE, OPTIONS',
                 'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
                 'Access-Control-Max-Age': '86400'
             },
@@ -47,8 +246,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
-    # Для POST, PUT, DELETE требуется авторизация админа
-    if method in ['POST', 'PUT', 'DELETE']:
+    # Для POST, PUT, PATCH, DELETE требуется авторизация админа
+    if method in ['POST', 'PUT', 'PATCH', 'DELETE']:
         request_headers = event.get('headers', {})
         admin_payload = verify_admin_token(request_headers)
         
@@ -60,7 +259,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    query_params = event.get('queryStringParameters') or {}
+    if method == 'GET' and query_params.get('recommendations'):
+        try:
+            product_id = int(query_params['recommendations'])
+            limit = min(max(int(query_params.get('limit', DEFAULT_RECOMMENDATIONS)), 1), MAX_RECOMMENDATIONS)
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': headers_response,
+                'body': json.dumps({'error': 'recommendations and limit must be integers'}),
+                'isBase64Encoded': False
+            }
+        
+        return {
+            'statusCode': 200,
+            'headers': {**headers_response, 'Cache-Control': 'public, max-age=300'},
+            'body': json.dumps(get_recommendations(product_id)[:limit]),
+            'isBase64Encoded': False
+        }
+    
+    conn = tracing.connect(os.environ['DATABASE_URL'])
     cur = conn.cursor()
     
     try:
@@ -71,16 +290,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             
             if stats_request == 'true':
                 cur.execute('''
-                    SELECT 
-                        COUNT(*) as total_products,
-                        SUM(CASE WHEN sample_pdf_url IS NOT NULL AND sample_pdf_url != '' THEN 1 ELSE 0 END) +
-                        SUM(CASE WHEN full_pdf_with_answers_url IS NOT NULL AND full_pdf_with_answers_url != '' THEN 1 ELSE 0 END) +
-                        SUM(CASE WHEN full_pdf_without_answers_url IS NOT NULL AND full_pdf_without_answers_url != '' THEN 1 ELSE 0 END) +
-                        SUM(CASE WHEN trainer1_url IS NOT NULL AND trainer1_url != '' THEN 1 ELSE 0 END) +
-                        SUM(CASE WHEN trainer2_url IS NOT NULL AND trainer2_url != '' THEN 1 ELSE 0 END) +
-                        SUM(CASE WHEN trainer3_url IS NOT NULL AND trainer3_url != '' THEN 1 ELSE 0 END) as total_files
-                    FROM products
-                ''')
+                    SELECT
+                        (SELECT COUNT(*) FROM products) as total_products,
+                        (SELECT COUNT(*) FROM product_assets WHERE kind = ANY(%s)) as total_files
+                ''', (ASSET_KINDS,))
                 stats_row = cur.fetchone()
                 stats = {
                     'total_products': stats_row[0] or 0,
@@ -93,29 +306,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
+            kinds = parse_asset_kinds(query_params)
+            
             if product_id:
                 cur.execute(
-                    "SELECT id, title, description, price, category, type, sample_pdf_url, full_pdf_with_answers_url, full_pdf_without_answers_url, trainer1_url, trainer2_url, trainer3_url, is_free, preview_image_url FROM products WHERE id = %s",
+                    f"SELECT {PRODUCT_SELECT} FROM products WHERE id = %s",
                     (int(product_id),)
                 )
                 row = cur.fetchone()
                 if row:
-                    product = {
-                        'id': row[0],
-                        'title': row[1],
-                        'description': row[2],
-                        'price': row[3],
-                        'category': row[4],
-                        'type': row[5],
-                        'sample_pdf_url': row[6],
-                        'full_pdf_with_answers_url': row[7],
-                        'full_pdf_without_answers_url': row[8],
-                        'trainer1_url': row[9],
-                        'trainer2_url': row[10],
-                        'trainer3_url': row[11],
-                        'is_free': row[12],
-                        'preview_image_url': row[13]
-                    }
+                    assets = load_assets(cur, kinds, [row[0]])
+                    product = product_to_dict(row, kinds, assets.get(row[0], {}))
                     return {
                         'statusCode': 200,
                         'headers': headers_response,
@@ -130,27 +331,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
             else:
-                cur.execute('SELECT id, title, description, price, category, type, sample_pdf_url, full_pdf_with_answers_url, full_pdf_without_answers_url, trainer1_url, trainer2_url, trainer3_url, is_free, preview_image_url FROM products ORDER BY id')
+                cur.execute(f'SELECT {PRODUCT_SELECT} FROM products ORDER BY id')
                 rows = cur.fetchall()
-                products = [
-                    {
-                        'id': row[0],
-                        'title': row[1],
-                        'description': row[2],
-                        'price': row[3],
-                        'category': row[4],
-                        'type': row[5],
-                        'sample_pdf_url': row[6],
-                        'full_pdf_with_answers_url': row[7],
-                        'full_pdf_without_answers_url': row[8],
-                        'trainer1_url': row[9],
-                        'trainer2_url': row[10],
-                        'trainer3_url': row[11],
-                        'is_free': row[12],
-                        'preview_image_url': row[13]
-                    }
-                    for row in rows
-                ]
+                assets = load_assets(cur, kinds)
+                products = [product_to_dict(row, kinds, assets.get(row[0], {})) for row in rows]
                 return {
                     'statusCode': 200,
                     'headers': headers_response,
@@ -185,6 +369,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             )
             new_id = cur.fetchone()[0]
             conn.commit()
+            notify_catalog_changed(request_headers)
             
             return {
                 'statusCode': 201,
@@ -216,12 +401,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 UPDATE products 
                 SET title = %s, description = %s, price = %s, category = %s, type = %s, 
                     sample_pdf_url = %s, full_pdf_with_answers_url = %s, full_pdf_without_answers_url = %s, 
-                    trainer1_url = %s, trainer2_url = %s, trainer3_url = %s, is_free = %s, preview_image_url = %s
+                    trainer1_url = %s, trainer2_url = %s, trainer3_url = %s, is_free = %s, preview_image_url = %s,
+                    updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
                 """,
                 (title, description, price, category, product_type, sample_pdf_url, full_pdf_with_answers_url, full_pdf_without_answers_url, trainer1_url, trainer2_url, trainer3_url, is_free, preview_image_url, product_id)
             )
             conn.commit()
+            notify_catalog_changed(request_headers)
             
             return {
                 'statusCode': 200,
@@ -230,12 +417,66 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
+        elif method == 'PATCH':
+            body_data = json.loads(event.get('body', '{}'))
+            
+            try:
+                product_id, columns, values, expected_updated_at = parse_patch(body_data)
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers_response,
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
+            
+            values.append(product_id)
+            if expected_updated_at:
+                values.append(expected_updated_at)
+            
+            cur.execute(get_patch_statement(columns, bool(expected_updated_at)), values)
+            updated_row = cur.fetchone()
+            
+            if not updated_row:
+                cur.execute("SELECT updated_at FROM products WHERE id = %s", (product_id,))
+                current_row = cur.fetchone()
+                if not current_row:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers_response,
+                        'body': json.dumps({'error': 'Product not found'}),
+                        'isBase64Encoded': False
+                    }
+                return {
+                    'statusCode': 409,
+                    'headers': headers_response,
+                    'body': json.dumps({
+                        'error': 'Product was modified by someone else',
+                        'updated_at': current_row[0].isoformat() if current_row[0] else None
+                    }),
+                    'isBase64Encoded': False
+                }
+            
+            conn.commit()
+            notify_catalog_changed(request_headers)
+            
+            return {
+                'statusCode': 200,
+                'headers': headers_response,
+                'body': json.dumps({
+                    'message': 'Product updated',
+                    'updated_at': updated_row[0].isoformat()
+                }),
+                'isBase64Encoded': False
+            }
+        
         elif method == 'DELETE':
             body_data = json.loads(event.get('body', '{}'))
             product_id = int(body_data.get('id'))
             
             cur.execute("DELETE FROM products WHERE id = %s", (product_id,))
             conn.commit()
+            notify_catalog_changed(request_headers)
             
             return {
                 'statusCode': 200,
@@ -0,0 +1,250 @@
+'''
+Business: Аналитика продаж для админки из дневных агрегатов (выручка, заказы, штуки по дням, товарам и категориям)
+          и догоняющий пересчёт агрегатов для заказов, оплаченных с опозданием или найденных сверкой
+Args: event - dict с httpMethod, headers (X-Admin-Token), queryStringParameters (date_from, date_to, group_by: day/product/category, limit)
+      context - object с request_id
+Returns: HTTP response с итогами за период и строками группировки; POST - число догнанных заказов
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import jwt
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+DEFAULT_PERIOD_DAYS = 30
+MAX_PERIOD_DAYS = 3660
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+CATCH_UP_BATCH_SIZE = 1000
+CATCH_UP_TIME_BUDGET_SECONDS = 20
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def parse_period(params: Dict[str, str]) -> Tuple[date, date]:
+    """Период включительно с обеих сторон, по умолчанию последние DEFAULT_PERIOD_DAYS дней"""
+    date_to = date.fromisoformat(params['date_to']) if params.get('date_to') else date.today()
+    date_from = date.fromisoformat(params['date_from']) if params.get('date_from') else date_to - timedelta(days=DEFAULT_PERIOD_DAYS - 1)
+    if date_from > date_to:
+        raise ValueError('date_from must not be after date_to')
+    if (date_to - date_from).days >= MAX_PERIOD_DAYS:
+        raise ValueError('Period is too long')
+    return date_from, date_to
+
+def to_number(value: Any) -> float:
+    return float(value) if value is not None else 0.0
+
+def query_totals(cur, date_from: date, date_to: date) -> Dict[str, Any]:
+    cur.execute(
+        """
+        SELECT COALESCE(SUM(revenue), 0), COALESCE(SUM(orders_count), 0), COALESCE(SUM(units), 0)
+        FROM t_p99209851_math_resources_site.sales_daily
+        WHERE day BETWEEN %s AND %s
+        """,
+        (date_from, date_to)
+    )
+    revenue, orders_count, units = cur.fetchone()
+    return {'revenue': to_number(revenue), 'orders': int(orders_count), 'units': int(units)}
+
+def query_rows(cur, group_by: str, date_from: date, date_to: date, limit: int) -> List[Dict[str, Any]]:
+    if group_by == 'day':
+        cur.execute(
+            """
+            SELECT day, revenue, orders_count, units
+            FROM t_p99209851_math_resources_site.sales_daily
+            WHERE day BETWEEN %s AND %s
+            ORDER BY day
+            """,
+            (date_from, date_to)
+        )
+        return [
+            {'day': row[0].isoformat(), 'revenue': to_number(row[1]), 'orders': row[2], 'units': row[3]}
+            for row in cur.fetchall()
+        ]
+
+    if group_by == 'product':
+        # Строк товар x день почти столько же, сколько позиций заказов: сначала агрегат и LIMIT, названия - только для него
+        cur.execute(
+            """
+            SELECT s.product_id, p.title, s.category, s.revenue, s.orders_count, s.units
+            FROM (
+                SELECT product_id, MAX(category) AS category, SUM(revenue) AS revenue,
+                       SUM(orders_count) AS orders_count, SUM(units) AS units
+                FROM t_p99209851_math_resources_site.sales_daily_products
+                WHERE day BETWEEN %s AND %s
+                GROUP BY product_id
+                ORDER BY SUM(revenue) DESC
+                LIMIT %s
+            ) s
+            LEFT JOIN t_p99209851_math_resources_site.products p ON p.id = s.product_id
+            ORDER BY s.revenue DESC
+            """,
+            (date_from, date_to, limit)
+        )
+        return [
+            {
+                'product_id': row[0],
+                'title': row[1],
+                'category': row[2],
+                'revenue': to_number(row[3]),
+                'orders': int(row[4]),
+                'units': int(row[5])
+            }
+            for row in cur.fetchall()
+        ]
+
+    cur.execute(
+        """
+        SELECT category, SUM(revenue), SUM(orders_count), SUM(units)
+        FROM t_p99209851_math_resources_site.sales_daily_categories
+        WHERE day BETWEEN %s AND %s
+        GROUP BY category
+        ORDER BY SUM(revenue) DESC
+        LIMIT %s
+        """,
+        (date_from, date_to, limit)
+    )
+    return [
+        {'category': row[0], 'revenue': to_number(row[1]), 'orders': int(row[2]), 'units': int(row[3])}
+        for row in cur.fetchall()
+    ]
+
+def catch_up(dsn: str, time_budget: float = CATCH_UP_TIME_BUDGET_SECONDS) -> Dict[str, Any]:
+    """Пачками добавляет в агрегаты оплаченные, но ещё не учтённые заказы, пока не кончатся или не выйдет время"""
+    started = time.monotonic()
+    conn = tracing.connect(dsn)
+    cur = conn.cursor()
+    rolled_up = 0
+
+    try:
+        while True:
+            cur.execute("SELECT t_p99209851_math_resources_site.rollup_pending_orders(%s)", (CATCH_UP_BATCH_SIZE,))
+            batch = cur.fetchone()[0]
+            conn.commit()
+            rolled_up += batch
+            if batch < CATCH_UP_BATCH_SIZE or time.monotonic() - started > time_budget:
+                break
+
+        cur.execute(
+            "SELECT COUNT(*) FROM t_p99209851_math_resources_site.orders WHERE payment_status = 'paid' AND rolled_up_at IS NULL"
+        )
+        pending = cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.close()
+
+    return {
+        'rolled_up': rolled_up,
+        'pending': pending,
+        'elapsed_ms': int((time.monotonic() - started) * 1000)
+    }
+
+@tracing.traced('sales-analytics')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers_response = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    if method not in ['GET', 'POST']:
+        return {
+            'statusCode': 405,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    if not verify_admin_token(event.get('headers', {})):
+        return {
+            'statusCode': 401,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    if method == 'POST':
+        return {
+            'statusCode': 200,
+            'headers': headers_response,
+            'body': json.dumps(catch_up(os.environ['DATABASE_URL'])),
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+    group_by = params.get('group_by', 'day')
+
+    try:
+        if group_by not in ['day', 'product', 'category']:
+            raise ValueError('group_by must be day, product or category')
+        date_from, date_to = parse_period(params)
+        limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': headers_response,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    conn = tracing.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    try:
+        totals = query_totals(cur, date_from, date_to)
+        rows = query_rows(cur, group_by, date_from, date_to, limit)
+    finally:
+        cur.close()
+        conn.close()
+
+    return {
+        'statusCode': 200,
+        'headers': headers_response,
+        'body': json.dumps({
+            'date_from': date_from.isoformat(),
+            'date_to': date_to.isoformat(),
+            'group_by': group_by,
+            'totals': totals,
+            'rows': rows
+        }),
+        'isBase64Encoded': False
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Догоняющий пересчёт дневных агрегатов продаж')
+    parser.add_argument('--time-budget', type=float, default=3600, help='секунд на проход, по умолчанию час')
+    args = parser.parse_args()
+
+    json.dump(catch_up(os.environ['DATABASE_URL'], args.time_budget), sys.stdout)
+    sys.stdout.write('\n')
@@ -0,0 +1,591 @@
+'''
+Business: Лёгкая трассировка вызова функции - спаны запросов к БД, внешних HTTP, S3 и SMTP и одна JSON-строка лога на вызов,
+          плюс метрики контейнера (счётчики и гистограммы) и время SQL-запросов по отпечаткам с планами медленных,
+          которые периодически досылаются в таблицы metrics и slow_queries
+Args: TRACE_SAMPLE_RATE - доля вызовов, по которым собираются спаны, время SQL-запросов (db_statement_duration_ms, slow_queries)
+      и пишется лог (0..1, по умолчанию 0.1); вызовы с ошибкой логируются всегда, но без спанов, если не попали в выборку;
+      handler_duration_ms и внешние вызовы учитываются у всех вызовов;
+      METRICS_FLUSH_SECONDS - как часто сбрасывать метрики в БД фоновым потоком (по умолчанию 60), METRICS_MAX_SERIES - предел рядов в памяти;
+      SLOW_QUERY_MS - порог медленного запроса (по умолчанию 100), SLOW_QUERY_EXPLAIN_RATE - доля медленных запросов,
+      для которых при сбросе снимается план обычным EXPLAIN без ANALYZE - запрос не выполняется ещё раз, литералы в плане
+      заменяются на ? (по умолчанию 0.2, не чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS на отпечаток)
+Returns: декоратор traced для handler, контекстный менеджер span, count/observe/cache_lookup для метрик, flush для сброса вручную,
+         connect и TracedCursor для psycopg2
+'''
+import atexit
+import bisect
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+    import psycopg2.extras
+except ImportError:
+    psycopg2 = None
+
+SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.1'))
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', '60'))
+METRICS_MAX_SERIES = int(os.environ.get('METRICS_MAX_SERIES', '1000'))
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', '0.2'))
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS', '600'))
+SLOW_QUERY_MAX_FINGERPRINTS = int(os.environ.get('SLOW_QUERY_MAX_FINGERPRINTS', '500'))
+
+# Границы корзин гистограмм в мс: четыре корзины на каждое удвоение от 0.5 мс до ~57 с, как в HDR Histogram,
+# и последняя корзина для всего, что дольше. Сетка общая для всех функций и для endpoint metrics -
+# менять её можно только вместе с очисткой таблицы metrics
+BUCKET_BOUNDS_MS = [2.0 ** exponent * (1 + step / 4) for exponent in range(-1, 16) for step in range(4)]
+# Сколько значений defer_observe копится до раскладки по корзинам
+PENDING_MAX = 1024
+
+
+class Trace:
+    """Спаны одного вызова, агрегированные по (вид, имя): количество, суммарное и максимальное время"""
+
+    def __init__(self, function_name: str, request_id: Optional[str], sampled: bool, started: Optional[float] = None):
+        self.function_name = function_name
+        self.request_id = request_id
+        self.sampled = sampled
+        self.started = time.perf_counter() if started is None else started
+        self.spans: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, elapsed: float, failed: bool) -> None:
+        """key - 'вид имя', как в логе: 'db SELECT', 'http yookassa'"""
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            stats = self.spans.get(key)
+            if stats is None:
+                stats = self.spans[key] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'errors': 0}
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            if elapsed_ms > stats['max_ms']:
+                stats['max_ms'] = elapsed_ms
+            if failed:
+                stats['errors'] += 1
+
+
+class Registry:
+    """Счётчики и гистограммы контейнера с прошлого сброса в БД; новые ряды сверх METRICS_MAX_SERIES отбрасываются"""
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        # ряд -> [счётчики по корзинам, сумма значений]
+        self.histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[Any]] = {}
+        self.dropped = 0
+        # (ключ ряда, мс) от defer_observe, ещё не разложенные по корзинам
+        self.pending: List[Tuple[Tuple[str, Tuple[Tuple[str, str], ...]], float]] = []
+        self._lock = threading.Lock()
+
+    def count(self, name: str, labels: Tuple[Tuple[str, str], ...], value: float) -> None:
+        self.count_key((name, labels), value)
+
+    def count_key(self, key: Tuple[str, Tuple[Tuple[str, str], ...]], value: float) -> None:
+        with self._lock:
+            if key in self.counters:
+                self.counters[key] += value
+            elif len(self.counters) + len(self.histograms) < METRICS_MAX_SERIES:
+                self.counters[key] = value
+            else:
+                self.dropped += 1
+
+    def observe(self, name: str, labels: Tuple[Tuple[str, str], ...], value_ms: float) -> None:
+        self.observe_key((name, labels), value_ms)
+
+    def observe_key(self, key: Tuple[str, Tuple[Tuple[str, str], ...]], value_ms: float) -> None:
+        """observe с готовым ключом ряда: горячие пути (запросы к БД, handler) не собирают кортеж меток на каждый вызов"""
+        index = bisect.bisect_left(BUCKET_BOUNDS_MS, value_ms)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                if len(self.counters) + len(self.histograms) >= METRICS_MAX_SERIES:
+                    self.dropped += 1
+                    return
+                histogram = self.histograms[key] = [[0] * (len(BUCKET_BOUNDS_MS) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += value_ms
+
+    def defer_observe(self, key: Tuple[str, Tuple[Tuple[str, str], ...]], value_ms: float) -> None:
+        """observe_key для путей, которые проходит каждый вызов: без блокировки и поиска корзины, только append в pending
+        (атомарен под GIL). По корзинам значения раскладываются пачкой - при PENDING_MAX значений и при сбросе; значение,
+        добавленное в уже забранный pending после раскладки, теряется - для метрик это допустимо"""
+        pending = self.pending
+        pending.append((key, value_ms))
+        if len(pending) >= PENDING_MAX:
+            self.fold_pending()
+
+    def fold_pending(self) -> None:
+        with self._lock:
+            pending, self.pending = self.pending, []
+        for key, value_ms in pending:
+            self.observe_key(key, value_ms)
+
+    def drain(self) -> Tuple[Dict, Dict, int]:
+        """Забирает накопленное и начинает с нуля: в БД уходят приращения"""
+        self.fold_pending()
+        with self._lock:
+            drained = self.counters, self.histograms, self.dropped
+            self.counters, self.histograms, self.dropped = {}, {}, 0
+        return drained
+
+
+class StatementStats:
+    """Время SQL-запросов контейнера по отпечаткам с прошлого сброса; отпечатки сверх SLOW_QUERY_MAX_FINGERPRINTS не учитываются"""
+
+    def __init__(self):
+        # отпечаток -> [нормализованный текст, вызовы, сумма мс, максимум мс, медленных вызовов, запрос для плана, мс этого вызова];
+        # запрос для плана - текст с подставленными параметрами, при сбросе он заменяется планом
+        self.statements: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, fingerprint: str, normalized: str, elapsed_ms: float, explain_source: Optional[bytes]) -> None:
+        with self._lock:
+            stats = self.statements.get(fingerprint)
+            if stats is None:
+                if len(self.statements) >= SLOW_QUERY_MAX_FINGERPRINTS:
+                    return
+                stats = self.statements[fingerprint] = [normalized, 0, 0.0, 0.0, 0, None, None]
+            stats[1] += 1
+            stats[2] += elapsed_ms
+            if elapsed_ms > stats[3]:
+                stats[3] = elapsed_ms
+            if elapsed_ms >= SLOW_QUERY_MS:
+                stats[4] += 1
+            if explain_source is not None:
+                stats[5] = explain_source
+                stats[6] = elapsed_ms
+
+    def drain(self) -> Dict[str, List[Any]]:
+        with self._lock:
+            drained, self.statements = self.statements, {}
+        return drained
+
+
+_registry = Registry()
+_statements = StatementStats()
+_function_name: Optional[str] = None
+_last_flush = time.monotonic()
+# Сброс идёт в фоновом потоке, вызов только будит его. RLock - SIGTERM может прийти посреди сброса в главном потоке
+_flush_lock = threading.RLock()
+_flush_requested = threading.Event()
+_flusher: Optional[threading.Thread] = None
+
+
+def count(name: str, value: float = 1, **labels: str) -> None:
+    """Увеличивает счётчик name с метками labels"""
+    _registry.count(name, tuple(sorted(labels.items())), value)
+
+
+def observe(name: str, value_ms: float, **labels: str) -> None:
+    """Добавляет длительность в мс в гистограмму name с метками labels"""
+    _registry.observe(name, tuple(sorted(labels.items())), value_ms)
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    """Учитывает попадание или промах кэша тёплого контейнера"""
+    _registry.count('cache_lookups_total', (('cache', cache), ('result', 'hit' if hit else 'miss')), 1)
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """Метки в виде Prometheus: name="value",..."""
+    return ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+
+
+def flush() -> None:
+    """Досылает накопленные приращения в таблицу metrics. Ошибка сброса не роняет вызов - метрики за интервал теряются"""
+    with _flush_lock:
+        _flush()
+
+
+def _flush() -> None:
+    global _last_flush
+    _last_flush = time.monotonic()
+    counters, histograms, dropped = _registry.drain()
+    statements = _statements.drain()
+    if dropped:
+        counters[('metrics_dropped_series_total', ())] = dropped
+    if _function_name is None or not (counters or histograms or statements):
+        return
+
+    rows = [
+        (_function_name, name, format_labels(labels), 'counter', value, 0, None)
+        for (name, labels), value in counters.items()
+    ] + [
+        (_function_name, name, format_labels(labels), 'histogram', total, sum(buckets), buckets)
+        for (name, labels), (buckets, total) in histograms.items()
+    ]
+
+    dsn = os.environ.get('DATABASE_URL')
+    if psycopg2 is None or not dsn:
+        # Функциям без БД остаётся лог: одна JSON-строка с приращениями за интервал
+        print(json.dumps({'type': 'metrics', 'function': _function_name, 'rows': rows}, ensure_ascii=False))
+        return
+
+    try:
+        conn = psycopg2.connect(dsn)
+        try:
+            capture_plans(conn, statements)
+            cur = conn.cursor()
+            psycopg2.extras.execute_values(
+                cur,
+                """
+                INSERT INTO t_p99209851_math_resources_site.metrics
+                    (function_name, name, labels, kind, value, count, buckets)
+                VALUES %s
+                ON CONFLICT (function_name, name, labels) DO UPDATE SET
+                    value = t_p99209851_math_resources_site.metrics.value + EXCLUDED.value,
+                    count = t_p99209851_math_resources_site.metrics.count + EXCLUDED.count,
+                    buckets = t_p99209851_math_resources_site.add_buckets(t_p99209851_math_resources_site.metrics.buckets, EXCLUDED.buckets),
+                    updated_at = CURRENT_TIMESTAMP
+                """,
+                rows
+            )
+            if statements:
+                psycopg2.extras.execute_values(
+                    cur,
+                    """
+                    INSERT INTO t_p99209851_math_resources_site.slow_queries
+                        (fingerprint, function_name, query, calls, total_ms, max_ms, slow_calls, plan, plan_elapsed_ms, plan_captured_at)
+                    VALUES %s
+                    ON CONFLICT (fingerprint, function_name) DO UPDATE SET
+                        calls = t_p99209851_math_resources_site.slow_queries.calls + EXCLUDED.calls,
+                        total_ms = t_p99209851_math_resources_site.slow_queries.total_ms + EXCLUDED.total_ms,
+                        max_ms = GREATEST(t_p99209851_math_resources_site.slow_queries.max_ms, EXCLUDED.max_ms),
+                        slow_calls = t_p99209851_math_resources_site.slow_queries.slow_calls + EXCLUDED.slow_calls,
+                        plan = COALESCE(EXCLUDED.plan, t_p99209851_math_resources_site.slow_queries.plan),
+                        plan_elapsed_ms = COALESCE(EXCLUDED.plan_elapsed_ms, t_p99209851_math_resources_site.slow_queries.plan_elapsed_ms),
+                        plan_captured_at = COALESCE(EXCLUDED.plan_captured_at, t_p99209851_math_resources_site.slow_queries.plan_captured_at),
+                        last_seen = CURRENT_TIMESTAMP
+                    """,
+                    [
+                        (fingerprint, _function_name, normalized, calls, total_ms, max_ms, slow_calls, plan, plan_ms,
+                         datetime.utcnow() if plan is not None else None)
+                        for fingerprint, (normalized, calls, total_ms, max_ms, slow_calls, plan, plan_ms) in statements.items()
+                    ]
+                )
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(json.dumps({'type': 'metrics_flush_error', 'function': _function_name, 'error': f'{type(e).__name__}: {e}'}))
+
+
+def _flush_loop() -> None:
+    while True:
+        _flush_requested.wait()
+        _flush_requested.clear()
+        flush()
+
+
+def request_flush() -> None:
+    """Будит поток сброса и сразу возвращается: вызов не ждёт подключения к БД и INSERT метрик.
+    Если контейнер заморозят посреди сброса, поток доделает его после разморозки - приращения уже забраны из памяти"""
+    global _flusher, _last_flush
+    _last_flush = time.monotonic()
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_loop, name='tracing-flush', daemon=True)
+        _flusher.start()
+    _flush_requested.set()
+
+
+def _flush_on_sigterm(signum, frame) -> None:
+    """Контейнер останавливают SIGTERM: досылаем метрики и завершаемся как без обработчика"""
+    flush()
+    signal.signal(signum, signal.SIG_DFL)
+    os.kill(os.getpid(), signum)
+
+
+atexit.register(flush)
+try:
+    if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _flush_on_sigterm)
+except ValueError:
+    # Импорт не из главного потока: остаётся atexit
+    pass
+
+
+# В контейнере обрабатывается один вызов за раз, потоки пулов внутри вызова пишут в тот же Trace.
+# Trace есть только у вызовов из выборки: остальным спаны не нужны, им хватает метрик
+_active: Optional[Trace] = None
+_HANDLER_DURATION_KEYS = {
+    status_class: ('handler_duration_ms', (('status', f'{status_class}xx' if status_class else 'error'),))
+    for status_class in range(6)
+}
+
+
+class _Span:
+    __slots__ = ('trace', 'kind', 'name', 'started')
+
+    def __init__(self, trace: Optional[Trace], kind: str, name: str):
+        self.trace = trace
+        self.kind = kind
+        self.name = name
+
+    def __enter__(self) -> '_Span':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self.started
+        failed = exc_type is not None
+        if self.kind == 'db':
+            _registry.observe('db_statement_duration_ms', (('statement', self.name),), elapsed * 1000)
+            if failed:
+                _registry.count('db_errors_total', (('statement', self.name),), 1)
+        else:
+            labels = (('kind', self.kind), ('target', self.name))
+            _registry.observe('outbound_duration_ms', labels, elapsed * 1000)
+            if failed:
+                _registry.count('outbound_failures_total', labels, 1)
+        if self.trace is not None:
+            self.trace.add(f'{self.kind} {self.name}', elapsed, failed)
+        return False
+
+
+def span(kind: str, name: str) -> _Span:
+    """Замеряет блок кода: kind - db/http/s3/smtp, name - к чему обращаемся.
+    В метрики попадает всегда, в трассу - только вызовы из выборки"""
+    return _Span(_active, kind, name)
+
+
+def traced(function_name: str) -> Callable:
+    """Оборачивает handler: открывает трассу вызова и в конце пишет одну JSON-строку в лог"""
+
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            global _active, _function_name
+            _function_name = function_name
+            started = time.perf_counter()
+            trace = Trace(function_name, getattr(context, 'request_id', None), True, started) if random.random() < SAMPLE_RATE else None
+            _active = trace
+            status = None
+            error = None
+            try:
+                response = handler(event, context)
+                status = response.get('statusCode') if isinstance(response, dict) else None
+                return response
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                raise
+            finally:
+                _active = None
+                status_class = status // 100 if isinstance(status, int) else 0
+                _registry.defer_observe(
+                    _HANDLER_DURATION_KEYS.get(status_class) or _HANDLER_DURATION_KEYS[0],
+                    (time.perf_counter() - started) * 1000
+                )
+                if trace is not None or error or (status or 0) >= 500:
+                    # Вызов вне выборки логируется при ошибке без спанов
+                    emit(trace or Trace(function_name, getattr(context, 'request_id', None), False, started), status, error)
+                if time.monotonic() - _last_flush >= METRICS_FLUSH_SECONDS:
+                    request_flush()
+
+        return wrapper
+
+    return decorator
+
+
+def emit(trace: Trace, status: Optional[int], error: Optional[str]) -> None:
+    record = {
+        'type': 'trace',
+        'function': trace.function_name,
+        'request_id': trace.request_id,
+        'status': status,
+        'duration_ms': round((time.perf_counter() - trace.started) * 1000, 2),
+        'sampled': trace.sampled,
+        'spans': {
+            key: {
+                'count': stats['count'],
+                'total_ms': round(stats['total_ms'], 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'errors': stats['errors']
+            }
+            for key, stats in trace.spans.items()
+        }
+    }
+    if error:
+        record['error'] = error
+    print(json.dumps(record, ensure_ascii=False))
+
+
+def statement_name(query: Any) -> str:
+    """Имя спана для SQL: первое слово запроса (SELECT, INSERT, ...)"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    if not isinstance(query, str):
+        query = str(query)
+    parts = query.split(None, 1)
+    return parts[0].upper() if parts else ''
+
+
+# Литералы и параметры заменяются на ?, списки значений сворачиваются - запросы, отличающиеся только данными,
+# получают один отпечаток (цикл по заказам с order_id = {id} в тексте - тоже один)
+_NORMALIZE_PATTERNS = [
+    (re.compile(r'--[^\n]*|/\*.*?\*/', re.S), ' '),
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'%\(\w+\)s|%s'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'), '(...)')
+]
+_FINGERPRINT_CACHE_SIZE = 2000
+# текст запроса -> (ключ спана в трассе, отпечаток, нормализованный текст, ключ гистограммы, ключ счётчика ошибок)
+_statement_infos: Dict[str, Tuple[str, str, str, Tuple, Tuple]] = {}
+# отпечаток -> когда последний раз снимали план в этом контейнере
+_explained: Dict[str, float] = {}
+
+
+def fingerprint_statement(query: Any) -> Tuple[str, str]:
+    """Отпечаток и нормализованный текст запроса"""
+    text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else str(query)
+    for pattern, replacement in _NORMALIZE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    normalized = text.strip()
+    return hashlib.md5(normalized.encode('utf-8')).hexdigest()[:16], normalized
+
+
+# В плане литералы видны в условиях: строки, даты и массивы в кавычках, числа - без. Стоимость и оценки строк
+# в заголовках узлов остаются, номера SubPlan/InitPlan и $n тоже
+_PLAN_STRING = re.compile(r"'(?:[^']|'')*'")
+_PLAN_NUMBER = re.compile(r'(?<![\w$.])(?<!Plan )-?\d+(?:\.\d+)?(?![\w.])')
+_PLAN_CONDITION = re.compile(r'^(\s*(?:[\w-]+ )*(?:Cond|Filter|Key|Call|Values): )(.*)$')
+
+
+def redact_plan(plan: str) -> str:
+    """План EXPLAIN без литералов: в slow_queries не должны попасть email, токены и прочие данные из параметров"""
+    lines = []
+    for line in _PLAN_STRING.sub('?', plan).split('\n'):
+        condition = _PLAN_CONDITION.match(line)
+        if condition:
+            line = condition.group(1) + _PLAN_NUMBER.sub('?', condition.group(2))
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def statement_info(query: Any) -> Tuple[str, str, str, Tuple, Tuple]:
+    """Всё, что нужно учёту запроса, одним поиском в кэше. Кэшируются только строки - тексты запросов в коде постоянные;
+    bytes приходят из execute_values и mogrify с данными внутри, каждый раз новые, и только вытесняли бы кэш"""
+    cacheable = isinstance(query, str)
+    if cacheable:
+        info = _statement_infos.get(query)
+        if info is not None:
+            return info
+    name = statement_name(query)
+    fingerprint, normalized = fingerprint_statement(query)
+    labels = (('statement', name),)
+    info = (f'db {name}', fingerprint, normalized, ('db_statement_duration_ms', labels), ('db_errors_total', labels))
+    if cacheable:
+        if len(_statement_infos) >= _FINGERPRINT_CACHE_SIZE:
+            _statement_infos.clear()
+        _statement_infos[query] = info
+    return info
+
+
+def should_explain(fingerprint: str) -> bool:
+    """Выборка планов: доля SLOW_QUERY_EXPLAIN_RATE и не чаще раза в SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS на отпечаток"""
+    if random.random() >= SLOW_QUERY_EXPLAIN_RATE:
+        return False
+    now = time.monotonic()
+    if now - _explained.get(fingerprint, float('-inf')) < SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS:
+        return False
+    if len(_explained) >= SLOW_QUERY_MAX_FINGERPRINTS:
+        _explained.clear()
+    _explained[fingerprint] = now
+    return True
+
+
+if psycopg2 is not None:
+
+    def capture_plans(conn, statements: Dict[str, List[Any]]) -> None:
+        """Планы медленных запросов с прошлого сброса на соединении сброса: обычный EXPLAIN без ANALYZE только планирует
+        запрос, а вызов не ждёт ни планировщика, ни лишнего запроса к БД. В slow_queries план уходит без литералов"""
+        cur = conn.cursor()
+        for stats in statements.values():
+            explain_source = stats[5]
+            if explain_source is None:
+                continue
+            try:
+                cur.execute(b'EXPLAIN ' + explain_source)
+                stats[5] = redact_plan('\n'.join(row[0] for row in cur.fetchall()))
+            except psycopg2.Error:
+                # Временные таблицы и настройки сессии вызова соединению сброса не видны - такой план не снять
+                conn.rollback()
+                stats[5] = stats[6] = None
+        conn.rollback()
+
+    def record_statement(cursor, query: Any, vars: Any, elapsed: float, failed: bool, by_fingerprint: bool, can_explain: bool) -> None:
+        """Спан и гистограмма запроса, а для выполненных - время по отпечатку; то же, что span('db', ...), без объекта спана"""
+        span_key, fingerprint, normalized, duration_key, errors_key = statement_info(query)
+        elapsed_ms = elapsed * 1000
+        _registry.defer_observe(duration_key, elapsed_ms)
+        if failed:
+            _registry.count_key(errors_key, 1)
+        trace = _active
+        if trace is not None:
+            trace.add(span_key, elapsed, failed)
+        if failed or not by_fingerprint:
+            return
+        explain_source = None
+        if can_explain and elapsed_ms >= SLOW_QUERY_MS and should_explain(fingerprint):
+            # mogrify собирает текст на клиенте, без обращения к БД; план снимет сброс
+            explain_source = cursor.mogrify(query, vars)
+        _statements.record(fingerprint, normalized, elapsed_ms, explain_source)
+
+    class TracedCursor(psycopg2.extensions.cursor):
+        """Курсор psycopg2, который замеряет execute/executemany/copy_expert и учитывает время запросов по отпечаткам"""
+
+        def execute(self, query, vars=None):
+            if _active is None:
+                # Соединение из вызова в выборке живёт дольше него: вне выборки запросы не учитываются
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = super().execute(query, vars)
+                failed = False
+                return result
+            finally:
+                # У именованного (серверного) курсора execute только объявляет его, время уходит в fetch
+                record_statement(self, query, vars, time.perf_counter() - started, failed, self.name is None, True)
+
+        def executemany(self, query, vars_list):
+            if _active is None:
+                return super().executemany(query, vars_list)
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = super().executemany(query, vars_list)
+                failed = False
+                return result
+            finally:
+                record_statement(self, query, None, time.perf_counter() - started, failed, True, False)
+
+        def copy_expert(self, sql, file, size=8192):
+            if _active is None:
+                return super().copy_expert(sql, file, size)
+            with span('db', 'COPY'):
+                return super().copy_expert(sql, file, size)
+
+    def connect(dsn: str, **kwargs: Any):
+        """psycopg2.connect с замером подключения и TracedCursor по умолчанию - только в вызовах из выборки:
+        остальным достаётся обычное соединение, и их запросы ничего не стоят трассировке"""
+        if _active is None:
+            return psycopg2.connect(dsn, **kwargs)
+        kwargs.setdefault('cursor_factory', TracedCursor)
+        with span('db', 'connect'):
+            return psycopg2.connect(dsn, **kwargs)
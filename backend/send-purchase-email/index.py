@@ -7,11 +7,12 @@ Returns: HTTP response с результатом отправки письма
 import json
 import os
 import smtplib
-import psycopg2
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from typing import Dict, Any, List
+import tracing
 
+@tracing.traced('send-purchase-email')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
@@ -54,6 +55,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     smtp_port = int(os.environ.get('SMTP_PORT', '587'))
     smtp_user = os.environ.get('SMTP_USER')
     smtp_password = os.environ.get('SMTP_PASSWORD')
+    smtp_starttls = os.environ.get('SMTP_STARTTLS', 'true') == 'true'
     
     if not all([dsn, smtp_host, smtp_user, smtp_password]):
         return {
@@ -63,7 +65,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = tracing.connect(dsn)
     cur = conn.cursor()
     
     cur.execute("""
@@ -154,11 +156,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
     msg.attach(MIMEText(html_body, 'html', 'utf-8'))
     
-    server = smtplib.SMTP(smtp_host, smtp_port)
-    server.starttls()
-    server.login(smtp_user, smtp_password)
-    server.send_message(msg)
-    server.quit()
+    with tracing.span('smtp', 'send'):
+        server = smtplib.SMTP(smtp_host, smtp_port)
+        if smtp_starttls:
+            server.starttls()
+        server.login(smtp_user, smtp_password)
+        server.send_message(msg)
+        server.quit()
     
     return {
         'statusCode': 200,
@@ -0,0 +1,352 @@
+'''
+Business: Пререндер лёгких HTML-страниц товаров для поисковиков и превью ссылок (title, description, цена, картинка, Open Graph) с загрузкой в S3;
+          перерисовываются только товары, у которых изменился updated_at
+Args: event - dict с httpMethod (GET или POST), headers (X-Admin-Token или Authorization: Bearer SEO_PAGES_TOKEN для планировщика),
+      queryStringParameters (full=true - перерисовать все страницы)
+      context - object с request_id
+Returns: HTTP response со счётчиками перерисованных и удалённых страниц; из командной строки - то же в stdout
+'''
+import argparse
+import hashlib
+import hmac
+import html
+import json
+import os
+import sys
+import boto3
+import jwt
+import psycopg2
+import psycopg2.extras
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+SCHEDULE_TOKEN = os.environ.get('SEO_PAGES_TOKEN', '')
+SITE_URL = os.environ.get('SITE_URL', 'https://p99209851.poehali.app')
+CDN_URL = os.environ.get('CDN_URL', 'https://cdn.poehali.dev')
+DEFAULT_OG_IMAGE = 'https://cdn.poehali.dev/intertnal/img/og.png'
+PAGE_PREFIX = 'seo/products'
+# Откуда раздаются страницы: {CDN_URL}/{PAGE_PREFIX} или свой домен. Та же переменная, что у sitemap:
+# canonical и og:url совпадают с адресом товара в sitemap
+SEO_PAGES_URL = os.environ.get('SEO_PAGES_URL')
+# Меняется вместе с разметкой страницы: страницы старой версии перерисовываются инкрементальным запуском
+TEMPLATE_VERSION = 2
+BATCH_SIZE = 500
+MAX_WORKERS = int(os.environ.get('SEO_PAGES_WORKERS', str(os.cpu_count() or 2)))
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{title} | Математическая кухня</title>
+<meta name="description" content="{description}">
+<link rel="canonical" href="{url}">
+<meta property="og:type" content="product">
+<meta property="og:site_name" content="Математическая кухня">
+<meta property="og:title" content="{title}">
+<meta property="og:description" content="{description}">
+<meta property="og:url" content="{url}">
+<meta property="og:image" content="{image}">
+<meta property="product:price:amount" content="{price}">
+<meta property="product:price:currency" content="RUB">
+<meta name="twitter:card" content="summary_large_image">
+<script type="application/ld+json">{json_ld}</script>
+</head>
+<body>
+<main>
+<h1>{title}</h1>
+<img src="{image}" alt="{title}" width="600">
+<p>{category} · {product_type}</p>
+<p>{full_description}</p>
+<p><strong>{price_label}</strong></p>
+<p><a href="{site_url}">Открыть на сайте</a></p>
+</main>
+</body>
+</html>
+'''
+
+_s3_client = None
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def verify_schedule_token(headers: Dict[str, str]) -> bool:
+    """Планировщик присылает статический токен SEO_PAGES_TOKEN в Authorization: Bearer"""
+    authorization = headers.get('authorization') or headers.get('Authorization') or ''
+    if not SCHEDULE_TOKEN or not authorization.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(authorization[len('Bearer '):], SCHEDULE_TOKEN)
+
+def canonical_url(product_id: int) -> str:
+    """Тот же адрес, что у товара в sitemap: пререндеренная страница, а без SEO_PAGES_URL - страница SPA"""
+    return f'{SEO_PAGES_URL}/{product_id}.html' if SEO_PAGES_URL else f'{SITE_URL}/?product={product_id}'
+
+def get_s3_client():
+    """boto3-клиент создаётся в каждом процессе пула отдельно: клиенты нельзя передавать через fork"""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client(
+            's3',
+            endpoint_url=os.environ.get('S3_ENDPOINT', 'https://storage.yandexcloud.net'),
+            region_name=os.environ.get('S3_REGION', 'ru-central1'),
+            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
+        )
+    return _s3_client
+
+def render_page(product: Tuple[Any, ...]) -> bytes:
+    product_id, title, description, price, category, product_type, is_free, preview_image_url, _ = product
+    url = canonical_url(product_id)
+    image = preview_image_url or DEFAULT_OG_IMAGE
+    short_description = ' '.join((description or '').split())[:300]
+    json_ld = {
+        '@context': 'https://schema.org',
+        '@type': 'Product',
+        'name': title,
+        'description': short_description,
+        'image': image,
+        'url': url,
+        'offers': {'@type': 'Offer', 'price': 0 if is_free else price, 'priceCurrency': 'RUB'}
+    }
+    page = PAGE_TEMPLATE.format(
+        title=html.escape(title),
+        description=html.escape(short_description),
+        full_description=html.escape(description or ''),
+        url=html.escape(url),
+        site_url=html.escape(f'{SITE_URL}/product/{product_id}'),
+        image=html.escape(image),
+        price=0 if is_free else price,
+        price_label='Бесплатно' if is_free else f'{price} ₽',
+        category=html.escape(category),
+        product_type=html.escape(product_type),
+        json_ld=json.dumps(json_ld, ensure_ascii=False).replace('</', '<\\/')
+    )
+    return page.encode('utf-8')
+
+def render_and_upload(products: List[Tuple[Tuple[Any, ...], Optional[str]]]) -> List[Tuple[int, datetime, str, str, int]]:
+    """Выполняется в процессе пула: рендерит пачку страниц и загружает изменившиеся в S3"""
+    s3_client = get_s3_client()
+    bucket = os.environ.get('S3_BUCKET', 'poehali-user-files')
+    rendered = []
+    for product, previous_hash in products:
+        body = render_page(product)
+        content_hash = hashlib.sha256(body).hexdigest()
+        object_key = f'{PAGE_PREFIX}/{product[0]}.html'
+        # updated_at мог смениться без изменения полей страницы - такой файл не перезаливаем
+        if content_hash != previous_hash:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=object_key,
+                Body=body,
+                ContentType='text/html; charset=utf-8',
+                CacheControl='public, max-age=3600'
+            )
+        rendered.append((product[0], product[8], object_key, content_hash, TEMPLATE_VERSION))
+    return rendered
+
+STALE_FILTER = '''
+    WHERE s.product_id IS NULL
+       OR s.rendered_updated_at IS DISTINCT FROM p.updated_at
+       OR s.template_version <> %(template_version)s
+'''
+
+def has_stale_pages(conn) -> bool:
+    """Дешёвая проверка перед запуском пула: есть ли хоть одна устаревшая или лишняя страница"""
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT EXISTS (
+            SELECT 1
+            FROM t_p99209851_math_resources_site.products p
+            LEFT JOIN t_p99209851_math_resources_site.seo_pages s ON s.product_id = p.id
+            {STALE_FILTER}
+        ) OR EXISTS (
+            SELECT 1
+            FROM t_p99209851_math_resources_site.seo_pages s
+            LEFT JOIN t_p99209851_math_resources_site.products p ON p.id = s.product_id
+            WHERE p.id IS NULL
+        )
+    """, {'template_version': TEMPLATE_VERSION})
+    stale = cur.fetchone()[0]
+    cur.close()
+    conn.commit()
+    return stale
+
+def iter_batches(conn, full: bool) -> Iterator[List[Tuple[Tuple[Any, ...], Optional[str]]]]:
+    """Читает товары, чья страница устарела, серверным курсором и режет на пачки для пула"""
+    cur = conn.cursor(name='seo_pages_stale')
+    cur.itersize = BATCH_SIZE
+    cur.execute(f"""
+        SELECT p.id, p.title, p.description, p.price, p.category, p.type, p.is_free, p.preview_image_url, p.updated_at,
+               s.content_hash
+        FROM t_p99209851_math_resources_site.products p
+        LEFT JOIN t_p99209851_math_resources_site.seo_pages s ON s.product_id = p.id
+        {'' if full else STALE_FILTER}
+        ORDER BY p.id
+    """, {'template_version': TEMPLATE_VERSION})
+    batch = []
+    for row in cur:
+        batch.append((row[:9], None if full else row[9]))
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+    cur.close()
+
+def remove_deleted_pages(conn) -> int:
+    """Удаляет из S3 и из seo_pages страницы товаров, которых больше нет"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT s.product_id, s.object_key
+        FROM t_p99209851_math_resources_site.seo_pages s
+        LEFT JOIN t_p99209851_math_resources_site.products p ON p.id = s.product_id
+        WHERE p.id IS NULL
+    """)
+    orphans = cur.fetchall()
+    bucket = os.environ.get('S3_BUCKET', 'poehali-user-files')
+    for start in range(0, len(orphans), 1000):
+        chunk = orphans[start:start + 1000]
+        with tracing.span('s3', 'delete_objects'):
+            get_s3_client().delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': object_key} for _, object_key in chunk], 'Quiet': True}
+            )
+        cur.execute(
+            "DELETE FROM t_p99209851_math_resources_site.seo_pages WHERE product_id = ANY(%s)",
+            ([product_id for product_id, _ in chunk],)
+        )
+        conn.commit()
+    cur.close()
+    return len(orphans)
+
+def rebuild(dsn: str, full: bool = False) -> Dict[str, Any]:
+    read_conn = tracing.connect(dsn)
+    write_conn = tracing.connect(dsn)
+    write_cur = write_conn.cursor()
+    rendered_count = 0
+    started = datetime.utcnow()
+
+    def save(rendered: List[Tuple[int, datetime, str, str, int]]) -> None:
+        nonlocal rendered_count
+        psycopg2.extras.execute_values(
+            write_cur,
+            """
+            INSERT INTO t_p99209851_math_resources_site.seo_pages
+                (product_id, rendered_updated_at, object_key, content_hash, template_version)
+            VALUES %s
+            ON CONFLICT (product_id) DO UPDATE SET
+                rendered_updated_at = EXCLUDED.rendered_updated_at,
+                object_key = EXCLUDED.object_key,
+                content_hash = EXCLUDED.content_hash,
+                template_version = EXCLUDED.template_version,
+                rendered_at = CURRENT_TIMESTAMP
+            """,
+            rendered
+        )
+        write_conn.commit()
+        rendered_count += len(rendered)
+
+    try:
+        # Без изменений в каталоге запуск по расписанию не поднимает пул процессов
+        if not full and not has_stale_pages(read_conn):
+            removed = 0
+        else:
+            # В работе не больше двух пачек на процесс, чтобы не вычитывать весь каталог в память заранее
+            with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                in_flight: deque = deque()
+                for batch in iter_batches(read_conn, full):
+                    in_flight.append(executor.submit(render_and_upload, batch))
+                    if len(in_flight) >= MAX_WORKERS * 2:
+                        save(in_flight.popleft().result())
+                while in_flight:
+                    save(in_flight.popleft().result())
+
+            removed = remove_deleted_pages(write_conn)
+    finally:
+        write_cur.close()
+        write_conn.close()
+        read_conn.close()
+
+    return {
+        'mode': 'full' if full else 'incremental',
+        'rendered': rendered_count,
+        'removed': removed,
+        'elapsed_ms': int((datetime.utcnow() - started).total_seconds() * 1000),
+        'base_url': f'{CDN_URL}/{PAGE_PREFIX}/'
+    }
+
+@tracing.traced('seo-pages')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token, Authorization',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers_response = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    if method not in ['GET', 'POST']:
+        return {
+            'statusCode': 405,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    # Каждый запуск читает весь каталог, поэтому анонимно его не дёрнуть: админ или планировщик со своим токеном
+    request_headers = event.get('headers') or {}
+    if not verify_admin_token(request_headers) and not verify_schedule_token(request_headers):
+        return {
+            'statusCode': 401,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+    full = params.get('full') == 'true'
+
+    result = rebuild(os.environ['DATABASE_URL'], full)
+
+    return {
+        'statusCode': 200,
+        'headers': headers_response,
+        'body': json.dumps(result),
+        'isBase64Encoded': False
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Пререндер SEO-страниц товаров в S3')
+    parser.add_argument('--full', action='store_true', help='перерисовать все страницы, а не только изменившиеся')
+    args = parser.parse_args()
+
+    json.dump(rebuild(os.environ['DATABASE_URL'], args.full), sys.stdout, ensure_ascii=False)
+    sys.stdout.write('\n')
@@ -1,18 +1,120 @@
 '''
-Business: Генерация sitemap.xml для поисковых систем со всеми товарами
-Args: event - dict с httpMethod
+Business: Генерация sitemap для поисковых систем: индекс sitemap и дочерние карты до 50 000 URL, сжатые gzip и закэшированные до изменения каталога
+Args: event - dict с httpMethod, queryStringParameters (page - номер дочерней карты, без него отдаётся индекс), headers (If-None-Match)
       context - object с request_id
-Returns: XML карта сайта со списком всех страниц
+Returns: gzip XML индекса sitemap или дочерней карты сайта в base64
 '''
+import base64
+import gzip
+import hashlib
+import io
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from datetime import datetime
+import tracing
 
+BASE_URL = os.environ.get('SITE_URL', 'https://p99209851.poehali.app')
+SITEMAP_URL = os.environ.get('SITEMAP_URL', 'https://functions.poehali.dev/f183b00f-e951-4402-9f28-b6f3364dfe06')
+# Если задан, товары в sitemap ведут на пререндеренные страницы seo-pages вместо SPA-маршрута.
+# seo-pages строит canonical и og:url по тем же SITE_URL и SEO_PAGES_URL, адреса совпадают
+SEO_PAGES_URL = os.environ.get('SEO_PAGES_URL')
+MAX_URLS_PER_SITEMAP = 50000
+FETCH_SIZE = 5000
+
+# Сжатые карты текущей версии каталога: живут, пока контейнер тёплый
+_sitemap_cache: Dict[str, Any] = {'version': None, 'etag': None, 'index': None, 'pages': []}
+
+def get_catalog_version(cur) -> Tuple[int, Optional[datetime]]:
+    """Версия каталога: число товаров и время последнего изменения"""
+    cur.execute("SELECT COUNT(*), MAX(COALESCE(updated_at, created_at)) FROM t_p99209851_math_resources_site.products")
+    count, last_modified = cur.fetchone()
+    return count, last_modified
+
+def iter_url_entries(conn) -> Iterator[str]:
+    """Отдаёт элементы <url> по одному, товары читаются серверным курсором порциями"""
+    today = datetime.now().strftime('%Y-%m-%d')
+    yield f'''  <url>
+    <loc>{BASE_URL}/</loc>
+    <lastmod>{today}</lastmod>
+    <changefreq>daily</changefreq>
+    <priority>1.0</priority>
+  </url>
+'''
+
+    cur = conn.cursor(name='sitemap_products')
+    cur.itersize = FETCH_SIZE
+    cur.execute(
+        "SELECT id, COALESCE(updated_at, created_at) FROM t_p99209851_math_resources_site.products ORDER BY id"
+    )
+    for product_id, last_modified in cur:
+        lastmod = last_modified.strftime('%Y-%m-%d') if last_modified else today
+        loc = f'{SEO_PAGES_URL}/{product_id}.html' if SEO_PAGES_URL else f'{BASE_URL}/?product={product_id}'
+        yield f'''  <url>
+    <loc>{loc}</loc>
+    <lastmod>{lastmod}</lastmod>
+    <changefreq>weekly</changefreq>
+    <priority>0.8</priority>
+  </url>
+'''
+    cur.close()
+
+def build_pages(conn) -> List[bytes]:
+    """Раскладывает URL по дочерним картам не больше MAX_URLS_PER_SITEMAP и сжимает каждую на лету"""
+    pages: List[bytes] = []
+    buffer: Optional[io.BytesIO] = None
+    writer: Optional[gzip.GzipFile] = None
+    urls_in_page = 0
+
+    def close_page() -> None:
+        writer.write(b'</urlset>')
+        writer.close()
+        pages.append(buffer.getvalue())
+
+    for entry in iter_url_entries(conn):
+        if writer is None or urls_in_page >= MAX_URLS_PER_SITEMAP:
+            if writer is not None:
+                close_page()
+            buffer = io.BytesIO()
+            writer = gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0)
+            writer.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+            urls_in_page = 0
+        writer.write(entry.encode('utf-8'))
+        urls_in_page += 1
+    close_page()
+
+    return pages
+
+def build_index(pages_count: int, last_modified: Optional[datetime]) -> bytes:
+    lastmod = (last_modified or datetime.now()).strftime('%Y-%m-%d')
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for page in range(1, pages_count + 1):
+        parts.append(f'''  <sitemap>
+    <loc>{SITEMAP_URL}?page={page}</loc>
+    <lastmod>{lastmod}</lastmod>
+  </sitemap>
+''')
+    parts.append('</sitemapindex>')
+    return gzip.compress(''.join(parts).encode('utf-8'), mtime=0)
+
+def xml_response(body: bytes, etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/xml',
+            'Content-Encoding': 'gzip',
+            'Cache-Control': 'public, max-age=3600',
+            'ETag': etag,
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': base64.b64encode(body).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+@tracing.traced('sitemap')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
@@ -25,7 +127,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': '',
             'isBase64Encoded': False
         }
-    
+
     if method != 'GET':
         return {
             'statusCode': 405,
@@ -33,9 +135,25 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
-    
+
+    query_params = event.get('queryStringParameters') or {}
+    page_param = query_params.get('page')
+    page: Optional[int] = None
+    if page_param is not None:
+        try:
+            page = int(page_param)
+        except ValueError:
+            page = 0
+        if page < 1:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': 'Invalid page'}),
+                'isBase64Encoded': False
+            }
+
     dsn = os.environ.get('DATABASE_URL')
-    
+
     if not dsn:
         return {
             'statusCode': 500,
@@ -43,52 +161,44 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Database not configured'}),
             'isBase64Encoded': False
         }
-    
-    conn = psycopg2.connect(dsn)
+
+    conn = tracing.connect(dsn)
     cur = conn.cursor()
-    
-    cur.execute(
-        "SELECT id, title, category, created_at FROM t_p99209851_math_resources_site.products ORDER BY id"
-    )
-    products = cur.fetchall()
-    
+
+    version = get_catalog_version(cur)
     cur.close()
+
+    tracing.cache_lookup('sitemap', _sitemap_cache['version'] == version)
+    if _sitemap_cache['version'] != version:
+        pages = build_pages(conn)
+        _sitemap_cache['version'] = version
+        _sitemap_cache['etag'] = '"' + hashlib.sha256(f'{version[0]}|{version[1]}'.encode('utf-8')).hexdigest()[:16] + '"'
+        _sitemap_cache['index'] = build_index(len(pages), version[1])
+        _sitemap_cache['pages'] = pages
+
     conn.close()
-    
-    base_url = 'https://p99209851.poehali.app'
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    sitemap_xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
-    sitemap_xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
-    
-    sitemap_xml += f'''  <url>
-    <loc>{base_url}/</loc>
-    <lastmod>{today}</lastmod>
-    <changefreq>daily</changefreq>
-    <priority>1.0</priority>
-  </url>
-'''
-    
-    for product in products:
-        product_id, title, category, created_at = product
-        lastmod = created_at.strftime('%Y-%m-%d') if created_at else today
-        
-        sitemap_xml += f'''  <url>
-    <loc>{base_url}/?product={product_id}</loc>
-    <lastmod>{lastmod}</lastmod>
-    <changefreq>weekly</changefreq>
-    <priority>0.8</priority>
-  </url>
-'''
-    
-    sitemap_xml += '</urlset>'
-    
-    return {
-        'statusCode': 200,
-        'headers': {
-            'Content-Type': 'application/xml',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': sitemap_xml,
-        'isBase64Encoded': False
-    }
+
+    etag = _sitemap_cache['etag']
+    request_headers = event.get('headers') or {}
+    if page is not None:
+        etag = etag[:-1] + f'-{page}"'
+    if (request_headers.get('If-None-Match') or request_headers.get('if-none-match')) == etag:
+        return {
+            'statusCode': 304,
+            'headers': {'ETag': etag, 'Access-Control-Allow-Origin': '*'},
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    if page is None:
+        return xml_response(_sitemap_cache['index'], etag)
+
+    if page > len(_sitemap_cache['pages']):
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Sitemap page not found'}),
+            'isBase64Encoded': False
+        }
+
+    return xml_response(_sitemap_cache['pages'][page - 1], etag)
@@ -0,0 +1,155 @@
+'''
+Business: Админский отчёт по SQL-запросам всех функций: отпечатки нормализованного текста, ранжированные по суммарному времени,
+          и последний план EXPLAIN (без ANALYZE, литералы заменены на ?) для медленных. Запросы учитываются только в вызовах из выборки
+          трассировки (TRACE_SAMPLE_RATE), поэтому calls и slow_calls - доля от настоящих, а соотношения между запросами верные
+Args: event - dict с httpMethod, headers (X-Admin-Token),
+      queryStringParameters (order_by: total_ms/calls/max_ms/mean_ms/slow_calls, function, limit; fingerprint - один запрос с планом)
+      context - object с request_id
+Returns: HTTP response со списком запросов или одним запросом с планом
+'''
+import json
+import os
+import jwt
+from typing import Dict, Any, Optional
+import tracing
+
+ADMIN_SECRET_KEY = os.environ.get('ADMIN_JWT_SECRET', 'admin-secret-key-change-in-production')
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+# Выражения сортировки подставляются в SQL только из этого словаря
+ORDER_BY = {
+    'total_ms': 'total_ms DESC',
+    'calls': 'calls DESC',
+    'max_ms': 'max_ms DESC',
+    'mean_ms': 'total_ms / GREATEST(calls, 1) DESC',
+    'slow_calls': 'slow_calls DESC'
+}
+
+def verify_admin_token(headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """Проверяет JWT токен админа из заголовка X-Admin-Token"""
+    token = headers.get('x-admin-token') or headers.get('X-Admin-Token')
+
+    if not token:
+        return None
+
+    try:
+        payload = jwt.decode(token, ADMIN_SECRET_KEY, algorithms=['HS256'])
+        if 'admin_id' not in payload:
+            return None
+        return payload
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
+        return None
+
+def row_to_dict(row: tuple) -> Dict[str, Any]:
+    fingerprint, function_name, query, calls, total_ms, max_ms, slow_calls, plan_captured_at, last_seen = row
+    return {
+        'fingerprint': fingerprint,
+        'function': function_name,
+        'query': query,
+        'calls': calls,
+        'total_ms': round(total_ms, 2),
+        'mean_ms': round(total_ms / calls, 2) if calls else 0,
+        'max_ms': round(max_ms, 2),
+        'slow_calls': slow_calls,
+        'plan_captured_at': plan_captured_at.isoformat() if plan_captured_at else None,
+        'last_seen': last_seen.isoformat() if last_seen else None
+    }
+
+@tracing.traced('slow-queries')
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    headers_response = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    if not verify_admin_token(event.get('headers', {})):
+        return {
+            'statusCode': 401,
+            'headers': headers_response,
+            'body': json.dumps({'error': 'Unauthorized: Admin access required'}),
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+    order_by = params.get('order_by', 'total_ms')
+    try:
+        if order_by not in ORDER_BY:
+            raise ValueError(f"order_by must be one of: {', '.join(ORDER_BY)}")
+        limit = min(max(int(params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': headers_response,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    columns = 'fingerprint, function_name, query, calls, total_ms, max_ms, slow_calls, plan_captured_at, last_seen'
+    conn = tracing.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+
+    try:
+        if params.get('fingerprint'):
+            cur.execute(
+                f"SELECT {columns}, plan, plan_elapsed_ms FROM t_p99209851_math_resources_site.slow_queries "
+                "WHERE fingerprint = %s ORDER BY total_ms DESC",
+                (params['fingerprint'],)
+            )
+            rows = cur.fetchall()
+            if not rows:
+                return {
+                    'statusCode': 404,
+                    'headers': headers_response,
+                    'body': json.dumps({'error': 'Query not found'}),
+                    'isBase64Encoded': False
+                }
+            queries = []
+            for row in rows:
+                query = row_to_dict(row[:9])
+                query['plan'] = row[9]
+                query['plan_elapsed_ms'] = round(row[10], 2) if row[10] is not None else None
+                queries.append(query)
+            body = {'queries': queries}
+        else:
+            function_filter = 'WHERE function_name = %s' if params.get('function') else ''
+            query_params = ([params['function']] if params.get('function') else []) + [limit]
+            cur.execute(
+                f"SELECT {columns} FROM t_p99209851_math_resources_site.slow_queries "
+                f"{function_filter} ORDER BY {ORDER_BY[order_by]} LIMIT %s",
+                query_params
+            )
+            body = {'order_by': order_by, 'queries': [row_to_dict(row) for row in cur.fetchall()]}
+    finally:
+        cur.close()
+        conn.close()
+
+    return {
+        'statusCode': 200,
+        'headers': headers_response,
+        'body': json.dumps(body),
+        'isBase64Encoded': False
+    }
@@ -8,7 +8,11 @@ import json
 import os
 import urllib.request
 from typing import Dict, Any
+import tracing
 
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org')
+
+@tracing.traced('telegram-notify')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -73,7 +77,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'parse_mode': 'HTML'
     }
     
-    url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
+    url = f'{TELEGRAM_API_URL}/bot{bot_token}/sendMessage'
     
     req = urllib.request.Request(
         url,
@@ -82,8 +86,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     )
     
     try:
-        response = urllib.request.urlopen(req)
-        response_data = json.loads(response.read().decode())
+        with tracing.span('http', 'telegram sendMessage'):
+            response = urllib.request.urlopen(req)
+            response_data = json.loads(response.read().decode())
         
         return {
             'statusCode': 200,
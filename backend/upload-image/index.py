@@ -4,7 +4,11 @@ import base64
 import uuid
 import requests
 from typing import Dict, Any
+import tracing
 
+UPLOAD_API_URL = os.environ.get('UPLOAD_API_URL', 'https://api.poehali.dev/v1/upload')
+
+@tracing.traced('upload-image')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Загрузка изображений для превью товаров через внутренний API
@@ -66,11 +70,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
         content_type = content_type_map.get(ext, 'image/png')
         
-        upload_response = requests.post(
-            'https://api.poehali.dev/v1/upload',
-            files={'file': (filename, file_bytes, content_type)},
-            timeout=30
-        )
+        with tracing.span('http', 'upload api'):
+            upload_response = requests.post(
+                UPLOAD_API_URL,
+                files={'file': (filename, file_bytes, content_type)},
+                timeout=30
+            )
         
         if upload_response.status_code == 200:
             upload_data = upload_response.json()
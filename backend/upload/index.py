@@ -5,7 +5,9 @@ import uuid
 import boto3
 from typing import Dict, Any
 from urllib.parse import parse_qs
+import tracing
 
+@tracing.traced('upload')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Загрузка файлов (PDF, изображений) в S3 хранилище
@@ -119,12 +121,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         ext = filename.split('.')[-1] if '.' in filename else 'bin'
         file_key = f'files/{uuid.uuid4()}.{ext}'
         
-        s3_client.put_object(
-            Bucket=s3_bucket,
-            Key=file_key,
-            Body=file_bytes,
-            ContentType=content_type_file
-        )
+        with tracing.span('s3', 'put_object'):
+            s3_client.put_object(
+                Bucket=s3_bucket,
+                Key=file_key,
+                Body=file_bytes,
+                ContentType=content_type_file
+            )
         
         file_url = f'https://cdn.poehali.dev/{file_key}'
         
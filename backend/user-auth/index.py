@@ -6,14 +6,15 @@ Returns: JWT токен при успешной регистрации/авто
 '''
 import json
 import os
-import psycopg2
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
 from typing import Dict, Any
+import tracing
 
 SECRET_KEY = os.environ.get('USER_JWT_SECRET', 'user-secret-key-change-in-production')
 
+@tracing.traced('user-auth')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
@@ -57,7 +58,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = tracing.connect(os.environ['DATABASE_URL'])
     cur = conn.cursor()
     
     try:
@@ -102,7 +103,6 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             row = cur.fetchone()
             
             if not row:
-                print(f'User not found: {email}')
                 return {
                     'statusCode': 401,
                     'headers': headers,
@@ -111,10 +111,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             user_id, password_hash, user_full_name = row
-            print(f'User found: {email}, checking password')
             
             password_match = bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
-            print(f'Password match: {password_match}')
             
             if not password_match:
                 return {
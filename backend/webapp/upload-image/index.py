@@ -5,11 +5,16 @@ Returns: JSON with url field
 '''
 
 import json
+import os
 import base64
 import requests
 from typing import Dict, Any
+import tracing
 
+STORAGE_UPLOAD_URL = os.environ.get('STORAGE_UPLOAD_URL', 'https://storage-upload.poehali.dev/upload')
 
+
+@tracing.traced('upload-image')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -45,11 +50,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
         file_data = base64.b64decode(body) if is_base64 else body.encode('latin1')
         
-        response = requests.post(
-            'https://storage-upload.poehali.dev/upload',
-            files={'file': ('image.png', file_data, 'image/png')},
-            timeout=30
-        )
+        with tracing.span('http', 'storage upload'):
+            response = requests.post(
+                STORAGE_UPLOAD_URL,
+                files={'file': ('image.png', file_data, 'image/png')},
+                timeout=30
+            )
         
         if response.status_code != 200:
             return {
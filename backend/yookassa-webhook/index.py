@@ -1,5 +1,5 @@
 '''
-Business: Обработка webhook от ЮКассы после оплаты, сохранение заказа в БД
+Business: Обработка webhook от ЮКассы после оплаты, перевод заказа в статус paid; отмены и возвраты обновляют локальную копию платежей
 Args: event - dict с httpMethod, body (уведомление от ЮКассы)
       context - object с request_id  
 Returns: HTTP response 200 для подтверждения получения webhook
@@ -7,10 +7,93 @@ Returns: HTTP response 200 для подтверждения получения
 import json
 import os
 import psycopg2
+import psycopg2.extras
 import urllib.request
-import base64
+from decimal import Decimal
 from typing import Dict, Any
+import yookassa_client
+import tracing
 
+SEND_PURCHASE_EMAIL_URL = os.environ.get('SEND_PURCHASE_EMAIL_URL', 'https://functions.poehali.dev/fa6783b1-aae1-4057-8f19-8f9ccb0665f1')
+TELEGRAM_NOTIFY_URL = os.environ.get('TELEGRAM_NOTIFY_URL', 'https://functions.poehali.dev/ce167a18-88d6-47c0-bb99-ee0343589867')
+# События, после которых меняется только локальная копия платежа: поле объекта уведомления с id платежа
+MIRROR_EVENTS = {'payment.canceled': 'id', 'payment.waiting_for_capture': 'id', 'refund.succeeded': 'payment_id'}
+
+def mirror_payment(cur, payment: yookassa_client.Payment) -> None:
+    """Обновляет платёж в локальной копии payments тем, что вернул API"""
+    cur.execute(
+        """
+        INSERT INTO t_p99209851_math_resources_site.payments (id, status, amount, refunded_amount, currency, customer_email, description, metadata, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (id) DO UPDATE SET
+            status = EXCLUDED.status,
+            amount = EXCLUDED.amount,
+            refunded_amount = EXCLUDED.refunded_amount,
+            customer_email = EXCLUDED.customer_email,
+            metadata = EXCLUDED.metadata,
+            synced_at = CURRENT_TIMESTAMP
+        """,
+        (
+            payment.id,
+            payment.status,
+            payment.amount.value,
+            payment.refunded_amount.value if payment.refunded_amount else 0,
+            payment.amount.currency,
+            payment.customer_email.lower() if payment.customer_email else None,
+            payment.description,
+            json.dumps(payment.metadata),
+            payment.created_at
+        )
+    )
+
+def refresh_mirror(payment_id: Any) -> Dict[str, Any]:
+    """Отмена или возврат: перечитывает платёж из API и обновляет копию, заказы не трогает"""
+    yookassa = yookassa_client.get_client()
+    dsn = os.environ.get('DATABASE_URL')
+    if not yookassa_client.is_valid_payment_id(payment_id):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Invalid payment_id'}),
+            'isBase64Encoded': False
+        }
+    if not yookassa or not dsn:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'Server configuration incomplete'}),
+            'isBase64Encoded': False
+        }
+
+    try:
+        payment = yookassa.get_payment(payment_id, timeout=5.0)
+    except yookassa_client.YooKassaError as e:
+        # Не 2xx - ЮКасса повторит уведомление позже
+        print(f'[WEBHOOK] Error fetching payment from API: {str(e)}')
+        return {
+            'statusCode': 502,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'YooKassa API error'}),
+            'isBase64Encoded': False
+        }
+
+    conn = tracing.connect(dsn)
+    try:
+        cur = conn.cursor()
+        mirror_payment(cur, payment)
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'status': 'mirrored', 'payment_status': payment.status}),
+        'isBase64Encoded': False
+    }
+
+@tracing.traced('yookassa-webhook')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
@@ -39,7 +122,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     notification_type = body_data.get('event')
     payment_obj = body_data.get('object', {})
     
-    print(f'[WEBHOOK] Event: {notification_type}, Payment: {json.dumps(payment_obj)}')
+    print(f"[WEBHOOK] Event: {notification_type}, Payment: {payment_obj.get('id')}")
+    
+    if notification_type in MIRROR_EVENTS:
+        return refresh_mirror(payment_obj.get(MIRROR_EVENTS[notification_type]))
     
     if notification_type != 'payment.succeeded':
         return {
@@ -59,46 +145,41 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    shop_id = os.environ.get('YOOKASSA_SHOP_ID')
-    secret_key = os.environ.get('YOOKASSA_SECRET_KEY')
-    
-    if not shop_id or not secret_key:
+    if not yookassa_client.is_valid_payment_id(payment_id):
         return {
-            'statusCode': 500,
+            'statusCode': 400,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({'error': 'YooKassa credentials not configured'}),
+            'body': json.dumps({'error': 'Invalid payment_id'}),
             'isBase64Encoded': False
         }
     
-    auth_string = f'{shop_id}:{secret_key}'
-    credentials = base64.b64encode(auth_string.encode('utf-8')).decode('ascii')
+    yookassa = yookassa_client.get_client()
     
-    payment_req = urllib.request.Request(
-        f'https://api.yookassa.ru/v3/payments/{payment_id}',
-        headers={
-            'Authorization': f'Basic {credentials}',
-            'Content-Type': 'application/json'
+    if not yookassa:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'YooKassa credentials not configured'}),
+            'isBase64Encoded': False
         }
-    )
     
+    # Оплату подтверждает только ответ API: тело уведомления может прислать кто угодно, кто знает id своего платежа
     try:
-        payment_response = urllib.request.urlopen(payment_req)
-        full_payment_data = json.loads(payment_response.read().decode())
-        print(f'[WEBHOOK] Full payment data from API: {json.dumps(full_payment_data)}')
-        
-        amount = float(full_payment_data.get('amount', {}).get('value', 0))
-        metadata = full_payment_data.get('metadata', {})
-        customer_email = metadata.get('customer_email') or full_payment_data.get('receipt', {}).get('customer', {}).get('email')
-        product_ids = metadata.get('product_ids', '')
-        
-        print(f'[WEBHOOK] Email: {customer_email}, Product IDs from API: {product_ids}')
-    except Exception as e:
+        payment = yookassa.get_payment(payment_id, timeout=5.0)
+    except yookassa_client.YooKassaError as e:
+        # Не 2xx - ЮКасса повторит уведомление позже
         print(f'[WEBHOOK] Error fetching payment from API: {str(e)}')
-        amount = float(payment_obj.get('amount', {}).get('value', 0))
-        metadata = payment_obj.get('metadata', {})
-        customer_email = metadata.get('customer_email') or payment_obj.get('receipt', {}).get('customer', {}).get('email')
-        product_ids = metadata.get('product_ids', '')
-        print(f'[WEBHOOK] Using webhook data - Email: {customer_email}, Product IDs: {product_ids}')
+        return {
+            'statusCode': 502,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': 'YooKassa API error'}),
+            'isBase64Encoded': False
+        }
+    
+    amount = Decimal(payment.amount.value)
+    customer_email = payment.customer_email
+    product_ids = payment.metadata.get('product_ids', '')
+    print(f'[WEBHOOK] Email: {customer_email}, Product IDs: {product_ids}')
     
     if not customer_email:
         return {
@@ -118,64 +199,115 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
+    conn = tracing.connect(dsn)
     cur = conn.cursor()
     
-    cur.execute(
-        "SELECT id FROM t_p99209851_math_resources_site.orders WHERE payment_id = %s",
-        (payment_id,)
-    )
-    existing_order = cur.fetchone()
+    # Копия платежей обновляется сразу, не дожидаясь payments-sync: manual-send-purchase опирается на её статус.
+    # Фиксируется отдельно, чтобы откат заказа ниже (повторная доставка, несовпадение суммы) её не отменял
+    mirror_payment(cur, payment)
+    conn.commit()
     
-    if existing_order:
-        print(f'[WEBHOOK] Order already exists for payment_id: {payment_id}')
+    if payment.status != 'succeeded':
         cur.close()
         conn.close()
+        print(f'[WEBHOOK] Payment {payment_id} is {payment.status} in the API, order is not marked paid')
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json'},
-            'body': json.dumps({
-                'status': 'already_processed',
-                'order_id': existing_order[0]
-            }),
+            'body': json.dumps({'status': 'not_succeeded', 'payment_status': payment.status}),
             'isBase64Encoded': False
         }
     
+    # Заказ уже создан в create-payment со статусом pending - просто подтверждаем оплату. Если create-payment
+    # не успел записать payment_id, заказ находится по order_id и idempotence_key из metadata платежа
+    metadata_order_id = str(payment.metadata.get('order_id', ''))
+    order_ref = int(metadata_order_id) if metadata_order_id.isdigit() else None
     cur.execute(
-        "INSERT INTO t_p99209851_math_resources_site.orders (guest_email, total_price, payment_id, payment_status) VALUES (%s, %s, %s, %s) RETURNING id",
-        (customer_email, int(amount), payment_id, 'paid')
+        """
+        UPDATE t_p99209851_math_resources_site.orders
+        SET payment_status = 'paid', paid_at = CURRENT_TIMESTAMP, payment_id = %s
+        WHERE payment_status = 'pending'
+          AND (payment_id = %s OR (payment_id IS NULL AND id = %s AND idempotence_key = %s))
+        RETURNING id, guest_email, total_price
+        """,
+        (payment_id, payment_id, order_ref, payment.metadata.get('idempotence_key'))
     )
-    order_id = cur.fetchone()[0]
+    pending_order = cur.fetchone()
     
-    if product_ids:
-        product_id_list = [int(pid) for pid in product_ids.split(',') if pid.strip()]
+    if pending_order:
+        order_id, customer_email, total_price = pending_order
+        if payment.amount.currency != 'RUB' or amount != Decimal(total_price):
+            conn.rollback()
+            cur.close()
+            conn.close()
+            print(f'[WEBHOOK] Payment {payment_id} amount {payment.amount.value} {payment.amount.currency} '
+                  f'does not match order {order_id} total {total_price}, order is not marked paid')
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'status': 'amount_mismatch', 'order_id': order_id}),
+                'isBase64Encoded': False
+            }
+        cur.execute(
+            "SELECT product_title FROM t_p99209851_math_resources_site.order_items WHERE order_id = %s ORDER BY id",
+            (order_id,)
+        )
+        product_titles = [row[0] for row in cur.fetchall()]
+    else:
+        # Платёж создан до появления pending-заказов - собираем заказ по metadata.
+        # Уникальный индекс по payment_id гарантирует, что заказ создаст только одна доставка webhook.
+        # Платёж с order_id в metadata свой заказ уже подтвердил раньше - второй заказ для него не создаётся
+        created_order = None
+        if order_ref is None:
+            cur.execute(
+                "INSERT INTO t_p99209851_math_resources_site.orders (guest_email, total_price, payment_id, payment_status, paid_at) VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP) ON CONFLICT (payment_id) DO NOTHING RETURNING id",
+                (customer_email, int(amount), payment_id, 'paid')
+            )
+            created_order = cur.fetchone()
         
-        for product_id in product_id_list:
+        if not created_order:
+            conn.rollback()
             cur.execute(
-                "SELECT title, price, full_pdf_url FROM t_p99209851_math_resources_site.products WHERE id = %s",
-                (product_id,)
+                "SELECT id FROM t_p99209851_math_resources_site.orders WHERE payment_id = %s OR id = %s ORDER BY payment_id IS NOT DISTINCT FROM %s DESC LIMIT 1",
+                (payment_id, order_ref, payment_id)
             )
-            product = cur.fetchone()
-            
-            if product:
-                cur.execute(
-                    "INSERT INTO t_p99209851_math_resources_site.order_items (order_id, product_id, product_title, product_price, full_pdf_url) VALUES (%s, %s, %s, %s, %s)",
-                    (order_id, product_id, product[0], product[1], product[2])
-                )
-    
-    product_titles = []
-    if product_ids:
-        product_id_list = [int(pid) for pid in product_ids.split(',') if pid.strip()]
+            existing_order = cur.fetchone()
+            print(f'[WEBHOOK] Order already exists for payment_id: {payment_id}')
+            cur.close()
+            conn.close()
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({
+                    'status': 'already_processed',
+                    'order_id': existing_order[0] if existing_order else None
+                }),
+                'isBase64Encoded': False
+            }
+        
+        order_id = created_order[0]
+        
+        product_id_list = [int(pid) for pid in product_ids.split(',') if pid.strip()] if product_ids else []
+        products = []
         
-        for product_id in product_id_list:
+        if product_id_list:
             cur.execute(
-                "SELECT title FROM t_p99209851_math_resources_site.products WHERE id = %s",
-                (product_id,)
+                "SELECT p.id, p.title, p.price, pa.url FROM t_p99209851_math_resources_site.products p "
+                "LEFT JOIN t_p99209851_math_resources_site.product_assets pa ON pa.product_id = p.id AND pa.kind = 'full_pdf' "
+                "WHERE p.id = ANY(%s)",
+                (product_id_list,)
             )
-            product = cur.fetchone()
-            if product:
-                product_titles.append(product[0])
+            products = cur.fetchall()
+            
+            psycopg2.extras.execute_values(
+                cur,
+                "INSERT INTO t_p99209851_math_resources_site.order_items (order_id, product_id, product_title, product_price, full_pdf_url) VALUES %s",
+                [(order_id, product_id, title, price, full_pdf_url) for product_id, title, price, full_pdf_url in products]
+            )
+        
+        product_titles = [product[1] for product in products]
     
+    cur.execute("SELECT t_p99209851_math_resources_site.on_order_paid(%s)", (order_id,))
     conn.commit()
     cur.close()
     conn.close()
@@ -186,13 +318,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     }).encode()
     
     email_req = urllib.request.Request(
-        'https://functions.poehali.dev/fa6783b1-aae1-4057-8f19-8f9ccb0665f1',
+        SEND_PURCHASE_EMAIL_URL,
         data=email_payload,
         headers={'Content-Type': 'application/json'}
     )
     
     try:
-        urllib.request.urlopen(email_req)
+        with tracing.span('http', 'send-purchase-email'):
+            urllib.request.urlopen(email_req)
     except Exception:
         pass
     
@@ -204,13 +337,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }).encode()
         
         telegram_req = urllib.request.Request(
-            'https://functions.poehali.dev/ce167a18-88d6-47c0-bb99-ee0343589867',
+            TELEGRAM_NOTIFY_URL,
             data=telegram_payload,
             headers={'Content-Type': 'application/json'}
         )
         
         try:
-            urllib.request.urlopen(telegram_req)
+            with tracing.span('http', 'telegram-notify'):
+                urllib.request.urlopen(telegram_req)
         except Exception as e:
             print(f'[WEBHOOK] Telegram notification error: {str(e)}')
     
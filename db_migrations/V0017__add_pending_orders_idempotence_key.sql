@@ -0,0 +1,6 @@
+-- Заказ создаётся в статусе pending при создании платежа, webhook только переводит его в paid
+ALTER TABLE t_p99209851_math_resources_site.orders
+ADD COLUMN idempotence_key VARCHAR(64),
+ADD COLUMN paid_at TIMESTAMP;
+
+CREATE UNIQUE INDEX idx_orders_idempotence_key ON t_p99209851_math_resources_site.orders(idempotence_key);
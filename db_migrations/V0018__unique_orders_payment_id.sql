@@ -1,10 +1,7 @@
--- SQL скрипт для удаления дублирующихся заказов
--- Выполните этот скрипт в интерфейсе управления базой данных
-
--- Шаг 1: Удаляем связанные записи в order_items для дублированных заказов
+-- Удаляем дубли заказов по payment_id (оставляем самый первый) и запрещаем их на уровне БД
 DELETE FROM t_p99209851_math_resources_site.order_items
 WHERE order_id IN (
-  SELECT o.id 
+  SELECT o.id
   FROM t_p99209851_math_resources_site.orders o
   INNER JOIN (
     SELECT payment_id, MIN(id) as first_order_id
@@ -16,10 +13,9 @@ WHERE order_id IN (
   WHERE o.id != duplicates.first_order_id
 );
 
--- Шаг 2: Удаляем дублирующиеся заказы, оставляя только самый первый (с минимальным id)
 DELETE FROM t_p99209851_math_resources_site.orders
 WHERE id IN (
-  SELECT o.id 
+  SELECT o.id
   FROM t_p99209851_math_resources_site.orders o
   INNER JOIN (
     SELECT payment_id, MIN(id) as first_order_id
@@ -31,9 +27,6 @@ WHERE id IN (
   WHERE o.id != duplicates.first_order_id
 );
 
--- Проверка результата: должны остаться только уникальные payment_id
-SELECT payment_id, COUNT(*) as count 
-FROM t_p99209851_math_resources_site.orders 
-WHERE payment_id IS NOT NULL 
-GROUP BY payment_id 
-HAVING COUNT(*) > 1;
+CREATE UNIQUE INDEX idx_orders_payment_id_unique ON t_p99209851_math_resources_site.orders(payment_id);
+
+DROP INDEX IF EXISTS t_p99209851_math_resources_site.idx_orders_payment_id;
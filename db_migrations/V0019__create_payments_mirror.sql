@@ -0,0 +1,22 @@
+-- Локальная копия платежей ЮКассы для поиска без обращения к API
+CREATE TABLE t_p99209851_math_resources_site.payments (
+    id VARCHAR(64) PRIMARY KEY,
+    status VARCHAR(32) NOT NULL,
+    amount NUMERIC(12, 2) NOT NULL,
+    currency VARCHAR(3) DEFAULT 'RUB',
+    customer_email VARCHAR(255),
+    description TEXT,
+    metadata JSONB,
+    created_at TIMESTAMP NOT NULL,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_payments_customer_email_status ON t_p99209851_math_resources_site.payments(customer_email, status, created_at DESC);
+CREATE INDEX idx_payments_created_at ON t_p99209851_math_resources_site.payments(created_at);
+
+-- Курсор инкрементальной синхронизации
+CREATE TABLE t_p99209851_math_resources_site.payments_sync_state (
+    name VARCHAR(50) PRIMARY KEY,
+    cursor_created_at TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,13 @@
+-- Кэш checkout: повторное оформление той же корзины возвращает уже созданный платёж
+CREATE TABLE t_p99209851_math_resources_site.checkout_sessions (
+    cache_key VARCHAR(64) PRIMARY KEY,
+    order_id INTEGER NOT NULL,
+    payment_id VARCHAR(64) NOT NULL,
+    payment_url TEXT NOT NULL,
+    total_amount INTEGER NOT NULL,
+    discount_applied BOOLEAN DEFAULT FALSE,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX idx_checkout_sessions_expires_at ON t_p99209851_math_resources_site.checkout_sessions(expires_at);
@@ -0,0 +1,39 @@
+-- Права на товары: заполняются в той же транзакции, что переводит заказ в paid
+CREATE TABLE t_p99209851_math_resources_site.entitlements (
+    id SERIAL PRIMARY KEY,
+    email VARCHAR(255) NOT NULL,
+    user_id INTEGER,
+    product_id INTEGER NOT NULL,
+    order_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_entitlements_email_product UNIQUE (email, product_id)
+);
+
+CREATE INDEX idx_entitlements_user_id ON t_p99209851_math_resources_site.entitlements(user_id);
+
+-- Выдаёт права по оплаченному заказу, вызывается из webhook и manual-deliver
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.grant_entitlements(p_order_id INTEGER) RETURNS VOID AS $$
+    INSERT INTO t_p99209851_math_resources_site.entitlements (email, user_id, product_id, order_id)
+    SELECT LOWER(o.guest_email), COALESCE(o.user_id, u.id), oi.product_id, o.id
+    FROM t_p99209851_math_resources_site.orders o
+    JOIN t_p99209851_math_resources_site.order_items oi ON oi.order_id = o.id
+    LEFT JOIN t_p99209851_math_resources_site.users u ON u.email = o.guest_email
+    WHERE o.id = p_order_id
+      AND o.payment_status = 'paid'
+      AND o.guest_email IS NOT NULL
+      AND oi.product_id IS NOT NULL
+    ON CONFLICT (email, product_id) DO NOTHING;
+$$ LANGUAGE sql;
+
+-- Заполняем права по уже оплаченным заказам (первый заказ с товаром)
+INSERT INTO t_p99209851_math_resources_site.entitlements (email, user_id, product_id, order_id, created_at)
+SELECT DISTINCT ON (LOWER(o.guest_email), oi.product_id)
+    LOWER(o.guest_email), COALESCE(o.user_id, u.id), oi.product_id, o.id, o.created_at
+FROM t_p99209851_math_resources_site.orders o
+JOIN t_p99209851_math_resources_site.order_items oi ON oi.order_id = o.id
+LEFT JOIN t_p99209851_math_resources_site.users u ON u.email = o.guest_email
+WHERE o.payment_status = 'paid'
+  AND o.guest_email IS NOT NULL
+  AND oi.product_id IS NOT NULL
+ORDER BY LOWER(o.guest_email), oi.product_id, o.id
+ON CONFLICT (email, product_id) DO NOTHING;
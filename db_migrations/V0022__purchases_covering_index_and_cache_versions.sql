@@ -0,0 +1,24 @@
+-- Покрывающий индекс для постраничной выдачи покупок по email
+CREATE INDEX idx_orders_guest_email_status_created ON t_p99209851_math_resources_site.orders(guest_email, payment_status, created_at DESC) INCLUDE (id);
+
+DROP INDEX IF EXISTS t_p99209851_math_resources_site.idx_orders_guest_email;
+
+-- Версия покупок покупателя: меняется при каждой оплате и сбрасывает кэш my-purchases в тёплых контейнерах
+CREATE TABLE t_p99209851_math_resources_site.customer_cache_versions (
+    email VARCHAR(255) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Всё, что должно произойти в транзакции перевода заказа в paid
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.on_order_paid(p_order_id INTEGER) RETURNS VOID AS $$
+    SELECT t_p99209851_math_resources_site.grant_entitlements(p_order_id);
+
+    INSERT INTO t_p99209851_math_resources_site.customer_cache_versions (email, version, updated_at)
+    SELECT LOWER(o.guest_email), 1, CURRENT_TIMESTAMP
+    FROM t_p99209851_math_resources_site.orders o
+    WHERE o.id = p_order_id AND o.guest_email IS NOT NULL
+    ON CONFLICT (email) DO UPDATE SET
+        version = t_p99209851_math_resources_site.customer_cache_versions.version + 1,
+        updated_at = CURRENT_TIMESTAMP;
+$$ LANGUAGE sql;
@@ -0,0 +1,2 @@
+-- Индекс для выгрузки заказов за период
+CREATE INDEX idx_orders_created_at ON t_p99209851_math_resources_site.orders(created_at);
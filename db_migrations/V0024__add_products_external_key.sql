@@ -0,0 +1,5 @@
+-- Внешний ключ товара для массового импорта с обновлением существующих записей
+ALTER TABLE t_p99209851_math_resources_site.products
+ADD COLUMN external_key VARCHAR(100);
+
+CREATE UNIQUE INDEX idx_products_external_key ON t_p99209851_math_resources_site.products(external_key);
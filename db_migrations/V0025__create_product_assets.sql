@@ -0,0 +1,80 @@
+-- Файлы товара вынесены в отдельную таблицу: одна строка на файл вместо шести URL-колонок
+CREATE TABLE t_p99209851_math_resources_site.product_assets (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES t_p99209851_math_resources_site.products(id) ON DELETE CASCADE,
+    kind VARCHAR(32) NOT NULL,
+    url TEXT NOT NULL,
+    size_bytes BIGINT,
+    sha256 CHAR(64),
+    position SMALLINT NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_product_assets_product_kind_position UNIQUE (product_id, kind, position)
+);
+
+CREATE INDEX idx_product_assets_kind ON t_p99209851_math_resources_site.product_assets(kind, product_id);
+
+-- URL-колонки products остаются формой записи (админка, импорт), таблица синхронизируется триггером
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.sync_product_assets() RETURNS TRIGGER AS $$
+BEGIN
+    WITH assets (kind, position, url) AS (
+        VALUES
+            ('sample_pdf', 1, NULLIF(NEW.sample_pdf_url, '')),
+            ('full_pdf_with_answers', 1, NULLIF(NEW.full_pdf_with_answers_url, '')),
+            ('full_pdf_without_answers', 1, NULLIF(NEW.full_pdf_without_answers_url, '')),
+            ('trainer', 1, NULLIF(NEW.trainer1_url, '')),
+            ('trainer', 2, NULLIF(NEW.trainer2_url, '')),
+            ('trainer', 3, NULLIF(NEW.trainer3_url, '')),
+            ('full_pdf', 1, NULLIF(NEW.full_pdf_url, ''))
+    )
+    DELETE FROM t_p99209851_math_resources_site.product_assets pa
+    USING assets a
+    WHERE pa.product_id = NEW.id
+      AND pa.kind = a.kind
+      AND pa.position = a.position
+      AND a.url IS NULL;
+
+    INSERT INTO t_p99209851_math_resources_site.product_assets (product_id, kind, position, url)
+    SELECT NEW.id, a.kind, a.position, a.url
+    FROM (
+        VALUES
+            ('sample_pdf', 1, NULLIF(NEW.sample_pdf_url, '')),
+            ('full_pdf_with_answers', 1, NULLIF(NEW.full_pdf_with_answers_url, '')),
+            ('full_pdf_without_answers', 1, NULLIF(NEW.full_pdf_without_answers_url, '')),
+            ('trainer', 1, NULLIF(NEW.trainer1_url, '')),
+            ('trainer', 2, NULLIF(NEW.trainer2_url, '')),
+            ('trainer', 3, NULLIF(NEW.trainer3_url, '')),
+            ('full_pdf', 1, NULLIF(NEW.full_pdf_url, ''))
+    ) AS a (kind, position, url)
+    WHERE a.url IS NOT NULL
+    ON CONFLICT (product_id, kind, position) DO UPDATE SET
+        url = EXCLUDED.url,
+        size_bytes = NULL,
+        sha256 = NULL
+    WHERE t_p99209851_math_resources_site.product_assets.url IS DISTINCT FROM EXCLUDED.url;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_products_sync_assets
+AFTER INSERT OR UPDATE OF sample_pdf_url, full_pdf_with_answers_url, full_pdf_without_answers_url,
+    trainer1_url, trainer2_url, trainer3_url, full_pdf_url
+ON t_p99209851_math_resources_site.products
+FOR EACH ROW EXECUTE FUNCTION t_p99209851_math_resources_site.sync_product_assets();
+
+-- Переносим уже заполненные ссылки
+INSERT INTO t_p99209851_math_resources_site.product_assets (product_id, kind, position, url)
+SELECT p.id, a.kind, a.position, a.url
+FROM t_p99209851_math_resources_site.products p
+CROSS JOIN LATERAL (
+    VALUES
+        ('sample_pdf', 1, NULLIF(p.sample_pdf_url, '')),
+        ('full_pdf_with_answers', 1, NULLIF(p.full_pdf_with_answers_url, '')),
+        ('full_pdf_without_answers', 1, NULLIF(p.full_pdf_without_answers_url, '')),
+        ('trainer', 1, NULLIF(p.trainer1_url, '')),
+        ('trainer', 2, NULLIF(p.trainer2_url, '')),
+        ('trainer', 3, NULLIF(p.trainer3_url, '')),
+        ('full_pdf', 1, NULLIF(p.full_pdf_url, ''))
+) AS a (kind, position, url)
+WHERE a.url IS NOT NULL
+ON CONFLICT (product_id, kind, position) DO NOTHING;
@@ -0,0 +1,9 @@
+-- Состояние публикации статического снимка каталога в S3
+CREATE TABLE t_p99209851_math_resources_site.catalog_publish_state (
+    name VARCHAR(50) PRIMARY KEY,
+    catalog_version VARCHAR(100),
+    manifest JSONB,
+    published_at TIMESTAMP
+);
+
+INSERT INTO t_p99209851_math_resources_site.catalog_publish_state (name) VALUES ('catalog');
@@ -0,0 +1,8 @@
+-- Пререндеренные HTML-страницы товаров: какая версия товара (updated_at) уже выложена в S3
+CREATE TABLE t_p99209851_math_resources_site.seo_pages (
+    product_id INTEGER PRIMARY KEY,
+    rendered_updated_at TIMESTAMP,
+    object_key TEXT NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    rendered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,10 @@
+-- «Часто покупают вместе»: top-K соседей товара по совместным покупкам, таблица целиком пересчитывается офлайн-задачей
+CREATE TABLE t_p99209851_math_resources_site.product_recommendations (
+    product_id INTEGER NOT NULL,
+    recommended_product_id INTEGER NOT NULL,
+    rank SMALLINT NOT NULL,
+    score REAL NOT NULL,
+    co_count INTEGER NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (product_id, rank)
+);
@@ -0,0 +1,121 @@
+-- Дневные агрегаты продаж для аналитики админки: обновляются при переводе заказа в paid
+CREATE TABLE t_p99209851_math_resources_site.sales_daily (
+    day DATE PRIMARY KEY,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE t_p99209851_math_resources_site.sales_daily_products (
+    day DATE NOT NULL,
+    product_id INTEGER NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, product_id)
+);
+
+CREATE TABLE t_p99209851_math_resources_site.sales_daily_categories (
+    day DATE NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    revenue NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    orders_count INTEGER NOT NULL DEFAULT 0,
+    units INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, category)
+);
+
+-- Отметка, что заказ уже учтён в агрегатах: защищает от двойного учёта при повторных вызовах
+ALTER TABLE t_p99209851_math_resources_site.orders ADD COLUMN rolled_up_at TIMESTAMP;
+
+CREATE INDEX idx_orders_paid_not_rolled_up ON t_p99209851_math_resources_site.orders(id)
+WHERE payment_status = 'paid' AND rolled_up_at IS NULL;
+
+-- Добавляет оплаченный заказ в дневные агрегаты ровно один раз.
+-- Выручка дня - фактически оплаченная сумма заказа, выручка товаров и категорий - по цене позиций.
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.rollup_order(p_order_id INTEGER) RETURNS BOOLEAN AS $$
+DECLARE
+    v_day DATE;
+    v_total NUMERIC;
+BEGIN
+    UPDATE t_p99209851_math_resources_site.orders
+    SET rolled_up_at = CURRENT_TIMESTAMP
+    WHERE id = p_order_id AND payment_status = 'paid' AND rolled_up_at IS NULL
+    RETURNING COALESCE(paid_at, created_at)::date, total_price INTO v_day, v_total;
+
+    IF NOT FOUND THEN
+        RETURN FALSE;
+    END IF;
+
+    INSERT INTO t_p99209851_math_resources_site.sales_daily (day, revenue, orders_count, units)
+    SELECT v_day, COALESCE(v_total, 0), 1, COALESCE(SUM(COALESCE(oi.quantity, 1)), 0)
+    FROM t_p99209851_math_resources_site.order_items oi
+    WHERE oi.order_id = p_order_id
+    ON CONFLICT (day) DO UPDATE SET
+        revenue = t_p99209851_math_resources_site.sales_daily.revenue + EXCLUDED.revenue,
+        orders_count = t_p99209851_math_resources_site.sales_daily.orders_count + 1,
+        units = t_p99209851_math_resources_site.sales_daily.units + EXCLUDED.units;
+
+    INSERT INTO t_p99209851_math_resources_site.sales_daily_products (day, product_id, category, revenue, orders_count, units)
+    SELECT v_day, oi.product_id, COALESCE(MAX(p.category), ''),
+           SUM(oi.product_price * COALESCE(oi.quantity, 1)), 1, SUM(COALESCE(oi.quantity, 1))
+    FROM t_p99209851_math_resources_site.order_items oi
+    LEFT JOIN t_p99209851_math_resources_site.products p ON p.id = oi.product_id
+    WHERE oi.order_id = p_order_id AND oi.product_id IS NOT NULL
+    GROUP BY oi.product_id
+    ON CONFLICT (day, product_id) DO UPDATE SET
+        revenue = t_p99209851_math_resources_site.sales_daily_products.revenue + EXCLUDED.revenue,
+        orders_count = t_p99209851_math_resources_site.sales_daily_products.orders_count + 1,
+        units = t_p99209851_math_resources_site.sales_daily_products.units + EXCLUDED.units;
+
+    INSERT INTO t_p99209851_math_resources_site.sales_daily_categories (day, category, revenue, orders_count, units)
+    SELECT v_day, COALESCE(p.category, ''),
+           SUM(oi.product_price * COALESCE(oi.quantity, 1)), 1, SUM(COALESCE(oi.quantity, 1))
+    FROM t_p99209851_math_resources_site.order_items oi
+    LEFT JOIN t_p99209851_math_resources_site.products p ON p.id = oi.product_id
+    WHERE oi.order_id = p_order_id AND oi.product_id IS NOT NULL
+    GROUP BY COALESCE(p.category, '')
+    ON CONFLICT (day, category) DO UPDATE SET
+        revenue = t_p99209851_math_resources_site.sales_daily_categories.revenue + EXCLUDED.revenue,
+        orders_count = t_p99209851_math_resources_site.sales_daily_categories.orders_count + 1,
+        units = t_p99209851_math_resources_site.sales_daily_categories.units + EXCLUDED.units;
+
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Догоняющий проход для заказов, оплаченных в обход on_order_paid или до появления агрегатов
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.rollup_pending_orders(p_limit INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    v_order_id INTEGER;
+    v_count INTEGER := 0;
+BEGIN
+    FOR v_order_id IN
+        SELECT id FROM t_p99209851_math_resources_site.orders
+        WHERE payment_status = 'paid' AND rolled_up_at IS NULL
+        ORDER BY id
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    LOOP
+        IF t_p99209851_math_resources_site.rollup_order(v_order_id) THEN
+            v_count := v_count + 1;
+        END IF;
+    END LOOP;
+    RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Всё, что должно произойти в транзакции перевода заказа в paid
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.on_order_paid(p_order_id INTEGER) RETURNS VOID AS $$
+    SELECT t_p99209851_math_resources_site.grant_entitlements(p_order_id);
+
+    INSERT INTO t_p99209851_math_resources_site.customer_cache_versions (email, version, updated_at)
+    SELECT LOWER(o.guest_email), 1, CURRENT_TIMESTAMP
+    FROM t_p99209851_math_resources_site.orders o
+    WHERE o.id = p_order_id AND o.guest_email IS NOT NULL
+    ON CONFLICT (email) DO UPDATE SET
+        version = t_p99209851_math_resources_site.customer_cache_versions.version + 1,
+        updated_at = CURRENT_TIMESTAMP;
+
+    SELECT t_p99209851_math_resources_site.rollup_order(p_order_id);
+$$ LANGUAGE sql;
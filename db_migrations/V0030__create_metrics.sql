@@ -0,0 +1,26 @@
+-- Накопленные метрики функций: контейнеры периодически досылают приращения счётчиков и корзин гистограмм,
+-- endpoint metrics отдаёт их в формате Prometheus
+CREATE TABLE t_p99209851_math_resources_site.metrics (
+    function_name VARCHAR(64) NOT NULL,
+    name VARCHAR(100) NOT NULL,
+    labels TEXT NOT NULL DEFAULT '',
+    kind VARCHAR(16) NOT NULL,
+    value DOUBLE PRECISION NOT NULL DEFAULT 0,
+    count BIGINT NOT NULL DEFAULT 0,
+    buckets BIGINT[],
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (function_name, name, labels)
+);
+
+-- Поэлементная сумма корзин гистограммы; у счётчиков корзин нет
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.add_buckets(a BIGINT[], b BIGINT[]) RETURNS BIGINT[] AS $$
+    SELECT CASE
+        WHEN a IS NULL THEN b
+        WHEN b IS NULL THEN a
+        ELSE ARRAY(
+            SELECT COALESCE(x, 0) + COALESCE(y, 0)
+            FROM unnest(a, b) WITH ORDINALITY AS t(x, y, position)
+            ORDER BY position
+        )
+    END
+$$ LANGUAGE sql IMMUTABLE;
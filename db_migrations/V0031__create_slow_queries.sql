@@ -0,0 +1,19 @@
+-- Время SQL-запросов функций по отпечаткам нормализованного текста: сколько раз, суммарно и максимум,
+-- сколько раз дольше порога и последний снятый план EXPLAIN (ANALYZE, BUFFERS) для медленных SELECT
+CREATE TABLE t_p99209851_math_resources_site.slow_queries (
+    fingerprint VARCHAR(16) NOT NULL,
+    function_name VARCHAR(64) NOT NULL,
+    query TEXT NOT NULL,
+    calls BIGINT NOT NULL DEFAULT 0,
+    total_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+    max_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+    slow_calls BIGINT NOT NULL DEFAULT 0,
+    plan TEXT,
+    plan_elapsed_ms DOUBLE PRECISION,
+    plan_captured_at TIMESTAMP,
+    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (fingerprint, function_name)
+);
+
+CREATE INDEX idx_slow_queries_total_ms ON t_p99209851_math_resources_site.slow_queries(total_ms DESC);
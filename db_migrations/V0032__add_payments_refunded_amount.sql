@@ -0,0 +1,7 @@
+-- Возвраты не меняют статус платежа (он остаётся succeeded), поэтому сумма возврата хранится отдельно
+ALTER TABLE t_p99209851_math_resources_site.payments
+ADD COLUMN refunded_amount NUMERIC(12, 2) NOT NULL DEFAULT 0;
+
+-- Платежи, которые payments-sync перечитывает на каждом запуске, пока они не перейдут в конечный статус
+CREATE INDEX idx_payments_non_final ON t_p99209851_math_resources_site.payments(synced_at)
+WHERE status IN ('pending', 'waiting_for_capture');
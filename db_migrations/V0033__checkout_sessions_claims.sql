@@ -0,0 +1,6 @@
+-- Сессия checkout создаётся до запроса в ЮКассу как заявка без платежа: payment_id и payment_url дописываются
+-- второй короткой транзакцией, claimed_at показывает, не брошена ли заявка
+ALTER TABLE t_p99209851_math_resources_site.checkout_sessions
+ALTER COLUMN payment_id DROP NOT NULL,
+ALTER COLUMN payment_url DROP NOT NULL,
+ADD COLUMN claimed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
@@ -0,0 +1,60 @@
+-- Единая форма email в entitlements и customer_cache_versions: LOWER(TRIM(...)), как ключ корзины в create-payment.
+-- Приводится один раз при записи, читатели передают уже приведённый email и сравнивают без функций
+
+-- Права, которые после приведения совпали бы, оставляем по самой ранней выдаче
+DELETE FROM t_p99209851_math_resources_site.entitlements e
+USING t_p99209851_math_resources_site.entitlements keep
+WHERE keep.product_id = e.product_id
+  AND LOWER(TRIM(keep.email)) = LOWER(TRIM(e.email))
+  AND keep.id < e.id;
+
+UPDATE t_p99209851_math_resources_site.entitlements
+SET email = LOWER(TRIM(email))
+WHERE email <> LOWER(TRIM(email));
+
+-- Версии кэша сливаем с повышением, чтобы тёплые контейнеры перечитали покупки
+INSERT INTO t_p99209851_math_resources_site.customer_cache_versions (email, version, updated_at)
+SELECT LOWER(TRIM(email)), MAX(version) + 1, CURRENT_TIMESTAMP
+FROM t_p99209851_math_resources_site.customer_cache_versions
+WHERE email <> LOWER(TRIM(email))
+GROUP BY LOWER(TRIM(email))
+ON CONFLICT (email) DO UPDATE SET
+    version = GREATEST(t_p99209851_math_resources_site.customer_cache_versions.version, EXCLUDED.version) + 1,
+    updated_at = CURRENT_TIMESTAMP;
+
+DELETE FROM t_p99209851_math_resources_site.customer_cache_versions
+WHERE email <> LOWER(TRIM(email));
+
+-- Запись в другой форме - ошибка писателя, а не тихий промах при чтении
+ALTER TABLE t_p99209851_math_resources_site.entitlements
+    ADD CONSTRAINT check_entitlements_email_normalized CHECK (email = LOWER(TRIM(email)));
+
+ALTER TABLE t_p99209851_math_resources_site.customer_cache_versions
+    ADD CONSTRAINT check_customer_cache_versions_email_normalized CHECK (email = LOWER(TRIM(email)));
+
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.grant_entitlements(p_order_id INTEGER) RETURNS VOID AS $$
+    INSERT INTO t_p99209851_math_resources_site.entitlements (email, user_id, product_id, order_id)
+    SELECT LOWER(TRIM(o.guest_email)), COALESCE(o.user_id, u.id), oi.product_id, o.id
+    FROM t_p99209851_math_resources_site.orders o
+    JOIN t_p99209851_math_resources_site.order_items oi ON oi.order_id = o.id
+    LEFT JOIN t_p99209851_math_resources_site.users u ON u.email = o.guest_email
+    WHERE o.id = p_order_id
+      AND o.payment_status = 'paid'
+      AND o.guest_email IS NOT NULL
+      AND oi.product_id IS NOT NULL
+    ON CONFLICT (email, product_id) DO NOTHING;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION t_p99209851_math_resources_site.on_order_paid(p_order_id INTEGER) RETURNS VOID AS $$
+    SELECT t_p99209851_math_resources_site.grant_entitlements(p_order_id);
+
+    INSERT INTO t_p99209851_math_resources_site.customer_cache_versions (email, version, updated_at)
+    SELECT LOWER(TRIM(o.guest_email)), 1, CURRENT_TIMESTAMP
+    FROM t_p99209851_math_resources_site.orders o
+    WHERE o.id = p_order_id AND o.guest_email IS NOT NULL
+    ON CONFLICT (email) DO UPDATE SET
+        version = t_p99209851_math_resources_site.customer_cache_versions.version + 1,
+        updated_at = CURRENT_TIMESTAMP;
+
+    SELECT t_p99209851_math_resources_site.rollup_order(p_order_id);
+$$ LANGUAGE sql;
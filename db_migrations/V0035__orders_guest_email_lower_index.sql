@@ -0,0 +1,6 @@
+-- my-purchases ищет заказы по email в той же форме, что entitlements: LOWER(TRIM(guest_email)).
+-- guest_email в INCLUDE - без него Postgres не делает index-only scan по индексу на выражении.
+-- Старый индекс по guest_email как есть больше никем не читается
+CREATE INDEX idx_orders_guest_email_lower_status_created ON t_p99209851_math_resources_site.orders(LOWER(TRIM(guest_email)), payment_status, created_at DESC) INCLUDE (id, guest_email);
+
+DROP INDEX IF EXISTS t_p99209851_math_resources_site.idx_orders_guest_email_status_created;
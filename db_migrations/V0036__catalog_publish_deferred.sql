@@ -0,0 +1,2 @@
+-- Отложенная публикация: до этого момента ждёт один вызов, который опубликует хвост серии правок
+ALTER TABLE t_p99209851_math_resources_site.catalog_publish_state ADD COLUMN deferred_until TIMESTAMP;
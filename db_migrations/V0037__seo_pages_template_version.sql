@@ -0,0 +1,4 @@
+-- Версия разметки, которой нарисована страница товара: после смены шаблона в seo-pages
+-- инкрементальный запуск перерисовывает все страницы старой версии, а не только изменённые товары
+ALTER TABLE t_p99209851_math_resources_site.seo_pages
+    ADD COLUMN template_version INTEGER NOT NULL DEFAULT 1;
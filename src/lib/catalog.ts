@@ -0,0 +1,20 @@
+const CATALOG_MANIFEST_URL = 'https://cdn.poehali.dev/catalog/manifest.json';
+
+// Каталог читается из статического снимка в CDN, при недоступности снимка - из функции products
+export async function loadCatalog<T>(fallbackUrl: string): Promise<T[]> {
+  try {
+    const manifestResponse = await fetch(CATALOG_MANIFEST_URL, { cache: 'no-cache' });
+    if (manifestResponse.ok) {
+      const manifest = await manifestResponse.json();
+      const snapshotResponse = await fetch(manifest.products.url);
+      if (snapshotResponse.ok) {
+        return await snapshotResponse.json();
+      }
+    }
+  } catch (error) {
+    console.error('Снимок каталога недоступен, загружаем из API');
+  }
+
+  const response = await fetch(fallbackUrl);
+  return await response.json();
+}
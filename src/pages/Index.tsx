@@ -12,6 +12,7 @@ import { Separator } from '@/components/ui/separator';
 import Icon from '@/components/ui/icon';
 import { toast } from 'sonner';
 import SEO from '@/components/SEO';
+import { loadCatalog } from '@/lib/catalog';
 
 interface Product {
   id: number;
@@ -99,8 +100,7 @@ const Index = () => {
 
   const loadProducts = async () => {
     try {
-      const response = await fetch(API_URL);
-      const data = await response.json();
+      const data = await loadCatalog<Product>(`${API_URL}?assets=sample_pdf,trainer`);
       console.log('Index page - loaded product with id=1:', data.find((p: any) => p.id === 1)?.description);
       setProducts(data);
     } catch (error) {
@@ -122,12 +122,11 @@ const Index = () => {
 
   const loadPurchasedProducts = async (email: string) => {
     try {
-      const response = await fetch(`https://functions.poehali.dev/3a1ed603-9a84-4270-a759-a900fcc8d5b3?email=${encodeURIComponent(email)}`);
+      const response = await fetch(`https://functions.poehali.dev/3a1ed603-9a84-4270-a759-a900fcc8d5b3?email=${encodeURIComponent(email)}&owned=true`);
       const data = await response.json();
       
-      if (response.ok && data.purchases) {
-        const productIds = data.purchases.map((p: any) => p.product_id);
-        setPurchasedProductIds(productIds);
+      if (response.ok && data.product_ids) {
+        setPurchasedProductIds(data.product_ids);
       }
     } catch (error) {
       console.error('Ошибка загрузки покупок');
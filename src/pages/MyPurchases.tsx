@@ -20,6 +20,8 @@ const MyPurchases = () => {
   const navigate = useNavigate();
   const [purchases, setPurchases] = useState<Purchase[]>([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const userEmail = localStorage.getItem('user_email');
 
   useEffect(() => {
@@ -39,6 +41,7 @@ const MyPurchases = () => {
       
       if (response.ok && data.purchases) {
         setPurchases(data.purchases);
+        setNextCursor(data.next_cursor || null);
       } else {
         setPurchases([]);
       }
@@ -50,6 +53,24 @@ const MyPurchases = () => {
     }
   };
 
+  const loadMorePurchases = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetch(`https://functions.poehali.dev/3a1ed603-9a84-4270-a759-a900fcc8d5b3?email=${encodeURIComponent(userEmail || '')}&cursor=${encodeURIComponent(nextCursor)}`);
+      const data = await response.json();
+      
+      if (response.ok && data.purchases) {
+        setPurchases((prev) => [...prev, ...data.purchases]);
+        setNextCursor(data.next_cursor || null);
+      }
+    } catch (error) {
+      toast.error('Ошибка загрузки покупок');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleLogout = () => {
     localStorage.removeItem('user_token');
     localStorage.removeItem('user_email');
@@ -156,6 +177,15 @@ const MyPurchases = () => {
             ))}
           </div>
         )}
+
+        {!loading && nextCursor && (
+          <div className="text-center mt-8">
+            <Button variant="outline" onClick={loadMorePurchases} disabled={loadingMore}>
+              <Icon name={loadingMore ? 'Loader2' : 'ChevronDown'} size={18} className={loadingMore ? 'mr-2 animate-spin' : 'mr-2'} />
+              Показать ещё
+            </Button>
+          </div>
+        )}
       </main>
     </div>
   );
@@ -7,6 +7,7 @@ import { Separator } from '@/components/ui/separator';
 import Icon from '@/components/ui/icon';
 import { toast } from 'sonner';
 import SEO from '@/components/SEO';
+import { loadCatalog } from '@/lib/catalog';
 
 interface Product {
   id: number;
@@ -48,19 +49,18 @@ const Product = () => {
 
   const loadProduct = async (email?: string) => {
     try {
-      const response = await fetch(API_URL);
-      const data = await response.json();
+      const data = await loadCatalog<Product>(`${API_URL}?assets=sample_pdf`);
       const foundProduct = data.find((p: Product) => p.id === Number(id));
       
       if (foundProduct) {
         setProduct(foundProduct);
         
         if (email) {
-          const purchasesResponse = await fetch(`https://functions.poehali.dev/3a1ed603-9a84-4270-a759-a900fcc8d5b3?email=${encodeURIComponent(email)}`);
+          const purchasesResponse = await fetch(`https://functions.poehali.dev/3a1ed603-9a84-4270-a759-a900fcc8d5b3?email=${encodeURIComponent(email)}&owned=true`);
           const purchasesData = await purchasesResponse.json();
           
-          if (purchasesResponse.ok && purchasesData.purchases) {
-            const purchased = purchasesData.purchases.some((p: any) => p.product_id === Number(id));
+          if (purchasesResponse.ok && purchasesData.product_ids) {
+            const purchased = purchasesData.product_ids.includes(Number(id));
             setIsPurchased(purchased);
           }
         }
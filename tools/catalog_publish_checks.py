@@ -0,0 +1,241 @@
+'''
+Business: Проверки catalog-publish против локального S3 (moto) и базы с миграциями: публикация снимка и манифеста,
+          повторный POST без изменений, GET только на чтение, 401 без токена админа и отложенная публикация серии правок
+          (один вызов ждёт конца окна троттлинга и публикует последнюю правку, остальные отвечают 202).
+          Функция вызывается в этом же процессе; правка каталога - сдвиг updated_at у первого товара. Бакет moto каждый раз
+          новый, поэтому состояние публикации в базе сбрасывается в начале: прошлый манифест ссылается на файлы, которых нет
+Args: имена проверок (по умолчанию все), --throttle-seconds (окно троттлинга для проверок); DATABASE_URL из окружения;
+      нужен пакет moto[server]
+Returns: PASS/FAIL по каждой проверке в stdout; код выхода 1, если хоть одна не прошла
+'''
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import boto3
+import jwt
+import psycopg2
+from moto.server import ThreadedMotoServer
+
+from flow_checks import CheckFailed, expect
+
+PUBLISH_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'catalog-publish'
+SCHEMA = 't_p99209851_math_resources_site'
+BUCKET = 'catalog-publish-checks'
+CDN_URL = 'https://cdn.example.com'
+ADMIN_SECRET = 'catalog-publish-checks-admin-secret'
+
+
+class Context:
+    request_id = 'catalog-publish-checks'
+
+
+class Checks:
+    def __init__(self, publish: Any, s3_client: Any, dsn: str):
+        self.publish = publish
+        self.s3 = s3_client
+        self.dsn = dsn
+        self.token = jwt.encode({'admin_id': 1, 'exp': int(time.time()) + 3600}, ADMIN_SECRET, algorithm='HS256')
+
+    def call(self, method: str, params: Optional[Dict[str, str]] = None, token: Optional[str] = None) -> Dict[str, Any]:
+        # Строки лога трассировки не нужны в выводе проверок
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.publish.handler({
+                'httpMethod': method,
+                'headers': {'X-Admin-Token': token} if token else {},
+                'queryStringParameters': params,
+                'body': '{}' if method == 'POST' else None
+            }, Context())
+        return {'status': response['statusCode'], 'body': json.loads(response['body'])}
+
+    def post(self, force: bool = False) -> Dict[str, Any]:
+        return self.call('POST', {'force': 'true'} if force else None, self.token)
+
+    def edit_catalog(self) -> None:
+        conn = psycopg2.connect(self.dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute(f"UPDATE {SCHEMA}.products SET updated_at = CURRENT_TIMESTAMP WHERE id = (SELECT MIN(id) FROM {SCHEMA}.products)")
+            expect(cur.rowcount == 1, 'no products in the database')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def state(self) -> Dict[str, Any]:
+        conn = psycopg2.connect(self.dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT catalog_version, published_at, deferred_until FROM {SCHEMA}.catalog_publish_state WHERE name = 'catalog'")
+            published_version, published_at, deferred_until = cur.fetchone()
+            cur.execute(f"SELECT COUNT(*), MAX(updated_at) FROM {SCHEMA}.products")
+            count, last_modified = cur.fetchone()
+        finally:
+            conn.close()
+        return {
+            'published_version': published_version,
+            'catalog_version': f"{count}|{last_modified.isoformat() if last_modified else ''}",
+            'published_at': published_at,
+            'deferred_until': deferred_until
+        }
+
+    def bucket_keys(self) -> Dict[str, Any]:
+        pages = self.s3.get_paginator('list_objects_v2').paginate(Bucket=BUCKET)
+        return {item['Key']: item['LastModified'] for page in pages for item in page.get('Contents', [])}
+
+    def manifest(self) -> Dict[str, Any]:
+        return json.loads(self.s3.get_object(Bucket=BUCKET, Key=self.publish.MANIFEST_KEY)['Body'].read())
+
+    def publish_snapshot(self) -> str:
+        """POST с force публикует текущий каталог: манифест в S3 ссылается на загруженные файлы и совпадает с версией"""
+        self.edit_catalog()
+        result = self.post(force=True)
+        expect(result['status'] == 200 and result['body']['status'] == 'published', f'publish returned {result}')
+        manifest = self.manifest()
+        state = self.state()
+        expect(manifest['version'] == state['catalog_version'] == state['published_version'],
+               f"manifest {manifest['version']}, catalog {state['catalog_version']}, state {state['published_version']}")
+        keys = self.bucket_keys()
+        urls = [manifest['products']['url']] + [entry['url'] for entry in manifest['categories'].values()]
+        missing = [url for url in urls if url[len(CDN_URL) + 1:] not in keys]
+        expect(not missing, f'manifest points at objects that are not in the bucket: {missing[:3]}')
+        return f"{manifest['products']['count']} products, {len(manifest['categories'])} categories, {result['body']['uploaded']} files uploaded"
+
+    def up_to_date(self) -> str:
+        """POST без изменений каталога ничего не загружает и отвечает up_to_date"""
+        self.post(force=True)
+        keys = self.bucket_keys()
+        result = self.post()
+        expect(result['status'] == 200 and result['body']['status'] == 'up_to_date', f'repeated publish returned {result}')
+        expect(self.bucket_keys() == keys, 'repeated publish wrote to the bucket')
+        return 'no uploads'
+
+    def get_read_only(self) -> str:
+        """GET после правки показывает stale, но не публикует, не ставит ожидание и не пишет в S3 - даже с force"""
+        self.post(force=True)
+        self.edit_catalog()
+        before, keys = self.state(), self.bucket_keys()
+        for params in [None, {'force': 'true'}]:
+            result = self.call('GET', params, self.token)
+            expect(result['status'] == 200 and result['body']['status'] == 'stale', f'GET returned {result}')
+        result = self.call('GET')
+        expect(result['status'] == 200 and result['body']['manifest']['version'] == before['published_version'],
+               f'GET without a token returned {result}')
+        after = self.state()
+        expect(after == before, f'GET changed the publish state: {before} -> {after}')
+        expect(self.bucket_keys() == keys, 'GET wrote to the bucket')
+        return 'state and bucket unchanged'
+
+    def unauthorized(self) -> str:
+        """POST без токена или с чужим токеном - 401, публикации нет"""
+        self.edit_catalog()
+        before = self.state()
+        forged = jwt.encode({'admin_id': 1, 'exp': int(time.time()) + 3600}, 'a-secret-this-deployment-does-not-use', algorithm='HS256')
+        statuses = [self.call('POST', {'force': 'true'})['status'], self.call('POST', {'force': 'true'}, forged)['status']]
+        expect(statuses == [401, 401], f'publish without a valid token returned {statuses}')
+        expect(self.state() == before, 'publish without a valid token changed the state')
+        return '401 without a token and with a forged one'
+
+    def deferred_waiter(self) -> str:
+        """Серия правок в окне троттлинга: первый вызов ждёт конца окна и публикует последнюю правку, второй сразу 202"""
+        self.post(force=True)
+        self.edit_catalog()
+        results: List[Dict[str, Any]] = []
+        started = time.monotonic()
+        waiter = threading.Thread(target=lambda: results.append(self.post()))
+        waiter.start()
+        deadline = time.monotonic() + 5
+        while self.state()['deferred_until'] is None:
+            expect(waiter.is_alive() and time.monotonic() < deadline, f'no call is waiting for the window: {results}')
+            time.sleep(0.05)
+        second = self.post()
+        expect(second['status'] == 202 and second['body']['status'] == 'deferred', f'second publish returned {second}')
+        self.edit_catalog()
+        waiter.join(self.publish.THROTTLE_SECONDS + 10)
+        waited = time.monotonic() - started
+        expect(results and results[0]['status'] == 200 and results[0]['body']['status'] == 'published',
+               f'waiting publish returned {results}')
+        state = self.state()
+        expect(state['published_version'] == state['catalog_version'] == self.manifest()['version'],
+               f'the last edit is not published: {state}')
+        expect(state['deferred_until'] is None, f'deferred_until left set: {state}')
+        return f'tail of the burst published after {waited:.1f} s, the other call got 202'
+
+
+CHECKS = {
+    'publish': Checks.publish_snapshot,
+    'up-to-date': Checks.up_to_date,
+    'get-read-only': Checks.get_read_only,
+    'unauthorized': Checks.unauthorized,
+    'deferred-waiter': Checks.deferred_waiter
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Проверки catalog-publish против локального S3')
+    parser.add_argument('checks', nargs='*', help='по умолчанию все: ' + ', '.join(CHECKS))
+    parser.add_argument('--throttle-seconds', type=int, default=3)
+    args = parser.parse_args()
+
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f'unknown checks: {", ".join(unknown)}')
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ.update({
+        'S3_ENDPOINT': f'http://{host}:{port}',
+        'S3_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'S3_BUCKET': BUCKET,
+        'CDN_URL': CDN_URL,
+        'ADMIN_JWT_SECRET': ADMIN_SECRET,
+        'CATALOG_PUBLISH_THROTTLE_SECONDS': str(args.throttle_seconds)
+    })
+    s3_client = boto3.client('s3', endpoint_url=os.environ['S3_ENDPOINT'], region_name='us-east-1',
+                             aws_access_key_id='testing', aws_secret_access_key='testing')
+    s3_client.create_bucket(Bucket=BUCKET)
+    sys.path.insert(0, str(PUBLISH_DIR))
+    publish = importlib.import_module('index')
+
+    conn = psycopg2.connect(dsn)
+    try:
+        conn.cursor().execute(
+            f"UPDATE {SCHEMA}.catalog_publish_state SET catalog_version = NULL, manifest = NULL, published_at = NULL, "
+            "deferred_until = NULL WHERE name = 'catalog'"
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    checks = Checks(publish, s3_client, dsn)
+    failed = 0
+    try:
+        for name in args.checks or list(CHECKS):
+            try:
+                print(f'PASS {name}: {CHECKS[name](checks)}')
+            except CheckFailed as e:
+                failed += 1
+                print(f'FAIL {name}: {e}')
+    finally:
+        server.stop()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,676 @@
+'''
+Business: Локальные заглушки внешних сервисов - YooKassa, Telegram Bot API, загрузка файлов (api.poehali.dev/v1/upload
+          и storage-upload.poehali.dev) и SMTP - чтобы цепочка оплата -> webhook -> письмо и уведомление работала
+          на одной машине без сети. У каждой заглушки настраиваются задержка, доля ошибок и лимит запросов в секунду
+Args: --host, --yookassa-port, --telegram-port, --upload-port, --smtp-port, --only (через запятую - поднять только эти),
+      --latency-ms, --jitter-ms, --error-rate, --rate-limit (значение для всех или <сервис>=<значение>, можно повторять),
+      --auto-pay-ms (через сколько созданный платёж становится succeeded), --decline-rate (доля отменённых вместо оплаты),
+      --webhook-url (куда слать уведомления YooKassa), --mail-dir (сохранять принятые письма как .eml)
+Returns: серверы до Ctrl+C; в stdout - переменные окружения для функций (KEY=VALUE), в stderr - статистика по сервисам
+'''
+import argparse
+import base64
+import heapq
+import json
+import os
+import random
+import re
+import signal
+import socket
+import socketserver
+import ssl
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+SERVICES = ['yookassa', 'telegram', 'upload', 'smtp']
+MAX_PAYMENTS = 100000
+WEBHOOK_ATTEMPTS = 3
+WEBHOOK_CONCURRENCY = 8
+MAX_BODY_BYTES = 50 * 1024 * 1024
+
+RATE_LIMITED = 'rate_limited'
+INJECTED_ERROR = 'injected_error'
+
+
+class TokenBucket:
+    """Лимит запросов в секунду с запасом на секунду всплеска"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.capacity = max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class Behaviour:
+    """Поведение одной заглушки: задержка ответа, случайные ошибки, лимит запросов и счётчики"""
+
+    def __init__(self, name: str, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, rate_limit: float = 0.0):
+        self.name = name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.bucket = TokenBucket(rate_limit) if rate_limit > 0 else None
+        self.stats: Dict[str, int] = {'requests': 0, 'ok': 0, RATE_LIMITED: 0, INJECTED_ERROR: 0}
+        self._lock = threading.Lock()
+
+    def admit(self) -> Optional[str]:
+        """Решение по запросу: None - обслужить, иначе RATE_LIMITED или INJECTED_ERROR"""
+        if self.bucket and not self.bucket.take():
+            verdict = RATE_LIMITED
+        elif self.error_rate and random.random() < self.error_rate:
+            verdict = INJECTED_ERROR
+        else:
+            verdict = None
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats[verdict or 'ok'] += 1
+        return verdict
+
+    def delay(self) -> None:
+        delay_ms = self.latency_ms + (random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] = self.stats.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
+
+
+def utc_timestamp() -> str:
+    """Время в формате YooKassa: 2024-01-01T12:00:00.000Z - строки сравниваются как даты"""
+    now = datetime.utcnow()
+    return now.strftime('%Y-%m-%dT%H:%M:%S.') + f'{now.microsecond // 1000:03d}Z'
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Общая часть HTTP-заглушек: keep-alive, JSON-ответы, задержка, ошибки и лимит перед маршрутом"""
+
+    protocol_version = 'HTTP/1.1'
+    # Без Nagle ответ на keep-alive соединении не ждёт delayed ACK клиента
+    disable_nagle_algorithm = True
+    behaviour: Behaviour
+    behaviours: Dict[str, Behaviour] = {}
+    public_url = ''
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(min(length, MAX_BODY_BYTES)) if length else b''
+
+    def send_json(self, status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def error_body(self, status: int, code: str, description: str) -> Any:
+        return {'error': code, 'description': description}
+
+    def dispatch(self, method: str) -> None:
+        parts = urlsplit(self.path)
+        params = dict(parse_qsl(parts.query))
+        body = self.read_body() if method == 'POST' else b''
+
+        if parts.path == '/_stats':
+            # ?service=smtp - счётчики другой заглушки, у SMTP своего HTTP нет
+            behaviour = self.behaviours.get(params.get('service', ''), self.behaviour)
+            self.send_json(200, behaviour.snapshot())
+            return
+
+        verdict = self.behaviour.admit()
+        self.behaviour.delay()
+        if verdict == RATE_LIMITED:
+            self.send_json(429, self.error_body(429, 'too_many_requests', 'Too many requests'), {'Retry-After': '1'})
+            return
+        if verdict == INJECTED_ERROR:
+            self.send_json(500, self.error_body(500, 'internal_server_error', 'Injected failure'))
+            return
+
+        try:
+            self.route(method, parts.path, params, body)
+        except (ValueError, KeyError) as e:
+            self.send_json(400, self.error_body(400, 'invalid_request', str(e)))
+
+    def route(self, method: str, path: str, params: Dict[str, str], body: bytes) -> None:
+        raise NotImplementedError
+
+    def do_GET(self) -> None:
+        self.dispatch('GET')
+
+    def do_POST(self) -> None:
+        self.dispatch('POST')
+
+
+class PaymentStore:
+    """Платежи заглушки YooKassa в памяти: идемпотентность по Idempotence-Key и вытеснение самых старых"""
+
+    def __init__(self, max_payments: int = MAX_PAYMENTS):
+        self.max_payments = max_payments
+        self.payments: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.idempotence: Dict[str, str] = {}
+        self.key_of: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def create(self, idempotence_key: str, request: Dict[str, Any], confirmation_base: str) -> Tuple[Dict[str, Any], bool]:
+        """Возвращает платёж и признак, что он создан этим запросом, а не повтором с тем же ключом"""
+        with self._lock:
+            existing_id = self.idempotence.get(idempotence_key)
+            if existing_id and existing_id in self.payments:
+                return dict(self.payments[existing_id]), False
+
+            payment_id = str(uuid.uuid4())
+            confirmation = request.get('confirmation') or {}
+            payment = {
+                'id': payment_id,
+                'status': 'pending',
+                'paid': False,
+                'amount': request['amount'],
+                'description': request.get('description', ''),
+                'created_at': utc_timestamp(),
+                'confirmation': {
+                    'type': confirmation.get('type', 'redirect'),
+                    'return_url': confirmation.get('return_url'),
+                    'confirmation_url': f'{confirmation_base}/checkout/{payment_id}'
+                },
+                'test': True,
+                'refundable': False,
+                'metadata': request.get('metadata') or {}
+            }
+            self.payments[payment_id] = payment
+            self.idempotence[idempotence_key] = payment_id
+            self.key_of[payment_id] = idempotence_key
+            while len(self.payments) > self.max_payments:
+                evicted_id, _ = self.payments.popitem(last=False)
+                self.idempotence.pop(self.key_of.pop(evicted_id), None)
+            return dict(payment), True
+
+    def get(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            payment = self.payments.get(payment_id)
+            return dict(payment) if payment else None
+
+    def finish(self, payment_id: str, status: str) -> Optional[Dict[str, Any]]:
+        """Переводит ожидающий платёж в succeeded или canceled; повторный вызов ничего не меняет"""
+        with self._lock:
+            payment = self.payments.get(payment_id)
+            if not payment or payment['status'] != 'pending':
+                return None
+            payment['status'] = status
+            payment['paid'] = status == 'succeeded'
+            if status == 'succeeded':
+                payment['captured_at'] = utc_timestamp()
+                payment['income_amount'] = payment['amount']
+            else:
+                payment['cancellation_details'] = {'party': 'payment_network', 'reason': 'general_decline'}
+            return dict(payment)
+
+    def list(self, params: Dict[str, str]) -> Dict[str, Any]:
+        """Список от новых к старым с фильтрами status и created_at.gte/gt/lte/lt и курсором-смещением"""
+        limit = min(max(int(params.get('limit', 10)), 1), 100)
+        offset = int(base64.urlsafe_b64decode(params['cursor']).decode()) if params.get('cursor') else 0
+        comparisons: List[Tuple[str, Callable[[str, str], bool]]] = [
+            ('created_at.gte', lambda value, bound: value >= bound),
+            ('created_at.gt', lambda value, bound: value > bound),
+            ('created_at.lte', lambda value, bound: value <= bound),
+            ('created_at.lt', lambda value, bound: value < bound)
+        ]
+        with self._lock:
+            matched = [
+                dict(payment) for payment in reversed(self.payments.values())
+                if (not params.get('status') or payment['status'] == params['status'])
+                and all(compare(payment['created_at'], params[name]) for name, compare in comparisons if params.get(name))
+            ]
+        page = {'type': 'list', 'items': matched[offset:offset + limit]}
+        if offset + limit < len(matched):
+            page['next_cursor'] = base64.urlsafe_b64encode(str(offset + limit).encode()).decode()
+        return page
+
+
+class WebhookSender:
+    """Планировщик уведомлений YooKassa: один поток ждёт сроков, доставка - в пуле с повторами"""
+
+    def __init__(self, url: Optional[str], behaviour: Behaviour, concurrency: int = WEBHOOK_CONCURRENCY):
+        self.url = url
+        self.behaviour = behaviour
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._queue: List[Tuple[float, int, Callable[[], None]]] = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def schedule(self, delay_seconds: float, action: Callable[[], None]) -> None:
+        with self._condition:
+            self._sequence += 1
+            heapq.heappush(self._queue, (time.monotonic() + delay_seconds, self._sequence, action))
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue or self._queue[0][0] > time.monotonic():
+                    self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                _, _, action = heapq.heappop(self._queue)
+            self.executor.submit(action)
+
+    def notify(self, event: str, payment: Dict[str, Any]) -> None:
+        if not self.url:
+            return
+        self.executor.submit(self._deliver, json.dumps({'type': 'notification', 'event': event, 'object': payment}).encode('utf-8'))
+
+    def _deliver(self, payload: bytes) -> None:
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            if attempt:
+                time.sleep(0.5 * (2 ** attempt))
+            request = urllib.request.Request(self.url, data=payload, headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(request, timeout=30):
+                    self.behaviour.count('webhooks_delivered')
+                    return
+            except Exception as e:
+                print(f'[fake-yookassa] Webhook attempt {attempt + 1} failed: {e}', file=sys.stderr)
+        self.behaviour.count('webhooks_failed')
+
+
+class YooKassaHandler(FakeHandler):
+    """POST /v3/payments, GET /v3/payments/<id>, GET /v3/payments (список), GET /checkout/<id> - "оплата" покупателем.
+    GET /checkout/<id>?notify=false оплачивает без уведомления: webhook отправляет и замеряет сам вызывающий"""
+
+    store: PaymentStore
+    webhooks: WebhookSender
+    auto_pay_seconds: Optional[float] = None
+    decline_rate = 0.0
+
+    def error_body(self, status: int, code: str, description: str) -> Any:
+        return {'type': 'error', 'id': str(uuid.uuid4()), 'code': code, 'description': description}
+
+    def finish_payment(self, payment_id: str, status: str) -> Optional[Dict[str, Any]]:
+        payment = self.store.finish(payment_id, status)
+        if payment:
+            self.behaviour.count(f'payments_{status}')
+            self.webhooks.notify(f'payment.{status}', payment)
+        return payment
+
+    def route(self, method: str, path: str, params: Dict[str, str], body: bytes) -> None:
+        checkout = re.fullmatch(r'/checkout/([0-9a-f-]+)', path)
+        if method == 'GET' and checkout:
+            if params.get('notify') == 'false':
+                payment = self.store.finish(checkout.group(1), 'succeeded') or self.store.get(checkout.group(1))
+            else:
+                payment = self.finish_payment(checkout.group(1), 'succeeded') or self.store.get(checkout.group(1))
+            if not payment:
+                self.send_json(404, self.error_body(404, 'not_found', 'Payment not found'))
+                return
+            self.send_response(302)
+            self.send_header('Location', payment['confirmation'].get('return_url') or '/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if not (self.headers.get('Authorization') or '').startswith('Basic '):
+            self.send_json(401, self.error_body(401, 'invalid_credentials', 'Basic authorization required'))
+            return
+
+        if method == 'POST' and path == '/v3/payments':
+            idempotence_key = self.headers.get('Idempotence-Key')
+            if not idempotence_key:
+                self.send_json(400, self.error_body(400, 'invalid_request', 'Idempotence-Key header is required'))
+                return
+            request = json.loads(body or b'{}')
+            if not (request.get('amount') or {}).get('value'):
+                self.send_json(400, self.error_body(400, 'invalid_request', 'amount.value is required'))
+                return
+            payment, created = self.store.create(idempotence_key, request, self.public_url)
+            if created:
+                self.behaviour.count('payments_created')
+                if self.auto_pay_seconds is not None:
+                    status = 'canceled' if random.random() < self.decline_rate else 'succeeded'
+                    self.webhooks.schedule(self.auto_pay_seconds, lambda: self.finish_payment(payment['id'], status))
+            self.send_json(200, payment)
+            return
+
+        if method == 'GET' and path == '/v3/payments':
+            self.send_json(200, self.store.list(params))
+            return
+
+        payment_path = re.fullmatch(r'/v3/payments/([0-9a-f-]+)', path)
+        if method == 'GET' and payment_path:
+            payment = self.store.get(payment_path.group(1))
+            if payment:
+                self.send_json(200, payment)
+            else:
+                self.send_json(404, self.error_body(404, 'not_found', 'Payment not found'))
+            return
+
+        self.send_json(404, self.error_body(404, 'not_found', f'Unknown endpoint {method} {path}'))
+
+
+class TelegramHandler(FakeHandler):
+    """POST /bot<token>/sendMessage с ответом в формате Bot API"""
+
+    message_id = 0
+    _lock = threading.Lock()
+
+    def error_body(self, status: int, code: str, description: str) -> Any:
+        body: Dict[str, Any] = {'ok': False, 'error_code': status, 'description': description}
+        if status == 429:
+            body['parameters'] = {'retry_after': 1}
+        return body
+
+    def route(self, method: str, path: str, params: Dict[str, str], body: bytes) -> None:
+        if not re.fullmatch(r'/bot[^/]+/sendMessage', path):
+            self.send_json(404, self.error_body(404, 'not_found', 'Not Found'))
+            return
+        message = json.loads(body or b'{}') if method == 'POST' else params
+        if not message.get('chat_id'):
+            self.send_json(400, self.error_body(400, 'invalid_request', 'Bad Request: chat not found'))
+            return
+        if not message.get('text'):
+            self.send_json(400, self.error_body(400, 'invalid_request', 'Bad Request: message text is empty'))
+            return
+        with TelegramHandler._lock:
+            TelegramHandler.message_id += 1
+            message_id = TelegramHandler.message_id
+        self.send_json(200, {'ok': True, 'result': {
+            'message_id': message_id,
+            'chat': {'id': message['chat_id']},
+            'date': int(time.time()),
+            'text': message['text']
+        }})
+
+
+class UploadHandler(FakeHandler):
+    """POST /v1/upload (api.poehali.dev) и POST /upload (storage-upload.poehali.dev): multipart с полем file -> {url}"""
+
+    def route(self, method: str, path: str, params: Dict[str, str], body: bytes) -> None:
+        if method != 'POST' or path not in ('/v1/upload', '/upload'):
+            self.send_json(404, self.error_body(404, 'not_found', f'Unknown endpoint {method} {path}'))
+            return
+        if not body:
+            self.send_json(400, self.error_body(400, 'invalid_request', 'No file provided'))
+            return
+        filename = re.search(rb'filename="([^"]*)"', body[:4096])
+        name = filename.group(1).decode('utf-8', 'replace') if filename else ''
+        ext = name.rsplit('.', 1)[-1].lower() if '.' in name else 'bin'
+        self.send_json(200, {'url': f'{self.public_url}/files/{uuid.uuid4()}.{ext}', 'size': len(body)})
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    """Минимальный ESMTP: EHLO/HELO, AUTH PLAIN/LOGIN (любые данные), MAIL, RCPT, DATA, RSET, NOOP, QUIT.
+    STARTTLS не поддерживается - функциям нужен SMTP_STARTTLS=false"""
+
+    behaviour: Behaviour
+    mail_dir: Optional[str] = None
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode('utf-8') + b'\r\n')
+        self.wfile.flush()
+
+    def read_line(self) -> Optional[str]:
+        line = self.rfile.readline(MAX_BODY_BYTES)
+        return line.decode('utf-8', 'replace').rstrip('\r\n') if line else None
+
+    def handle(self) -> None:
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reply('220 fake-smtp ESMTP ready')
+        envelope: Dict[str, Any] = {'from': None, 'to': []}
+        while True:
+            line = self.read_line()
+            if line is None:
+                return
+            command, _, argument = line.partition(' ')
+            command = command.upper()
+
+            if command == 'EHLO':
+                self.reply('250-fake-smtp')
+                self.reply('250-8BITMIME')
+                self.reply('250-SMTPUTF8')
+                self.reply('250 AUTH PLAIN LOGIN')
+            elif command == 'HELO':
+                self.reply('250 fake-smtp')
+            elif command == 'AUTH':
+                mechanism, _, initial = argument.partition(' ')
+                if mechanism.upper() == 'LOGIN':
+                    self.reply('334 VXNlcm5hbWU6')
+                    if self.read_line() is None:
+                        return
+                    self.reply('334 UGFzc3dvcmQ6')
+                    if self.read_line() is None:
+                        return
+                elif mechanism.upper() == 'PLAIN' and not initial:
+                    self.reply('334 ')
+                    if self.read_line() is None:
+                        return
+                self.reply('235 2.7.0 Authentication successful')
+            elif command == 'MAIL':
+                # Лимит и случайная ошибка срабатывают на MAIL FROM, как у реальных серверов - временным кодом 4xx
+                verdict = self.behaviour.admit()
+                if verdict == RATE_LIMITED:
+                    self.reply('450 4.7.0 Rate limit exceeded')
+                elif verdict == INJECTED_ERROR:
+                    self.reply('451 4.3.0 Injected failure')
+                else:
+                    envelope = {'from': argument, 'to': []}
+                    self.reply('250 2.1.0 OK')
+            elif command == 'RCPT':
+                if envelope['from'] is None:
+                    self.reply('503 5.5.1 MAIL first')
+                else:
+                    envelope['to'].append(argument)
+                    self.reply('250 2.1.5 OK')
+            elif command == 'DATA':
+                if not envelope['to']:
+                    self.reply('503 5.5.1 RCPT first')
+                    continue
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data_line = self.rfile.readline(MAX_BODY_BYTES)
+                    if not data_line:
+                        return
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                self.behaviour.delay()
+                message_id = uuid.uuid4().hex
+                if self.mail_dir:
+                    with open(os.path.join(self.mail_dir, f'{message_id}.eml'), 'wb') as message_file:
+                        message_file.write(b''.join(lines))
+                self.behaviour.count('messages')
+                envelope = {'from': None, 'to': []}
+                self.reply(f'250 2.0.0 Queued as {message_id}')
+            elif command == 'RSET':
+                envelope = {'from': None, 'to': []}
+                self.reply('250 2.0.0 OK')
+            elif command == 'NOOP':
+                self.reply('250 2.0.0 OK')
+            elif command == 'STARTTLS':
+                self.reply('454 4.7.0 TLS not available, set SMTP_STARTTLS=false')
+            elif command == 'QUIT':
+                self.reply('221 2.0.0 Bye')
+                return
+            else:
+                self.reply('502 5.5.2 Command not recognized')
+
+
+class ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def parse_setting(values: Optional[List[str]], cast: Callable[[str], float]) -> Dict[str, float]:
+    """Значения вида 50 (для всех сервисов) или telegram=300; более поздние перекрывают более ранние"""
+    settings: Dict[str, float] = {}
+    for value in values or []:
+        if '=' in value:
+            name, _, number = value.partition('=')
+            if name not in SERVICES:
+                raise SystemExit(f'Unknown service {name!r}, expected one of {", ".join(SERVICES)}')
+            settings[name] = cast(number)
+        else:
+            settings.update({name: cast(value) for name in SERVICES})
+    return settings
+
+
+def make_handler(base: type, attributes: Dict[str, Any]) -> type:
+    """Подкласс обработчика со своим поведением: у каждого сервера состояние отдельное"""
+    return type(base.__name__, (base,), dict(attributes))
+
+
+def serve_http(base: type, behaviour: Behaviour, host: str = '127.0.0.1', port: int = 0,
+               attributes: Optional[Dict[str, Any]] = None, behaviours: Optional[Dict[str, Behaviour]] = None,
+               ssl_context: Optional[ssl.SSLContext] = None) -> Tuple[ThreadingHTTPServer, str]:
+    """HTTP-заглушка в фоновом потоке: сервер и его адрес. port=0 - свободный порт, ssl_context - HTTPS.
+    Бенчмарки в tools/ поднимают так свою заглушку с нужным поведением"""
+    scheme = 'https' if ssl_context else 'http'
+    server = ThreadingHTTPServer((host, port), make_handler(base, {}))
+    server.daemon_threads = True
+    if ssl_context:
+        server.socket = ssl_context.wrap_socket(server.socket, server_side=True)
+    public_url = f'{scheme}://{host}:{server.server_address[1]}'
+    server.RequestHandlerClass = make_handler(base, {
+        'behaviour': behaviour, 'behaviours': behaviours or {behaviour.name: behaviour}, 'public_url': public_url,
+        **(attributes or {})
+    })
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, public_url
+
+
+def serve_yookassa(behaviour: Behaviour, host: str = '127.0.0.1', port: int = 0, webhook_url: Optional[str] = None,
+                   ssl_context: Optional[ssl.SSLContext] = None) -> Tuple[ThreadingHTTPServer, str, PaymentStore]:
+    """YooKassa-заглушка в фоновом потоке без автооплаты: сервер, адрес и хранилище платежей"""
+    store = PaymentStore()
+    server, url = serve_http(YooKassaHandler, behaviour, host, port, {
+        'store': store,
+        'webhooks': WebhookSender(webhook_url, behaviour)
+    }, ssl_context=ssl_context)
+    return server, url, store
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Локальные заглушки YooKassa, Telegram, загрузки файлов и SMTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--yookassa-port', type=int, default=8101)
+    parser.add_argument('--telegram-port', type=int, default=8102)
+    parser.add_argument('--upload-port', type=int, default=8103)
+    parser.add_argument('--smtp-port', type=int, default=8125)
+    parser.add_argument('--only', help='имена сервисов через запятую: ' + ','.join(SERVICES))
+    parser.add_argument('--latency-ms', action='append', help='задержка ответа, мс: 50 или telegram=300')
+    parser.add_argument('--jitter-ms', action='append', help='разброс задержки +-, мс')
+    parser.add_argument('--error-rate', action='append', help='доля ответов 500 (SMTP - 451), 0..1')
+    parser.add_argument('--rate-limit', action='append', help='запросов в секунду, сверх - 429 (SMTP - 450); 0 - без лимита')
+    parser.add_argument('--auto-pay-ms', type=float, help='через сколько мс созданный платёж оплачивается сам')
+    parser.add_argument('--decline-rate', type=float, default=0.0, help='доля платежей, которые вместо оплаты отменяются')
+    parser.add_argument('--webhook-url', default='http://127.0.0.1:8000/yookassa-webhook')
+    parser.add_argument('--local-server-url', default='http://127.0.0.1:8000', help='для переменных окружения функций')
+    parser.add_argument('--mail-dir', help='сохранять принятые письма в этот каталог')
+    args = parser.parse_args()
+
+    enabled = args.only.split(',') if args.only else SERVICES
+    latency = parse_setting(args.latency_ms, float)
+    jitter = parse_setting(args.jitter_ms, float)
+    error_rate = parse_setting(args.error_rate, float)
+    rate_limit = parse_setting(args.rate_limit, float)
+    behaviours = {
+        name: Behaviour(name, latency.get(name, 0.0), jitter.get(name, 0.0), error_rate.get(name, 0.0), rate_limit.get(name, 0.0))
+        for name in SERVICES
+    }
+    if args.mail_dir:
+        os.makedirs(args.mail_dir, exist_ok=True)
+
+    servers = []
+    env: Dict[str, str] = {}
+
+    def start_http(name: str, port: int, base: type, attributes: Dict[str, Any]) -> str:
+        server, public_url = serve_http(base, behaviours[name], args.host, port, attributes, behaviours)
+        servers.append(server)
+        return public_url
+
+    if 'yookassa' in enabled:
+        webhooks = WebhookSender(args.webhook_url, behaviours['yookassa'])
+        url = start_http('yookassa', args.yookassa_port, YooKassaHandler, {
+            'store': PaymentStore(),
+            'webhooks': webhooks,
+            'auto_pay_seconds': args.auto_pay_ms / 1000 if args.auto_pay_ms is not None else None,
+            'decline_rate': args.decline_rate
+        })
+        env.update({
+            'YOOKASSA_API_URL': url,
+            'YOOKASSA_SHOP_ID': 'fake-shop',
+            'YOOKASSA_SECRET_KEY': 'fake-secret',
+            'YOOKASSA_WEBHOOK_URL': args.webhook_url
+        })
+    if 'telegram' in enabled:
+        url = start_http('telegram', args.telegram_port, TelegramHandler, {})
+        env.update({
+            'TELEGRAM_API_URL': url,
+            'TELEGRAM_BOT_TOKEN': 'fake-token',
+            'TELEGRAM_CHAT_ID': '1'
+        })
+    if 'upload' in enabled:
+        url = start_http('upload', args.upload_port, UploadHandler, {})
+        env.update({'UPLOAD_API_URL': f'{url}/v1/upload', 'STORAGE_UPLOAD_URL': f'{url}/upload'})
+    if 'smtp' in enabled:
+        handler = make_handler(SMTPHandler, {'behaviour': behaviours['smtp'], 'mail_dir': args.mail_dir})
+        smtp_server = ThreadingSMTPServer((args.host, args.smtp_port), handler)
+        threading.Thread(target=smtp_server.serve_forever, daemon=True).start()
+        servers.append(smtp_server)
+        env.update({
+            'SMTP_HOST': args.host,
+            'SMTP_PORT': str(args.smtp_port),
+            'SMTP_USER': 'shop@example.com',
+            'SMTP_PASSWORD': 'fake-password',
+            'SMTP_STARTTLS': 'false'
+        })
+    env.update({
+        'SEND_PURCHASE_EMAIL_URL': f'{args.local_server_url}/send-purchase-email',
+        'TELEGRAM_NOTIFY_URL': f'{args.local_server_url}/telegram-notify'
+    })
+
+    for key, value in env.items():
+        print(f'{key}={value}')
+    sys.stdout.flush()
+    print(f'[fake-services] {", ".join(enabled)} on {args.host}', file=sys.stderr)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    try:
+        stop.wait()
+    except KeyboardInterrupt:
+        pass
+    for name in enabled:
+        print(f'[fake-services] {name}: {json.dumps(behaviours[name].snapshot())}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+'''
+Business: Проверки платёжной цепочки под параллельной нагрузкой на локальном стенде: tools/local_server.py с функциями,
+          tools/fake_services.py вместо внешних сервисов (без --auto-pay-ms) и база с миграциями.
+          Каждая проверка берёт свой email, поэтому не мешает другим данным в базе
+Args: имена проверок (по умолчанию все), --base-url (локальный сервер), --yookassa-url (заглушка YooKassa),
+      --product-ids, --parallel (сколько одинаковых запросов отправить сразу), --webhook-parallel;
+      DATABASE_URL из окружения - проверки смотрят в базу
+Returns: PASS/FAIL по каждой проверке в stdout; код выхода 1, если хоть одна не прошла
+'''
+import argparse
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import psycopg2
+
+SCHEMA = 't_p99209851_math_resources_site'
+
+class CheckFailed(Exception):
+    pass
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args: Any) -> None:
+        return None
+
+
+def http_json(url: str, body: Optional[Dict[str, Any]] = None, timeout: float = 60) -> Tuple[int, Any]:
+    """POST с JSON-телом (GET без тела); ответ - статус и разобранный JSON, если он есть"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            status, raw = response.status, response.read()
+    except urllib.error.HTTPError as e:
+        status, raw = e.code, e.read()
+    try:
+        return status, json.loads(raw) if raw else None
+    except ValueError:
+        return status, raw.decode('utf-8', 'replace')
+
+
+def in_parallel(count: int, call: Callable[[], Any]) -> List[Any]:
+    """Запускает count одинаковых вызовов одновременно"""
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        return list(executor.map(lambda _: call(), range(count)))
+
+
+def expect(condition: bool, message: str) -> None:
+    if not condition:
+        raise CheckFailed(message)
+
+
+class Checks:
+    def __init__(self, args: argparse.Namespace):
+        self.base_url = args.base_url.rstrip('/')
+        self.yookassa_url = args.yookassa_url.rstrip('/')
+        self.product_ids = [int(product_id) for product_id in args.product_ids.split(',')]
+        self.parallel = args.parallel
+        self.webhook_parallel = args.webhook_parallel
+        self.dsn = os.environ.get('DATABASE_URL')
+
+    def fake_stats(self, service: str = 'yookassa') -> Dict[str, int]:
+        _, stats = http_json(f'{self.yookassa_url}/_stats?service={service}')
+        return stats
+
+    def query(self, sql: str, params: Tuple[Any, ...]) -> List[Tuple[Any, ...]]:
+        expect(bool(self.dsn), 'DATABASE_URL is not set')
+        conn = psycopg2.connect(self.dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            return cur.fetchall()
+        finally:
+            conn.close()
+
+    def execute(self, sql: str, params: Tuple[Any, ...]) -> int:
+        expect(bool(self.dsn), 'DATABASE_URL is not set')
+        conn = psycopg2.connect(self.dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+    def wait_for(self, condition: Callable[[], bool], timeout: float, message: str) -> None:
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                raise CheckFailed(message)
+            time.sleep(0.1)
+
+    def checkout(self, email: str) -> Tuple[int, Any]:
+        return http_json(f'{self.base_url}/create-payment', {
+            'product_ids': self.product_ids,
+            'customer_email': email,
+            'return_url': 'https://example.com/return'
+        })
+
+    def pay(self, payment_url: str, notify: bool = True) -> None:
+        """Открывает confirmation_url заглушки, как покупатель: платёж становится succeeded, уходит webhook (если notify)"""
+        try:
+            urllib.request.build_opener(NoRedirect).open(payment_url if notify else f'{payment_url}?notify=false', timeout=10)
+        except urllib.error.HTTPError as e:
+            expect(e.code == 302, f'paying {payment_url} returned {e.code}')
+
+    def checkout_dedup(self) -> str:
+        """Одинаковые параллельные checkout одной корзины - ровно один платёж у провайдера и один ответ у всех"""
+        email = f'checkout-{uuid.uuid4().hex[:12]}@example.com'
+        before = self.fake_stats().get('payments_created', 0)
+        responses = in_parallel(self.parallel, lambda: self.checkout(email))
+        created = self.fake_stats().get('payments_created', 0) - before
+
+        statuses = sorted({status for status, _ in responses})
+        expect(statuses == [200], f'statuses {statuses}, bodies {[body for status, body in responses if status != 200][:3]}')
+        payment_ids = {body['payment_id'] for _, body in responses}
+        expect(len(payment_ids) == 1, f'{len(payment_ids)} distinct payment ids returned')
+        expect(created == 1, f'{created} payments created at the provider')
+        return f'{self.parallel} parallel checkouts -> 1 provider payment {payment_ids.pop()}'
+
+    def checkout_after_payment(self) -> str:
+        """После оплаты повторный checkout той же корзины создаёт новый платёж, а не отдаёт ссылку из кэша"""
+        email = f'repeat-{uuid.uuid4().hex[:12]}@example.com'
+        status, first = self.checkout(email)
+        expect(status == 200, f'checkout returned {status}: {first}')
+        status, cached = self.checkout(email)
+        expect(status == 200 and cached['payment_id'] == first['payment_id'], 'repeated checkout before payment got another payment')
+        self.pay(first['payment_url'])
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            status, body = self.checkout(email)
+            expect(status == 200, f'checkout returned {status}: {body}')
+            if body['payment_id'] != first['payment_id']:
+                return f'paid {first["payment_id"]}, next checkout got {body["payment_id"]}'
+            time.sleep(0.2)
+        raise CheckFailed(f'checkout still returns paid payment {first["payment_id"]} after 10s')
+
+    def webhook_dedup(self) -> str:
+        """Параллельные повторные доставки одного payment.succeeded: один оплаченный заказ, один вызов on_order_paid,
+        одно письмо и одно уведомление в Telegram"""
+        email = f'webhook-{uuid.uuid4().hex[:12]}@example.com'
+        status, checkout = self.checkout(email)
+        expect(status == 200, f'checkout returned {status}: {checkout}')
+        payment_id = checkout['payment_id']
+
+        # Письма от уведомлений предыдущих проверок не должны попасть в счётчики этой
+        def settled() -> bool:
+            stats = self.fake_stats()
+            return stats.get('webhooks_delivered', 0) + stats.get('webhooks_failed', 0) >= stats.get('payments_succeeded', 0)
+        self.wait_for(settled, 30, 'earlier fake webhooks are still in flight')
+
+        yookassa_before = self.fake_stats()
+        smtp_before = self.fake_stats('smtp').get('messages', 0)
+        telegram_before = self.fake_stats('telegram').get('ok', 0)
+
+        # Оплата сама отправляет одно уведомление из заглушки, остальные доставки - параллельно отсюда
+        self.pay(checkout['payment_url'])
+        notification = {'type': 'notification', 'event': 'payment.succeeded', 'object': {'id': payment_id}}
+        responses = in_parallel(self.webhook_parallel, lambda: http_json(f'{self.base_url}/yookassa-webhook', notification))
+        statuses = sorted({status for status, _ in responses})
+        expect(statuses == [200], f'webhook statuses {statuses}, bodies {[body for status, body in responses if status != 200][:3]}')
+
+        delivered = yookassa_before.get('webhooks_delivered', 0) + 1
+        self.wait_for(lambda: self.fake_stats().get('webhooks_delivered', 0) >= delivered, 30, 'fake webhook was not delivered')
+
+        orders = self.query(f"SELECT id, payment_status FROM {SCHEMA}.orders WHERE payment_id = %s", (payment_id,))
+        expect(len(orders) == 1 and orders[0][1] == 'paid', f'orders for payment: {orders}')
+        # on_order_paid увеличивает версию кэша покупателя на 1 при каждом вызове
+        versions = self.query(f"SELECT version FROM {SCHEMA}.customer_cache_versions WHERE email = %s", (email,))
+        expect(versions == [(1,)], f'on_order_paid calls (customer cache version): {versions}')
+        entitlements = self.query(f"SELECT COUNT(*) FROM {SCHEMA}.entitlements WHERE email = %s", (email,))[0][0]
+        expect(entitlements == len(set(self.product_ids)), f'{entitlements} entitlements granted')
+
+        # Повторная доставка откатывает только работу с заказом: копия платежа всё равно обновляется
+        self.execute(f"DELETE FROM {SCHEMA}.payments WHERE id = %s", (payment_id,))
+        status, body = http_json(f'{self.base_url}/yookassa-webhook', notification)
+        expect(status == 200 and body.get('status') == 'already_processed', f'repeated delivery: {status} {body}')
+        mirrored = self.query(f"SELECT status FROM {SCHEMA}.payments WHERE id = %s", (payment_id,))
+        expect(mirrored == [('succeeded',)], f'payments mirror after a repeated delivery: {mirrored}')
+
+        emails = self.fake_stats('smtp').get('messages', 0) - smtp_before
+        expect(emails == 1, f'{emails} purchase emails sent')
+        notifications = self.fake_stats('telegram').get('ok', 0) - telegram_before
+        expect(notifications == 1, f'{notifications} telegram notifications sent')
+        return f'{self.webhook_parallel + 2} deliveries -> order {orders[0][0]} paid once, 1 email, 1 notification'
+
+    def webhook_forged(self) -> str:
+        """Уведомление, которое не подтверждает API: неоплаченный платёж с телом succeeded и несуществующий платёж.
+        Заказ остаётся pending, прав на товары нет"""
+        email = f'forged-{uuid.uuid4().hex[:12]}@example.com'
+        status, checkout = self.checkout(email)
+        expect(status == 200, f'checkout returned {status}: {checkout}')
+        payment_id = checkout['payment_id']
+
+        forged = {'type': 'notification', 'event': 'payment.succeeded', 'object': {
+            'id': payment_id, 'status': 'succeeded', 'paid': True,
+            'amount': {'value': f'{checkout["total_amount"]:.2f}', 'currency': 'RUB'},
+            'metadata': {'customer_email': email}
+        }}
+        status, body = http_json(f'{self.base_url}/yookassa-webhook', forged)
+        expect(status == 200 and body.get('status') == 'not_succeeded', f'unpaid payment: {status} {body}')
+        unknown = dict(forged, object=dict(forged['object'], id=str(uuid.uuid4())))
+        status, body = http_json(f'{self.base_url}/yookassa-webhook', unknown)
+        expect(status >= 500, f'unknown payment: {status} {body}')
+
+        orders = self.query(f"SELECT payment_status FROM {SCHEMA}.orders WHERE payment_id = %s", (payment_id,))
+        expect(orders == [('pending',)], f'orders for payment: {orders}')
+        entitlements = self.query(f"SELECT COUNT(*) FROM {SCHEMA}.entitlements WHERE email = %s", (email,))[0][0]
+        expect(entitlements == 0, f'{entitlements} entitlements granted')
+        return f'unpaid {payment_id} stays pending, unknown payment -> {status}'
+
+    def webhook_lost_payment_id(self) -> str:
+        """create-payment создал платёж, но не успел записать payment_id в заказ: webhook находит заказ
+        по order_id и idempotence_key из metadata и не создаёт второй"""
+        email = f'lost-{uuid.uuid4().hex[:12]}@example.com'
+        status, checkout = self.checkout(email)
+        expect(status == 200, f'checkout returned {status}: {checkout}')
+        payment_id = checkout['payment_id']
+        self.execute(f"UPDATE {SCHEMA}.orders SET payment_id = NULL WHERE id = %s", (checkout['order_id'],))
+
+        self.pay(checkout['payment_url'], notify=False)
+        notification = {'type': 'notification', 'event': 'payment.succeeded', 'object': {'id': payment_id}}
+        status, body = http_json(f'{self.base_url}/yookassa-webhook', notification)
+        expect(status == 200 and body.get('order_id') == checkout['order_id'], f'webhook: {status} {body}')
+
+        orders = self.query(f"SELECT id, payment_id, payment_status FROM {SCHEMA}.orders WHERE guest_email = %s", (email,))
+        expect(orders == [(checkout['order_id'], payment_id, 'paid')], f'orders for customer: {orders}')
+        return f'order {checkout["order_id"]} paid by metadata, no second order'
+
+
+CHECKS = {
+    'checkout-dedup': Checks.checkout_dedup,
+    'checkout-after-payment': Checks.checkout_after_payment,
+    'webhook-dedup': Checks.webhook_dedup,
+    'webhook-forged': Checks.webhook_forged,
+    'webhook-lost-payment-id': Checks.webhook_lost_payment_id
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Проверки платёжной цепочки на локальном стенде')
+    parser.add_argument('checks', nargs='*', help='по умолчанию все: ' + ', '.join(CHECKS))
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--yookassa-url', default='http://127.0.0.1:8101')
+    parser.add_argument('--product-ids', default='1,2')
+    parser.add_argument('--parallel', type=int, default=20)
+    parser.add_argument('--webhook-parallel', type=int, default=50)
+    args = parser.parse_args()
+
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f'unknown checks: {", ".join(unknown)}')
+
+    checks = Checks(args)
+    failed = 0
+    for name in args.checks or list(CHECKS):
+        try:
+            print(f'PASS {name}: {CHECKS[name](checks)}')
+        except CheckFailed as e:
+            failed += 1
+            print(f'FAIL {name}: {e}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,357 @@
+'''
+Business: Синтетические данные в реальной схеме (products, users, orders, order_items, password_reset_tokens) для вопросов
+          производительности: классы и типы материалов, перекос цен, популярные товары, повторные покупатели, корзины до 25 позиций.
+          Загрузка через COPY потоком без промежуточных файлов, один и тот же seed и --end-date дают одни и те же данные
+Args: --scale (1, 100, 10000 - множитель базового объёма), --seed, --end-date (последний день истории заказов),
+      --years (глубина истории), --truncate (очистить таблицы перед загрузкой); DATABASE_URL из окружения
+Returns: число строк, время и скорость генерации с загрузкой по каждой таблице в stdout
+'''
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg2
+
+SCHEMA = 't_p99209851_math_resources_site'
+
+# Объём при --scale 1; остальное умножается на scale
+BASE_PRODUCTS = 50
+BASE_USERS = 500
+BASE_ORDERS = 1500
+BASE_RESET_TOKENS = 100
+
+CATEGORIES = ['5 класс', '6 класс', '7 класс', '8 класс', '9 класс', '10 класс', '11 класс', 'ОГЭ', 'ЕГЭ']
+CATEGORY_WEIGHTS = [6, 7, 8, 9, 10, 9, 10, 19, 22]
+TYPES = ['Методичка', 'Тренажёр', 'Рабочий лист', 'Сборник задач', 'Контрольные работы']
+TYPE_WEIGHTS = [35, 25, 20, 12, 8]
+TOPICS = [
+    'Дроби и проценты', 'Уравнения', 'Неравенства', 'Геометрия', 'Квадратные уравнения', 'Функции', 'Тригонометрия',
+    'Производные', 'Логарифмы', 'Вероятность', 'Векторы', 'Площади фигур', 'Текстовые задачи', 'Степени и корни',
+    'Системы уравнений', 'Прогрессии', 'Стереометрия', 'Параметры', 'Интегралы', 'Модуль числа'
+]
+FIRST_NAMES = ['Анна', 'Мария', 'Елена', 'Ольга', 'Наталья', 'Ирина', 'Дмитрий', 'Алексей', 'Сергей', 'Андрей', 'Иван', 'Павел']
+LAST_NAMES = ['Иванова', 'Смирнова', 'Кузнецова', 'Попова', 'Соколова', 'Лебедева', 'Козлов', 'Новиков', 'Морозов', 'Волков']
+EMAIL_DOMAINS = ['mail.ru', 'yandex.ru', 'gmail.com', 'bk.ru', 'inbox.ru', 'list.ru']
+CDN_URL = 'https://cdn.poehali.dev/generated'
+
+# Состав корзины: (вероятность, минимум, максимум позиций)
+CART_SIZES = [(0.55, 1, 1), (0.30, 2, 3), (0.12, 4, 9), (0.03, 10, 25)]
+ORDER_STATUSES = ['paid', 'pending', 'canceled']
+ORDER_STATUS_WEIGHTS = [85, 10, 5]
+# Доля заказов от гостей, которые ни разу не регистрировались
+GUEST_SHARE = 0.3
+# Чем больше степень, тем сильнее перекос: популярные товары и постоянные покупатели
+PRODUCT_POPULARITY_SKEW = 2.5
+REPEAT_BUYER_SKEW = 1.5
+FREE_SHARE = 0.08
+# bcrypt-хэш пароля password123 (rounds=10), один на всех пользователей: посчитан заранее, чтобы данные от seed не зависели
+# от случайной соли, а генерация не требовала bcrypt
+PASSWORD_HASH = '$2b$10$fUXtGwBRFn54FDf2oQBMk.SBeEH3KGI/RCwAtrlPpTzSHTX/AhP1m'
+
+
+def copy_value(value: Any) -> str:
+    """Значение в текстовом формате COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    text = str(value)
+    if '\\' in text or '\t' in text or '\n' in text or '\r' in text:
+        text = text.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return text
+
+
+class RowStream:
+    """Файлоподобный источник для copy_expert: строки генерируются по мере чтения, в памяти только текущий буфер"""
+
+    def __init__(self, rows: Iterator[Sequence[Any]], batch_rows: int = 5000):
+        self.rows = rows
+        self.batch_rows = batch_rows
+        self.buffer = b''
+        self.count = 0
+        self.bytes = 0
+        self.exhausted = False
+
+    def read(self, size: int = -1) -> bytes:
+        while not self.exhausted and (size < 0 or len(self.buffer) < size):
+            lines = []
+            for row in self.rows:
+                lines.append('\t'.join(copy_value(value) for value in row))
+                if len(lines) >= self.batch_rows:
+                    break
+            if not lines:
+                self.exhausted = True
+                break
+            self.count += len(lines)
+            self.buffer += ('\n'.join(lines) + '\n').encode('utf-8')
+        if size < 0:
+            chunk, self.buffer = self.buffer, b''
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.bytes += len(chunk)
+        return chunk
+
+
+def skewed_index(rng: random.Random, count: int, skew: float) -> int:
+    """Индекс 0..count-1 с плотностью, убывающей по степенному закону: малые индексы - самые популярные"""
+    return min(int(count * rng.random() ** skew), count - 1)
+
+
+def random_moment(rng: random.Random, start: datetime, end: datetime) -> datetime:
+    return start + timedelta(seconds=rng.random() * (end - start).total_seconds())
+
+
+def round_price(value: float) -> int:
+    """Цены как на витрине: 49, 99, 149, 199 ... 2990"""
+    if value < 100:
+        return 49 if value < 75 else 99
+    if value < 1000:
+        return int(round(value / 50.0)) * 50 - 1
+    return int(round(value / 100.0)) * 100 - 10
+
+
+class Dataset:
+    def __init__(self, scale: int, seed: int, end_date: date, years: int):
+        self.scale = scale
+        self.seed = seed
+        self.end = datetime.combine(end_date, datetime.min.time()) + timedelta(days=1)
+        self.start = self.end - timedelta(days=365 * years)
+        self.products_count = BASE_PRODUCTS * scale
+        self.users_count = BASE_USERS * scale
+        self.orders_count = BASE_ORDERS * scale
+        self.reset_tokens_count = BASE_RESET_TOKENS * scale
+        # (id, title, price, full_pdf_url) сгенерированных товаров и порядок популярности
+        self.products: List[Tuple[int, str, int, Optional[str]]] = []
+        self.popularity: List[int] = []
+        self.order_items_count = 0
+
+    def rng(self, table: str) -> random.Random:
+        """Свой генератор на таблицу: данные таблицы не зависят от того, сколько случайных чисел взяли другие"""
+        return random.Random(f'{self.seed}:{table}')
+
+    def user_email(self, index: int) -> str:
+        return f'user{index}@{EMAIL_DOMAINS[index % len(EMAIL_DOMAINS)]}'
+
+    def product_rows(self, first_id: int) -> Iterator[Tuple[Any, ...]]:
+        rng = self.rng('products')
+        for offset in range(self.products_count):
+            product_id = first_id + offset
+            category = rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0]
+            product_type = rng.choices(TYPES, TYPE_WEIGHTS)[0]
+            topic = rng.choice(TOPICS)
+            title = f'{product_type} "{topic}"' + (f' - часть {offset // len(TOPICS) + 1}' if offset >= len(TOPICS) else '')
+            is_free = rng.random() < FREE_SHARE
+            # Логнормальное распределение: большинство 150-400 ₽, длинный хвост дорогих курсов
+            price = 0 if is_free else min(round_price(rng.lognormvariate(5.6, 0.55)), 2990)
+            created_at = random_moment(rng, self.start, self.end)
+            updated_at = random_moment(rng, created_at, self.end) if rng.random() < 0.4 else created_at
+            base_url = f'{CDN_URL}/products/{product_id}'
+            has_answers = rng.random() < 0.5
+            trainers = rng.choices([0, 1, 2, 3], [60, 20, 12, 8])[0]
+            full_pdf_url = f'{base_url}/full.pdf'
+            self.products.append((product_id, title, price, full_pdf_url))
+            yield (
+                product_id, title, f'{topic}: теория, примеры и задачи для {category}', price, category, product_type,
+                created_at, updated_at, f'{base_url}/sample.pdf' if rng.random() < 0.8 else None, full_pdf_url,
+                f'{base_url}/with-answers.pdf' if has_answers else None, full_pdf_url,
+                *[f'{base_url}/trainer{position}' if position <= trainers else None for position in (1, 2, 3)],
+                is_free, f'{base_url}/preview.jpg' if rng.random() < 0.7 else None
+            )
+
+    def user_rows(self, first_id: int, password_hash: str) -> Iterator[Tuple[Any, ...]]:
+        rng = self.rng('users')
+        for index in range(self.users_count):
+            full_name = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}' if rng.random() < 0.7 else None
+            yield (first_id + index, self.user_email(index), password_hash, full_name, random_moment(rng, self.start, self.end))
+
+    def order_rows(self, first_id: int, first_user_id: int, item_rows: List[Tuple[Any, ...]],
+                   first_item_id: int) -> Iterator[Tuple[Any, ...]]:
+        """Заказы; позиции копятся в item_rows и уходят отдельным COPY после заказов"""
+        rng = self.rng('orders')
+        for offset in range(self.orders_count):
+            order_id = first_id + offset
+            if rng.random() < GUEST_SHARE:
+                user_id = None
+                email = f'guest{offset}@{rng.choice(EMAIL_DOMAINS)}'
+            else:
+                # Первые пользователи - постоянные покупатели с многими заказами
+                user_index = skewed_index(rng, self.users_count, REPEAT_BUYER_SKEW)
+                user_id = first_user_id + user_index
+                email = self.user_email(user_index)
+
+            _, low, high = rng.choices(CART_SIZES, [size[0] for size in CART_SIZES])[0]
+            cart_size = min(rng.randint(low, high), len(self.products))
+            product_indexes = set()
+            while len(product_indexes) < cart_size:
+                product_indexes.add(self.popularity[skewed_index(rng, len(self.popularity), PRODUCT_POPULARITY_SKEW)])
+
+            status = rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0]
+            created_at = random_moment(rng, self.start, self.end)
+            paid_at = created_at + timedelta(seconds=rng.randint(20, 900)) if status == 'paid' else None
+            total = 0
+            for product_index in sorted(product_indexes):
+                product_id, title, price, full_pdf_url = self.products[product_index]
+                item_rows.append((first_item_id + self.order_items_count, order_id, product_id, title, price,
+                                  full_pdf_url, 1, created_at))
+                self.order_items_count += 1
+                total += price
+
+            token = hashlib.sha256(f'{self.seed}:order:{order_id}'.encode()).hexdigest()
+            yield (
+                order_id, user_id, email, total, f'gen-{token[:32]}', status, created_at,
+                token[32:64] if status != 'canceled' else None, paid_at
+            )
+
+    def reset_token_rows(self, first_id: int) -> Iterator[Tuple[Any, ...]]:
+        rng = self.rng('password_reset_tokens')
+        for offset in range(self.reset_tokens_count):
+            created_at = random_moment(rng, self.start, self.end)
+            token = hashlib.sha256(f'{self.seed}:reset:{first_id + offset}'.encode()).hexdigest()
+            yield (
+                first_id + offset, self.user_email(skewed_index(rng, self.users_count, 1.5)), token,
+                created_at + timedelta(hours=1), rng.random() < 0.6, created_at
+            )
+
+
+TABLES = {
+    'products': ['id', 'title', 'description', 'price', 'category', 'type', 'created_at', 'updated_at', 'sample_pdf_url',
+                 'full_pdf_url', 'full_pdf_with_answers_url', 'full_pdf_without_answers_url', 'trainer1_url', 'trainer2_url',
+                 'trainer3_url', 'is_free', 'preview_image_url'],
+    'users': ['id', 'email', 'password_hash', 'full_name', 'created_at'],
+    'orders': ['id', 'user_id', 'guest_email', 'total_price', 'payment_id', 'payment_status', 'created_at',
+               'idempotence_key', 'paid_at'],
+    'order_items': ['id', 'order_id', 'product_id', 'product_title', 'product_price', 'full_pdf_url', 'quantity', 'created_at'],
+    'password_reset_tokens': ['id', 'email', 'token', 'expires_at', 'used', 'created_at']
+}
+
+
+def next_id(cur, table: str) -> int:
+    cur.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {SCHEMA}.{table}')
+    return cur.fetchone()[0]
+
+
+def copy_rows(cur, table: str, rows: Iterator[Sequence[Any]]) -> Tuple[int, int, float]:
+    """COPY FROM STDIN из генератора; возвращает строки, байты и секунды (генерация вместе с загрузкой)"""
+    stream = RowStream(rows)
+    started = time.perf_counter()
+    cur.copy_expert(f"COPY {SCHEMA}.{table} ({', '.join(TABLES[table])}) FROM STDIN", stream, size=1 << 20)
+    # id задаются явно - сдвигаем последовательность, чтобы обычные INSERT не упёрлись в занятые id
+    cur.execute(f"SELECT setval(pg_get_serial_sequence('{SCHEMA}.{table}', 'id'), (SELECT MAX(id) FROM {SCHEMA}.{table}))")
+    return stream.count, stream.bytes, time.perf_counter() - started
+
+
+def report(table: str, rows: int, size: int, seconds: float) -> None:
+    print(f'{table:<22} {rows:>12,} rows {seconds:>9.2f} s {rows / seconds if seconds else 0:>12,.0f} rows/s '
+          f'{size / seconds / 1048576 if seconds else 0:>8.1f} MB/s')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Синтетические данные каталога, покупателей и заказов через COPY')
+    parser.add_argument('--scale', type=int, default=1, help='множитель базового объёма: 1, 100, 10000')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--end-date', type=date.fromisoformat, default=date.today(), help='YYYY-MM-DD, по умолчанию сегодня')
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--truncate', action='store_true', help='очистить таблицы перед загрузкой (id начнутся с 1)')
+    args = parser.parse_args()
+
+    dataset = Dataset(args.scale, args.seed, args.end_date, args.years)
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    started = time.perf_counter()
+    total_rows = 0
+
+    try:
+        if args.truncate:
+            cur.execute(
+                f'TRUNCATE {SCHEMA}.order_items, {SCHEMA}.orders, {SCHEMA}.password_reset_tokens, {SCHEMA}.users, '
+                f'{SCHEMA}.products, {SCHEMA}.product_assets, {SCHEMA}.entitlements, {SCHEMA}.product_recommendations, '
+                f'{SCHEMA}.sales_daily, {SCHEMA}.sales_daily_products, {SCHEMA}.sales_daily_categories RESTART IDENTITY'
+            )
+
+        first_product_id = next_id(cur, 'products')
+        rows, size, seconds = copy_rows(cur, 'products', dataset.product_rows(first_product_id))
+        report('products', rows, size, seconds)
+        total_rows += rows
+        dataset.popularity = list(range(len(dataset.products)))
+        dataset.rng('popularity').shuffle(dataset.popularity)
+
+        first_user_id = next_id(cur, 'users')
+        rows, size, seconds = copy_rows(cur, 'users', dataset.user_rows(first_user_id, PASSWORD_HASH))
+        report('users', rows, size, seconds)
+        total_rows += rows
+
+        # Позиции заказов копятся в памяти порциями заказов, чтобы не держать всю историю сразу
+        first_order_id = next_id(cur, 'orders')
+        first_item_id = next_id(cur, 'order_items')
+        item_rows: List[Tuple[Any, ...]] = []
+        orders = dataset.order_rows(first_order_id, first_user_id, item_rows, first_item_id)
+        order_totals = [0, 0, 0.0]
+        item_totals = [0, 0, 0.0]
+        batch_orders = 100000
+        while True:
+            batch = []
+            for row in orders:
+                batch.append(row)
+                if len(batch) >= batch_orders:
+                    break
+            if not batch:
+                break
+            for totals, (table, table_rows) in ((order_totals, ('orders', batch)), (item_totals, ('order_items', item_rows))):
+                rows, size, seconds = copy_rows(cur, table, iter(table_rows))
+                totals[0] += rows
+                totals[1] += size
+                totals[2] += seconds
+            item_rows.clear()
+        report('orders', *order_totals)
+        report('order_items', *item_totals)
+        total_rows += order_totals[0] + item_totals[0]
+
+        rows, size, seconds = copy_rows(cur, 'password_reset_tokens', dataset.reset_token_rows(next_id(cur, 'password_reset_tokens')))
+        report('password_reset_tokens', rows, size, seconds)
+        total_rows += rows
+
+        # Права на купленное, как их выдал бы webhook; дневные агрегаты догоняет sales-analytics (POST или CLI)
+        derived_started = time.perf_counter()
+        cur.execute(
+            f"""
+            INSERT INTO {SCHEMA}.entitlements (email, user_id, product_id, order_id, created_at)
+            SELECT DISTINCT ON (LOWER(TRIM(o.guest_email)), oi.product_id)
+                LOWER(TRIM(o.guest_email)), o.user_id, oi.product_id, o.id, o.paid_at
+            FROM {SCHEMA}.orders o
+            JOIN {SCHEMA}.order_items oi ON oi.order_id = o.id
+            WHERE o.id >= %s AND o.payment_status = 'paid' AND oi.product_id IS NOT NULL
+            ORDER BY LOWER(TRIM(o.guest_email)), oi.product_id, o.id
+            ON CONFLICT (email, product_id) DO NOTHING
+            """,
+            (first_order_id,)
+        )
+        report('entitlements', cur.rowcount, 0, time.perf_counter() - derived_started)
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f'ANALYZE {SCHEMA}.products, {SCHEMA}.users, {SCHEMA}.orders, {SCHEMA}.order_items, '
+                f'{SCHEMA}.password_reset_tokens, {SCHEMA}.product_assets, {SCHEMA}.entitlements')
+    cur.close()
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f'total: {total_rows:,} rows in {elapsed:.1f} s ({total_rows / elapsed:,.0f} rows/s), scale {args.scale}, seed {args.seed}',
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+'''
+Business: Нагрузочный прогон по сценариям из backend/*/tests.json: смешанная нагрузка на функции с заданной параллельностью
+          и длительностью, гистограммы задержек и доля ошибок по каждому сценарию, сравнение p99 с сохранённым базовым прогоном
+Args: --base-url (по умолчанию локальный сервер tools/local_server.py: <base-url>/<функция><path>), --concurrency, --duration,
+      --warmup, --functions и --cases (фильтры), --read-only (только GET и OPTIONS), --output (отчёт JSON),
+      --baseline (отчёт, с которым сравнивать), --threshold и --min-regression-ms (допустимый рост p99)
+Returns: таблица в stdout; код выхода 1, если p99 какого-либо сценария вырос сверх порога, 2 - если нет сценариев
+'''
+import argparse
+import http.client
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+# 16 корзин на каждое удвоение: ошибка оценки перцентиля не больше ~4.5%, как у HDR Histogram с двумя значащими цифрами
+SUB_BUCKETS = 16
+MIN_LATENCY_MS = 0.01
+
+
+class Histogram:
+    """Логарифмически-линейная гистограмма задержек в мс с фиксированной точностью и памятью по числу занятых корзин"""
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.max_ms = 0.0
+
+    @staticmethod
+    def bucket_of(value_ms: float) -> int:
+        return int(math.floor(math.log2(max(value_ms, MIN_LATENCY_MS) / MIN_LATENCY_MS) * SUB_BUCKETS))
+
+    @staticmethod
+    def upper_bound(bucket: int) -> float:
+        return MIN_LATENCY_MS * 2 ** ((bucket + 1) / SUB_BUCKETS)
+
+    def record(self, value_ms: float) -> None:
+        bucket = self.bucket_of(value_ms)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.total += 1
+        if value_ms > self.max_ms:
+            self.max_ms = value_ms
+
+    def merge(self, other: 'Histogram') -> None:
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.total += other.total
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, percent: float) -> float:
+        """Верхняя граница корзины, в которую попадает перцентиль (не больше максимума)"""
+        if not self.total:
+            return 0.0
+        rank = math.ceil(self.total * percent / 100)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self.upper_bound(bucket), self.max_ms)
+        return self.max_ms
+
+
+class CaseStats:
+    def __init__(self):
+        self.histogram = Histogram()
+        self.errors = 0
+        self.error_samples: Dict[str, int] = {}
+
+    def merge(self, other: 'CaseStats') -> None:
+        self.histogram.merge(other.histogram)
+        self.errors += other.errors
+        for sample, count in other.error_samples.items():
+            self.error_samples[sample] = self.error_samples.get(sample, 0) + count
+
+
+def load_cases(functions: Optional[List[str]], case_pattern: Optional[str], read_only: bool) -> List[Dict[str, Any]]:
+    """Сценарии всех tests.json: ключ '<функция>: <name>', метод, путь, тело, заголовки и ожидаемый статус"""
+    pattern = re.compile(case_pattern) if case_pattern else None
+    cases = []
+    for tests_path in sorted(BACKEND_DIR.glob('*/tests.json')):
+        function_name = tests_path.parent.name
+        if functions and function_name not in functions:
+            continue
+        for test in json.loads(tests_path.read_text(encoding='utf-8')).get('tests', []):
+            key = f"{function_name}: {test['name']}"
+            method = test.get('method', 'GET').upper()
+            if read_only and method not in ('GET', 'OPTIONS', 'HEAD'):
+                continue
+            if pattern and not pattern.search(key):
+                continue
+
+            headers = dict(test.get('headers') or {})
+            body = test.get('body')
+            if body is not None and not isinstance(body, str):
+                body = json.dumps(body, ensure_ascii=False)
+                headers.setdefault('Content-Type', 'application/json')
+            cases.append({
+                'key': key,
+                'function': function_name,
+                'method': method,
+                'path': test.get('path', '/'),
+                'headers': headers,
+                'body': body.encode('utf-8') if body is not None else None,
+                'expected_status': test.get('expectedStatus')
+            })
+    return cases
+
+
+def run_worker(base_url: str, cases: List[Dict[str, Any]], warmup_until: float, deadline: float,
+               results: Dict[str, CaseStats], seed: int) -> None:
+    """Один поток нагрузки: случайный сценарий, keep-alive соединение; ошибка - сбой запроса или статус не как в tests.json"""
+    parts = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    prefix = parts.path.rstrip('/')
+    rng = random.Random(seed)
+    conn = None
+
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            break
+        case = rng.choice(cases)
+        if conn is None:
+            conn = connection_class(parts.hostname, parts.port, timeout=30)
+
+        error = None
+        started = time.perf_counter()
+        try:
+            conn.request(case['method'], f"{prefix}/{case['function']}{case['path']}", body=case['body'], headers=case['headers'])
+            response = conn.getresponse()
+            response.read()
+            if case['expected_status'] is not None and response.status != case['expected_status']:
+                error = f"status {response.status}, expected {case['expected_status']}"
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (http.client.HTTPException, OSError) as e:
+            error = f'{type(e).__name__}: {e}'
+            conn.close()
+            conn = None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if now < warmup_until:
+            continue
+        stats = results.setdefault(case['key'], CaseStats())
+        stats.histogram.record(elapsed_ms)
+        if error:
+            stats.errors += 1
+            stats.error_samples[error] = stats.error_samples.get(error, 0) + 1
+
+    if conn is not None:
+        conn.close()
+
+
+def run(base_url: str, cases: List[Dict[str, Any]], concurrency: int, duration: float, warmup: float, seed: int) -> Dict[str, CaseStats]:
+    started = time.monotonic()
+    warmup_until = started + warmup
+    deadline = warmup_until + duration
+    # У каждого потока свои результаты: без общей блокировки на каждом запросе
+    per_worker: List[Dict[str, CaseStats]] = [{} for _ in range(concurrency)]
+    threads = [
+        threading.Thread(target=run_worker, args=(base_url, cases, warmup_until, deadline, per_worker[index], seed + index))
+        for index in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    merged: Dict[str, CaseStats] = {}
+    for results in per_worker:
+        for key, stats in results.items():
+            merged.setdefault(key, CaseStats()).merge(stats)
+    return merged
+
+
+def build_report(results: Dict[str, CaseStats], args: argparse.Namespace) -> Dict[str, Any]:
+    cases = {}
+    for key in sorted(results):
+        stats = results[key]
+        histogram = stats.histogram
+        cases[key] = {
+            'count': histogram.total,
+            'rps': round(histogram.total / args.duration, 2),
+            'errors': stats.errors,
+            'error_rate': round(stats.errors / histogram.total, 4) if histogram.total else 0,
+            'p50_ms': round(histogram.percentile(50), 3),
+            'p90_ms': round(histogram.percentile(90), 3),
+            'p99_ms': round(histogram.percentile(99), 3),
+            'max_ms': round(histogram.max_ms, 3),
+            'histogram': {str(bucket): count for bucket, count in sorted(histogram.counts.items())},
+            'error_samples': dict(sorted(stats.error_samples.items(), key=lambda item: -item[1])[:5])
+        }
+    total = sum(case['count'] for case in cases.values())
+    return {
+        'started_at': datetime.utcnow().isoformat() + 'Z',
+        'base_url': args.base_url,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'seed': args.seed,
+        'total': {
+            'count': total,
+            'rps': round(total / args.duration, 2),
+            'errors': sum(case['errors'] for case in cases.values())
+        },
+        'cases': cases
+    }
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_regression_ms: float) -> List[str]:
+    """Сценарии, у которых p99 вырос больше чем на threshold (доля) и больше чем на min_regression_ms"""
+    regressions = []
+    for key, case in report['cases'].items():
+        base = baseline.get('cases', {}).get(key)
+        if not base or not base.get('count'):
+            continue
+        limit = max(base['p99_ms'] * (1 + threshold), base['p99_ms'] + min_regression_ms)
+        if case['p99_ms'] > limit:
+            regressions.append(f"{key}: p99 {case['p99_ms']:.2f} ms vs baseline {base['p99_ms']:.2f} ms (limit {limit:.2f} ms)")
+    return regressions
+
+
+def print_table(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    width = max([len(key) for key in report['cases']] + [4])
+    header = f"{'case':<{width}} {'count':>8} {'rps':>9} {'err%':>7} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"
+    if baseline:
+        header += f" {'p99 base':>9} {'delta':>8}"
+    print(header)
+    for key, case in report['cases'].items():
+        line = (f"{key:<{width}} {case['count']:>8} {case['rps']:>9.1f} {case['error_rate'] * 100:>6.2f}% "
+                f"{case['p50_ms']:>9.2f} {case['p90_ms']:>9.2f} {case['p99_ms']:>9.2f} {case['max_ms']:>9.2f}")
+        base = (baseline or {}).get('cases', {}).get(key)
+        if base and base.get('p99_ms'):
+            line += f" {base['p99_ms']:>9.2f} {(case['p99_ms'] / base['p99_ms'] - 1) * 100:>+7.1f}%"
+        print(line)
+        for sample, count in case['error_samples'].items():
+            print(f"{'':<{width}}   {count} x {sample}")
+    total = report['total']
+    print(f"total: {total['count']} requests, {total['rps']:.1f} req/s, {total['errors']} errors")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон по сценариям tests.json')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='секунд измерения')
+    parser.add_argument('--warmup', type=float, default=5, help='секунд прогрева, не попадают в отчёт')
+    parser.add_argument('--functions', help='имена функций через запятую')
+    parser.add_argument('--cases', help='регулярное выражение по "<функция>: <name>"')
+    parser.add_argument('--read-only', action='store_true', help='только GET/OPTIONS: сценарии с записью не запускаются')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='куда сохранить отчёт JSON (его же можно потом передать как --baseline)')
+    parser.add_argument('--baseline', help='отчёт прошлого прогона для сравнения p99')
+    parser.add_argument('--threshold', type=float, default=0.2, help='допустимый рост p99, доля (0.2 = 20%%)')
+    parser.add_argument('--min-regression-ms', type=float, default=2.0, help='рост p99 меньше этого не считается регрессией')
+    args = parser.parse_args()
+
+    cases = load_cases(args.functions.split(',') if args.functions else None, args.cases, args.read_only)
+    if not cases:
+        print('No test cases matched', file=sys.stderr)
+        sys.exit(2)
+
+    print(f'{len(cases)} cases, concurrency {args.concurrency}, {args.warmup:g}s warmup + {args.duration:g}s against {args.base_url}',
+          file=sys.stderr)
+    results = run(args.base_url, cases, args.concurrency, args.duration, args.warmup, args.seed)
+    report = build_report(results, args)
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8')) if args.baseline else None
+    print_table(report, baseline)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    if baseline:
+        regressions = compare(report, baseline, args.threshold, args.min_regression_ms)
+        if regressions:
+            print('p99 regressions:', file=sys.stderr)
+            for regression in regressions:
+                print(f'  {regression}', file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
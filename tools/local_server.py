@@ -0,0 +1,518 @@
+'''
+Business: Локальный сервер для всех функций backend/*/index.py в одном процессе - для разработки, нагрузочных прогонов
+          и самостоятельного хостинга на одной машине. Запрос /<функция>/<путь>?<query> превращается в event/context,
+          как их передаёт платформа, ответ handler - обратно в HTTP
+Args: --port, --workers (процессов-воркеров на общем сокете), --env-file (KEY=VALUE до импорта функций; можно повторять - следующий файл перекрывает предыдущий),
+      --only (через запятую - поднять только эти функции), --cold (каждый вызов импортирует функцию заново, без общих пулов)
+Returns: HTTP-сервер; GET / - список функций и ошибок их загрузки
+'''
+import argparse
+import atexit
+import base64
+import importlib.util
+import json
+import os
+import signal
+import smtplib
+import socket
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import ModuleType
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+DB_POOL_MAX_IDLE = 8
+SMTP_POOL_MAX_IDLE = 2
+# Тело с таким Content-Type передаётся строкой, остальное - base64 с isBase64Encoded, как на платформе
+TEXT_CONTENT_TYPES = ('application/json', 'text/', 'application/x-www-form-urlencoded', 'application/xml')
+# sys.path и sys.modules общие для всех функций: с --cold импорты разных функций идут из разных потоков
+# и без общей блокировки одна забирает из sys.modules tracing другой
+_import_lock = threading.Lock()
+
+
+class Context:
+    """Поля context, которые читают функции, плюс оставшееся время как у платформы"""
+
+    def __init__(self, function_name: str, timeout_seconds: float = 30.0):
+        self.request_id = str(uuid.uuid4())
+        self.function_name = function_name
+        self.function_version = 'local'
+        self.memory_limit_in_mb = 128
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(int((self._deadline - time.monotonic()) * 1000), 0)
+
+
+class DatabasePool:
+    """Общий для всех функций воркера пул соединений psycopg2 по DSN"""
+
+    def __init__(self, max_idle: int = DB_POOL_MAX_IDLE):
+        self.max_idle = max_idle
+        self._idle: Dict[str, List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, dsn: str, connect_kwargs: Dict[str, Any]):
+        import psycopg2
+
+        with self._lock:
+            idle = self._idle.get(dsn, [])
+            conn = idle.pop() if idle else None
+        if conn is None or conn.closed:
+            conn = psycopg2.connect(dsn, **connect_kwargs)
+        return conn
+
+    def release(self, dsn: str, conn) -> None:
+        if conn.closed:
+            return
+        try:
+            # Незакоммиченное функцией не должно достаться следующему вызову
+            conn.rollback()
+            conn.autocommit = False
+        except Exception:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(dsn, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+class PooledConnection:
+    """Соединение из пула: close возвращает его в пул, курсоры создаются TracedCursor вызывающей функции"""
+
+    def __init__(self, pool: DatabasePool, dsn: str, conn, cursor_factory):
+        self._pool = pool
+        self._dsn = dsn
+        self._conn = conn
+        self._cursor_factory = cursor_factory
+
+    def cursor(self, *args: Any, **kwargs: Any):
+        if self._cursor_factory is not None:
+            kwargs.setdefault('cursor_factory', self._cursor_factory)
+        return self._conn.cursor(*args, **kwargs)
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._pool.release(self._dsn, self._conn)
+            self._conn = None
+
+    def __enter__(self) -> 'PooledConnection':
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+
+
+class SMTPPool:
+    """Общий пул SMTP-сессий: соединение, STARTTLS и логин переживают вызовы, между письмами - RSET"""
+
+    def __init__(self, smtp_class, max_idle: int = SMTP_POOL_MAX_IDLE):
+        self.smtp_class = smtp_class
+        self.max_idle = max_idle
+        self._idle: Dict[Tuple[str, int], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str, port: int, args: tuple, kwargs: Dict[str, Any]):
+        while True:
+            with self._lock:
+                idle = self._idle.get((host, port), [])
+                server = idle.pop() if idle else None
+            if server is None:
+                server = self.smtp_class(host, port, *args, **kwargs)
+                server.pool_tls = False
+                server.pool_login = None
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.discard(server)
+
+    def release(self, host: str, port: int, server) -> None:
+        try:
+            server.rset()
+        except (smtplib.SMTPException, OSError):
+            self.discard(server)
+            return
+        with self._lock:
+            idle = self._idle.setdefault((host, port), [])
+            if len(idle) < self.max_idle:
+                idle.append(server)
+                return
+        self.discard(server)
+
+    def discard(self, server) -> None:
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+
+def make_pooled_smtp(pool: SMTPPool):
+    """Замена smtplib.SMTP с тем же интерфейсом, который используют функции (starttls, login, send_message, quit, with)"""
+
+    class PooledSMTP:
+        def __init__(self, host: str = '', port: int = 0, *args: Any, **kwargs: Any):
+            self._host = host
+            self._port = port
+            self._server = pool.acquire(host, port, args, kwargs)
+            self._broken = False
+
+        def starttls(self, *args: Any, **kwargs: Any):
+            if self._server.pool_tls:
+                return (220, b'Ready to start TLS')
+            result = self._server.starttls(*args, **kwargs)
+            self._server.pool_tls = True
+            return result
+
+        def login(self, user: str, password: str, *args: Any, **kwargs: Any):
+            if self._server.pool_login == user:
+                return (235, b'Authentication successful')
+            result = self._server.login(user, password, *args, **kwargs)
+            self._server.pool_login = user
+            return result
+
+        def quit(self):
+            if self._server is not None:
+                if self._broken:
+                    pool.discard(self._server)
+                else:
+                    pool.release(self._host, self._port, self._server)
+                self._server = None
+            return (221, b'Bye')
+
+        close = quit
+
+        def __enter__(self) -> 'PooledSMTP':
+            return self
+
+        def __exit__(self, exc_type, exc, tb) -> bool:
+            self._broken = self._broken or exc_type is not None
+            self.quit()
+            return False
+
+        def __getattr__(self, name: str) -> Any:
+            attribute = getattr(self._server, name)
+            if not callable(attribute):
+                return attribute
+
+            def call(*args: Any, **kwargs: Any) -> Any:
+                try:
+                    return attribute(*args, **kwargs)
+                except (smtplib.SMTPServerDisconnected, OSError):
+                    self._broken = True
+                    raise
+
+            return call
+
+    return PooledSMTP
+
+
+class SharedPools:
+    """Пулы воркера: БД, SMTP и HTTP-соединения к YooKassa, общие для всех функций"""
+
+    def __init__(self):
+        self.db = DatabasePool()
+        self.http: Dict[Tuple[str, int], Any] = {}
+        self._http_lock = threading.Lock()
+        self.smtp = SMTPPool(smtplib.SMTP)
+        smtplib.SMTP = make_pooled_smtp(self.smtp)
+
+    def install(self, local_modules: Dict[str, ModuleType]) -> None:
+        """Подключает пулы к локальным модулям функции (tracing, yookassa_client)"""
+        tracing = local_modules.get('tracing')
+        if tracing is not None and hasattr(tracing, 'connect'):
+            cursor_factory = getattr(tracing, 'TracedCursor', None)
+
+            def connect(dsn: str, **kwargs: Any) -> PooledConnection:
+                kwargs.pop('cursor_factory', None)
+                with tracing.span('db', 'connect'):
+                    conn = self.db.acquire(dsn, kwargs)
+                return PooledConnection(self.db, dsn, conn, cursor_factory)
+
+            tracing.connect = connect
+
+        yookassa_client = local_modules.get('yookassa_client')
+        if yookassa_client is not None and hasattr(yookassa_client, 'ConnectionPool'):
+            connection_pool_class = yookassa_client.ConnectionPool
+
+            def shared_connection_pool(base_url: str, max_size: int = 4):
+                key = (base_url, max_size)
+                with self._http_lock:
+                    if key not in self.http:
+                        self.http[key] = connection_pool_class(base_url, max_size)
+                    return self.http[key]
+
+            yookassa_client.ConnectionPool = shared_connection_pool
+
+
+class Function:
+    """Функция из backend/<name>: модуль index со своими копиями tracing.py и yookassa_client.py"""
+
+    def __init__(self, name: str, directory: Path):
+        self.name = name
+        self.directory = directory
+        self.module: Optional[ModuleType] = None
+        self.local_modules: Dict[str, ModuleType] = {}
+        self.error: Optional[str] = None
+        # Как на платформе: один контейнер обрабатывает один вызов за раз
+        self.lock = threading.Lock()
+
+    def load(self, pools: Optional[SharedPools]) -> Tuple[ModuleType, Dict[str, ModuleType]]:
+        """Импортирует index.py так, чтобы его tracing/yookassa_client не пересекались с модулями других функций"""
+        local_names = [path.stem for path in self.directory.glob('*.py') if path.stem != 'index']
+        module_name = 'backend_' + self.name.replace('-', '_')
+        with _import_lock:
+            saved = {name: sys.modules.pop(name) for name in local_names if name in sys.modules}
+            sys.path.insert(0, str(self.directory))
+            try:
+                spec = importlib.util.spec_from_file_location(module_name, self.directory / 'index.py')
+                module = importlib.util.module_from_spec(spec)
+                # Под этим именем модуль находят pickle и ProcessPoolExecutor (seo-pages)
+                sys.modules[module_name] = module
+                spec.loader.exec_module(module)
+                local_modules = {name: sys.modules.pop(name) for name in local_names if name in sys.modules}
+            finally:
+                sys.path.remove(str(self.directory))
+                sys.modules.update(saved)
+        if pools is not None:
+            pools.install(local_modules)
+        return module, local_modules
+
+    def shutdown(self, local_modules: Dict[str, ModuleType]) -> None:
+        """Холодный вызов: контейнер завершился - досылаем его метрики и не копим обработчики atexit"""
+        tracing = local_modules.get('tracing')
+        if tracing is not None and hasattr(tracing, 'flush'):
+            atexit.unregister(tracing.flush)
+            tracing.flush()
+
+
+def discover(only: Optional[List[str]] = None) -> Dict[str, Function]:
+    functions = {}
+    for index_path in sorted(BACKEND_DIR.glob('*/index.py')):
+        name = index_path.parent.name
+        if only and name not in only:
+            continue
+        functions[name] = Function(name, index_path.parent)
+    return functions
+
+
+def load_all(functions: Dict[str, Function], pools: Optional[SharedPools]) -> None:
+    for function in functions.values():
+        try:
+            function.module, function.local_modules = function.load(pools)
+        except Exception as e:
+            # Например, не установлены зависимости из requirements.txt именно этой функции
+            function.error = f'{type(e).__name__}: {e}'
+            print(f'[local-server] {function.name}: not loaded ({function.error})', file=sys.stderr)
+
+
+def build_event(method: str, raw_path: str, headers: Dict[str, str], body: bytes) -> Tuple[str, Dict[str, Any]]:
+    """Путь /<функция>/<остаток>?<query> -> имя функции и event в формате платформы"""
+    parts = urlsplit(raw_path)
+    segments = parts.path.lstrip('/').split('/', 1)
+    function_name = segments[0]
+    path = '/' + (segments[1] if len(segments) > 1 else '')
+
+    content_type = headers.get('Content-Type', headers.get('content-type', ''))
+    is_text = not body or content_type.startswith(TEXT_CONTENT_TYPES)
+    event = {
+        'httpMethod': method,
+        'path': path,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(parts.query, keep_blank_values=True)),
+        'body': body.decode('utf-8', 'replace') if is_text else base64.b64encode(body).decode('ascii'),
+        'isBase64Encoded': not is_text,
+        'requestContext': {'requestId': None, 'identity': {'sourceIp': headers.get('X-Forwarded-For', '127.0.0.1')}}
+    }
+    return function_name, event
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, server_address, functions: Dict[str, Function], pools: Optional[SharedPools], cold: bool,
+                 bind_and_activate: bool = True):
+        super().__init__(server_address, RequestHandler, bind_and_activate)
+        self.functions = functions
+        self.pools = pools
+        self.cold = cold
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят разными send: без TCP_NODELAY keep-alive упирается в задержку ACK (~40 мс на запрос)
+    disable_nagle_algorithm = True
+    server: Server
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if os.environ.get('LOCAL_SERVER_ACCESS_LOG'):
+            super().log_message(format, *args)
+
+    def handle_any(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        function_name, event = build_event(self.command, self.path, dict(self.headers.items()), body)
+
+        if not function_name:
+            self.send_json(200, {
+                name: {'loaded': function.module is not None or self.server.cold, 'error': function.error}
+                for name, function in self.server.functions.items()
+            })
+            return
+
+        function = self.server.functions.get(function_name)
+        if function is None:
+            self.send_json(404, {'error': f'Unknown function {function_name}'})
+            return
+        if function.error and not self.server.cold:
+            self.send_json(503, {'error': f'Function failed to load: {function.error}'})
+            return
+
+        context = Context(function_name)
+        event['requestContext']['requestId'] = context.request_id
+        local_modules: Dict[str, ModuleType] = {}
+        try:
+            with function.lock:
+                if self.server.cold:
+                    module, local_modules = function.load(None)
+                else:
+                    module = function.module
+                response = module.handler(event, context)
+        except Exception as e:
+            self.send_json(502, {'error': f'{type(e).__name__}: {e}', 'function': function_name})
+            return
+        finally:
+            if local_modules:
+                function.shutdown(local_modules)
+
+        self.send_handler_response(response)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_HEAD = handle_any
+
+    def send_handler_response(self, response: Dict[str, Any]) -> None:
+        body = response.get('body') or ''
+        if response.get('isBase64Encoded'):
+            payload = base64.b64decode(body)
+        else:
+            payload = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+
+        self.send_response(int(response.get('statusCode', 200)))
+        for name, value in (response.get('headers') or {}).items():
+            if name.lower() not in ('content-length', 'connection', 'transfer-encoding'):
+                self.send_header(name, str(value))
+        for name, values in (response.get('multiValueHeaders') or {}).items():
+            for value in values:
+                self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+
+    def send_json(self, status: int, data: Dict[str, Any]) -> None:
+        self.send_handler_response({
+            'statusCode': status,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps(data, ensure_ascii=False)
+        })
+
+
+def load_env_files(paths: List[str]) -> None:
+    """KEY=VALUE построчно; более поздний файл перекрывает ранний, уже заданные в окружении переменные не перезаписываются"""
+    values: Dict[str, str] = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as env_file:
+            for line in env_file:
+                line = line.strip()
+                if not line or line.startswith('#') or '=' not in line:
+                    continue
+                key, value = line.split('=', 1)
+                values[key.strip()] = value.strip().strip('"').strip("'")
+    for key, value in values.items():
+        os.environ.setdefault(key, value)
+
+
+def serve(listener: socket.socket, functions: Dict[str, Function], cold: bool) -> None:
+    # SIGTERM завершает воркер через atexit, где функции досылают метрики; обработчик ставится до импорта функций,
+    # чтобы tracing первой из них не занял его только под себя
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # Пулы создаются в каждом воркере после fork: соединения нельзя делить между процессами
+    pools = None if cold else SharedPools()
+    if not cold:
+        load_all(functions, pools)
+    server = Server(listener.getsockname(), functions, pools, cold, bind_and_activate=False)
+    server.socket = listener
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Все функции backend/ в одном локальном сервере')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--env-file', action='append')
+    parser.add_argument('--only', help='имена функций через запятую')
+    parser.add_argument('--cold', action='store_true', help='импортировать функцию заново на каждый вызов, без общих пулов')
+    args = parser.parse_args()
+
+    if args.env_file:
+        load_env_files(args.env_file)
+
+    functions = discover(args.only.split(',') if args.only else None)
+    if args.cold:
+        # Импорт проверяется один раз, чтобы сразу показать функции с недостающими зависимостями
+        load_all(functions, None)
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((args.host, args.port))
+    listener.listen(1024)
+    print(f'[local-server] {len(functions)} functions on http://{args.host}:{args.port}/<function>/, '
+          f'{args.workers} workers{" (cold)" if args.cold else ""}', file=sys.stderr)
+
+    if args.workers <= 1 or not hasattr(os, 'fork'):
+        serve(listener, functions, args.cold)
+        return
+
+    children = []
+    for _ in range(args.workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve(listener, functions, args.cold)
+            finally:
+                atexit._run_exitfuncs()
+                os._exit(0)
+        children.append(pid)
+
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+
+if __name__ == '__main__':
+    main()
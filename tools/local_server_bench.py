@@ -0,0 +1,121 @@
+'''
+Business: Пропускная способность tools/local_server.py с тёплыми функциями против --cold (импорт функции на каждый вызов,
+          без общих пулов соединений) под одной и той же нагрузкой tools/load_test.py. Сервер запускается отдельным
+          процессом на свободном порту для каждого режима по очереди; нагрузка - только читающие сценарии tests.json
+Args: --functions (через запятую, по умолчанию products), --workers (воркеров сервера), --concurrency, --duration, --warmup,
+      --seed, --env-file (передаётся серверу, можно повторять); DATABASE_URL и прочее окружение функций - как для local_server
+Returns: таблица в stdout: режим, запросы, req/s, ошибки (с частыми образцами), p50/p99 мс по всем сценариям;
+         во сколько раз тёплый быстрее
+'''
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List
+
+from load_test import Histogram
+
+TOOLS_DIR = Path(__file__).resolve().parent
+MODES = ['warm', 'cold']
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def wait_ready(base_url: str, server: subprocess.Popen, timeout: float) -> None:
+    """GET / отвечает, когда воркеры загрузили функции"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f'local_server exited with {server.returncode}')
+        try:
+            with urllib.request.urlopen(base_url + '/', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f'local_server did not answer on {base_url} in {timeout:.0f} s')
+
+
+def run_mode(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    command = [sys.executable, str(TOOLS_DIR / 'local_server.py'), '--port', str(port), '--workers', str(args.workers),
+               '--only', args.functions]
+    for env_file in args.env_file or []:
+        command += ['--env-file', env_file]
+    if mode == 'cold':
+        command.append('--cold')
+    # Своя группа процессов: SIGTERM доходит до всех воркеров, и они досылают метрики через atexit
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        wait_ready(base_url, server, 60)
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / f'{mode}.json'
+            result = subprocess.run([
+                sys.executable, str(TOOLS_DIR / 'load_test.py'), '--base-url', base_url, '--functions', args.functions,
+                '--concurrency', str(args.concurrency), '--duration', str(args.duration), '--warmup', str(args.warmup),
+                '--seed', str(args.seed), '--read-only', '--output', str(output)
+            ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if result.returncode == 2 or not output.exists():
+                raise SystemExit(f'load_test.py failed against the {mode} server:\n{result.stderr}')
+            report = json.loads(output.read_text(encoding='utf-8'))
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+
+    # Перцентили по всем сценариям - из слитых гистограмм отчёта
+    histogram = Histogram()
+    for case in report['cases'].values():
+        for bucket, count in case['histogram'].items():
+            histogram.counts[int(bucket)] = histogram.counts.get(int(bucket), 0) + count
+        histogram.total += case['count']
+        histogram.max_ms = max(histogram.max_ms, case['max_ms'])
+    samples: Dict[str, int] = {}
+    for key, case in report['cases'].items():
+        for sample, count in case['error_samples'].items():
+            samples[f'{key}: {sample}'] = samples.get(f'{key}: {sample}', 0) + count
+    return {
+        'samples': samples,
+        'requests': report['total']['count'],
+        'rps': report['total']['rps'],
+        'errors': report['total']['errors'],
+        'p50': histogram.percentile(50),
+        'p99': histogram.percentile(99)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='local_server: тёплые функции против --cold под load_test.py')
+    parser.add_argument('--functions', default='products')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--env-file', action='append')
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    print(f'{args.functions}: {args.workers} workers, concurrency {args.concurrency}, {args.warmup:g}s warmup + {args.duration:g}s per mode')
+    print(f"{'mode':<5} {'requests':>9} {'req/s':>9} {'errors':>7} {'p50 ms':>9} {'p99 ms':>9}")
+    for mode in MODES:
+        result = results[mode] = run_mode(mode, args)
+        print(f"{mode:<5} {result['requests']:>9} {result['rps']:>9.1f} {result['errors']:>7} {result['p50']:>9.2f} {result['p99']:>9.2f}")
+        for sample, count in sorted(result['samples'].items(), key=lambda item: -item[1])[:3]:
+            print(f'      {count} x {sample}')
+    if results['cold']['rps']:
+        print(f"warm / cold: {results['warm']['rps'] / results['cold']['rps']:.1f}x req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+'''
+Business: Стоимость записи метрики в реестр tracing.py без базы: count/observe/cache_lookup с метками-kwargs, observe_key
+          с готовым ключом, defer_observe (им пишут длительность handler и запросы к БД), спан внешнего вызова и учёт
+          одного SQL-запроса TracedCursor в вызове из выборки.
+          Из каждого замера вычитается пустой вызов той же формы. Отдельно - запись из нескольких потоков и память реестра,
+          заполненного до METRICS_MAX_SERIES рядов
+Args: --function (каталог в backend, чей tracing.py меряется), --calls (вызовов в замере), --repeat (замеров на случай),
+      --threads (потоков для замера с конкуренцией)
+Returns: таблица в stdout: случай и нс на вызов (медиана замеров) за вычетом пустого вызова; ряды, отброшенные ряды и байт на ряд
+'''
+import argparse
+import importlib
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+# Длительности по всей сетке корзин, чтобы bisect шёл не в одну и ту же корзину
+VALUES_MS = [0.3 * 1.37 ** step for step in range(40)]
+QUERY = 'SELECT id, title FROM t_p99209851_math_resources_site.products WHERE id = %s'
+
+
+def measure(call: Callable[[float], Any], calls: int, repeat: int) -> float:
+    """нс на вызов, медиана замеров"""
+    values = (VALUES_MS * (calls // len(VALUES_MS) + 1))[:calls]
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        for value in values:
+            call(value)
+        timings.append((time.perf_counter_ns() - started) / calls)
+    return statistics.median(timings)
+
+
+def measure_threads(call: Callable[[float], Any], calls: int, threads: int) -> float:
+    """нс на вызов при записи из threads потоков одновременно"""
+    values = (VALUES_MS * (calls // len(VALUES_MS) + 1))[:calls]
+    barrier = threading.Barrier(threads + 1)
+
+    def worker() -> None:
+        barrier.wait()
+        for value in values:
+            call(value)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter_ns()
+    for thread in workers:
+        thread.join()
+    return (time.perf_counter_ns() - started) / (calls * threads)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Стоимость записи метрики в реестр tracing.py')
+    parser.add_argument('--function', default='products')
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND_DIR / args.function))
+    tracing = importlib.import_module('tracing')
+    # Сброс в БД не должен попасть в замеры
+    tracing._last_flush = float('inf')
+    registry = tracing._registry
+    # Как в вызове из выборки: спаны и запросы пишутся ещё и в трассу
+    tracing._active = tracing.Trace(args.function, 'metrics-record-bench', True)
+    observe_key = ('bench_duration_ms', (('kind', 'a'),))
+
+    def empty(value: float) -> None:
+        pass
+
+    def span_http(value: float) -> None:
+        with tracing.span('http', 'bench'):
+            pass
+
+    cases: Dict[str, Callable[[float], Any]] = {
+        'count(kind=...)': lambda value: tracing.count('bench_total', kind='a'),
+        'observe(kind=...)': lambda value: tracing.observe('bench_duration_ms', value, kind='a'),
+        'cache_lookup()': lambda value: tracing.cache_lookup('bench', True),
+        'observe_key()': lambda value: registry.observe_key(observe_key, value),
+        'defer_observe()': lambda value: registry.defer_observe(observe_key, value),
+        "span('http')": span_http,
+        # Без EXPLAIN: план медленного запроса снимается в базе, а здесь меряется только учёт
+        'SQL statement': lambda value: tracing.record_statement(None, QUERY, None, value / 1000, False, True, False)
+    }
+
+    baseline = measure(lambda value: empty(value), args.calls, args.repeat)
+    print(f'{args.function}/tracing.py; {args.calls} calls x {args.repeat}; empty call {baseline:.0f} ns')
+    print(f"{'case':<20} {'ns/call':>8} {f'{args.threads} threads':>10}")
+    for name, call in cases.items():
+        single = measure(call, args.calls, args.repeat) - baseline
+        threaded = measure_threads(call, args.calls // args.threads, args.threads) - baseline
+        print(f'{name:<20} {single:>8.0f} {threaded:>10.0f}')
+        registry.drain()
+        tracing._statements.drain()
+
+    # Реестр до предела рядов: память не растёт, лишние ряды только считаются
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for series in range(tracing.METRICS_MAX_SERIES * 2):
+        tracing.observe('bench_duration_ms', 1.0, series=str(series))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    kept = len(registry.histograms) + len(registry.counters)
+    print(f'registry: {kept} series kept, {registry.dropped} dropped, {used / 1024:.0f} KB ({used / max(kept, 1):.0f} B per series)')
+
+
+if __name__ == '__main__':
+    main()
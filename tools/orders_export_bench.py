@@ -0,0 +1,137 @@
+'''
+Business: Память и скорость выгрузки заказов orders-export на данных tools/generate_dataset.py: командная строка функции
+          (серверный курсор порциями, запись потоком) в CSV и JSONL против выборки fetchall с выгрузкой, собранной в памяти.
+          Каждый режим запускается отдельным процессом, пиковая память берётся из ru_maxrss этого процесса
+Args: --date-from, --date-to (период выгрузки), --formats (через запятую), --max-rss-mb (порог пиковой памяти выгрузки
+      функции, при превышении код выхода 1), --skip-fetchall (без прежнего режима); DATABASE_URL из окружения
+Returns: таблица в stdout: заказы, строки файла (в CSV - позиции, в JSONL - заказы), секунды, строк в секунду,
+         пиковая память МБ и размер файла по каждому режиму
+'''
+import argparse
+import csv
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import psycopg2
+
+EXPORT_SCRIPT = Path(__file__).resolve().parent.parent / 'backend' / 'orders-export' / 'index.py'
+SCHEMA = 't_p99209851_math_resources_site'
+# Тот же запрос, что в backend/orders-export, но одной выборкой - как выгрузка без серверного курсора
+FETCHALL_QUERY = f"""
+    SELECT o.id, o.created_at, o.paid_at, o.guest_email, o.total_price, o.payment_id, o.payment_status,
+           oi.product_id, oi.product_title, oi.product_price, oi.quantity
+    FROM {SCHEMA}.orders o
+    LEFT JOIN {SCHEMA}.order_items oi ON oi.order_id = o.id
+    WHERE o.created_at >= %s AND o.created_at < %s::date + interval '1 day'
+    ORDER BY o.id, oi.id
+"""
+CSV_COLUMNS = [
+    'order_id', 'created_at', 'paid_at', 'guest_email', 'total_price', 'payment_id', 'payment_status',
+    'product_id', 'product_title', 'product_price', 'quantity'
+]
+
+
+def fetchall_export(date_from: str, date_to: str, output: str) -> None:
+    """Прежний способ: все строки в память, CSV собирается в строке и только потом пишется в файл"""
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    try:
+        cur = conn.cursor()
+        cur.execute(FETCHALL_QUERY, (date_from, date_to))
+        rows = cur.fetchall()
+    finally:
+        conn.close()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for row in rows:
+        writer.writerow([row[0], row[1].isoformat() + 'Z', row[2].isoformat() + 'Z' if row[2] else None] + list(row[3:]))
+    with open(output, 'w', encoding='utf-8', newline='') as f:
+        f.write(buffer.getvalue())
+    print(f'Exported {len({row[0] for row in rows})} orders', file=sys.stderr)
+
+
+def run_process(command: List[str]) -> Dict[str, Any]:
+    """Запускает выгрузку отдельным процессом: секунды, пиковая память и число заказов из её stderr"""
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    stderr = process.stderr.read()
+    process.stderr.close()
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise SystemExit(f'{" ".join(command)} failed:\n{stderr}')
+    orders = next((int(line.split()[1]) for line in stderr.splitlines() if line.startswith('Exported ')), 0)
+    # ru_maxrss в Linux - в килобайтах
+    return {'seconds': seconds, 'rss_mb': usage.ru_maxrss / 1024, 'orders': orders}
+
+
+def count_rows(path: str, export_format: str) -> int:
+    with open(path, 'rb') as f:
+        lines = sum(1 for _ in f)
+    # В CSV первая строка - заголовок; в JSONL строка - заказ, позиции внутри
+    return lines - 1 if export_format == 'csv' else lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Память и скорость выгрузки заказов')
+    parser.add_argument('--date-from', required=True)
+    parser.add_argument('--date-to', required=True)
+    parser.add_argument('--formats', default='csv,jsonl')
+    parser.add_argument('--max-rss-mb', type=float, help='порог пиковой памяти выгрузки функции')
+    parser.add_argument('--skip-fetchall', action='store_true')
+    parser.add_argument('--fetchall-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+    if args.fetchall_output:
+        fetchall_export(args.date_from, args.date_to, args.fetchall_output)
+        return
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT COUNT(DISTINCT o.id), COUNT(*)
+        FROM {SCHEMA}.orders o LEFT JOIN {SCHEMA}.order_items oi ON oi.order_id = o.id
+        WHERE o.created_at >= %s AND o.created_at < %s::date + interval '1 day'
+    """, (args.date_from, args.date_to))
+    orders, rows = cur.fetchone()
+    conn.close()
+    print(f'{args.date_from}..{args.date_to}: {orders:,} orders, {rows:,} order rows')
+
+    exceeded = []
+    print(f"{'mode':<16} {'orders':>10} {'lines':>11} {'seconds':>8} {'lines/s':>9} {'peak MB':>8} {'file MB':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        modes = [(f'streaming {export_format}', export_format) for export_format in args.formats.split(',')]
+        if not args.skip_fetchall:
+            modes.append(('fetchall csv', 'csv'))
+        for name, export_format in modes:
+            output = os.path.join(directory, f'{name.replace(" ", "-")}.{export_format}')
+            if name.startswith('streaming'):
+                command = [sys.executable, str(EXPORT_SCRIPT), '--format', export_format,
+                           '--date-from', args.date_from, '--date-to', args.date_to, '--output', output]
+            else:
+                command = [sys.executable, __file__, '--date-from', args.date_from, '--date-to', args.date_to,
+                           '--fetchall-output', output]
+            result = run_process(command)
+            written = count_rows(output, export_format)
+            print(f"{name:<16} {result['orders']:>10,} {written:>11,} {result['seconds']:>8.1f} "
+                  f"{written / result['seconds']:>9,.0f} {result['rss_mb']:>8.0f} {os.path.getsize(output) / 2 ** 20:>8.0f}")
+            if name.startswith('streaming') and args.max_rss_mb and result['rss_mb'] > args.max_rss_mb:
+                exceeded.append(f"{name}: {result['rss_mb']:.0f} MB")
+            os.remove(output)
+
+    if exceeded:
+        print(f'peak memory above {args.max_rss_mb:.0f} MB: {", ".join(exceeded)}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+'''
+Business: Поиск платежей покупателя для manual-send-purchase: индексный запрос к локальной копии payments против обхода
+          /v3/payments с фильтром по receipt.customer.email (вся выдача и одна первая страница, как было до копии).
+          Заглушка YooKassa из tools/fake_services.py поднимается здесь же и заполняется платежами, копия заполняется
+          кодом backend/payments-sync (backfill с ограниченной параллельностью и инкрементальный запуск по курсору).
+          Созданные платежи удаляются из копии в конце
+Args: --payments (платежей в заглушке), --customers (разных покупателей), --target-payments (платежей у искомого покупателя),
+      --latency-ms (задержка заглушки), --concurrency (потоков backfill), --new-payments (новых платежей после курсора),
+      --runs (замеров запроса к копии); DATABASE_URL из окружения
+Returns: таблица в stdout: найденные платежи и время по каждому способу поиска, время backfill и инкрементальной синхронизации
+'''
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List
+
+import psycopg2
+
+from fake_services import Behaviour, serve_yookassa
+
+SYNC_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'payments-sync'
+SCHEMA = 't_p99209851_math_resources_site'
+# Тот же запрос, что в backend/manual-send-purchase
+MIRROR_QUERY = (
+    f"SELECT id, amount, created_at, metadata FROM {SCHEMA}.payments "
+    "WHERE customer_email = lower(%s) AND status = 'succeeded' AND refunded_amount < amount ORDER BY created_at DESC"
+)
+
+
+def fill_fake(store: Any, base_url: str, payments: int, customers: int, target_email: str, target_payments: int) -> List[str]:
+    """Платежи в хранилище заглушки напрямую: почти все оплачены, у искомого покупателя target_payments штук"""
+    target_every = max(payments // target_payments, 1) if target_payments else payments + 1
+    payment_ids = []
+    for index in range(payments):
+        is_target = index % target_every == 0 and index // target_every < target_payments
+        email = target_email if is_target else f'customer{index % customers}@example.com'
+        payment, _ = store.create(f'mirror-bench-{uuid.uuid4()}', {
+            'amount': {'value': f'{100 + index % 900}.00', 'currency': 'RUB'},
+            'description': f'Заказ {index}',
+            'receipt': {'customer': {'email': email}},
+            'metadata': {'customer_email': email, 'product_ids': str(1 + index % 50)}
+        }, base_url)
+        # Заглушка не хранит receipt из запроса, а прежний поиск читал email именно оттуда
+        store.payments[payment['id']]['receipt'] = {'customer': {'email': email}}
+        if index % 20 != 19:
+            store.finish(payment['id'], 'succeeded')
+        payment_ids.append(payment['id'])
+    return payment_ids
+
+
+def api_scan(client: Any, email: str, first_page_only: bool) -> List[str]:
+    """Поиск платежей по email обходом API, как manual-send-purchase до локальной копии"""
+    found = []
+    if first_page_only:
+        items = client.request('GET', '/v3/payments', params={'status': 'succeeded'}).get('items', [])
+    else:
+        items = client.iter_list('/v3/payments', {'status': 'succeeded', 'limit': 100})
+    for item in items:
+        if ((item.get('receipt') or {}).get('customer') or {}).get('email') == email:
+            found.append(item['id'])
+    return found
+
+
+def timed(call: Any, runs: int) -> Dict[str, Any]:
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'result': result, 'p50_ms': statistics.median(timings), 'max_ms': max(timings)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Поиск платежей покупателя: локальная копия против обхода API')
+    parser.add_argument('--payments', type=int, default=10000)
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--target-payments', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--new-payments', type=int, default=100, help='платежей после курсора для инкрементального запуска')
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    behaviour = Behaviour('yookassa')
+    _, base_url, store = serve_yookassa(behaviour)
+    os.environ.update({'YOOKASSA_API_URL': base_url, 'YOOKASSA_SHOP_ID': 'bench-shop', 'YOOKASSA_SECRET_KEY': 'bench-secret'})
+    sys.path.insert(0, str(SYNC_DIR))
+    sync = importlib.import_module('index')
+    client = sync.yookassa_client.get_client()
+
+    target_email = f'target-{uuid.uuid4().hex[:8]}@example.com'
+    started_at = datetime.utcnow() - timedelta(minutes=1)
+    payment_ids = fill_fake(store, base_url, args.payments, args.customers, target_email, args.target_payments)
+    # Задержка API включается после заполнения: в замер попадает только обход
+    behaviour.latency_ms = args.latency_ms
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"SELECT cursor_created_at FROM {SCHEMA}.payments_sync_state WHERE name = %s", (sync.SYNC_NAME,))
+    saved_cursor = cur.fetchone()
+    try:
+        started = time.perf_counter()
+        backfill = sync.run_backfill(client, dsn, started_at, datetime.utcnow() + timedelta(minutes=1), args.concurrency)
+        backfill_s = time.perf_counter() - started
+        cur.execute(f"ANALYZE {SCHEMA}.payments")
+
+        # Инкрементальный запуск после backfill: курсор - сейчас, без окна перечитывания, и --new-payments новых платежей
+        sync.OVERLAP_MINUTES = 0
+        cur.execute(
+            f"""
+            INSERT INTO {SCHEMA}.payments_sync_state (name, cursor_created_at) VALUES (%s, CURRENT_TIMESTAMP AT TIME ZONE 'UTC')
+            ON CONFLICT (name) DO UPDATE SET cursor_created_at = EXCLUDED.cursor_created_at
+            """,
+            (sync.SYNC_NAME,)
+        )
+        behaviour.latency_ms = 0.0
+        payment_ids += fill_fake(store, base_url, args.new_payments, args.customers, target_email, 0)
+        behaviour.latency_ms = args.latency_ms
+        started = time.perf_counter()
+        incremental = sync.run_incremental(client, dsn)
+        incremental_s = time.perf_counter() - started
+
+        mirror = timed(lambda: (cur.execute(MIRROR_QUERY, (target_email,)), cur.fetchall())[1], args.runs)
+        cur.execute('EXPLAIN ' + MIRROR_QUERY, (target_email,))
+        plan = ', '.join(row[0].split('  (cost')[0].strip(' ->') for row in cur.fetchall() if 'Scan' in row[0])
+        first_page = timed(lambda: api_scan(client, target_email, True), 5)
+        full_scan = timed(lambda: api_scan(client, target_email, False), 1)
+
+        print(f'{args.payments:,} payments in the fake, {args.target_payments} of them for {target_email}, '
+              f'API latency {args.latency_ms:.0f} ms')
+        print(f"{'lookup':<28} {'found':>6} {'p50 ms':>10} {'max ms':>10}")
+        for name, result in [('mirror query', mirror), ('API, first page', first_page), ('API, every page', full_scan)]:
+            print(f"{name:<28} {len(result['result']):>6} {result['p50_ms']:>10.2f} {result['max_ms']:>10.2f}")
+        print(f'mirror plan: {plan}')
+        print(f"backfill: {backfill['synced']:,} payments in {backfill_s:.2f} s with {args.concurrency} threads "
+              f"({backfill['synced'] / backfill_s:,.0f}/s); incremental: {incremental['synced']} new, "
+              f"{incremental['refreshed']} re-read in {incremental_s:.2f} s")
+    finally:
+        for start in range(0, len(payment_ids), 1000):
+            cur.execute(f"DELETE FROM {SCHEMA}.payments WHERE id = ANY(%s)", (payment_ids[start:start + 1000],))
+        if saved_cursor is not None:
+            cur.execute(f"UPDATE {SCHEMA}.payments_sync_state SET cursor_created_at = %s WHERE name = %s",
+                        (saved_cursor[0], sync.SYNC_NAME))
+        else:
+            cur.execute(f"DELETE FROM {SCHEMA}.payments_sync_state WHERE name = %s", (sync.SYNC_NAME,))
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+'''
+Business: Ширина строк и время запросов каталога products на данных tools/generate_dataset.py: прежние запросы со всеми
+          URL-колонками товара против узкой выборки products и ссылок нужных видов из product_assets (код backend/products).
+          Функции ходят в таблицы без схемы, поэтому у роли или базы должен стоять search_path на схему сайта
+Args: --runs (замеров на запрос), --ids (товаров для запроса по id); DATABASE_URL из окружения
+Returns: таблица в stdout: строки, средняя ширина строки в байтах (pg_column_size), МБ значений ответа и p50/p95 мс по запросам
+         (время включает сборку карточек товара, как в handler)
+'''
+import argparse
+import importlib
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import psycopg2
+
+PRODUCTS_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'products'
+SCHEMA = 't_p99209851_math_resources_site'
+# Запросы backend/products до product_assets
+WIDE_SELECT = (
+    'id, title, description, price, category, type, sample_pdf_url, full_pdf_with_answers_url, full_pdf_without_answers_url, '
+    'trainer1_url, trainer2_url, trainer3_url, is_free, preview_image_url, updated_at'
+)
+WIDE_STATS = f"""
+    SELECT COUNT(*),
+        SUM(CASE WHEN sample_pdf_url IS NOT NULL AND sample_pdf_url != '' THEN 1 ELSE 0 END) +
+        SUM(CASE WHEN full_pdf_with_answers_url IS NOT NULL AND full_pdf_with_answers_url != '' THEN 1 ELSE 0 END) +
+        SUM(CASE WHEN full_pdf_without_answers_url IS NOT NULL AND full_pdf_without_answers_url != '' THEN 1 ELSE 0 END) +
+        SUM(CASE WHEN trainer1_url IS NOT NULL AND trainer1_url != '' THEN 1 ELSE 0 END) +
+        SUM(CASE WHEN trainer2_url IS NOT NULL AND trainer2_url != '' THEN 1 ELSE 0 END) +
+        SUM(CASE WHEN trainer3_url IS NOT NULL AND trainer3_url != '' THEN 1 ELSE 0 END)
+    FROM {SCHEMA}.products
+"""
+WIDE_COLUMNS = [column.strip() for column in WIDE_SELECT.split(',')]
+STOREFRONT_KINDS = ['sample_pdf', 'trainer']
+
+
+def wide_to_dict(row: tuple) -> Dict[str, Any]:
+    """Карточка товара, как её собирал прежний handler: все URL-колонки в каждом ответе"""
+    product = dict(zip(WIDE_COLUMNS, row))
+    product['updated_at'] = product['updated_at'].isoformat() if product['updated_at'] else None
+    return product
+
+
+def row_width(cur, select: str) -> float:
+    cur.execute(f'SELECT AVG(pg_column_size(t.*)) FROM (SELECT {select} FROM {SCHEMA}.products) t')
+    return float(cur.fetchone()[0])
+
+
+def result_mb(rows: List[Any]) -> float:
+    """Объём значений ответа: длина текстов и по 8 байт на прочие значения"""
+    total = 0
+    for row in rows:
+        for value in (row.values() if isinstance(row, dict) else row):
+            total += len(value.encode('utf-8')) if isinstance(value, str) else 8
+    return total / 2 ** 20
+
+
+def timed(call: Callable[[], Any], runs: int) -> Dict[str, Any]:
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(timings)
+    return {'result': result, 'p50': statistics.median(timings), 'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Каталог: URL-колонки products против product_assets')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--ids', type=int, default=200)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    sys.path.insert(0, str(PRODUCTS_DIR))
+    products = importlib.import_module('index')
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f'SELECT id FROM {SCHEMA}.products')
+    ids = random.Random(42).sample([row[0] for row in cur.fetchall()], args.ids)
+
+    def wide_list() -> List[Any]:
+        cur.execute(f'SELECT {WIDE_SELECT} FROM {SCHEMA}.products ORDER BY id')
+        return [wide_to_dict(row) for row in cur.fetchall()]
+
+    def narrow_list(kinds: List[str]) -> Callable[[], List[Any]]:
+        def call() -> List[Any]:
+            cur.execute(f'SELECT {products.PRODUCT_SELECT} FROM {SCHEMA}.products ORDER BY id')
+            rows = cur.fetchall()
+            assets = products.load_assets(cur, kinds)
+            return [products.product_to_dict(row, kinds, assets.get(row[0], {})) for row in rows]
+        return call
+
+    def wide_by_id() -> List[Any]:
+        rows = []
+        for product_id in ids:
+            cur.execute(f'SELECT {WIDE_SELECT} FROM {SCHEMA}.products WHERE id = %s', (product_id,))
+            rows.append(wide_to_dict(cur.fetchone()))
+        return rows
+
+    def narrow_by_id() -> List[Any]:
+        rows = []
+        for product_id in ids:
+            cur.execute(f'SELECT {products.PRODUCT_SELECT} FROM {SCHEMA}.products WHERE id = %s', (product_id,))
+            row = cur.fetchone()
+            assets = products.load_assets(cur, products.ASSET_KINDS, [row[0]])
+            rows.append(products.product_to_dict(row, products.ASSET_KINDS, assets.get(row[0], {})))
+        return rows
+
+    def new_stats() -> List[Any]:
+        cur.execute(f"""
+            SELECT (SELECT COUNT(*) FROM {SCHEMA}.products),
+                   (SELECT COUNT(*) FROM {SCHEMA}.product_assets WHERE kind = ANY(%s))
+        """, (products.ASSET_KINDS,))
+        return cur.fetchall()
+
+    def old_stats() -> List[Any]:
+        cur.execute(WIDE_STATS)
+        return cur.fetchall()
+
+    cases = [
+        ('list, URL columns', wide_list, args.runs),
+        ('list, all assets', narrow_list(products.ASSET_KINDS), args.runs),
+        ('list, storefront assets', narrow_list(STOREFRONT_KINDS), args.runs),
+        ('list, no assets', narrow_list([]), args.runs),
+        (f'{args.ids} by id, URL columns', wide_by_id, args.runs),
+        (f'{args.ids} by id, assets', narrow_by_id, args.runs),
+        ('stats, URL columns', old_stats, args.runs),
+        ('stats, product_assets', new_stats, args.runs)
+    ]
+
+    cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.products')
+    products_count = cur.fetchone()[0]
+    cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.product_assets')
+    print(f'{products_count:,} products, {cur.fetchone()[0]:,} product_assets rows')
+    print(f'average row width: URL columns {row_width(cur, WIDE_SELECT):.0f} B, '
+          f'narrow {row_width(cur, products.PRODUCT_SELECT):.0f} B')
+    print(f"{'query':<28} {'rows':>8} {'MB':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, call, runs in cases:
+        call()
+        result = timed(call, runs)
+        print(f"{name:<28} {len(result['result']):>8,} {result_mb(result['result']):>7.1f} {result['p50']:>9.1f} {result['p95']:>9.1f}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
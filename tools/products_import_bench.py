@@ -0,0 +1,126 @@
+'''
+Business: Скорость импорта каталога products-bulk: разбор файла и COPY через staging-таблицу (код backend/products-bulk)
+          против INSERT ... ON CONFLICT на каждую строку в одной транзакции. Товары генерируются как в tools/generate_dataset.py
+          со своими external_key; каждый файл импортируется дважды - создание и обновление тех же товаров. Созданные
+          товары удаляются в конце
+Args: --sizes (строк в файле, через запятую), --format (csv или jsonl), --seed; DATABASE_URL из окружения
+Returns: таблица в stdout: строки, создано, обновлено, секунды и строк в секунду по каждому способу, размеру и проходу
+'''
+import argparse
+import csv
+import importlib
+import io
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import date
+from pathlib import Path
+from typing import Any, Tuple
+
+import psycopg2
+
+from generate_dataset import BASE_PRODUCTS, Dataset, TABLES
+
+BULK_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'products-bulk'
+SCHEMA = 't_p99209851_math_resources_site'
+
+
+def make_file(bulk: Any, rows: int, seed: int, key_prefix: str, import_format: str) -> str:
+    """Файл импорта из товаров генератора: колонки PRODUCT_COLUMNS, external_key с префиксом прогона"""
+    dataset = Dataset(rows // BASE_PRODUCTS + 1, seed, date.today(), 1)
+    names = TABLES['products']
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=bulk.PRODUCT_COLUMNS) if import_format == 'csv' else None
+    if writer:
+        writer.writeheader()
+    for index, values in zip(range(rows), dataset.product_rows(1)):
+        product = dict(zip(names, values))
+        product['external_key'] = f'{key_prefix}{index}'
+        row = {column: product.get(column) for column in bulk.PRODUCT_COLUMNS}
+        if writer:
+            writer.writerow(row)
+        else:
+            out.write(json.dumps(row, ensure_ascii=False) + '\n')
+    return out.getvalue()
+
+
+def import_copy(bulk: Any, dsn: str, body: str, import_format: str) -> Tuple[int, int]:
+    """Импорт так, как его делает handler products-bulk"""
+    buffer, _, errors, _ = bulk.build_copy_buffer(body, import_format)
+    if errors:
+        raise SystemExit(f'generated file has invalid rows: {errors[:3]}')
+    conn = psycopg2.connect(dsn)
+    try:
+        created, updated, _ = bulk.import_products(conn, buffer)
+    finally:
+        conn.close()
+    return created, updated
+
+
+def import_rows(bulk: Any, dsn: str, body: str, import_format: str) -> Tuple[int, int]:
+    """Та же проверка строк, но INSERT ... ON CONFLICT на каждую строку"""
+    columns = ', '.join(bulk.PRODUCT_COLUMNS)
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in bulk.PRODUCT_COLUMNS if column != 'external_key')
+    query = f"""
+        INSERT INTO {SCHEMA}.products ({columns}) VALUES ({', '.join(['%s'] * len(bulk.PRODUCT_COLUMNS))})
+        ON CONFLICT (external_key) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+        RETURNING (xmax = 0)
+    """
+    created = updated = 0
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        for _, raw in bulk.iter_import_rows(body, import_format):
+            cur.execute(query, bulk.validate_row(raw))
+            if cur.fetchone()[0]:
+                created += 1
+            else:
+                updated += 1
+        conn.commit()
+    finally:
+        conn.close()
+    return created, updated
+
+
+METHODS = {'copy': import_copy, 'row-insert': import_rows}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Импорт каталога: COPY через staging против INSERT на строку')
+    parser.add_argument('--sizes', default='10000,50000')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    sys.path.insert(0, str(BULK_DIR))
+    bulk = importlib.import_module('index')
+    run_prefix = f'import-bench-{uuid.uuid4().hex[:8]}-'
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    print(f"{'method':<11} {'rows':>7} {'pass':<7} {'created':>8} {'updated':>8} {'seconds':>8} {'rows/s':>9}")
+    try:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            for method, run in METHODS.items():
+                body = make_file(bulk, size, args.seed, f'{run_prefix}{method}-{size}-', args.format)
+                for phase in ['create', 'update']:
+                    started = time.perf_counter()
+                    created, updated = run(bulk, dsn, body, args.format)
+                    seconds = time.perf_counter() - started
+                    print(f"{method:<11} {size:>7} {phase:<7} {created:>8} {updated:>8} {seconds:>8.2f} {size / seconds:>9,.0f}")
+    finally:
+        cur.execute(f"DELETE FROM {SCHEMA}.products WHERE external_key LIKE %s", (f'{run_prefix}%',))
+        print(f'removed {cur.rowcount} benchmark products', file=sys.stderr)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
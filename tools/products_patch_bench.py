@@ -0,0 +1,107 @@
+'''
+Business: Объём WAL и время правки цены товара через handler backend/products: PATCH только с ценой против PUT со всей
+          карточкой, как её отправляла админка. PUT переписывает и URL-колонки, поэтому срабатывает триггер product_assets.
+          Цена пишется та же, что была, поэтому каталог не меняется, сдвигается только updated_at. WAL берётся из разницы
+          pg_current_wal_lsn() и потому меряет всю базу: сервер на время замера не должен писать ничего другого
+Args: --products (товаров tools/generate_dataset.py на режим), --admin-secret (ADMIN_JWT_SECRET для токена); DATABASE_URL из окружения
+Returns: таблица в stdout: правок, байт WAL на правку, HOT-обновлений, p50 мс и правок в секунду по режимам
+'''
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import jwt
+import psycopg2
+
+PRODUCTS_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'products'
+SCHEMA = 't_p99209851_math_resources_site'
+CARD_COLUMNS = [
+    'id', 'title', 'description', 'price', 'category', 'type', 'sample_pdf_url', 'full_pdf_with_answers_url',
+    'full_pdf_without_answers_url', 'trainer1_url', 'trainer2_url', 'trainer3_url', 'is_free', 'preview_image_url'
+]
+MODES = ['PATCH', 'PUT']
+
+
+class Context:
+    request_id = 'products-patch-bench'
+
+
+def counters(cur) -> Dict[str, int]:
+    cur.execute(f"""
+        SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')::bigint, n_tup_upd, n_tup_hot_upd
+        FROM pg_stat_all_tables WHERE schemaname = %s AND relname = 'products'
+    """, (SCHEMA,))
+    wal, updates, hot = cur.fetchone()
+    return {'wal': wal, 'updates': updates, 'hot': hot}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='WAL и время правки цены: PATCH против PUT')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--admin-secret', default='products-patch-bench-admin-secret')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    os.environ['ADMIN_JWT_SECRET'] = args.admin_secret
+    os.environ.pop('CATALOG_PUBLISH_URL', None)
+    sys.path.insert(0, str(PRODUCTS_DIR))
+    products = importlib.import_module('index')
+    token = jwt.encode({'admin_id': 1, 'exp': int(time.time()) + 3600}, args.admin_secret, algorithm='HS256')
+    context = Context()
+    # Сброс метрик трассировки тоже пишет в WAL - на время замера он выключен
+    products.tracing._last_flush = float('inf')
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(CARD_COLUMNS)} FROM {SCHEMA}.products ORDER BY id LIMIT %s", (args.products * len(MODES),))
+    cards = [dict(zip(CARD_COLUMNS, row)) for row in cur.fetchall()]
+    if len(cards) < args.products * len(MODES):
+        print(f'{len(cards)} products in the database, {args.products * len(MODES)} needed', file=sys.stderr)
+        sys.exit(2)
+
+    print(f"{'mode':<6} {'edits':>6} {'WAL bytes/edit':>15} {'HOT':>6} {'p50 ms':>8} {'edits/s':>8}")
+    for index, mode in enumerate(MODES):
+        batch = cards[index * args.products:(index + 1) * args.products]
+        bodies: List[Dict[str, Any]] = [
+            {'id': card['id'], 'price': card['price']} if mode == 'PATCH' else card for card in batch
+        ]
+        # Прогрев: импорт и первый запрос не попадают в замер
+        with contextlib.redirect_stdout(io.StringIO()):
+            products.handler({'httpMethod': mode, 'headers': {'X-Admin-Token': token}, 'body': json.dumps(bodies[0])}, context)
+        before = counters(cur)
+        timings = []
+        started = time.perf_counter()
+        # Строки лога трассировки не должны мерить скорость терминала
+        with contextlib.redirect_stdout(io.StringIO()):
+            for body in bodies:
+                call_started = time.perf_counter()
+                response = products.handler({'httpMethod': mode, 'headers': {'X-Admin-Token': token}, 'body': json.dumps(body)}, context)
+                timings.append((time.perf_counter() - call_started) * 1000)
+                if response['statusCode'] != 200:
+                    raise SystemExit(f"{mode} {body['id']}: {response['statusCode']} {response['body']}")
+        seconds = time.perf_counter() - started
+        wal = counters(cur)['wal'] - before['wal']
+        # Статистика таблиц доходит до pg_stat_all_tables с задержкой
+        time.sleep(1)
+        cur.execute('SELECT pg_stat_clear_snapshot()')
+        after = counters(cur)
+        print(f"{mode:<6} {len(bodies):>6} {wal / len(bodies):>15,.0f} "
+              f"{after['hot'] - before['hot']:>6} {statistics.median(timings):>8.2f} {len(bodies) / seconds:>8,.0f}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
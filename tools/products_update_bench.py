@@ -0,0 +1,99 @@
+'''
+Business: Скорость пакетного изменения товаров products-bulk: UPDATE ... FROM (VALUES ...) по набору колонок (код
+          backend/products-bulk) против UPDATE на каждый товар. Изменяются товары tools/generate_dataset.py: только цена
+          или разные наборы колонок у разных товаров. Каждый прогон идёт в транзакции и откатывается
+Args: --rows (товаров в пакете), --runs (прогонов на способ); DATABASE_URL из окружения
+Returns: таблица в stdout: пакет, способ, отправленные запросы, p50 секунд и строк в секунду
+'''
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+BULK_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'products-bulk'
+SCHEMA = 't_p99209851_math_resources_site'
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Считает запросы, ушедшие в базу"""
+    statements = 0
+
+    def execute(self, query, vars=None):
+        CountingCursor.statements += 1
+        return super().execute(query, vars)
+
+
+def make_batches(ids: List[int]) -> Dict[str, List[Tuple[int, Dict[str, Any]]]]:
+    mixed_columns = [('price',), ('price', 'is_free'), ('category',), ('title', 'price')]
+    mixed = []
+    for index, product_id in enumerate(ids):
+        values = {'price': 100 + index % 900, 'is_free': index % 7 == 0, 'category': 'ОГЭ', 'title': f'Товар {product_id}'}
+        mixed.append((product_id, {column: values[column] for column in mixed_columns[index % len(mixed_columns)]}))
+    return {
+        'price': [(product_id, {'price': 100 + index % 900}) for index, product_id in enumerate(ids)],
+        'mixed columns': mixed
+    }
+
+
+def update_per_row(cur, updates: List[Tuple[int, Dict[str, Any]]]) -> set:
+    """UPDATE на каждый товар, как без пакетного изменения"""
+    updated_ids = set()
+    for product_id, changes in updates:
+        assignments = ', '.join(f'{column} = %s' for column in changes)
+        cur.execute(
+            f"UPDATE {SCHEMA}.products SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING id",
+            list(changes.values()) + [product_id]
+        )
+        updated_ids.update(row[0] for row in cur.fetchall())
+    return updated_ids
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Пакетное изменение товаров против UPDATE на товар')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    sys.path.insert(0, str(BULK_DIR))
+    bulk = importlib.import_module('index')
+    methods = {'values batch': bulk.apply_updates, 'per row': update_per_row}
+
+    conn = psycopg2.connect(dsn, cursor_factory=CountingCursor)
+    cur = conn.cursor()
+    cur.execute(f"SELECT id FROM {SCHEMA}.products ORDER BY id LIMIT %s", (args.rows,))
+    ids = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    if len(ids) < args.rows:
+        print(f'{len(ids)} products in the database, --rows is {args.rows}', file=sys.stderr)
+        sys.exit(2)
+
+    print(f"{'batch':<14} {'method':<13} {'updated':>8} {'statements':>10} {'p50 s':>8} {'rows/s':>9}")
+    for batch_name, updates in make_batches(ids).items():
+        for method, apply in methods.items():
+            timings = []
+            for _ in range(args.runs):
+                CountingCursor.statements = 0
+                started = time.perf_counter()
+                updated = apply(cur, updates)
+                timings.append(time.perf_counter() - started)
+                statements = CountingCursor.statements
+                conn.rollback()
+            seconds = statistics.median(timings)
+            print(f"{batch_name:<14} {method:<13} {len(updated):>8} {statements:>10} {seconds:>8.2f} {len(updates) / seconds:>9,.0f}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+'''
+Business: Планы и время запросов my-purchases на покупателях с заданным числом купленных позиций: проверка владения
+          через entitlements против выборки из orders/order_items, версия кэша, страницы покупок против выдачи всего списка.
+          Покупатели создаются в транзакции поверх данных tools/generate_dataset.py и откатываются в конце
+Args: --sizes (купленных позиций у покупателя, через запятую), --items-per-order, --page-size, --runs (замеров на запрос),
+      --cases (имена через запятую), --explain (печатать планы целиком); DATABASE_URL из окружения
+Returns: таблица в stdout: строки, p50/p95 мс, прочитанные буферы и узлы чтения из EXPLAIN ANALYZE по каждому запросу и размеру
+'''
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+SCHEMA = 't_p99209851_math_resources_site'
+HISTORY_START = datetime(2024, 1, 1)
+
+# Те же запросы, что в backend/my-purchases; owned-from-orders и purchases-all - как владение и список покупок
+# читались до entitlements и постраничной выдачи
+PURCHASES_SELECT = f"""
+    SELECT oi.id, oi.product_id, oi.product_title, oi.product_price,
+           p.full_pdf_with_answers_url, p.full_pdf_without_answers_url, o.created_at
+    FROM {SCHEMA}.orders o
+    JOIN {SCHEMA}.order_items oi ON oi.order_id = o.id
+    LEFT JOIN {SCHEMA}.products p ON p.id = oi.product_id
+"""
+QUERIES = {
+    'owned': f"SELECT product_id FROM {SCHEMA}.entitlements WHERE email = %(email)s ORDER BY product_id",
+    'owned-from-orders': f"""
+        SELECT DISTINCT oi.product_id
+        FROM {SCHEMA}.orders o
+        JOIN {SCHEMA}.order_items oi ON oi.order_id = o.id
+        WHERE LOWER(TRIM(o.guest_email)) = %(email)s AND o.payment_status = 'paid' AND oi.product_id IS NOT NULL
+        ORDER BY oi.product_id
+    """,
+    'cache-version': f"SELECT version FROM {SCHEMA}.customer_cache_versions WHERE email = %(email)s",
+    'purchases-page': PURCHASES_SELECT + """
+        WHERE LOWER(TRIM(o.guest_email)) = %(email)s AND o.payment_status = 'paid'
+        ORDER BY o.created_at DESC, oi.id DESC
+        LIMIT %(limit)s
+    """,
+    'purchases-deep-page': PURCHASES_SELECT + """
+        WHERE LOWER(TRIM(o.guest_email)) = %(email)s AND o.payment_status = 'paid'
+          AND o.created_at <= %(cursor_created_at)s AND (o.created_at, oi.id) < (%(cursor_created_at)s, %(cursor_id)s)
+        ORDER BY o.created_at DESC, oi.id DESC
+        LIMIT %(limit)s
+    """,
+    'purchases-all': PURCHASES_SELECT + """
+        WHERE LOWER(TRIM(o.guest_email)) = %(email)s AND o.payment_status = 'paid'
+        ORDER BY o.created_at DESC
+    """
+}
+
+
+def create_customer(cur, items: int, items_per_order: int, product_ids: List[int]) -> str:
+    """Оплаченные заказы покупателя с items позициями разных товаров, права выдаются как при оплате.
+    Email в заказах с заглавными буквами - как его ввёл покупатель"""
+    email = f'Bench-{items}-{uuid.uuid4().hex[:8]}@Example.com'
+    orders = math.ceil(items / items_per_order)
+    step = timedelta(minutes=max(1, int((datetime(2026, 1, 1) - HISTORY_START).total_seconds() / 60 / orders)))
+    order_rows = [(email, 0, 'paid', HISTORY_START + step * index, HISTORY_START + step * index) for index in range(orders)]
+    order_ids = [row[0] for row in psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO {SCHEMA}.orders (guest_email, total_price, payment_status, created_at, paid_at) VALUES %s RETURNING id",
+        order_rows, page_size=1000, fetch=True
+    )]
+    item_rows = []
+    for position in range(items):
+        product_id = product_ids[position % len(product_ids)]
+        item_rows.append((order_ids[position // items_per_order], product_id, f'Товар {product_id}', 100, 1))
+    psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO {SCHEMA}.order_items (order_id, product_id, product_title, product_price, quantity) VALUES %s",
+        item_rows, page_size=1000
+    )
+    cur.execute(f"SELECT {SCHEMA}.grant_entitlements(id) FROM {SCHEMA}.orders WHERE id = ANY(%s)", (order_ids,))
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.customer_cache_versions (email, version) VALUES (%s, 1) ON CONFLICT (email) DO NOTHING",
+        (email.strip().lower(),)
+    )
+    return email
+
+
+def query_params(cur, email: str, page_size: int) -> Dict[str, Any]:
+    """Параметры запросов; курсор глубокой страницы - середина истории покупателя"""
+    params = {'email': email.strip().lower(), 'limit': page_size + 1}
+    cur.execute(QUERIES['purchases-all'], params)
+    rows = cur.fetchall()
+    middle = rows[len(rows) // 2] if rows else None
+    params['cursor_created_at'] = middle[6] if middle else HISTORY_START
+    params['cursor_id'] = middle[0] if middle else 0
+    return params
+
+
+def scan_nodes(plan: Dict[str, Any]) -> List[str]:
+    """Узлы чтения таблиц из плана: тип узла и индекс или таблица"""
+    nodes = []
+    if 'Relation Name' in plan or 'Index Name' in plan:
+        nodes.append(f"{plan['Node Type']} {plan.get('Index Name') or plan['Relation Name']}")
+    for child in plan.get('Plans', []):
+        nodes.extend(scan_nodes(child))
+    return nodes
+
+
+def measure(cur, sql: str, params: Dict[str, Any], runs: int, show_plan: bool) -> Dict[str, Any]:
+    cur.execute(sql, params)
+    rows = len(cur.fetchall())
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    cur.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql, params)
+    explain = cur.fetchone()[0][0]
+    plan = explain['Plan']
+    if show_plan:
+        cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+        print('\n'.join(row[0] for row in cur.fetchall()))
+        print()
+    timings.sort()
+    return {
+        'rows': rows,
+        'p50_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'buffers': plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0),
+        'nodes': ', '.join(dict.fromkeys(scan_nodes(plan)))
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Планы и время запросов my-purchases')
+    parser.add_argument('--sizes', default='1,100,10000', help='купленных позиций у покупателя')
+    parser.add_argument('--items-per-order', type=int, default=5)
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--cases', help='по умолчанию все: ' + ', '.join(QUERIES))
+    parser.add_argument('--explain', action='store_true', help='печатать EXPLAIN ANALYZE каждого запроса')
+    args = parser.parse_args()
+
+    cases = args.cases.split(',') if args.cases else list(QUERIES)
+    unknown = [name for name in cases if name not in QUERIES]
+    if unknown:
+        parser.error(f'unknown cases: {", ".join(unknown)}')
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    conn = psycopg2.connect(dsn)
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT id FROM {SCHEMA}.products ORDER BY id")
+        product_ids = [row[0] for row in cur.fetchall()]
+        cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.order_items")
+        print(f'{cur.fetchone()[0]:,} order items, {len(product_ids):,} products', file=sys.stderr)
+
+        customers: List[Tuple[int, Dict[str, Any]]] = []
+        for size in [int(size) for size in args.sizes.split(',')]:
+            email = create_customer(cur, size, args.items_per_order, product_ids)
+            customers.append((size, query_params(cur, email, args.page_size)))
+        cur.execute(f"ANALYZE {SCHEMA}.orders, {SCHEMA}.order_items, {SCHEMA}.entitlements")
+
+        print(f"{'case':<20} {'items':>6} {'rows':>6} {'p50 ms':>8} {'p95 ms':>8} {'buffers':>8}  plan")
+        for name in cases:
+            for size, params in customers:
+                if args.explain:
+                    print(f'-- {name}, {size} items')
+                result = measure(cur, QUERIES[name], params, args.runs, args.explain)
+                print(f"{name:<20} {size:>6} {result['rows']:>6} {result['p50_ms']:>8.3f} {result['p95_ms']:>8.3f} "
+                      f"{result['buffers']:>8}  {result['nodes']}")
+    finally:
+        # Покупатели и ANALYZE в той же транзакции - после прогона база как была
+        conn.rollback()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
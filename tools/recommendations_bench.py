@@ -0,0 +1,112 @@
+'''
+Business: Время и пиковая память пересчёта рекомендаций product-recommendations на данных tools/generate_dataset.py
+          при разных размерах порции RECOMMENDATIONS_CHUNK_ROWS и скорость выдачи рекомендаций режимом products
+          ?recommendations= из тёплого кэша против промаха. Каждый пересчёт запускается командной строкой функции
+          отдельным процессом, пиковая память берётся из ru_maxrss этого процесса; таблица product_recommendations
+          при этом заменяется
+Args: --chunk-rows (размеры порции через запятую), --max-rss-mb (предел памяти пересчёта), --products (товаров для выдачи);
+      DATABASE_URL из окружения
+Returns: таблицы в stdout: порция, позиции, заказы, рекомендации, секунды и пик памяти; p50/p95 мс выдачи с промахом и из кэша.
+         Код выхода 1, если пересчёт вышел за --max-rss-mb
+'''
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import psycopg2
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+SCHEMA = 't_p99209851_math_resources_site'
+
+
+class Context:
+    request_id = 'recommendations-bench'
+
+
+def run_rebuild(chunk_rows: int) -> Dict[str, Any]:
+    """Пересчёт командной строкой функции: результат из её stdout, секунды и пиковая память процесса"""
+    command = [sys.executable, str(BACKEND_DIR / 'product-recommendations' / 'index.py')]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                               env={**os.environ, 'RECOMMENDATIONS_CHUNK_ROWS': str(chunk_rows)})
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    stdout, stderr = process.stdout.read(), process.stderr.read()
+    process.stdout.close()
+    process.stderr.close()
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise SystemExit(f'{" ".join(command)} failed:\n{stderr}')
+    result = json.loads(stdout.strip().splitlines()[-1])
+    # ru_maxrss в Linux - в килобайтах
+    return {**result, 'seconds': seconds, 'rss_mb': usage.ru_maxrss / 1024}
+
+
+def percentile(timings: List[float], percent: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Пересчёт и выдача рекомендаций «Часто покупают вместе»')
+    parser.add_argument('--chunk-rows', default='100000,500000,2000000')
+    parser.add_argument('--max-rss-mb', type=float, default=None)
+    parser.add_argument('--products', type=int, default=500)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    over_budget = []
+    print(f"{'chunk rows':>10} {'items':>11} {'orders':>10} {'recommendations':>15} {'seconds':>8} {'peak MB':>8}")
+    for chunk_rows in [int(size) for size in args.chunk_rows.split(',')]:
+        result = run_rebuild(chunk_rows)
+        print(f"{chunk_rows:>10,} {result['items']:>11,} {result['orders']:>10,} {result['recommendations']:>15,} "
+              f"{result['seconds']:>8.1f} {result['rss_mb']:>8.0f}")
+        if args.max_rss_mb is not None and result['rss_mb'] > args.max_rss_mb:
+            over_budget.append(chunk_rows)
+
+    sys.path.insert(0, str(BACKEND_DIR / 'products'))
+    products = importlib.import_module('index')
+    context = Context()
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute(f'SELECT DISTINCT product_id FROM {SCHEMA}.product_recommendations')
+    product_ids = [row[0] for row in cur.fetchall()]
+    conn.close()
+    product_ids = random.Random(42).sample(product_ids, min(args.products, len(product_ids)))
+
+    timings: Dict[str, List[float]] = {'miss': [], 'warm cache': []}
+    # Строки лога трассировки не должны мерить скорость терминала
+    with contextlib.redirect_stdout(io.StringIO()):
+        for mode in timings:
+            for product_id in product_ids:
+                event = {'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': {'recommendations': str(product_id)}}
+                started = time.perf_counter()
+                response = products.handler(event, context)
+                timings[mode].append((time.perf_counter() - started) * 1000)
+                if response['statusCode'] != 200:
+                    raise SystemExit(f"recommendations {product_id}: {response['statusCode']} {response['body']}")
+
+    print(f"\n{'serving':<11} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, values in timings.items():
+        print(f"{mode:<11} {len(values):>6} {statistics.median(values):>8.3f} {percentile(values, 95):>8.3f}")
+
+    if over_budget:
+        print(f'peak memory above {args.max_rss_mb:.0f} MB for chunk rows {", ".join(map(str, over_budget))}', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+'''
+Business: Пропускная способность payments-reconcile на локальном стенде: tools/local_server.py с функциями,
+          tools/fake_services.py (без --auto-pay-ms) и база с миграциями. В заглушке YooKassa создаются --payments
+          оплаченных платежей; у всех, кроме --missing, уже есть оплаченный заказ, у остальных заказ остался pending,
+          как если бы webhook не дошёл. Сверка запускается кодом backend/payments-reconcile и восстанавливает их через
+          yookassa-webhook локального сервера, затем повторяется без пропусков с разной параллельностью.
+          Заказы стенда берут свой email и остаются в базе, как у tools/flow_checks.py
+Args: --base-url (локальный сервер), --yookassa-url (заглушка), --payments, --missing, --concurrency (потоков сверки
+      с восстановлением), --scan-concurrency (через запятую - прогоны без пропусков); DATABASE_URL из окружения
+Returns: таблица в stdout: проверено, не найдено, восстановлено, секунды и платежей в секунду по каждому прогону
+'''
+import argparse
+import importlib
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+from flow_checks import NoRedirect
+
+RECONCILE_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'payments-reconcile'
+SCHEMA = 't_p99209851_math_resources_site'
+PRICE = 199
+
+
+def pay_without_notification(payment_url: str) -> None:
+    try:
+        urllib.request.build_opener(NoRedirect).open(f'{payment_url}?notify=false', timeout=10)
+    except urllib.error.HTTPError as e:
+        if e.code != 302:
+            raise SystemExit(f'paying {payment_url} returned {e.code}')
+
+
+def create_orders(cur, email: str, statuses: List[str]) -> List[Tuple[int, str]]:
+    """Заказы стенда без позиций: (id, idempotence_key) в порядке statuses"""
+    keys = [str(uuid.uuid4()) for _ in statuses]
+    rows = psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO {SCHEMA}.orders (guest_email, total_price, payment_status, idempotence_key) VALUES %s RETURNING id",
+        [(email, PRICE, status, key) for status, key in zip(statuses, keys)],
+        page_size=1000, fetch=True
+    )
+    return [(row[0], key) for row, key in zip(rows, keys)]
+
+
+def create_payment(client: Any, email: str, order_id: int, idempotence_key: str) -> str:
+    """Платёж в заглушке с metadata, как у create-payment, оплаченный без уведомления"""
+    payment = client.create_payment({
+        'amount': {'value': f'{PRICE:.2f}', 'currency': 'RUB'},
+        'confirmation': {'type': 'redirect', 'return_url': 'https://example.com/return'},
+        'capture': True,
+        'description': f'Заказ {order_id}',
+        'metadata': {'order_id': str(order_id), 'idempotence_key': idempotence_key, 'customer_email': email}
+    }, idempotence_key)
+    pay_without_notification(payment.confirmation_url)
+    return payment.id
+
+
+def run(reconcile: Any, client: Any, dsn: str, concurrency: int) -> Dict[str, Any]:
+    reconcile.CONCURRENCY = concurrency
+    started = time.perf_counter()
+    result = reconcile.reconcile(client, dsn, 1)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Пропускная способность сверки платежей с заказами')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--yookassa-url', default='http://127.0.0.1:8101')
+    parser.add_argument('--payments', type=int, default=10000)
+    parser.add_argument('--missing', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--scan-concurrency', default='1,4,8')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    os.environ['YOOKASSA_API_URL'] = args.yookassa_url
+    os.environ['YOOKASSA_WEBHOOK_URL'] = f'{args.base_url.rstrip("/")}/yookassa-webhook'
+    os.environ.setdefault('YOOKASSA_SHOP_ID', 'fake-shop')
+    os.environ.setdefault('YOOKASSA_SECRET_KEY', 'fake-secret')
+    sys.path.insert(0, str(RECONCILE_DIR))
+    reconcile = importlib.import_module('index')
+    client = reconcile.yookassa_client.get_client()
+
+    email = f'reconcile-{uuid.uuid4().hex[:12]}@example.com'
+    statuses = ['pending'] * args.missing + ['paid'] * (args.payments - args.missing)
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    orders = create_orders(cur, email, statuses)
+    conn.commit()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        payment_ids = list(executor.map(lambda order: create_payment(client, email, *order), orders))
+    print(f'{len(payment_ids):,} payments created and paid in {time.perf_counter() - started:.1f} s', file=sys.stderr)
+    psycopg2.extras.execute_values(
+        cur,
+        f"""
+        UPDATE {SCHEMA}.orders o
+        SET payment_id = v.payment_id,
+            paid_at = CASE WHEN o.payment_status = 'paid' THEN CURRENT_TIMESTAMP END,
+            rolled_up_at = CASE WHEN o.payment_status = 'paid' THEN CURRENT_TIMESTAMP END
+        FROM (VALUES %s) AS v(id, payment_id)
+        WHERE o.id = v.id
+        """,
+        [(order_id, payment_id) for (order_id, _), payment_id in zip(orders, payment_ids)],
+        page_size=1000
+    )
+    conn.commit()
+
+    runs = [('recover', args.concurrency)] + [('scan', int(value)) for value in args.scan_concurrency.split(',')]
+    print(f"{'run':<8} {'threads':>7} {'checked':>8} {'missing':>8} {'recovered':>9} {'seconds':>8} {'payments/s':>11}")
+    for name, concurrency in runs:
+        result = run(reconcile, client, dsn, concurrency)
+        print(f"{name:<8} {concurrency:>7} {result['checked']:>8,} {result['missing']:>8} {result['recovered']:>9} "
+              f"{result['seconds']:>8.2f} {result['checked'] / result['seconds']:>11,.0f}")
+        if result['failed']:
+            print(f"  failed: {', '.join(result['failed'][:5])}", file=sys.stderr)
+
+    cur.execute(f"SELECT payment_status, COUNT(*) FROM {SCHEMA}.orders WHERE guest_email = %s GROUP BY 1 ORDER BY 1", (email,))
+    print(f'orders of {email}: ' + ', '.join(f'{status} {count}' for status, count in cur.fetchall()))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
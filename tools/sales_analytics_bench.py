@@ -0,0 +1,166 @@
+'''
+Business: Время ответа аналитики продаж sales-analytics из дневных агрегатов против той же агрегации по orders и order_items
+          на данных tools/generate_dataset.py: итоги периода и строки по дням, товарам и категориям за периоды разной длины.
+          Ответы обоих способов сверяются. Если в базе есть оплаченные, но не учтённые заказы, сначала идёт догоняющий
+          пересчёт агрегатов (catch_up функции) - его скорость печатается отдельно
+Args: --periods (дней в периоде через запятую), --date-to (последний день, по умолчанию день последней оплаты),
+      --runs (замеров на случай), --limit, --catch-up-budget (секунд на догоняющий пересчёт); DATABASE_URL из окружения
+Returns: таблица в stdout: период, группировка, p50 мс из агрегатов и по сырым таблицам, ускорение; код выхода 1 при расхождении
+'''
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+
+SALES_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'sales-analytics'
+SCHEMA = 't_p99209851_math_resources_site'
+GROUPS = ['day', 'product', 'category']
+# Оплаченные заказы периода по дню оплаты - как rollup_order выбирает день заказа
+PAID_ORDERS = f"""
+    SELECT id, COALESCE(paid_at, created_at)::date AS day, total_price
+    FROM {SCHEMA}.orders
+    WHERE payment_status = 'paid' AND COALESCE(paid_at, created_at) >= %s AND COALESCE(paid_at, created_at) < %s
+"""
+
+
+def raw_totals(cur, date_from: date, date_to: date) -> Dict[str, Any]:
+    cur.execute(f"""
+        WITH paid AS ({PAID_ORDERS})
+        SELECT COALESCE(SUM(total_price), 0), COUNT(*),
+               (SELECT COALESCE(SUM(COALESCE(oi.quantity, 1)), 0) FROM {SCHEMA}.order_items oi JOIN paid ON paid.id = oi.order_id)
+        FROM paid
+    """, (date_from, date_to + timedelta(days=1)))
+    revenue, orders_count, units = cur.fetchone()
+    return {'revenue': float(revenue), 'orders': int(orders_count), 'units': int(units)}
+
+
+def raw_rows(cur, group_by: str, date_from: date, date_to: date, limit: int) -> List[Dict[str, Any]]:
+    params = (date_from, date_to + timedelta(days=1))
+    if group_by == 'day':
+        cur.execute(f"""
+            WITH paid AS ({PAID_ORDERS})
+            SELECT paid.day, SUM(paid.total_price), COUNT(*), SUM(COALESCE(items.units, 0))
+            FROM paid
+            LEFT JOIN (
+                SELECT oi.order_id, SUM(COALESCE(oi.quantity, 1)) AS units
+                FROM {SCHEMA}.order_items oi JOIN paid ON paid.id = oi.order_id
+                GROUP BY oi.order_id
+            ) items ON items.order_id = paid.id
+            GROUP BY paid.day
+            ORDER BY paid.day
+        """, params)
+        return [{'day': row[0].isoformat(), 'revenue': float(row[1]), 'orders': row[2], 'units': int(row[3])} for row in cur.fetchall()]
+
+    if group_by == 'product':
+        cur.execute(f"""
+            WITH paid AS ({PAID_ORDERS})
+            SELECT oi.product_id, p.title, COALESCE(MAX(p.category), ''), SUM(oi.product_price * COALESCE(oi.quantity, 1)),
+                   COUNT(DISTINCT oi.order_id), SUM(COALESCE(oi.quantity, 1))
+            FROM paid
+            JOIN {SCHEMA}.order_items oi ON oi.order_id = paid.id
+            LEFT JOIN {SCHEMA}.products p ON p.id = oi.product_id
+            WHERE oi.product_id IS NOT NULL
+            GROUP BY oi.product_id, p.title
+            ORDER BY SUM(oi.product_price * COALESCE(oi.quantity, 1)) DESC
+            LIMIT %s
+        """, params + (limit,))
+        return [
+            {'product_id': row[0], 'title': row[1], 'category': row[2], 'revenue': float(row[3]), 'orders': row[4], 'units': int(row[5])}
+            for row in cur.fetchall()
+        ]
+
+    cur.execute(f"""
+        WITH paid AS ({PAID_ORDERS})
+        SELECT COALESCE(p.category, ''), SUM(oi.product_price * COALESCE(oi.quantity, 1)), COUNT(DISTINCT oi.order_id),
+               SUM(COALESCE(oi.quantity, 1))
+        FROM paid
+        JOIN {SCHEMA}.order_items oi ON oi.order_id = paid.id
+        LEFT JOIN {SCHEMA}.products p ON p.id = oi.product_id
+        WHERE oi.product_id IS NOT NULL
+        GROUP BY COALESCE(p.category, '')
+        ORDER BY SUM(oi.product_price * COALESCE(oi.quantity, 1)) DESC
+        LIMIT %s
+    """, params + (limit,))
+    return [{'category': row[0], 'revenue': float(row[1]), 'orders': row[2], 'units': int(row[3])} for row in cur.fetchall()]
+
+
+def timed(call: Callable[[], Any], runs: int) -> Tuple[float, Any]:
+    timings = []
+    result = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = call()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), result
+
+
+def comparable(group_by: str, answer: Tuple[Dict[str, Any], List[Dict[str, Any]]]) -> Any:
+    """При равной выручке LIMIT может выбрать разные товары: у товаров и категорий сверяются итоги и ряд выручки"""
+    totals, rows = answer
+    totals = {key: round(value, 2) for key, value in totals.items()}
+    if group_by == 'day':
+        return totals, [{**row, 'revenue': round(row['revenue'], 2)} for row in rows]
+    return totals, [round(row['revenue'], 2) for row in rows]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Аналитика продаж: дневные агрегаты против сырых таблиц')
+    parser.add_argument('--periods', default='30,365,1095')
+    parser.add_argument('--date-to', type=date.fromisoformat, default=None)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--catch-up-budget', type=float, default=7200)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    sys.path.insert(0, str(SALES_DIR))
+    sales = importlib.import_module('index')
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM {SCHEMA}.orders WHERE payment_status = 'paid' AND rolled_up_at IS NULL")
+    if cur.fetchone()[0]:
+        result = sales.catch_up(dsn, args.catch_up_budget)
+        print(f"catch-up: {result['rolled_up']:,} orders in {result['elapsed_ms'] / 1000:.0f} s "
+              f"({result['rolled_up'] / max(result['elapsed_ms'] / 1000, 0.001):,.0f} orders/s), {result['pending']:,} pending")
+        if result['pending']:
+            print('rollups are not caught up: raise --catch-up-budget', file=sys.stderr)
+            sys.exit(2)
+
+    cur.execute(f"SELECT COUNT(*), MAX(COALESCE(paid_at, created_at))::date FROM {SCHEMA}.orders WHERE payment_status = 'paid'")
+    paid_orders, last_day = cur.fetchone()
+    cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.orders')
+    date_to = args.date_to or last_day
+    print(f'{cur.fetchone()[0]:,} orders, {paid_orders:,} paid; periods end on {date_to.isoformat()}')
+
+    mismatches = 0
+    print(f"{'days':>5} {'group_by':<9} {'rollups ms':>11} {'raw ms':>10} {'speedup':>8}")
+    for days in [int(value) for value in args.periods.split(',')]:
+        date_from = date_to - timedelta(days=days - 1)
+        for group_by in GROUPS:
+            rollup_ms, rollup_answer = timed(lambda: (sales.query_totals(cur, date_from, date_to),
+                                                      sales.query_rows(cur, group_by, date_from, date_to, args.limit)), args.runs)
+            raw_ms, raw_answer = timed(lambda: (raw_totals(cur, date_from, date_to),
+                                                raw_rows(cur, group_by, date_from, date_to, args.limit)), args.runs)
+            same = comparable(group_by, rollup_answer) == comparable(group_by, raw_answer)
+            mismatches += not same
+            print(f"{days:>5} {group_by:<9} {rollup_ms:>11.1f} {raw_ms:>10.1f} {raw_ms / rollup_ms:>7.0f}x"
+                  + ('' if same else '  MISMATCH'))
+    conn.close()
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
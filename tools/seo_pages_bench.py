@@ -0,0 +1,123 @@
+'''
+Business: Время полной и инкрементальной перерисовки SEO-страниц seo-pages на каталоге в --products товаров против
+          локального S3 (moto): полная перерисовка, инкрементальный запуск без изменений, после правки цены у --changed
+          товаров и после сдвига одного updated_at (страница перерисовывается, но не перезаливается). Бакет moto каждый раз
+          новый, поэтому seo_pages очищается в начале; недостающие товары добавляются генератором tools/generate_dataset.py,
+          а они и правки цены убираются в конце
+Args: --products (товаров в каталоге), --changed (товаров, изменённых перед инкрементальным запуском), --seed;
+      DATABASE_URL из окружения; нужен пакет moto[server]
+Returns: таблица в stdout: запуск, перерисовано страниц, загружено в S3, секунды и страниц в секунду
+'''
+import argparse
+import contextlib
+import importlib
+import io
+import logging
+import os
+import sys
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import boto3
+import psycopg2
+from moto.server import ThreadedMotoServer
+
+from generate_dataset import BASE_PRODUCTS, Dataset, copy_rows, next_id
+
+SEO_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'seo-pages'
+SCHEMA = 't_p99209851_math_resources_site'
+BUCKET = 'seo-pages-bench'
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='seo-pages: полная перерисовка против инкрементальной')
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--changed', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    os.environ.update({
+        'S3_ENDPOINT': f'http://{host}:{port}',
+        'S3_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'S3_BUCKET': BUCKET
+    })
+    s3_client = boto3.client('s3', endpoint_url=os.environ['S3_ENDPOINT'], region_name='us-east-1',
+                             aws_access_key_id='testing', aws_secret_access_key='testing')
+    s3_client.create_bucket(Bucket=BUCKET)
+    sys.path.insert(0, str(SEO_DIR))
+    seo_pages = importlib.import_module('index')
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.products')
+    missing = args.products - cur.fetchone()[0]
+    first_added = None
+    if missing > 0:
+        first_added = next_id(cur, 'products')
+        dataset = Dataset(missing // BASE_PRODUCTS + 1, args.seed, date.today(), 1)
+        rows, _, seconds = copy_rows(cur, 'products', (row for _, row in zip(range(missing), dataset.product_rows(first_added))))
+        print(f'added {rows:,} generated products in {seconds:.1f} s', file=sys.stderr)
+    cur.execute(f'DELETE FROM {SCHEMA}.seo_pages')
+    cur.execute(f'SELECT id FROM {SCHEMA}.products ORDER BY id LIMIT %s', (args.changed,))
+    changed_ids = [row[0] for row in cur.fetchall()]
+
+    def uploaded_since(moment: datetime) -> int:
+        pages = s3_client.get_paginator('list_objects_v2').paginate(Bucket=BUCKET)
+        return sum(1 for page in pages for item in page.get('Contents', []) if item['LastModified'] >= moment)
+
+    def run(name: str, full: bool, prepare: Callable[[], None] = lambda: None) -> None:
+        prepare()
+        # Время S3 в листинге с точностью до секунды: ждём начала новой секунды, чтобы не засчитать прошлые загрузки
+        time.sleep(1 - time.time() % 1)
+        moment = datetime.now(timezone.utc).replace(microsecond=0)
+        started = time.perf_counter()
+        # Строки лога трассировки не должны мерить скорость терминала
+        with contextlib.redirect_stdout(io.StringIO()):
+            result: Dict[str, Any] = seo_pages.rebuild(dsn, full)
+        seconds = time.perf_counter() - started
+        rendered = result['rendered']
+        print(f"{name:<26} {rendered:>9,} {uploaded_since(moment):>9,} {seconds:>8.2f} {rendered / seconds:>8,.0f}")
+
+    def change_prices() -> None:
+        cur.execute(f'UPDATE {SCHEMA}.products SET price = price + 1, updated_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)', (changed_ids,))
+
+    def touch() -> None:
+        cur.execute(f'UPDATE {SCHEMA}.products SET updated_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)', (changed_ids,))
+
+    try:
+        cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.products')
+        print(f'{cur.fetchone()[0]:,} products, {seo_pages.MAX_WORKERS} render processes')
+        print(f"{'run':<26} {'rendered':>9} {'uploaded':>9} {'seconds':>8} {'pages/s':>8}")
+        run('full', True)
+        run('incremental, no changes', False)
+        run(f'incremental, {args.changed} prices', False, change_prices)
+        run(f'incremental, {args.changed} touched', False, touch)
+        run('full again', True)
+    finally:
+        cur.execute(f'UPDATE {SCHEMA}.products SET price = price - 1 WHERE id = ANY(%s)', (changed_ids,))
+        if first_added is not None:
+            cur.execute(f'DELETE FROM {SCHEMA}.products WHERE id >= %s', (first_added,))
+            removed = cur.rowcount
+            cur.execute(f'DELETE FROM {SCHEMA}.seo_pages WHERE product_id >= %s', (first_added,))
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{SCHEMA}.products', 'id'), (SELECT MAX(id) FROM {SCHEMA}.products))")
+            print(f'removed {removed:,} generated products', file=sys.stderr)
+        conn.close()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
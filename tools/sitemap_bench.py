@@ -0,0 +1,168 @@
+'''
+Business: Время и память sitemap на каталоге в --products товаров: прежняя сборка одного XML через += по всем товарам
+          против индекса с дочерними картами gzip из генератора (handler backend/sitemap) - холодная сборка после
+          изменения каталога, тёплые запросы из кэша и 304 по ETag. Если товаров в базе меньше, недостающие добавляются
+          генератором tools/generate_dataset.py и удаляются в конце
+Args: --products (товаров в каталоге), --runs (замеров на случай), --seed; DATABASE_URL из окружения
+Returns: таблица в stdout: случай, p50/p95 мс, пик памяти Python в МБ (tracemalloc, отдельный прогон) и байт ответа
+'''
+import argparse
+import base64
+import contextlib
+import gzip
+import importlib
+import io
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import psycopg2
+
+from generate_dataset import BASE_PRODUCTS, Dataset, copy_rows, next_id
+
+SITEMAP_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'sitemap'
+SCHEMA = 't_p99209851_math_resources_site'
+
+
+class Context:
+    request_id = 'sitemap-bench'
+
+
+def legacy_sitemap(dsn: str) -> bytes:
+    """sitemap до индекса: все товары одним fetchall и одна строка XML, собранная через +="""
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute(f"SELECT id, title, category, created_at FROM {SCHEMA}.products ORDER BY id")
+    products = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    base_url = 'https://p99209851.poehali.app'
+    today = datetime.now().strftime('%Y-%m-%d')
+    sitemap_xml = '<?xml version="1.0" encoding="UTF-8"?>\n'
+    sitemap_xml += '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    sitemap_xml += f'''  <url>
+    <loc>{base_url}/</loc>
+    <lastmod>{today}</lastmod>
+    <changefreq>daily</changefreq>
+    <priority>1.0</priority>
+  </url>
+'''
+    for product_id, title, category, created_at in products:
+        lastmod = created_at.strftime('%Y-%m-%d') if created_at else today
+        sitemap_xml += f'''  <url>
+    <loc>{base_url}/?product={product_id}</loc>
+    <lastmod>{lastmod}</lastmod>
+    <changefreq>weekly</changefreq>
+    <priority>0.8</priority>
+  </url>
+'''
+    sitemap_xml += '</urlset>'
+    return sitemap_xml.encode('utf-8')
+
+
+def measure(call: Callable[[], bytes], runs: int) -> Dict[str, Any]:
+    timings = []
+    body = b''
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = call()
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    ordered = sorted(timings)
+    return {
+        'p50': statistics.median(timings),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'peak_mb': peak / 2 ** 20,
+        'bytes': len(body)
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='sitemap: одна строка XML против индекса с gzip-картами')
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    sys.path.insert(0, str(SITEMAP_DIR))
+    sitemap = importlib.import_module('index')
+    context = Context()
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.products')
+    missing = args.products - cur.fetchone()[0]
+    first_added = None
+    if missing > 0:
+        first_added = next_id(cur, 'products')
+        dataset = Dataset(missing // BASE_PRODUCTS + 1, args.seed, date.today(), 1)
+        rows, _, seconds = copy_rows(cur, 'products', (row for _, row in zip(range(missing), dataset.product_rows(first_added))))
+        print(f'added {rows:,} generated products in {seconds:.1f} s', file=sys.stderr)
+
+    def call(params: Optional[Dict[str, str]] = None, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        # Строки лога трассировки не должны мерить скорость терминала
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sitemap.handler({'httpMethod': 'GET', 'queryStringParameters': params, 'headers': headers or {}}, context)
+
+    def cold() -> bytes:
+        """Каталог изменился: сборка всех карт и индекса"""
+        sitemap._sitemap_cache['version'] = None
+        return base64.b64decode(call()['body'])
+
+    def warm(page: Optional[int] = None) -> Callable[[], bytes]:
+        def run() -> bytes:
+            return base64.b64decode(call({'page': str(page)} if page else None)['body'])
+        return run
+
+    def not_modified() -> bytes:
+        response = call({'page': '1'}, {'If-None-Match': etag})
+        assert response['statusCode'] == 304, response['statusCode']
+        return b''
+
+    try:
+        cur.execute(f'SELECT COUNT(*) FROM {SCHEMA}.products')
+        print(f'{cur.fetchone()[0]:,} products')
+        cold()
+        pages = len(sitemap._sitemap_cache['pages'])
+        etag = sitemap._sitemap_cache['etag'][:-1] + '-1"'
+        xml_bytes = sum(len(gzip.decompress(page)) for page in sitemap._sitemap_cache['pages'])
+        print(f'{pages} child sitemaps, {xml_bytes / 2 ** 20:.1f} MB of XML, '
+              f"{sum(len(page) for page in sitemap._sitemap_cache['pages']) / 2 ** 20:.1f} MB gzip")
+
+        cases: List[Any] = [
+            ('legacy: single XML', lambda: legacy_sitemap(dsn)),
+            ('index: cold build', cold),
+            ('index: warm index', warm()),
+            ('index: warm page 1', warm(1)),
+            ('index: 304 page 1', not_modified)
+        ]
+        print(f"{'case':<22} {'p50 ms':>9} {'p95 ms':>9} {'peak MB':>8} {'bytes':>11}")
+        for name, run in cases:
+            result = measure(run, args.runs)
+            print(f"{name:<22} {result['p50']:>9.1f} {result['p95']:>9.1f} {result['peak_mb']:>8.1f} {result['bytes']:>11,}")
+    finally:
+        if first_added is not None:
+            cur.execute(f'DELETE FROM {SCHEMA}.products WHERE id >= %s', (first_added,))
+            removed = cur.rowcount
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{SCHEMA}.products', 'id'), (SELECT MAX(id) FROM {SCHEMA}.products))")
+            print(f'removed {removed:,} generated products', file=sys.stderr)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
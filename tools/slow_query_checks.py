@@ -0,0 +1,174 @@
+'''
+Business: Проверки журнала медленных запросов tracing.py против локальной базы: план медленного запроса попадает
+          в slow_queries, в плане и тексте нет литералов из параметров, запрос не выполняется второй раз ради плана
+          (nextval в списке выборки сдвигает последовательность ровно на один) и путь вызова не обращается к БД за планом
+          (последний запрос соединения вызова в pg_stat_activity - сам запрос, а не EXPLAIN или точка сохранения).
+          Порог медленного запроса и выборки ставятся так, чтобы план снимался с каждого вызова; таблица и
+          последовательность проверок создаются в схеме и удаляются в конце вместе со строками slow_queries и metrics
+Args: имена проверок (по умолчанию все); DATABASE_URL из окружения
+Returns: PASS/FAIL по каждой проверке в stdout; код выхода 1, если хоть одна не прошла
+'''
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import sys
+import uuid
+from pathlib import Path
+from typing import Any, Dict
+
+import psycopg2
+
+from flow_checks import CheckFailed, expect
+
+SLOW_QUERIES_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'slow-queries'
+SCHEMA = 't_p99209851_math_resources_site'
+FUNCTION = 'slow-query-checks'
+QUERY = f'SELECT id, email FROM {SCHEMA}.slow_query_check WHERE email = %s AND id <> %s'
+# Тот же запрос с nextval: если ради плана он выполнится ещё раз, последовательность сдвинется дважды
+COUNTING_QUERY = (f"SELECT nextval('{SCHEMA}.slow_query_check_seq'), id, email FROM {SCHEMA}.slow_query_check "
+                  "WHERE email = %s AND id <> %s")
+# Число в условии, которого нет ни в стоимости, ни в оценках строк плана
+SECRET_NUMBER = 987654321
+
+
+class Context:
+    request_id = 'slow-query-checks'
+
+
+class Checks:
+    def __init__(self, tracing: Any, dsn: str):
+        self.tracing = tracing
+        self.dsn = dsn
+        self.monitor = psycopg2.connect(dsn)
+        self.monitor.autocommit = True
+
+    def fetch(self, query: str, params: Any = None) -> Any:
+        cur = self.monitor.cursor()
+        cur.execute(query, params)
+        return cur.fetchone()
+
+    def run(self, query: str = QUERY) -> Dict[str, Any]:
+        """Один вызов с медленным (по порогу 0 мс) запросом под уникальным email, потом сброс метрик"""
+        email = f'slow-query-check-{uuid.uuid4().hex}@example.com'
+        self.monitor.cursor().execute(f'INSERT INTO {SCHEMA}.slow_query_check (email) VALUES (%s)', (email,))
+        sequence_before = self.fetch(f'SELECT last_value FROM {SCHEMA}.slow_query_check_seq')[0]
+        self.tracing._explained.clear()
+        seen: Dict[str, Any] = {}
+
+        @self.tracing.traced(FUNCTION)
+        def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            conn = self.tracing.connect(self.dsn)
+            cur = conn.cursor()
+            cur.execute(query, (email, SECRET_NUMBER))
+            seen['rows'] = cur.fetchall()
+            seen['conn'] = conn
+            return {'statusCode': 200, 'body': ''}
+
+        # Строки лога трассировки не нужны в выводе проверок
+        with contextlib.redirect_stdout(io.StringIO()):
+            handler({'httpMethod': 'GET', 'headers': {}}, Context())
+        conn = seen['conn']
+        try:
+            # Соединение вызова ещё открыто: его последний запрос виден в pg_stat_activity
+            seen['last_query'] = self.fetch('SELECT query FROM pg_stat_activity WHERE pid = %s', (conn.get_backend_pid(),))[0]
+        finally:
+            conn.close()
+        self.tracing.flush()
+        seen['sequence_step'] = self.fetch(f'SELECT last_value FROM {SCHEMA}.slow_query_check_seq')[0] - sequence_before
+        seen['email'] = email
+        seen['stored'] = self.fetch(
+            f'SELECT query, plan, plan_elapsed_ms FROM {SCHEMA}.slow_queries WHERE fingerprint = %s AND function_name = %s',
+            (self.tracing.fingerprint_statement(query)[0], FUNCTION)
+        )
+        expect(len(seen['rows']) == 1, f"the check query returned {len(seen['rows'])} rows")
+        expect(seen['stored'] is not None, 'no slow_queries row for the check query')
+        return seen
+
+    def plan_captured(self) -> str:
+        """План медленного запроса уходит в slow_queries вместе с временем вызова"""
+        query, plan, plan_elapsed_ms = self.run()['stored']
+        expect(plan is not None and 'cost=' in plan and 'slow_query_check' in plan, f'no plan captured: {plan!r}')
+        expect(plan_elapsed_ms is not None, 'plan_elapsed_ms is not set')
+        return f"{len(plan.splitlines())} plan lines, call took {plan_elapsed_ms:.2f} ms"
+
+    def no_literals(self) -> str:
+        """Ни email, ни число из параметров не попадают ни в текст запроса, ни в план"""
+        seen = self.run()
+        query, plan, _ = seen['stored']
+        leaks = [value for value in (seen['email'], str(SECRET_NUMBER)) for text in (query, plan or '') if value in text]
+        expect(not leaks, f'literals stored in slow_queries: {leaks}')
+        expect(plan is not None and '?' in plan, f'plan has no redacted conditions: {plan!r}')
+        return next((line.strip() for line in plan.splitlines() if 'Filter:' in line or 'Cond:' in line), 'redacted')
+
+    def not_re_executed(self) -> str:
+        """План снимается EXPLAIN без ANALYZE: nextval в запросе вызывается один раз - самим вызовом"""
+        seen = self.run(COUNTING_QUERY)
+        expect(seen['stored'][1] is not None, 'no plan captured')
+        expect(seen['sequence_step'] == 1, f"the sequence moved by {seen['sequence_step']}: the query ran again for its plan")
+        return 'sequence moved by 1'
+
+    def off_request_path(self) -> str:
+        """На соединении вызова после запроса ничего не выполнялось: ни EXPLAIN, ни точки сохранения"""
+        seen = self.run()
+        expect(seen['last_query'].lstrip().startswith('SELECT id, email'),
+               f"the call's connection ran {seen['last_query']!r} after the query")
+        return 'last statement of the call connection is the query itself'
+
+
+CHECKS = {
+    'plan-captured': Checks.plan_captured,
+    'no-literals': Checks.no_literals,
+    'not-re-executed': Checks.not_re_executed,
+    'off-request-path': Checks.off_request_path
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Проверки журнала медленных запросов против локальной базы')
+    parser.add_argument('checks', nargs='*', help='по умолчанию все: ' + ', '.join(CHECKS))
+    args = parser.parse_args()
+
+    unknown = [name for name in args.checks if name not in CHECKS]
+    if unknown:
+        parser.error(f'unknown checks: {", ".join(unknown)}')
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    sys.path.insert(0, str(SLOW_QUERIES_DIR))
+    tracing = importlib.import_module('tracing')
+    tracing.SAMPLE_RATE = 1.0
+    tracing.SLOW_QUERY_MS = 0.0
+    tracing.SLOW_QUERY_EXPLAIN_RATE = 1.0
+    # Сброс только вручную, после вызова
+    tracing._last_flush = float('inf')
+
+    checks = Checks(tracing, dsn)
+    cur = checks.monitor.cursor()
+    cur.execute(f'CREATE SEQUENCE IF NOT EXISTS {SCHEMA}.slow_query_check_seq')
+    # У новой последовательности первый nextval не сдвигает last_value - сдвигаем заранее
+    cur.execute(f"SELECT nextval('{SCHEMA}.slow_query_check_seq')")
+    cur.execute(f'CREATE TABLE IF NOT EXISTS {SCHEMA}.slow_query_check (id SERIAL PRIMARY KEY, email TEXT NOT NULL)')
+    cur.execute(f'DELETE FROM {SCHEMA}.slow_queries WHERE function_name = %s', (FUNCTION,))
+    failed = 0
+    try:
+        for name in args.checks or list(CHECKS):
+            try:
+                print(f'PASS {name}: {CHECKS[name](checks)}')
+            except CheckFailed as e:
+                failed += 1
+                print(f'FAIL {name}: {e}')
+    finally:
+        cur.execute(f'DROP TABLE IF EXISTS {SCHEMA}.slow_query_check')
+        cur.execute(f'DROP SEQUENCE IF EXISTS {SCHEMA}.slow_query_check_seq')
+        cur.execute(f'DELETE FROM {SCHEMA}.slow_queries WHERE function_name = %s', (FUNCTION,))
+        cur.execute(f'DELETE FROM {SCHEMA}.metrics WHERE function_name = %s', (FUNCTION,))
+        checks.monitor.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
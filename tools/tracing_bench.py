@@ -0,0 +1,156 @@
+'''
+Business: Накладные расходы tracing.py на вызов функции против живой базы: handler без трассировки (обычные курсоры psycopg2)
+          против traced с выборкой по умолчанию и со спанами у каждого вызова. Режимы чередуются на каждом вызове,
+          чтобы дрейф базы и кэшей делился между ними поровну. Отдельно - сколько длится сброс метрик в БД
+          и сколько из этого остаётся на пути запроса
+Args: --function (каталог в backend, по умолчанию products), --paths (запросы GET через запятую), --calls (вызовов на режим),
+      --warmup, --flushes (замеров сброса); DATABASE_URL из окружения
+Returns: таблица в stdout: p50/p95/среднее мс по режимам и прирост к режиму plain (plain-again - шум замера), время сброса и строки metrics, дошедшие до БД
+'''
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, Callable, List
+from urllib.parse import parse_qsl, urlsplit
+
+import psycopg2
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+SCHEMA = 't_p99209851_math_resources_site'
+# plain-again - тот же plain: разница между ними показывает шум замера
+MODES = ['plain', 'plain-again', 'traced', 'sampled']
+
+
+class Context:
+    request_id = 'tracing-bench'
+
+
+def load_function(name: str) -> Any:
+    sys.path.insert(0, str(BACKEND_DIR / name))
+    return importlib.import_module('index')
+
+
+def make_event(path: str) -> Dict[str, Any]:
+    parts = urlsplit(path)
+    return {
+        'httpMethod': 'GET',
+        'path': parts.path or '/',
+        'headers': {},
+        'queryStringParameters': dict(parse_qsl(parts.query)) or None,
+        'body': None
+    }
+
+
+def configure(tracing: Any, mode: str, defaults: Dict[str, Any]) -> Callable:
+    """Настраивает модуль трассировки под режим и возвращает, что вызывать"""
+    tracing.SAMPLE_RATE = 1.0 if mode == 'sampled' else defaults['SAMPLE_RATE']
+    plain = mode.startswith('plain')
+    tracing.connect = psycopg2.connect if plain else defaults['connect']
+    return defaults['raw_handler'] if plain else defaults['handler']
+
+
+def percentile(timings: List[float], percent: float) -> float:
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Накладные расходы трассировки на вызов функции')
+    parser.add_argument('--function', default='products')
+    parser.add_argument('--paths', default='/,/?id=1,/?stats=true')
+    parser.add_argument('--calls', type=int, default=3000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--flushes', type=int, default=20)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        print('DATABASE_URL is not set', file=sys.stderr)
+        sys.exit(2)
+
+    module = load_function(args.function)
+    tracing = module.tracing
+    defaults = {
+        'SAMPLE_RATE': tracing.SAMPLE_RATE,
+        'connect': tracing.connect,
+        'handler': module.handler,
+        'raw_handler': module.handler.__wrapped__
+    }
+    events = [make_event(path) for path in args.paths.split(',')]
+    context = Context()
+
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    cur.execute(f"SELECT COALESCE(SUM(count), 0) FROM {SCHEMA}.metrics WHERE function_name = %s AND name = 'handler_duration_ms'",
+                (args.function,))
+    calls_before = cur.fetchone()[0]
+
+    timings: Dict[str, List[float]] = {mode: [] for mode in MODES}
+    flush_ms: List[float] = []
+    request_flush_ms: List[float] = []
+    traced_calls = 0
+    # Сброс по таймеру не должен попасть в замеры вызовов - он меряется отдельно ниже
+    tracing._last_flush = float('inf')
+    # Строки лога трассировки не должны мерить скорость терминала
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        for call in range(args.warmup + args.calls):
+            event = events[call % len(events)]
+            for mode in random.sample(MODES, len(MODES)):
+                handler = configure(tracing, mode, defaults)
+                started = time.perf_counter()
+                response = handler(event, context)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if response['statusCode'] != 200:
+                    raise SystemExit(f'{mode} {event["queryStringParameters"]}: {response["statusCode"]} {response["body"]}')
+                traced_calls += not mode.startswith('plain')
+                if call >= args.warmup:
+                    timings[mode].append(elapsed_ms)
+            log.seek(0)
+            log.truncate()
+
+        # Сколько вызов ждал бы сброса, если бы сбрасывал сам, и сколько стоит разбудить поток сброса
+        handler = configure(tracing, 'traced', defaults)
+        for flush in range(args.flushes):
+            for call in range(len(events)):
+                handler(events[call], context)
+            traced_calls += len(events)
+            if flush % 2:
+                started = time.perf_counter()
+                tracing.flush()
+                flush_ms.append((time.perf_counter() - started) * 1000)
+            else:
+                started = time.perf_counter()
+                tracing.request_flush()
+                request_flush_ms.append((time.perf_counter() - started) * 1000)
+                tracing.flush()
+        tracing.flush()
+
+    cur.execute(f"SELECT COALESCE(SUM(count), 0) FROM {SCHEMA}.metrics WHERE function_name = %s AND name = 'handler_duration_ms'",
+                (args.function,))
+    calls_flushed = cur.fetchone()[0] - calls_before
+    conn.close()
+
+    baseline = statistics.mean(timings['plain'])
+    baseline_p50 = statistics.median(timings['plain'])
+    print(f'{args.function}: {", ".join(args.paths.split(","))}; {args.calls} calls per mode')
+    print(f"{'mode':<18} {'calls':>6} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'p50 +%':>7} {'mean +%':>8}")
+    for mode in MODES:
+        mean = statistics.mean(timings[mode])
+        p50 = statistics.median(timings[mode])
+        print(f"{mode:<18} {len(timings[mode]):>6} {p50:>8.3f} {percentile(timings[mode], 95):>8.3f} {mean:>8.3f} "
+              f"{(p50 / baseline_p50 - 1) * 100:>+7.2f} {(mean / baseline - 1) * 100:>+8.2f}")
+    print(f'flush to metrics: p50 {statistics.median(flush_ms):.3f} ms; on the request path (request_flush): '
+          f'p50 {statistics.median(request_flush_ms):.3f} ms')
+    print(f'handler_duration_ms in metrics: {calls_flushed} of {traced_calls} traced calls')
+
+
+if __name__ == '__main__':
+    main()
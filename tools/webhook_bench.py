@@ -0,0 +1,118 @@
+'''
+Business: Задержка checkout и webhook оплаты в зависимости от размера корзины на локальном стенде: tools/local_server.py с функциями,
+          tools/fake_services.py вместо внешних сервисов и база с товарами. Платёж оплачивается в заглушке без уведомления,
+          уведомление payment.succeeded отправляется отсюда и замеряется: первая доставка и повторная того же платежа
+Args: --base-url (локальный сервер), --sizes (позиций в корзине, через запятую),
+      --runs (замеров на размер), --product-ids (по умолчанию первые товары из базы по DATABASE_URL), --output (отчёт JSON)
+Returns: таблица в stdout: p50/p95/max мс checkout, первой и повторной доставки webhook по каждому размеру корзины
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from typing import Dict, Any, List
+
+import psycopg2
+
+from flow_checks import NoRedirect, http_json
+
+SCHEMA = 't_p99209851_math_resources_site'
+STAGES = ['checkout', 'webhook', 'webhook-repeat']
+
+
+def timed(call) -> Any:
+    started = time.perf_counter()
+    status, body = call()
+    return status, body, (time.perf_counter() - started) * 1000
+
+
+def pay_without_notification(payment_url: str) -> None:
+    try:
+        urllib.request.build_opener(NoRedirect).open(f'{payment_url}?notify=false', timeout=10)
+    except urllib.error.HTTPError as e:
+        if e.code != 302:
+            raise SystemExit(f'paying {payment_url} returned {e.code}')
+
+
+def run_once(base_url: str, product_ids: List[int]) -> Dict[str, float]:
+    email = f'bench-{uuid.uuid4().hex[:12]}@example.com'
+    status, checkout, checkout_ms = timed(lambda: http_json(f'{base_url}/create-payment', {
+        'product_ids': product_ids,
+        'customer_email': email,
+        'return_url': 'https://example.com/return'
+    }))
+    if status != 200:
+        raise SystemExit(f'checkout of {len(product_ids)} items returned {status}: {checkout}')
+    pay_without_notification(checkout['payment_url'])
+
+    notification = {'type': 'notification', 'event': 'payment.succeeded', 'object': {'id': checkout['payment_id']}}
+    result = {'checkout': checkout_ms}
+    for stage in ['webhook', 'webhook-repeat']:
+        status, body, elapsed_ms = timed(lambda: http_json(f'{base_url}/yookassa-webhook', notification))
+        if status != 200:
+            raise SystemExit(f'{stage} for {len(product_ids)} items returned {status}: {body}')
+        result[stage] = elapsed_ms
+    return result
+
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Задержка checkout и webhook по размеру корзины')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--sizes', default='1,5,10,25,50')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--product-ids', help='через запятую; по умолчанию первые товары из базы')
+    parser.add_argument('--output', help='сохранить замеры в JSON')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    if args.product_ids:
+        product_ids = [int(product_id) for product_id in args.product_ids.split(',')]
+    else:
+        dsn = os.environ.get('DATABASE_URL')
+        if not dsn:
+            print('DATABASE_URL is not set and --product-ids is not given', file=sys.stderr)
+            sys.exit(2)
+        conn = psycopg2.connect(dsn)
+        try:
+            cur = conn.cursor()
+            cur.execute(f"SELECT id FROM {SCHEMA}.products WHERE NOT is_free ORDER BY id LIMIT %s", (max(sizes),))
+            product_ids = [row[0] for row in cur.fetchall()]
+        finally:
+            conn.close()
+    if len(product_ids) < max(sizes):
+        print(f'{len(product_ids)} products available, the largest cart needs {max(sizes)}', file=sys.stderr)
+        sys.exit(2)
+
+    base_url = args.base_url.rstrip('/')
+    # Прогрев: импорт функций и пулы подключений не попадают в замеры
+    run_once(base_url, product_ids[:1])
+
+    report: Dict[str, Dict[str, List[float]]] = {}
+    print(f"{'items':>5} {'stage':<15} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for size in sizes:
+        timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        for _ in range(args.runs):
+            for stage, elapsed_ms in run_once(base_url, product_ids[:size]).items():
+                timings[stage].append(elapsed_ms)
+        report[str(size)] = timings
+        for stage in STAGES:
+            print(f"{size:>5} {stage:<15} {statistics.median(timings[stage]):>8.1f} {percentile(timings[stage], 95):>8.1f} "
+                  f"{max(timings[stage]):>8.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'base_url': base_url, 'runs': args.runs, 'timings_ms': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
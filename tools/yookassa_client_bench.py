@@ -0,0 +1,148 @@
+'''
+Business: Задержка и надёжность вызовов API ЮКассы: общий клиент backend/*/yookassa_client.py (пул keep-alive соединений,
+          таймауты, повторы с тем же Idempotence-Key) против прежнего urllib.request.urlopen с новым соединением на вызов.
+          Заглушка YooKassa из tools/fake_services.py поднимается здесь же с заданной задержкой, долей ошибок 500 и,
+          с --tls, по HTTPS с самоподписанным сертификатом (нужен openssl)
+Args: --calls (вызовов на режим), --concurrency (потоков в замере пропускной способности), --latency-ms (задержка заглушки),
+      --error-rate (доля 500 в замере ошибок), --payments (платежей в замере списка), --tls
+Returns: таблица в stdout: p50/p95 мс и вызовов в секунду по режимам, доля неудачных вызовов при ошибках заглушки,
+         сколько платежей видит обход списка по next_cursor против одной первой страницы
+'''
+import argparse
+import base64
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from fake_services import Behaviour, serve_yookassa
+
+CLIENT_DIR = Path(__file__).resolve().parent.parent / 'backend' / 'create-payment'
+SHOP_ID = 'bench-shop'
+SECRET_KEY = 'bench-secret'
+MODES = ['per-call', 'pooled']
+
+
+def self_signed_context(directory: str) -> ssl.SSLContext:
+    """Серверный TLS-контекст с сертификатом на 127.0.0.1; клиенты доверяют ему через SSL_CERT_FILE"""
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+         '-addext', 'subjectAltName=IP:127.0.0.1', '-keyout', key, '-out', cert],
+        check=True, capture_output=True
+    )
+    os.environ['SSL_CERT_FILE'] = cert
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
+
+
+def per_call_get(base_url: str) -> Callable[[str], Dict[str, Any]]:
+    """GET платежа так, как функции делали до общего клиента: заголовок на каждый вызов, urlopen без таймаута и повторов"""
+    def get(payment_id: str) -> Dict[str, Any]:
+        credentials = base64.b64encode(f'{SHOP_ID}:{SECRET_KEY}'.encode('utf-8')).decode('utf-8')
+        request = urllib.request.Request(f'{base_url}/v3/payments/{payment_id}', headers={
+            'Authorization': f'Basic {credentials}',
+            'Content-Type': 'application/json'
+        })
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read().decode('utf-8'))
+    return get
+
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def timed_calls(call: Callable[[str], Any], payment_ids: List[str], concurrency: int) -> Dict[str, Any]:
+    """Вызовы по списку id в concurrency потоках: задержки успешных, число неудачных и вызовов в секунду"""
+    def one(payment_id: str) -> Any:
+        started = time.perf_counter()
+        try:
+            call(payment_id)
+        except Exception:
+            return None
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(one, payment_ids))
+    else:
+        results = [one(payment_id) for payment_id in payment_ids]
+    elapsed = time.perf_counter() - started
+    timings = [result for result in results if result is not None]
+    return {
+        'timings': timings,
+        'failed': len(results) - len(timings),
+        'rps': len(results) / elapsed
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Общий клиент ЮКассы против urlopen на каждый вызов')
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.1)
+    parser.add_argument('--payments', type=int, default=1000)
+    parser.add_argument('--tls', action='store_true', help='заглушка по HTTPS: в замер попадает TLS-рукопожатие')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        behaviour = Behaviour('yookassa', latency_ms=args.latency_ms)
+        _, base_url, _ = serve_yookassa(behaviour, ssl_context=self_signed_context(directory) if args.tls else None)
+
+        # Клиент читает адрес API при импорте, а сертификат заглушки - при создании пула
+        os.environ['YOOKASSA_API_URL'] = base_url
+        sys.path.insert(0, str(CLIENT_DIR))
+        import yookassa_client
+
+        client = yookassa_client.YooKassaClient(SHOP_ID, SECRET_KEY, base_url=base_url, backoff=0.05)
+        calls = {'per-call': per_call_get(base_url), 'pooled': lambda payment_id: client.get_payment(payment_id)}
+
+        payment_ids = []
+        for index in range(max(args.payments, 1)):
+            payment = client.create_payment({'amount': {'value': '100.00', 'currency': 'RUB'}, 'description': f'bench {index}'},
+                                             f'bench-{index}')
+            payment_ids.append(payment.id)
+        targets = [payment_ids[index % len(payment_ids)] for index in range(args.calls)]
+
+        print(f"{base_url}, latency {args.latency_ms:.0f} ms, {args.calls} calls per mode")
+        print(f"{'mode':<10} {'phase':<22} {'p50 ms':>8} {'p95 ms':>8} {'calls/s':>9} {'failed':>7}")
+        phases = [('sequential', 1, 0.0), (f'{args.concurrency} threads', args.concurrency, 0.0),
+                  (f'{args.error_rate:.0%} errors', args.concurrency, args.error_rate)]
+        for phase, concurrency, error_rate in phases:
+            behaviour.error_rate = error_rate
+            for mode in MODES:
+                # Прогрев: соединения пула и импорт не попадают в замер
+                timed_calls(calls[mode], targets[:concurrency * 2], concurrency)
+                result = timed_calls(calls[mode], targets, concurrency)
+                print(f"{mode:<10} {phase:<22} {statistics.median(result['timings']):>8.2f} "
+                      f"{percentile(result['timings'], 95):>8.2f} {result['rps']:>9.0f} {result['failed']:>7}")
+        behaviour.error_rate = 0.0
+
+        # Прежний manual-send-purchase читал только первую страницу /v3/payments
+        started = time.perf_counter()
+        request = urllib.request.Request(f'{base_url}/v3/payments', headers={'Authorization': client.auth_header})
+        with urllib.request.urlopen(request) as response:
+            first_page = json.loads(response.read().decode('utf-8'))['items']
+        first_page_ms = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        listed = sum(1 for _ in client.list_payments())
+        listed_ms = (time.perf_counter() - started) * 1000
+        print(f'list of {len(payment_ids)} payments: first page {len(first_page)} in {first_page_ms:.1f} ms, '
+              f'next_cursor walk {listed} in {listed_ms:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()